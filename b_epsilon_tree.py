@@ -0,0 +1,597 @@
+import bisect
+import struct
+from contextlib import contextmanager
+from typing import Iterator
+
+from b_plus_tree import LEAF_ENTRY, VAL_OVERFLOW, OVERFLOW_REF, check_key, free_vals, separator, split_starts, \
+    store_val
+from const import BYTES_PAGE, BYTES_NODE, BYTES_NODE_MIN, BE_FANOUT, BYTES_BE_PIVOTS
+from free_list import FreeList
+from overflow import Overflow, new_overflow_from_ref
+from pager import Pager
+
+# 页头：is_leaf | page_id | key 个数 | 消息条数 | children[0]（仅内部节点）
+BE_NODE_HEADER = struct.Struct('>?qHHq')
+# 内部节点的分隔 key：key 长度 | key 右侧子节点的 page_id | key
+PIVOT_ENTRY = struct.Struct('>Hq')
+# 缓冲区里的消息：类型 | key 长度 | val 长度 | key | val，val 长度为 VAL_OVERFLOW 时 val 为溢出引用
+MESSAGE_ENTRY = struct.Struct('>BHH')
+
+# 消息类型：覆盖写入 / 不存在时写入 / 删除
+MSG_UPSERT = 0
+MSG_ADD = 1
+MSG_DELETE = 2
+
+Message = tuple[int, bytes | Overflow]
+
+
+class BEpsilonTreeNode:
+    """
+    Bε 树节点，从页读出时整页解码。叶节点存按 key 排序的记录；内部节点除了分隔 key 和子节点，
+    页里剩下的空间是消息缓冲区 messages，每个 key 只留一条合并后的消息，比子树里的消息新。
+    """
+
+    def __init__(self):
+        self.pager: Pager | None = None
+        self.free_list: FreeList | None = None
+        self.is_leaf: bool = False
+        self.page_id: int = 0
+        # 叶节点的 key，或内部节点的分隔 key
+        self.keys: list[bytes] = []
+        self.vals: list[bytes | Overflow] = []
+        self.children: list[int] = []
+        self.messages: dict[bytes, Message] = {}
+
+    def __bytes__(self) -> bytes:
+        first_child = 0 if self.is_leaf else self.children[0]
+        r = [BE_NODE_HEADER.pack(self.is_leaf, self.page_id, len(self.keys), len(self.messages), first_child)]
+        if self.is_leaf:
+            for key, val in zip(self.keys, self.vals):
+                length, val_bs = encode_val(val)
+                r.append(LEAF_ENTRY.pack(len(key), length) + key + val_bs)
+        else:
+            for key, child in zip(self.keys, self.children[1:]):
+                r.append(PIVOT_ENTRY.pack(len(key), child) + key)
+            for key in sorted(self.messages):
+                op, val = self.messages[key]
+                length, val_bs = encode_val(val)
+                r.append(MESSAGE_ENTRY.pack(op, len(key), length) + key + val_bs)
+        bs = b''.join(r)
+        if len(bs) > BYTES_PAGE:
+            raise ValueError("page 溢出")
+        return bs
+
+    def size(self) -> int:
+        if self.is_leaf:
+            return BE_NODE_HEADER.size + sum(LEAF_ENTRY.size + len(key) + val_size(val)
+                                             for key, val in zip(self.keys, self.vals))
+        return BE_NODE_HEADER.size + self.pivots_size() + sum(message_size(key, val)
+                                                              for key, (_, val) in self.messages.items())
+
+    def pivots_size(self) -> int:
+        return sum(PIVOT_ENTRY.size + len(key) for key in self.keys)
+
+    def pivots_full(self) -> bool:
+        return len(self.children) > BE_FANOUT or self.pivots_size() > BYTES_BE_PIVOTS
+
+    def persist(self) -> None:
+        self.pager.page_set(self.page_id, bytes(self))
+        self.pager.node_cache.put(self.page_id, self, self.size())
+
+    def child_index(self, key: bytes) -> int:
+        return bisect.bisect_right(self.keys, key)
+
+    def child(self, index: int) -> 'BEpsilonTreeNode':
+        return new_b_epsilon_tree_node_from_page_id(self.pager, self.free_list, self.children[index])
+
+    def put(self, key: bytes, message: Message) -> None:
+        """较新的消息放进缓冲区，与同一 key 已有的消息合并，被覆盖的 val 释放溢出页"""
+        old = self.messages.get(key)
+        if old is None:
+            self.messages[key] = message
+            return
+        merged = combine(old, message)
+        for _, val in (old, message):
+            if val is not merged[1]:
+                free_vals([val])
+        self.messages[key] = merged
+
+    def apply(self, messages: dict[bytes, Message]) -> None:
+        """叶节点：消息按 key 归并进记录"""
+        keys = []
+        vals = []
+        i = 0
+        for key in sorted(messages):
+            op, val = messages[key]
+            while i < len(self.keys) and self.keys[i] < key:
+                keys.append(self.keys[i])
+                vals.append(self.vals[i])
+                i += 1
+            old = None
+            if i < len(self.keys) and self.keys[i] == key:
+                old = self.vals[i]
+                i += 1
+            if op == MSG_DELETE:
+                free_vals([old] if old is not None else [])
+                continue
+            if op == MSG_ADD and old is not None:
+                free_vals([val])
+                val = old
+            elif old is not None:
+                free_vals([old])
+            keys.append(key)
+            vals.append(val)
+        keys.extend(self.keys[i:])
+        vals.extend(self.vals[i:])
+        self.keys = keys
+        self.vals = vals
+
+    def settle(self) -> list[tuple[bytes, 'BEpsilonTreeNode']]:
+        """
+        改完后收尾并写回：内部节点先把超出一页的缓冲区推下去；叶节点超过 BYTES_NODE，
+        或内部节点的分隔 key 超出上限时切开，返回新增的右侧节点及其分隔 key，由父节点插入
+        """
+        if self.is_leaf:
+            if self.size() <= BYTES_NODE:
+                self.persist()
+                return []
+            return self.split_leaf()
+        self.flush()
+        if not self.pivots_full():
+            self.persist()
+            return []
+        return self.split_internal()
+
+    def flush(self) -> None:
+        """
+        缓冲区放不下时，把消息字节数最多的那个子节点的消息整批推下去，直到放得下。
+        分隔 key 超出上限时先停下，由 split_internal 切开后各自再推。
+        """
+        while len(self.messages) > 0 and self.size() > BYTES_PAGE and not self.pivots_full():
+            groups = {}
+            for key, (_, val) in self.messages.items():
+                index = self.child_index(key)
+                groups[index] = groups.get(index, 0) + message_size(key, val)
+            index = max(groups, key=groups.get)
+            batch = {key: message for key, message in self.messages.items() if self.child_index(key) == index}
+            for key in batch:
+                del self.messages[key]
+            self.push(index, batch)
+
+    def push(self, index: int, batch: dict[bytes, Message]) -> None:
+        """一批消息交给第 index 个子节点：叶节点直接归并，内部节点并入其缓冲区"""
+        child = self.child(index)
+        if child.is_leaf:
+            child.apply(batch)
+        else:
+            for key in sorted(batch):
+                child.put(key, batch[key])
+        splits = child.settle()
+        self.keys[index:index] = [key for key, _ in splits]
+        self.children[index + 1:index + 1] = [node.page_id for _, node in splits]
+        if len(splits) == 0:
+            self.shrink_child(index, child)
+
+    def shrink_child(self, index: int, child: 'BEpsilonTreeNode') -> None:
+        """
+        子节点整棵空了就去掉；叶节点低于 BYTES_NODE_MIN 时与右（或左）邻合并，合并后放不下一页时保持欠满
+        """
+        if len(self.children) == 1:
+            return
+        if child.is_empty():
+            self.remove_child(index, child)
+            return
+        if not child.is_leaf or child.size() >= BYTES_NODE_MIN:
+            return
+        left, right = (index, index + 1) if index + 1 < len(self.children) else (index - 1, index)
+        left_child = child if left == index else self.child(left)
+        right_child = child if right == index else self.child(right)
+        size = left_child.size() + right_child.size() - BE_NODE_HEADER.size
+        if size > BYTES_NODE:
+            return
+        left_child.keys = left_child.keys + right_child.keys
+        left_child.vals = left_child.vals + right_child.vals
+        left_child.persist()
+        self.keys.pop(left)
+        self.children.pop(right)
+        self.free_list.add_page_id(right_child.page_id)
+
+    def is_empty(self) -> bool:
+        """
+        子树里没有记录也没有消息：叶节点没有记录，或内部节点缓冲区为空且只剩一个空的子节点
+        （有兄弟的空子节点已被去掉，空子树只会是一条单链）
+        """
+        if self.is_leaf:
+            return len(self.keys) == 0
+        return len(self.messages) == 0 and len(self.children) == 1 and self.child(0).is_empty()
+
+    def remove_child(self, index: int, child: 'BEpsilonTreeNode') -> None:
+        """去掉空的子树，其区间并给左邻（最左时给右邻）"""
+        child.free_subtree()
+        self.children.pop(index)
+        self.keys.pop(index - 1 if index > 0 else 0)
+
+    def split_leaf(self) -> list[tuple[bytes, 'BEpsilonTreeNode']]:
+        sizes = [LEAF_ENTRY.size + len(key) + val_size(val) for key, val in zip(self.keys, self.vals)]
+        starts = split_starts(sizes)
+        keys = self.keys
+        vals = self.vals
+        ends = starts[1:] + [len(keys)]
+        splits = []
+        for start, end in zip(starts, ends):
+            node = self if start == 0 else new_b_epsilon_tree_node(self.pager, self.free_list, True)
+            node.keys = keys[start:end]
+            node.vals = vals[start:end]
+            node.persist()
+            if start != 0:
+                splits.append((separator(keys[start - 1], keys[start]), node))
+        return splits
+
+    def split_internal(self) -> list[tuple[bytes, 'BEpsilonTreeNode']]:
+        """从中间的分隔 key 切成两半，它上移到父节点，缓冲区按它分开，两半各自再收尾"""
+        middle = len(self.keys) // 2
+        key_up = self.keys[middle]
+        right = new_b_epsilon_tree_node(self.pager, self.free_list, False)
+        right.keys = self.keys[middle + 1:]
+        right.children = self.children[middle + 1:]
+        right.messages = {key: message for key, message in self.messages.items() if key >= key_up}
+        self.keys = self.keys[:middle]
+        self.children = self.children[:middle + 1]
+        self.messages = {key: message for key, message in self.messages.items() if key < key_up}
+        return self.settle() + [(key_up, right)] + right.settle()
+
+    def delete_side(self, key: bytes, inclusive: bool, left: bool) -> None:
+        """
+        删除 key 一侧（left 为 True 时 < key，inclusive 时含 key）的全部记录和消息：
+        整个落在这一侧的子树直接释放，只沿包含 key 的路径向下
+        """
+        def inside(k: bytes) -> bool:
+            return (k < key if left else k > key) or (inclusive and k == key)
+
+        if self.is_leaf:
+            kept = [(k, v) for k, v in zip(self.keys, self.vals) if not inside(k)]
+            free_vals([v for k, v in zip(self.keys, self.vals) if inside(k)])
+            self.keys = [k for k, _ in kept]
+            self.vals = [v for _, v in kept]
+            self.persist()
+            return
+        for k in [k for k in self.messages if inside(k)]:
+            free_vals([self.messages.pop(k)[1]])
+        index = self.child_index(key)
+        if left:
+            dropped = self.children[:index]
+            self.keys = self.keys[index:]
+            self.children = self.children[index:]
+            index = 0
+        else:
+            dropped = self.children[index + 1:]
+            self.keys = self.keys[:index]
+            self.children = self.children[:index + 1]
+        for page_id in dropped:
+            new_b_epsilon_tree_node_from_page_id(self.pager, self.free_list, page_id).free_subtree()
+        child = self.child(index)
+        child.delete_side(key, inclusive, left)
+        self.shrink_child(index, child)
+        self.persist()
+
+    def free_subtree(self) -> None:
+        """释放整棵子树的页，包括记录和消息的溢出页"""
+        if self.is_leaf:
+            free_vals(self.vals)
+        else:
+            free_vals([val for _, val in self.messages.values()])
+            for index in range(len(self.children)):
+                self.child(index).free_subtree()
+        self.free_list.add_page_id(self.page_id)
+
+
+def val_size(val: bytes | Overflow) -> int:
+    return OVERFLOW_REF.size if isinstance(val, Overflow) else len(val)
+
+
+def message_size(key: bytes, val: bytes | Overflow) -> int:
+    return MESSAGE_ENTRY.size + len(key) + val_size(val)
+
+
+def encode_val(val: bytes | Overflow) -> tuple[int, bytes]:
+    """记录里的 val 长度和内容，溢出的 val 为 VAL_OVERFLOW 和溢出引用"""
+    if isinstance(val, Overflow):
+        return VAL_OVERFLOW, OVERFLOW_REF.pack(val.page_id, val.length)
+    return len(val), val
+
+
+def decode_val(pager: Pager, free_list: FreeList, view: memoryview, offset: int, length: int) \
+        -> tuple[bytes | Overflow, int]:
+    """返回 val 及其后的偏移"""
+    if length == VAL_OVERFLOW:
+        page_id, length_val = OVERFLOW_REF.unpack_from(view, offset)
+        return new_overflow_from_ref(pager, free_list, page_id, length_val), offset + OVERFLOW_REF.size
+    return view[offset:offset + length].tobytes(), offset + length
+
+
+def combine(old: Message, new: Message) -> Message:
+    """
+    同一 key 的两条消息合并成一条，new 较新。消息看作对记录的改写，合并即函数复合：
+    add 遇到已有的 upsert/add 不起作用，遇到 delete 变成 upsert
+    """
+    if new[0] != MSG_ADD:
+        return new
+    if old[0] == MSG_DELETE:
+        return MSG_UPSERT, new[1]
+    return old
+
+
+def apply_message(val: bytes | Overflow | None, message: Message) -> bytes | Overflow | None:
+    """记录当前的 val（不存在为 None）经过一条消息后的 val"""
+    op, val_new = message
+    if op == MSG_UPSERT:
+        return val_new
+    if op == MSG_DELETE:
+        return None
+    return val if val is not None else val_new
+
+
+def read_val(val: bytes | Overflow | None) -> bytes | None:
+    if isinstance(val, Overflow):
+        return val.read()
+    return val
+
+
+def new_b_epsilon_tree_node(pager: Pager, free_list: FreeList, is_leaf: bool) -> BEpsilonTreeNode:
+    node = BEpsilonTreeNode()
+    node.pager = pager
+    node.free_list = free_list
+    node.is_leaf = is_leaf
+    node.page_id = free_list.get_page_id()
+    node.keys = []
+    node.vals = []
+    node.children = []
+    node.messages = {}
+    return node
+
+
+def new_b_epsilon_tree_node_from_page_id(pager: Pager, free_list: FreeList, page_id: int) -> BEpsilonTreeNode:
+    """优先取节点缓存里已解码的对象，取到的对象被修改后必须 persist"""
+    node = pager.node_cache.get(page_id)
+    if node is not None:
+        return node
+    node = BEpsilonTreeNode()
+    node.pager = pager
+    node.free_list = free_list
+    view = pager.page_view(page_id)
+    is_leaf, _page_id, num_keys, num_messages, first_child = BE_NODE_HEADER.unpack_from(view)
+    if _page_id != page_id:
+        raise ValueError("page_id 错误")
+    node.is_leaf = is_leaf
+    node.page_id = page_id
+    node.keys = []
+    node.vals = []
+    node.children = [] if is_leaf else [first_child]
+    node.messages = {}
+    offset = BE_NODE_HEADER.size
+    for _ in range(num_keys):
+        if is_leaf:
+            length_key, length_val = LEAF_ENTRY.unpack_from(view, offset)
+            offset += LEAF_ENTRY.size
+            node.keys.append(view[offset:offset + length_key].tobytes())
+            val, offset = decode_val(pager, free_list, view, offset + length_key, length_val)
+            node.vals.append(val)
+        else:
+            length_key, child = PIVOT_ENTRY.unpack_from(view, offset)
+            offset += PIVOT_ENTRY.size
+            node.keys.append(view[offset:offset + length_key].tobytes())
+            node.children.append(child)
+            offset += length_key
+    for _ in range(num_messages):
+        op, length_key, length_val = MESSAGE_ENTRY.unpack_from(view, offset)
+        offset += MESSAGE_ENTRY.size
+        key = view[offset:offset + length_key].tobytes()
+        val, offset = decode_val(pager, free_list, view, offset + length_key, length_val)
+        node.messages[key] = (op, val)
+    pager.node_cache.put(page_id, node, node.size())
+    return node
+
+
+class BEpsilonTree:
+    """
+    写优化的 Bε 树，对外接口与 BPlusTree 的 get_*/range/add/upsert/delete_* 相同。
+    写入只作为消息放进根的缓冲区，缓冲区满了才成批推给子节点，一路推到叶节点，
+    每次页写入摊到多条记录上；查询沿路径把各层缓冲区里较新的消息合并到叶节点的记录上。
+    写者持根指针的独占闩到操作结束，读者整个读取期间持共享闩。
+    """
+
+    def __init__(self):
+        self.pager: Pager | None = None
+        self.free_list: FreeList | None = None
+        self.seq: int = 0
+
+    @property
+    def root(self) -> BEpsilonTreeNode:
+        """写者取根时对根指针加独占闩，到操作结束才放开"""
+        if self.pager.is_writer():
+            self.pager.latch_exclusive_gated(self.root_latch_key())
+        root_page_id = self.pager.root_page_id_get(self.seq)
+        return new_b_epsilon_tree_node_from_page_id(self.pager, self.free_list, root_page_id)
+
+    @root.setter
+    def root(self, root: BEpsilonTreeNode) -> None:
+        self.pager.root_page_id_set(self.seq, root.page_id)
+
+    def root_latch_key(self) -> tuple[str, int]:
+        return 'root', self.seq
+
+    @contextmanager
+    def reading(self):
+        """读者持根指针的共享闩，期间写者不会改树"""
+        with self.pager.latch_shared_gated(self.root_latch_key()):
+            yield new_b_epsilon_tree_node_from_page_id(self.pager, self.free_list,
+                                                       self.pager.root_page_id_get(self.seq))
+
+    def get_one(self, key: bytes) -> bytes | None:
+        with self.reading() as node:
+            messages = []
+            while not node.is_leaf:
+                message = node.messages.get(key)
+                if message is not None:
+                    messages.append(message)
+                node = node.child(node.child_index(key))
+            i = bisect.bisect_left(node.keys, key)
+            val = node.vals[i] if i < len(node.keys) and node.keys[i] == key else None
+            # 越靠上的消息越新，从下往上作用
+            for message in reversed(messages):
+                val = apply_message(val, message)
+            return read_val(val)
+
+    def get_all(self) -> list[bytes]:
+        return self.range()
+
+    def get_lt(self, key: bytes) -> list[bytes]:
+        return self.range(hi=key, hi_inclusive=False)
+
+    def get_le(self, key: bytes) -> list[bytes]:
+        return self.range(hi=key, hi_inclusive=True)
+
+    def get_gt(self, key: bytes) -> list[bytes]:
+        return self.range(lo=key, lo_inclusive=False)
+
+    def get_ge(self, key: bytes) -> list[bytes]:
+        return self.range(lo=key, lo_inclusive=True)
+
+    def range(self, lo: bytes | None = None, hi: bytes | None = None, lo_inclusive: bool = True,
+              hi_inclusive: bool = False, limit: int | None = None, offset: int = 0,
+              reverse: bool = False) -> list[bytes]:
+        """参数含义同 BPlusTree.range，没有子树记录数，offset 逐条跳过"""
+        vals = []
+        with self.reading() as root:
+            for _, val in self._scan(root, lo, hi, lo_inclusive, hi_inclusive, reverse, {}):
+                if offset > 0:
+                    offset -= 1
+                    continue
+                if limit is not None and len(vals) >= limit:
+                    break
+                vals.append(read_val(val))
+        return vals
+
+    def count(self) -> int:
+        """记录总数，要合并缓冲区里的消息，需扫描全部叶节点"""
+        with self.reading() as root:
+            return sum(1 for _ in self._scan(root, None, None, True, False, False, {}))
+
+    def _scan(self, node: BEpsilonTreeNode, lo: bytes | None, hi: bytes | None, lo_inclusive: bool,
+              hi_inclusive: bool, reverse: bool, pending: dict[bytes, Message]) \
+            -> Iterator[tuple[bytes, bytes | Overflow]]:
+        """按序产出 lo ~ hi 之间的记录，pending 为上层缓冲区里落在本子树的消息（已合并，比本节点的新）"""
+        def inside(key: bytes) -> bool:
+            return ((lo is None or key > lo or (lo_inclusive and key == lo))
+                    and (hi is None or key < hi or (hi_inclusive and key == hi)))
+
+        if node.is_leaf:
+            records = {key: val for key, val in zip(node.keys, node.vals) if inside(key)}
+            for key in sorted(records.keys() | pending.keys(), reverse=reverse):
+                val = records.get(key)
+                if key in pending:
+                    val = apply_message(val, pending[key])
+                if val is not None:
+                    yield key, val
+            return
+        pending = dict(pending)
+        for key, message in node.messages.items():
+            if inside(key):
+                pending[key] = combine(message, pending[key]) if key in pending else message
+        indexes = range(len(node.children))
+        for index in reversed(indexes) if reverse else indexes:
+            key_lo = node.keys[index - 1] if index > 0 else None
+            key_hi = node.keys[index] if index < len(node.keys) else None
+            if (key_lo is not None and hi is not None and key_lo > hi) or \
+                    (key_hi is not None and lo is not None and key_hi <= lo):
+                continue
+            child_pending = {key: message for key, message in pending.items()
+                             if (key_lo is None or key >= key_lo) and (key_hi is None or key < key_hi)}
+            yield from self._scan(node.child(index), lo, hi, lo_inclusive, hi_inclusive, reverse, child_pending)
+
+    def add(self, key_vals: list[tuple[bytes, bytes]]) -> None:
+        """已存在的 key 保持不变，批内重复的 key 保留第一条"""
+        self.write(key_vals, False)
+
+    def upsert(self, key_vals: list[tuple[bytes, bytes]]) -> None:
+        """批内重复的 key 保留最后一条"""
+        self.write(key_vals, True)
+
+    def write(self, key_vals: list[tuple[bytes, bytes]], replace: bool) -> None:
+        batch = {}
+        for key, val in key_vals:
+            check_key(key)
+            if replace or key not in batch:
+                batch[key] = val
+        if len(batch) == 0:
+            return
+        with self.pager.operation():
+            op = MSG_UPSERT if replace else MSG_ADD
+            self._put({key: (op, store_val(self.pager, self.free_list, key, val)) for key, val in batch.items()})
+
+    def delete_one(self, key: bytes) -> None:
+        with self.pager.operation():
+            self._put({key: (MSG_DELETE, b'')})
+
+    def _put(self, messages: dict[bytes, Message]) -> None:
+        """消息放进根：根是叶节点时直接归并，否则进缓冲区，满了再往下推；根被切开时新建一层"""
+        root = self.root
+        if root.is_leaf:
+            root.apply(messages)
+        else:
+            for key in sorted(messages):
+                root.put(key, messages[key])
+        splits = root.settle()
+        while len(splits) > 0:
+            new_root = new_b_epsilon_tree_node(self.pager, self.free_list, False)
+            new_root.keys = [key for key, _ in splits]
+            new_root.children = [root.page_id] + [node.page_id for _, node in splits]
+            splits = new_root.settle()
+            root = new_root
+        self._shrink_root(root)
+
+    def delete_lt(self, key: bytes) -> None:
+        """删除所有 key < k 的记录"""
+        self._delete_side(key, False, True)
+
+    def delete_le(self, key: bytes) -> None:
+        """删除所有 key <= k 的记录"""
+        self._delete_side(key, True, True)
+
+    def delete_gt(self, key: bytes) -> None:
+        """删除所有 key > k 的记录"""
+        self._delete_side(key, False, False)
+
+    def delete_ge(self, key: bytes) -> None:
+        """删除所有 key >= k 的记录"""
+        self._delete_side(key, True, False)
+
+    def _delete_side(self, key: bytes, inclusive: bool, left: bool) -> None:
+        with self.pager.operation():
+            root = self.root
+            root.delete_side(key, inclusive, left)
+            self._shrink_root(root)
+
+    def _shrink_root(self, root: BEpsilonTreeNode) -> None:
+        """根（内部节点）只剩一个子节点且缓冲区为空时下降一层，最后把根写进 meta"""
+        while not root.is_leaf and len(root.children) == 1 and len(root.messages) == 0:
+            old_root = root
+            root = root.child(0)
+            self.free_list.add_page_id(old_root.page_id)
+        if root.page_id != self.pager.root_page_id_get(self.seq):
+            self.root = root
+
+
+def new_b_epsilon_tree(pager: Pager, free_list: FreeList, seq: int, is_seq_new: bool) -> BEpsilonTree:
+    if pager.cow:
+        raise ValueError("写时复制模式不支持 Bε 树")
+    tree = BEpsilonTree()
+    tree.pager = pager
+    tree.free_list = free_list
+    tree.seq = seq
+    if is_seq_new:
+        with pager.operation():
+            root = new_b_epsilon_tree_node(pager, free_list, True)
+            root.persist()
+            tree.root = root
+    return tree
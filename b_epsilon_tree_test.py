@@ -0,0 +1,272 @@
+import inspect
+import os
+import random
+import threading
+import pytest
+
+from b_epsilon_tree import BEpsilonTree, BEpsilonTreeNode, new_b_epsilon_tree, new_b_epsilon_tree_node_from_page_id, \
+    MSG_UPSERT, MSG_ADD, MSG_DELETE, combine
+from const import META_PAGE_ID, BYTES_PAGE, BE_FANOUT, NULL_PAGE_ID
+from file import file_open
+from free_list import FreeList, new_free_list, new_free_list_node_from_page_id
+from overflow import Overflow
+from pager import new_pager
+
+
+def init(name: str) -> tuple[int, BEpsilonTree]:
+    fd = file_open(f'{name}.db')
+    pager = new_pager(fd)
+    free_list = new_free_list(pager, META_PAGE_ID)
+    tree = new_b_epsilon_tree(pager, free_list, 0, True)
+    return fd, tree
+
+
+def close(fd: int, name: str) -> None:
+    os.close(fd)
+    os.remove(f'{name}.db')
+
+
+def check_nodes(node: BEpsilonTreeNode, lo: bytes | None, hi: bytes | None) -> int:
+    """校验每页能编码、key 落在父节点划分的区间内、叶节点深度相同、有兄弟的子树不为空，返回树高"""
+    assert len(bytes(node)) <= BYTES_PAGE
+    keys = node.keys if node.is_leaf else node.keys + list(node.messages)
+    for key in keys:
+        assert (lo is None or key >= lo) and (hi is None or key < hi)
+    assert node.keys == sorted(node.keys)
+    if node.is_leaf:
+        return 1
+    assert len(node.children) == len(node.keys) + 1 <= BE_FANOUT + 1
+    bounds = [lo] + node.keys + [hi]
+    heights = set()
+    for index, page_id in enumerate(node.children):
+        child = new_b_epsilon_tree_node_from_page_id(node.pager, node.free_list, page_id)
+        heights.add(check_nodes(child, bounds[index], bounds[index + 1]))
+        assert len(node.children) == 1 or not child.is_empty()
+    assert len(heights) == 1
+    return heights.pop() + 1
+
+
+def root_of(tree: BEpsilonTree) -> BEpsilonTreeNode:
+    return new_b_epsilon_tree_node_from_page_id(tree.pager, tree.free_list, tree.pager.root_page_id_get(tree.seq))
+
+
+def test_combine():
+    assert combine((MSG_UPSERT, b'a'), (MSG_ADD, b'b')) == (MSG_UPSERT, b'a')
+    assert combine((MSG_ADD, b'a'), (MSG_ADD, b'b')) == (MSG_ADD, b'a')
+    assert combine((MSG_DELETE, b''), (MSG_ADD, b'b')) == (MSG_UPSERT, b'b')
+    assert combine((MSG_ADD, b'a'), (MSG_UPSERT, b'b')) == (MSG_UPSERT, b'b')
+    assert combine((MSG_UPSERT, b'a'), (MSG_DELETE, b'')) == (MSG_DELETE, b'')
+
+
+def test_add_get():
+    name = inspect.currentframe().f_code.co_name
+    fd, tree = init(name)
+    keys = [b'%05d' % i for i in range(5000)]
+    random.Random(0).shuffle(keys)
+    for i in range(0, len(keys), 50):
+        tree.add([(key, key * 3) for key in keys[i:i + 50]])
+    tree.add([(keys[0], b'x')])
+    assert tree.get_one(keys[0]) == keys[0] * 3
+    assert tree.get_one(b'x') is None
+    assert check_nodes(root_of(tree), None, None) >= 3
+    keys.sort()
+    assert tree.get_all() == [key * 3 for key in keys]
+    assert tree.count() == len(keys)
+    # 内部节点的缓冲区里还有没推下去的消息
+    assert len(root_of(tree).messages) > 0
+    close(fd, name)
+
+
+def test_range():
+    name = inspect.currentframe().f_code.co_name
+    fd, tree = init(name)
+    keys = [b'%04d' % i for i in range(0, 3000, 2)]
+    tree.upsert([(key, key) for key in keys])
+    assert tree.range(b'0100', b'0110') == keys[50:55]
+    assert tree.range(b'0100', b'0110', lo_inclusive=False, hi_inclusive=True) == keys[51:56]
+    assert tree.range(b'0100', b'0110', reverse=True) == keys[54:49:-1]
+    assert tree.range(b'0100', limit=3, offset=2) == keys[52:55]
+    assert tree.get_lt(b'0004') == keys[:2]
+    assert tree.get_le(b'0004') == keys[:3]
+    assert tree.get_gt(b'2994') == keys[-2:]
+    assert tree.get_ge(b'2994') == keys[-3:]
+    close(fd, name)
+
+
+def test_delete_side():
+    name = inspect.currentframe().f_code.co_name
+    fd, tree = init(name)
+    keys = [b'%04d' % i for i in range(3000)]
+    tree.upsert([(key, key * 20) for key in keys])
+    tree.delete_lt(b'0500')
+    tree.delete_ge(b'2500')
+    tree.delete_le(b'1000')
+    tree.delete_gt(b'1999')
+    assert tree.get_all() == [key * 20 for key in keys[1001:2000]]
+    check_nodes(root_of(tree), None, None)
+    tree.delete_ge(b'')
+    assert tree.get_all() == []
+    assert root_of(tree).is_leaf
+    close(fd, name)
+
+
+def test_random():
+    """随机的 add / upsert / delete 与 dict 比对，val 有长有短（含溢出页）"""
+    name = inspect.currentframe().f_code.co_name
+    fd, tree = init(name)
+    rnd = random.Random(0)
+    ref = {}
+    for step in range(3000):
+        r = rnd.random()
+        key = b'%04d' % rnd.randrange(2000)
+        if r < 0.4:
+            key_vals = [(b'%04d' % rnd.randrange(2000), b'v%d' % step * rnd.choice((1, 5, 200)))
+                        for _ in range(rnd.randrange(1, 20))]
+            tree.upsert(key_vals)
+            ref.update(key_vals)
+        elif r < 0.7:
+            val = b'a%d' % step * rnd.choice((1, 300))
+            tree.add([(key, val)])
+            ref.setdefault(key, val)
+        elif r < 0.95:
+            tree.delete_one(key)
+            ref.pop(key, None)
+        elif r < 0.97:
+            tree.delete_lt(key)
+            ref = {k: v for k, v in ref.items() if k >= key}
+        else:
+            tree.delete_gt(key)
+            ref = {k: v for k, v in ref.items() if k <= key}
+        if step % 500 == 0:
+            check_nodes(root_of(tree), None, None)
+            for k in rnd.sample(range(2000), 50):
+                assert tree.get_one(b'%04d' % k) == ref.get(b'%04d' % k)
+    check_nodes(root_of(tree), None, None)
+    assert tree.get_all() == [ref[key] for key in sorted(ref)]
+    assert tree.get_ge(b'1000') == [ref[key] for key in sorted(ref) if key >= b'1000']
+    for key in ref:
+        assert tree.get_one(key) == ref[key]
+    close(fd, name)
+
+
+def tree_page_ids(node: BEpsilonTreeNode) -> set[int]:
+    """子树用到的全部页，含溢出页"""
+    vals = node.vals if node.is_leaf else [val for _, val in node.messages.values()]
+    page_ids = {node.page_id}
+    for val in vals:
+        if isinstance(val, Overflow):
+            page_ids.update(val.page_ids())
+    for page_id in node.children:
+        page_ids |= tree_page_ids(new_b_epsilon_tree_node_from_page_id(node.pager, node.free_list, page_id))
+    return page_ids
+
+
+def free_page_ids(free_list: FreeList) -> set[int]:
+    page_ids = set()
+    node = free_list.head
+    while True:
+        page_ids.update(node.page_ids[node.unused:])
+        if node.next_page_id == NULL_PAGE_ID:
+            return page_ids
+        node = new_free_list_node_from_page_id(free_list.pager, node.next_page_id)
+
+
+def test_pages_freed():
+    """全部删掉后除了根都回到空闲链"""
+    name = inspect.currentframe().f_code.co_name
+    fd, tree = init(name)
+    tree.upsert([(b'%04d' % i, b'x' * size) for i, size in zip(range(2000), [10, 1000, 3000] * 700)])
+    page_ids = tree_page_ids(root_of(tree))
+    assert len(page_ids) > 100
+    tree.delete_ge(b'')
+    root = root_of(tree)
+    assert page_ids - free_page_ids(tree.free_list) == {root.page_id}
+    close(fd, name)
+
+
+def test_delete_child_range():
+    """根的一个子节点的区间整个删掉后，不论是推下去的删除消息还是 delete_side 删空的，空子树都被去掉并释放"""
+    name = inspect.currentframe().f_code.co_name
+    fd, tree = init(name)
+    keys = [b'%04d' % i for i in range(3000)]
+    tree.upsert([(key, key * 20) for key in keys])
+    root = root_of(tree)
+    assert check_nodes(root, None, None) == 3
+    num_children = len(root.children)
+    lo, hi = root.keys[0], root.keys[1]
+    doomed = [key for key in keys if lo <= key < hi]
+    page_ids = tree_page_ids(root)
+    for key in doomed:
+        tree.delete_one(key)
+    # 区间里不存在的 key 的删除消息撑满缓冲区，把消息一批批推到这棵子树
+    for i in range(10):
+        for key in doomed:
+            tree.delete_one(key + b'x%d' % i)
+    root = root_of(tree)
+    assert len(root.children) == num_children - 1
+    check_nodes(root, None, None)
+    assert tree.get_all() == [key * 20 for key in keys if not lo <= key < hi]
+    assert page_ids - tree_page_ids(root) <= free_page_ids(tree.free_list)
+
+    # delete_side 删空根的第二个子节点，根只剩第一个（缓冲区里还有删除消息，根不下降）
+    page_ids = tree_page_ids(root)
+    lo = root.keys[0]
+    tree.delete_ge(lo)
+    root = root_of(tree)
+    assert len(root.children) == 1
+    check_nodes(root, None, None)
+    assert tree.get_all() == [key * 20 for key in keys if key < lo and key not in doomed]
+    assert page_ids - tree_page_ids(root) <= free_page_ids(tree.free_list)
+    close(fd, name)
+
+
+def test_reopen():
+    name = inspect.currentframe().f_code.co_name
+    fd, tree = init(name)
+    keys = [b'%04d' % i for i in range(2000)]
+    tree.upsert([(key, key) for key in keys])
+    tree.delete_one(keys[0])
+    tree.pager.node_cache.clear()
+    assert tree.get_all() == keys[1:]
+    tree_2 = new_b_epsilon_tree(tree.pager, tree.free_list, 0, False)
+    assert tree_2.get_one(keys[1]) == keys[1]
+    close(fd, name)
+
+
+def test_concurrent():
+    """读者与写者并发，读者看到的始终是完整的某次操作之后的状态"""
+    name = inspect.currentframe().f_code.co_name
+    fd, tree = init(name)
+    stable = [b'%04d' % i for i in range(0, 3000, 3)]
+    tree.upsert([(key, key) for key in stable])
+    stop = threading.Event()
+    errors = []
+
+    def reader() -> None:
+        try:
+            while not stop.is_set():
+                assert set(stable) <= set(tree.range(b'0000', b'3000'))
+                assert tree.get_one(stable[100]) == stable[100]
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=reader) for _ in range(3)]
+    for t in readers:
+        t.start()
+    rnd = random.Random(0)
+    for _ in range(300):
+        key = b'%04d' % (rnd.randrange(1000) * 3 + 1)
+        if rnd.random() < 0.6:
+            tree.upsert([(key, key)])
+        else:
+            tree.delete_one(key)
+    stop.set()
+    for t in readers:
+        t.join(10)
+        assert not t.is_alive()
+    assert errors == []
+    close(fd, name)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -1,10 +1,38 @@
-from const import NULL_PAGE_ID, DEGREE
+import bisect
+import random
+import struct
+from typing import Callable, Iterable
+
+from bloom import BloomFilter, new_bloom_filter, new_bloom_filter_from_page_id
+from const import NULL_PAGE_ID, BYTES_PAGE, BYTES_NODE, BYTES_NODE_MIN, BYTES_NODE_HEADER, BYTES_ENTRY_MAX, \
+    BYTES_KEY_MAX, BYTES_VAL_INLINE_MAX
+from extent import ExtentFreeList, new_extent_free_list
 from free_list import FreeList
-from pager import Pager
-from utils import to_bytes, from_buf
+from overflow import Overflow, new_overflow, new_overflow_from_ref, BYTES_OVERFLOW_DATA
+from pager import Pager, Snapshot
+
+# 页头：is_leaf | page_id | left_page_id | right_page_id | num_keys | page_ids[0] | counts[0]（仅内部节点）| 公共前缀长度
+NODE_HEADER = struct.Struct('>?qqqHqqH')
+# 叶节点记录：key 后缀长度 | val 长度 | key 后缀 | val
+LEAF_ENTRY = struct.Struct('>HH')
+# val 长度为 VAL_OVERFLOW 时 val 存在溢出页上，记录里放溢出引用：首页 page_id | val 长度
+VAL_OVERFLOW = 0xFFFF
+OVERFLOW_REF = struct.Struct('>qq')
+# 内部节点记录：key 后缀长度 | key 右侧子节点的 page_id | 该子树的记录数 | key 后缀
+INTERNAL_ENTRY = struct.Struct('>Hqq')
+SLOT = struct.Struct('>H')
 
 
 class BPlusTreeNode:
+    """
+    页内为 slotted 布局：页头之后是本页所有 key 的公共前缀，然后是按 key 排序的 slot 数组，
+    每个 slot 是一条记录在页内的偏移，记录从页尾向前存放，记录里只存 key 去掉公共前缀后的部分。
+    从页读出的节点只持有页的视图，查找直接在视图上对 slot 二分，只解码命中的记录；
+    keys/vals/page_ids 第一次被访问时才整体解码，之后以列表为准。
+    大 val 存在溢出页上，vals 里是 Overflow 引用，val_at 取值时才读溢出页。
+    内部节点为每个子节点记录其子树的记录数 counts，计数、排名和按序号定位只需走一条路径。
+    写时复制模式下 persist 把已提交的节点换到新页，父节点随后改指针，一直到根；这种树不维护叶链。
+    """
 
     def __init__(self):
         self.pager: Pager | None = None
@@ -13,472 +41,655 @@ class BPlusTreeNode:
         self.page_id: int = 0
         self.left_page_id: int = 0
         self.right_page_id: int = 0
-        self.keys: list[bytes] = []
-        self.vals: list[bytes] = []
-        self.page_ids: list[int] = []
+        self.view: memoryview | None = None
+        self.num_keys: int = 0
+        self.prefix: bytes = b''
+        self._keys: list[bytes] | None = []
+        self._vals: list[bytes | Overflow] | None = []
+        self._page_ids: list[int] | None = []
+        self._counts: list[int] | None = []
 
     def __bytes__(self) -> bytes:
-        r = b''
-        r += to_bytes(self.is_leaf)
-        r += to_bytes(self.page_id)
-        r += to_bytes(self.left_page_id)
-        r += to_bytes(self.right_page_id)
-        r += to_bytes(len(self.keys))
-        for key in self.keys:
-            r += to_bytes(key)
+        if self._keys is None:
+            # 只改了页头（如叶链表指针），直接在原页上覆盖
+            bs = bytearray(self.view)
+            first_page_id, first_count = (0, 0) if self.is_leaf else (self.page_id_at(0), self.count_at(0))
+            NODE_HEADER.pack_into(bs, 0, self.is_leaf, self.page_id, self.left_page_id, self.right_page_id,
+                                  self.num_keys, first_page_id, first_count, len(self.prefix))
+            return bytes(bs)
+        prefix = common_prefix(self._keys)
+        entries = []
+        for i, key in enumerate(self._keys):
+            suffix = key[len(prefix):]
+            if self.is_leaf:
+                val = self._vals[i]
+                if isinstance(val, Overflow):
+                    ref = OVERFLOW_REF.pack(val.page_id, val.length)
+                    entries.append(LEAF_ENTRY.pack(len(suffix), VAL_OVERFLOW) + suffix + ref)
+                else:
+                    entries.append(LEAF_ENTRY.pack(len(suffix), len(val)) + suffix + val)
+            else:
+                entries.append(INTERNAL_ENTRY.pack(len(suffix), self._page_ids[i + 1], self._counts[i + 1]) + suffix)
+        slots = []
+        offset = BYTES_PAGE
+        for entry in entries:
+            offset -= len(entry)
+            slots.append(offset)
+        first_page_id, first_count = (0, 0) if self.is_leaf else (self._page_ids[0], self._counts[0])
+        header = NODE_HEADER.pack(self.is_leaf, self.page_id, self.left_page_id, self.right_page_id,
+                                  len(self._keys), first_page_id, first_count, len(prefix))
+        slot_bs = b''.join(SLOT.pack(slot) for slot in slots)
+        gap = offset - len(header) - len(prefix) - len(slot_bs)
+        if gap < 0:
+            raise ValueError("page 溢出")
+        return header + prefix + slot_bs + b'\x00' * gap + b''.join(reversed(entries))
+
+    @property
+    def keys(self) -> list[bytes]:
+        self.decode()
+        return self._keys
+
+    @keys.setter
+    def keys(self, keys: list[bytes]) -> None:
+        self.decode()
+        self._keys = keys
+
+    @property
+    def vals(self) -> list[bytes | Overflow]:
+        self.decode()
+        return self._vals
+
+    @vals.setter
+    def vals(self, vals: list[bytes | Overflow]) -> None:
+        self.decode()
+        self._vals = vals
+
+    @property
+    def page_ids(self) -> list[int]:
+        self.decode()
+        return self._page_ids
+
+    @page_ids.setter
+    def page_ids(self, page_ids: list[int]) -> None:
+        self.decode()
+        self._page_ids = page_ids
+
+    @property
+    def counts(self) -> list[int]:
+        self.decode()
+        return self._counts
+
+    @counts.setter
+    def counts(self, counts: list[int]) -> None:
+        self.decode()
+        self._counts = counts
+
+    def decode(self) -> None:
+        if self._keys is not None:
+            return
+        n = self.num_keys
+        keys = [self.key_at(i) for i in range(n)]
+        vals = []
+        page_ids = []
+        counts = []
         if self.is_leaf:
-            r += to_bytes(len(self.vals))
-            for val in self.vals:
-                r += to_bytes(val)
+            vals = [self.stored_val_at(i) for i in range(n)]
         else:
-            r += to_bytes(len(self.page_ids))
-            for page_id in self.page_ids:
-                r += to_bytes(page_id)
-        return r
-
-    def get_lt(self, key: bytes) -> list[bytes]:
-        if self.is_leaf:
-            result = self._get_lt(key)
-            return result
-        index = self.get_page_id_index(key)
-        page_id = self.page_ids[index]
-        child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, page_id)
-        result = child.get_lt(key)
-        return result
-
-    def _get_lt(self, key: bytes) -> list[bytes]:
-        result = []
-        i = len(self.keys) - 1
-        while i >= 0 and self.keys[i] >= key:
-            i = i - 1
-        # while i >= 0:
-        #     val = self.vals[i]
-        #     result.append(val)
-        #     i = i - 1
-        if i >= 0:
-            vals = self.vals[:i + 1]
-            result.extend(vals)
-        result_left = self._get_left()
-        result = result_left + result
-        return result
-
-    def get_le(self, key: bytes) -> list[bytes]:
-        if self.is_leaf:
-            result = self._get_le(key)
-            return result
-        index = self.get_page_id_index(key)
-        page_id = self.page_ids[index]
-        child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, page_id)
-        result = child.get_le(key)
-        return result
-
-    def _get_le(self, key: bytes) -> list[bytes]:
-        result = []
-        i = len(self.keys) - 1
-        while i >= 0 and self.keys[i] > key:
-            i = i - 1
-        # while i >= 0:
-        #     val = self.vals[i]
-        #     result.append(val)
-        #     i = i - 1
-        if i >= 0:
-            vals = self.vals[:i + 1]
-            result.extend(vals)
-        result_left = self._get_left()
-        result = result_left + result
-        return result
-
-    def get_gt(self, key: bytes) -> list[bytes]:
+            page_ids = [self.page_id_at(i) for i in range(n + 1)]
+            counts = [self.count_at(i) for i in range(n + 1)]
+        # 多个读者可能同时解码同一个缓存的节点，_keys 最后赋值，它不为 None 时其余列表已就绪
+        self._vals = vals
+        self._page_ids = page_ids
+        self._counts = counts
+        self._keys = keys
+
+    def key_count(self) -> int:
+        if self._keys is not None:
+            return len(self._keys)
+        return self.num_keys
+
+    def slot_at(self, i: int) -> int:
+        offset, = SLOT.unpack_from(self.view, BYTES_NODE_HEADER + len(self.prefix) + SLOT.size * i)
+        return offset
+
+    def key_at(self, i: int) -> bytes:
+        if self._keys is not None:
+            return self._keys[i]
+        return self.prefix + self.suffix_at(i)
+
+    def suffix_at(self, i: int) -> bytes:
+        """页上第 i 个 key 去掉公共前缀的部分"""
+        offset = self.slot_at(i)
         if self.is_leaf:
-            result = self._get_gt(key)
-            return result
-        index = self.get_page_id_index(key)
-        page_id = self.page_ids[index]
-        child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, page_id)
-        result = child.get_gt(key)
-        return result
-
-    def _get_gt(self, key: bytes) -> list[bytes]:
-        result = []
-        i = 0
-        while i < len(self.keys) and self.keys[i] <= key:
-            i = i + 1
-        # while i < len(self.keys):
-        #     val = self.vals[i]
-        #     result.append(val)
-        #     i = i + 1
-        if i < len(self.keys):
-            vals = self.vals[i:]
-            result.extend(vals)
-        result_right = self._get_right()
-        result.extend(result_right)
-        return result
+            length, _ = LEAF_ENTRY.unpack_from(self.view, offset)
+            offset += LEAF_ENTRY.size
+        else:
+            length, _, _ = INTERNAL_ENTRY.unpack_from(self.view, offset)
+            offset += INTERNAL_ENTRY.size
+        return self.view[offset:offset + length].tobytes()
+
+    def val_at(self, i: int) -> bytes:
+        val = self.stored_val_at(i)
+        if isinstance(val, Overflow):
+            return val.read()
+        return val
 
-    def get_ge(self, key: bytes) -> list[bytes]:
+    def stored_val_at(self, i: int) -> bytes | Overflow:
+        """第 i 个 val 在节点里存的形式，溢出的 val 只返回引用"""
+        if self._keys is not None:
+            return self._vals[i]
+        offset = self.slot_at(i)
+        length_key, length_val = LEAF_ENTRY.unpack_from(self.view, offset)
+        offset += LEAF_ENTRY.size + length_key
+        if length_val == VAL_OVERFLOW:
+            page_id, length = OVERFLOW_REF.unpack_from(self.view, offset)
+            return new_overflow_from_ref(self.pager, self.free_list, page_id, length)
+        return self.view[offset:offset + length_val].tobytes()
+
+    def page_id_at(self, i: int) -> int:
+        """第 i 个子节点，内部节点的 page_ids[0] 在页头，其余跟在 keys[i - 1] 的记录里"""
+        if self._keys is not None:
+            return self._page_ids[i]
+        if i == 0:
+            return NODE_HEADER.unpack_from(self.view)[5]
+        offset = self.slot_at(i - 1)
+        _, page_id, _ = INTERNAL_ENTRY.unpack_from(self.view, offset)
+        return page_id
+
+    def count_at(self, i: int) -> int:
+        """第 i 个子树的记录数，存放位置同 page_id_at"""
+        if self._keys is not None:
+            return self._counts[i]
+        if i == 0:
+            return NODE_HEADER.unpack_from(self.view)[6]
+        offset = self.slot_at(i - 1)
+        _, _, count = INTERNAL_ENTRY.unpack_from(self.view, offset)
+        return count
+
+    def count(self) -> int:
+        """本子树的记录数"""
         if self.is_leaf:
-            result = self._get_ge(key)
-            return result
-        index = self.get_page_id_index(key)
-        page_id = self.page_ids[index]
-        child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, page_id)
-        result = child.get_ge(key)
-        return result
-
-    def _get_ge(self, key: bytes) -> list[bytes]:
-        result = []
-        i = 0
-        while i < len(self.keys) and self.keys[i] < key:
-            i = i + 1
-        # while i < len(self.keys):
-        #     val = self.vals[i]
-        #     result.append(val)
-        #     i = i + 1
-        if i < len(self.keys):
-            vals = self.vals[i:]
-            result.extend(vals)
-        result_right = self._get_right()
-        result.extend(result_right)
-        return result
-
-    def _get_left(self) -> list[bytes]:
-        result = []
-        node = self
-        while node.left_page_id != NULL_PAGE_ID:
-            node = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, node.left_page_id)
-            result = node.vals + result
-        return result
-
-    def _get_right(self) -> list[bytes]:
-        result = []
-        node = self
-        while node.right_page_id != NULL_PAGE_ID:
-            node = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, node.right_page_id)
-            result.extend(node.vals)
-        return result
+            return self.key_count()
+        return sum(self.count_at(i) for i in range(self.key_count() + 1))
+
+    def bisect_left(self, key: bytes) -> int:
+        """第一个 >= key 的下标"""
+        if self._keys is not None:
+            return bisect.bisect_left(self._keys, key)
+        if not key.startswith(self.prefix):
+            # 与公共前缀不同，key 比本页所有 key 都小或都大
+            return 0 if key < self.prefix else self.num_keys
+        suffix = key[len(self.prefix):]
+        lo, hi = 0, self.num_keys
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.suffix_at(mid) < suffix:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def bisect_right(self, key: bytes) -> int:
+        """第一个 > key 的下标"""
+        if self._keys is not None:
+            return bisect.bisect_right(self._keys, key)
+        if not key.startswith(self.prefix):
+            return 0 if key < self.prefix else self.num_keys
+        suffix = key[len(self.prefix):]
+        lo, hi = 0, self.num_keys
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if suffix < self.suffix_at(mid):
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
 
     def get_one(self, key: bytes) -> bytes | None:
         if self.is_leaf:
             result = self._get_one(key)
             return result
         index = self.get_page_id_index(key)
-        page_id = self.page_ids[index]
+        page_id = self.page_id_at(index)
         child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, page_id)
         result = child.get_one(key)
         return result
 
     def _get_one(self, key: bytes) -> bytes | None:
-        try:
-            i = self.keys.index(key)
-        except ValueError:
+        i = self.bisect_left(key)
+        if i == self.key_count() or self.key_at(i) != key:
             return None
-        val = self.vals[i]
+        val = self.val_at(i)
         return val
 
     def get_page_id_index(self, key: bytes) -> int:
-        i = len(self.keys) - 1
-        while i >= 0 and key < self.keys[i]:
-            i = i - 1
-        i = i + 1
-        return i
+        return self.bisect_right(key)
 
-    def add(self, key: bytes, val: bytes) -> None:
+    def write(self, key_vals: list[tuple[bytes, bytes]], replace: bool) -> list[tuple[bytes, 'BPlusTreeNode']]:
+        """
+        批量写入，key_vals 已按 key 排序且不重复，replace 为 False 时不覆盖已有的 key（add）。
+        每个子节点只下降一次，带上落在它区间里的全部记录；本节点修改后只写一次，
+        放不下一页时切成若干个节点，返回新增的右侧节点及其分隔 key，由父节点插入。
+        """
         if self.is_leaf:
-            self._add(key, val)
-            self.persist()
-            return
-
-        index = self.get_page_id_index(key)
-        page_id = self.page_ids[index]
-        child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, page_id)
-        if not child.is_full():
-            child.add(key, val)
-            return
-
-        # self not leaf
-        # child is full
-        if child.is_leaf:
-            self.keys.insert(index, child.keys[DEGREE])
+            changed = self._write(key_vals, replace)
         else:
-            self.keys.insert(index, child.keys[DEGREE - 1])
-        child_new = child.split()
-        self.page_ids.insert(index + 1, child_new.page_id)
-        self.persist()
-        if key > self.keys[index]:
-            child_new.add(key, val)
-        else:
-            child.add(key, val)
-        return
-
-    def _add(self, key: bytes, val: bytes) -> None:
-        i = len(self.keys) - 1
-        while i >= 0 and key < self.keys[i]:
-            i = i - 1
-        if not (i >= 0 and key == self.keys[i]):
-            i = i + 1
-            self.keys.insert(i, key)
-            self.vals.insert(i, val)
-
-    def upsert(self, key: bytes, val: bytes) -> None:
-        if self.is_leaf:
-            self._upsert(key, val)
+            changed = False
+            splits = []
+            start = 0
+            while start < len(key_vals):
+                index = self.get_page_id_index(key_vals[start][0])
+                end = len(key_vals)
+                if index < self.key_count():
+                    end = bisect.bisect_left(key_vals, self.key_at(index), start, key=lambda key_val: key_val[0])
+                child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, self.page_id_at(index))
+                child_splits = child.write(key_vals[start:end], replace)
+                if len(child_splits) > 0:
+                    splits.append((index, child_splits))
+                if child.page_id != self.page_id_at(index):
+                    # 写时复制时子节点换了页
+                    self.page_ids[index] = child.page_id
+                    changed = True
+                count = child.count()
+                if count != self.count_at(index):
+                    self.counts[index] = count
+                    changed = True
+                start = end
+            # 从右往左插入，前面的下标不受影响
+            for index, child_splits in reversed(splits):
+                self.keys[index:index] = [key for key, _ in child_splits]
+                self.page_ids[index + 1:index + 1] = [node.page_id for _, node in child_splits]
+                self.counts[index + 1:index + 1] = [node.count() for _, node in child_splits]
+                changed = True
+
+        if not changed:
+            return []
+        if self.size() <= BYTES_NODE:
             self.persist()
-            return
-
-        index = self.get_page_id_index(key)
-        page_id = self.page_ids[index]
-        child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, page_id)
-        if not child.is_full():
-            child.upsert(key, val)
-            return
-
-        # self not leaf
-        # child is full
-        if child.is_leaf:
-            self.keys.insert(index, child.keys[DEGREE])
-        else:
-            self.keys.insert(index, child.keys[DEGREE - 1])
-        child_new = child.split()
-        self.page_ids.insert(index + 1, child_new.page_id)
-        self.persist()
-        if key > self.keys[index]:
-            child_new.upsert(key, val)
-        else:
-            child.upsert(key, val)
-        return
-
-    def _upsert(self, key: bytes, val: bytes) -> None:
-        i = len(self.keys) - 1
-        while i >= 0 and key < self.keys[i]:
-            i = i - 1
-        if i >= 0 and key == self.keys[i]:
-            self.vals[i] = val
-        else:
-            i = i + 1
-            self.keys.insert(i, key)
-            self.vals.insert(i, val)
-
-    def update_lt(self, key_search: bytes, index: int, val: bytes) -> None:
+            return []
+        return self.split()
+
+    def _write(self, key_vals: list[tuple[bytes, bytes]], replace: bool) -> bool:
+        """与叶节点已有的记录归并，返回是否有改动"""
+        keys = []
+        vals = []
+        changed = False
+        i = 0
+        for key, val in key_vals:
+            while i < len(self.keys) and self.keys[i] < key:
+                keys.append(self.keys[i])
+                vals.append(self.vals[i])
+                i = i + 1
+            if i < len(self.keys) and self.keys[i] == key:
+                if replace and self.vals[i] != val:
+                    free_vals(self.vals[i:i + 1])
+                    keys.append(key)
+                    vals.append(store_val(self.pager, self.free_list, key, val))
+                    changed = True
+                else:
+                    keys.append(self.keys[i])
+                    vals.append(self.vals[i])
+                i = i + 1
+            else:
+                keys.append(key)
+                vals.append(store_val(self.pager, self.free_list, key, val))
+                changed = True
+        keys.extend(self.keys[i:])
+        vals.extend(self.vals[i:])
+        self.keys = keys
+        self.vals = vals
+        return changed
+
+    def update_lt(self, key_search: bytes, index: int, val: bytes) -> list[tuple[bytes, bytes]]:
+        """改写 key 在 key_search 左侧的 val，返回改写后放不下本叶节点的记录（见 _update_range）"""
         if self.is_leaf:
-            self._update_lt(key_search, index, val)
+            grown = self._update_lt(key_search, index, val)
             self.persist()
-            return
+            return grown
 
-        index = self.get_page_id_index(key_search)
-        page_id = self.page_ids[index]
+        i = self.get_page_id_index(key_search)
+        page_id = self.page_id_at(i)
         child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, page_id)
-        child.update_lt(key_search, index, val)
-        return
+        grown = child.update_lt(key_search, index, val)
+        if self.pager.cow:
+            grown += self._update_children(range(i), index, val)
+            self.page_ids[i] = child.page_id
+            self.persist()
+        return grown
 
-    def _update_lt(self, key_search: bytes, index: int, val: bytes) -> None:
+    def _update_lt(self, key_search: bytes, index: int, val: bytes) -> list[tuple[bytes, bytes]]:
         i = len(self.keys) - 1
         while i >= 0 and key_search < self.keys[i]:
             i = i - 1
-        while i >= 0:
-            val_in = self.vals[i]
-            val_out = val_in[:index] + val + val_in[index + len(val):]
-            self.vals[i] = val_out
-            i = i - 1
-        self._update_left(index, val)
+        grown = self._update_range(range(i + 1), index, val)
+        return grown + self._update_left(index, val)
 
-    def update_le(self, key_search: bytes, index: int, val: bytes) -> None:
+    def update_le(self, key_search: bytes, index: int, val: bytes) -> list[tuple[bytes, bytes]]:
         if self.is_leaf:
-            self._update_le(key_search, index, val)
+            grown = self._update_le(key_search, index, val)
             self.persist()
-            return
+            return grown
 
-        index = self.get_page_id_index(key_search)
-        page_id = self.page_ids[index]
+        i = self.get_page_id_index(key_search)
+        page_id = self.page_id_at(i)
         child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, page_id)
-        child.update_le(key_search, index, val)
-        return
+        grown = child.update_le(key_search, index, val)
+        if self.pager.cow:
+            grown += self._update_children(range(i), index, val)
+            self.page_ids[i] = child.page_id
+            self.persist()
+        return grown
 
-    def _update_le(self, key_search: bytes, index: int, val: bytes) -> None:
+    def _update_le(self, key_search: bytes, index: int, val: bytes) -> list[tuple[bytes, bytes]]:
         i = len(self.keys) - 1
         while i >= 0 and key_search <= self.keys[i]:
             i = i - 1
-        while i >= 0:
-            val_in = self.vals[i]
-            val_out = val_in[:index] + val + val_in[index + len(val):]
-            self.vals[i] = val_out
-            i = i - 1
-        self._update_left(index, val)
+        grown = self._update_range(range(i + 1), index, val)
+        return grown + self._update_left(index, val)
 
-    def update_gt(self, key_search: bytes, index: int, val: bytes) -> None:
+    def update_gt(self, key_search: bytes, index: int, val: bytes) -> list[tuple[bytes, bytes]]:
         if self.is_leaf:
-            self._update_gt(key_search, index, val)
+            grown = self._update_gt(key_search, index, val)
             self.persist()
-            return
+            return grown
 
-        index = self.get_page_id_index(key_search)
-        page_id = self.page_ids[index]
+        i = self.get_page_id_index(key_search)
+        page_id = self.page_id_at(i)
         child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, page_id)
-        child.update_gt(key_search, index, val)
-        return
+        grown = child.update_gt(key_search, index, val)
+        if self.pager.cow:
+            grown += self._update_children(range(i + 1, self.key_count() + 1), index, val)
+            self.page_ids[i] = child.page_id
+            self.persist()
+        return grown
 
-    def _update_gt(self, key_search: bytes, index: int, val: bytes) -> None:
+    def _update_gt(self, key_search: bytes, index: int, val: bytes) -> list[tuple[bytes, bytes]]:
         i = 0
         while i < len(self.keys) and self.keys[i] <= key_search:
             i = i + 1
-        while i < len(self.keys):
-            val_in = self.vals[i]
-            val_out = val_in[:index] + val + val_in[index + len(val):]
-            self.vals[i] = val_out
-            i = i + 1
-        self._update_right(index, val)
+        grown = self._update_range(range(i, len(self.keys)), index, val)
+        return grown + self._update_right(index, val)
 
-    def update_ge(self, key_search: bytes, index: int, val: bytes) -> None:
+    def update_ge(self, key_search: bytes, index: int, val: bytes) -> list[tuple[bytes, bytes]]:
         if self.is_leaf:
-            self._update_ge(key_search, index, val)
+            grown = self._update_ge(key_search, index, val)
             self.persist()
-            return
+            return grown
 
-        index = self.get_page_id_index(key_search)
-        page_id = self.page_ids[index]
+        i = self.get_page_id_index(key_search)
+        page_id = self.page_id_at(i)
         child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, page_id)
-        child.update_ge(key_search, index, val)
-        return
+        grown = child.update_ge(key_search, index, val)
+        if self.pager.cow:
+            grown += self._update_children(range(i + 1, self.key_count() + 1), index, val)
+            self.page_ids[i] = child.page_id
+            self.persist()
+        return grown
 
-    def _update_ge(self, key_search: bytes, index: int, val: bytes) -> None:
+    def _update_ge(self, key_search: bytes, index: int, val: bytes) -> list[tuple[bytes, bytes]]:
         i = 0
         while i < len(self.keys) and self.keys[i] < key_search:
             i = i + 1
-        while i < len(self.keys):
-            val_in = self.vals[i]
-            val_out = val_in[:index] + val + val_in[index + len(val):]
-            self.vals[i] = val_out
-            i = i + 1
-        self._update_right(index, val)
-
-    def _update_left(self, index: int, val: bytes) -> None:
+        grown = self._update_range(range(i, len(self.keys)), index, val)
+        return grown + self._update_right(index, val)
+
+    def _update_left(self, index: int, val: bytes) -> list[tuple[bytes, bytes]]:
+        grown = []
+        if self.pager.cow:
+            # 没有叶链，路径左侧的叶节点由上层的 _update_children 改写
+            return grown
         node = self
         while node.left_page_id != NULL_PAGE_ID:
+            self.pager.read_ahead_scan(node.left_page_id, left_page_id_from_page)
             node = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, node.left_page_id)
-            node._update_vals(index, val)
+            grown += node._update_vals(index, val)
             node.persist()
+        self.pager.read_ahead_scan_end()
+        return grown
 
-    def _update_right(self, index: int, val: bytes) -> None:
+    def _update_right(self, index: int, val: bytes) -> list[tuple[bytes, bytes]]:
+        grown = []
+        if self.pager.cow:
+            return grown
         node = self
         while node.right_page_id != NULL_PAGE_ID:
+            self.pager.read_ahead_scan(node.right_page_id, right_page_id_from_page)
             node = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, node.right_page_id)
-            node._update_vals(index, val)
+            grown += node._update_vals(index, val)
             node.persist()
+        self.pager.read_ahead_scan_end()
+        return grown
+
+    def _update_children(self, indexes: range, index: int, val: bytes) -> list[tuple[bytes, bytes]]:
+        """写时复制的树没有叶链：改写这些子树里的全部 val，子节点换页后更新指针，由调用方写回本节点"""
+        grown = []
+        for i in indexes:
+            child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, self.page_id_at(i))
+            if child.is_leaf:
+                grown += child._update_vals(index, val)
+            else:
+                grown += child._update_children(range(child.key_count() + 1), index, val)
+            child.persist()
+            self.page_ids[i] = child.page_id
+        return grown
+
+    def _update_vals(self, index: int, val: bytes) -> list[tuple[bytes, bytes]]:
+        return self._update_range(range(self.key_count()), index, val)
 
-    def _update_vals(self, index: int, val: bytes) -> None:
-        for i, val_in in enumerate(self.vals):
-            val_out = val_in[:index] + val + val_in[index + len(val):]
-            self.vals[i] = val_out
+    def _update_range(self, indexes: range, index: int, val: bytes) -> list[tuple[bytes, bytes]]:
+        """
+        把 indexes 处的 val 从 index 起改写为 val。先算出改写后节点的大小：不超过 BYTES_NODE 才原地改，返回 []；
+        超过时本节点不动，返回这些记录改写后的 (key, val)，由 BPlusTree 走写入路径分裂
+        """
+        size = self.size()
+        updates = []
+        for i in indexes:
+            key = self.keys[i]
+            val_in = self.vals[i]
+            if isinstance(val_in, Overflow):
+                if not self.pager.cow and 0 <= index and index + len(val) <= val_in.length:
+                    # 溢出页上原地改写，叶节点里的引用不变；写时复制时溢出页也不原地改
+                    val_in.update(index, val)
+                    continue
+                # 改写后变长，读出来重新存
+                val_old = val_in.read()
+            else:
+                val_old = val_in
+            val_out = val_old[:index] + val + val_old[index + len(val):]
+            size += stored_entry_size(key, val_out) - leaf_entry_size(key, val_in)
+            updates.append((i, val_out))
+        if size > BYTES_NODE:
+            return [(self.keys[i], val_out) for i, val_out in updates]
+        for i, val_out in updates:
+            free_vals(self.vals[i:i + 1])
+            self.vals[i] = store_val(self.pager, self.free_list, self.keys[i], val_out)
+        return []
 
     def persist(self) -> None:
+        if self.pager.cow and self.page_id not in self.pager.fresh:
+            # 写时复制：已提交的页可能还在快照里，换到新页写，旧页等快照关闭后回收
+            page_id = self.page_id
+            self.page_id = self.free_list.get_page_id()
+            if self.pager.is_writer():
+                self.pager.latch_exclusive(self.page_id)
+            self.free_list.add_page_id(page_id)
         bs = bytes(self)
         self.pager.page_set(self.page_id, bs)
-
-    def is_full(self) -> bool:
-        return len(self.keys) >= 2 * DEGREE - 1
-
-    def split(self) -> 'BPlusTreeNode':
-        new = new_b_plus_tree_node(self.pager, self.free_list, self.is_leaf)
+        # 写入后本对象与页一致，放回节点缓存
+        self.pager.node_cache.put(self.page_id, self, self.size())
+
+    def size(self) -> int:
+        """页内已用的字节数：页头、公共前缀、slot 数组与记录"""
+        if self._keys is None:
+            if self.num_keys == 0:
+                return BYTES_NODE_HEADER
+            # 记录从页尾起连续存放，最后一条离页头最近
+            offset = self.slot_at(self.num_keys - 1)
+            return BYTES_NODE_HEADER + len(self.prefix) + SLOT.size * self.num_keys + BYTES_PAGE - offset
+        return node_size(self.is_leaf, self._keys, self._vals)
+
+    def split_count(self, size_add: int) -> int:
+        """
+        再加入共 size_add 字节（未压缩）的记录后最多分裂出几个新节点，0 表示一定放得下。
+        公共前缀可能因新 key 而消失，按每条记录都不压缩估算。
+        """
+        n = self.key_count()
+        prefix = len(self.prefix) if self._keys is None else len(common_prefix(self._keys))
+        raw = self.size() - BYTES_NODE_HEADER - prefix + n * prefix + size_add
+        if BYTES_NODE_HEADER + raw <= BYTES_NODE:
+            return 0
+        # split_starts 切成 count 段的目标大小，贪心切分时相邻两段之和超过目标，段数不超过 2 * count - 1
+        count = -(-raw // (BYTES_NODE - BYTES_NODE_HEADER))
+        return 2 * count - 2
+
+    def may_underflow(self) -> bool:
+        """
+        内部节点的子节点借位或合并后，本节点少一个 key 或换掉一个分隔 key，是否可能低于 BYTES_NODE_MIN。
+        去掉首尾的 key 时公共前缀可能变长，单独计算；去掉中间的 key 公共前缀不变。
+        """
+        keys = self.keys
+        sizes = [node_size(False, keys[1:], []), node_size(False, keys[:-1], [])]
+        if len(keys) > 2:
+            suffix_max = max(len(key) for key in keys[1:-1]) - len(common_prefix(keys))
+            sizes.append(self.size() - internal_entry_size(b'') - suffix_max)
+        return min(sizes) < BYTES_NODE_MIN
+
+    def split(self) -> list[tuple[bytes, 'BPlusTreeNode']]:
+        """
+        按编码后的字节数把放不下一页的节点切成若干段，各段字节数接近，
+        本节点保留第一段，返回其余各段的分隔 key 和新节点
+        """
         if self.is_leaf:
-            new.keys = self.keys[DEGREE:]
-            new.vals = self.vals[DEGREE:]
-            self.keys = self.keys[:DEGREE]
-            self.vals = self.vals[:DEGREE]
-        else:
-            new.keys = self.keys[DEGREE:]
-            new.page_ids = self.page_ids[DEGREE:]
-            self.keys = self.keys[:DEGREE - 1]
-            self.page_ids = self.page_ids[:DEGREE]
-
-        if self.right_page_id != NULL_PAGE_ID:
-            r = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, self.right_page_id)
-            r.left_page_id = new.page_id
-            r.persist()
-            self.right_page_id = new.page_id
-            new.left_page_id = self.page_id
-            new.right_page_id = r.page_id
+            sizes = [leaf_entry_size(k, v) for k, v in zip(self.keys, self.vals)]
         else:
-            self.right_page_id = new.page_id
-            new.left_page_id = self.page_id
-
-        new.persist()
-        self.persist()
-        return new
+            sizes = [internal_entry_size(k) for k in self.keys]
+        starts = split_starts(sizes)
+
+        keys = self.keys
+        vals = self.vals
+        page_ids = self.page_ids
+        counts = self.counts
+        ends = starts[1:] + [len(keys)]
+        nodes = [self]
+        splits = []
+        for start, end in zip(starts, ends):
+            if start == 0:
+                node = self
+            else:
+                node = new_b_plus_tree_node(self.pager, self.free_list, self.is_leaf)
+                nodes.append(node)
+            if self.is_leaf:
+                node.keys = keys[start:end]
+                node.vals = vals[start:end]
+                if start != 0:
+                    key = separator(keys[start - 1], keys[start])
+            elif start == 0:
+                node.keys = keys[:end]
+                node.page_ids = page_ids[:end + 1]
+                node.counts = counts[:end + 1]
+            else:
+                # keys[start] 上移到父节点，两边都不保留
+                node.keys = keys[start + 1:end]
+                node.page_ids = page_ids[start + 1:end + 1]
+                node.counts = counts[start + 1:end + 1]
+                key = keys[start]
+            if start != 0:
+                splits.append((key, node))
+
+        # 写时复制的树不维护叶链：改邻居的指针就要把邻居也换页
+        if not self.pager.cow:
+            right_page_id = self.right_page_id
+            for left, right in zip(nodes, nodes[1:]):
+                left.right_page_id = right.page_id
+                right.left_page_id = left.page_id
+            nodes[-1].right_page_id = right_page_id
+            if right_page_id != NULL_PAGE_ID:
+                r = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, right_page_id)
+                r.left_page_id = nodes[-1].page_id
+                r.persist()
+
+        for node in nodes:
+            node.persist()
+        return splits
 
-    def delete_one(self, key: bytes) -> bytes | None:
+    def delete_one(self, key: bytes) -> bool:
+        """返回是否删除了记录"""
         if self.is_leaf:
-            key_right = self._delete_one(key)
-            self.persist()
-            return key_right
+            deleted = self._delete_one(key)
+            if deleted:
+                self.persist()
+            return deleted
 
-        page_id_index = self.get_page_id_index(key)
-        page_id = self.page_ids[page_id_index]
+        index = self.get_page_id_index(key)
+        page_id = self.page_id_at(index)
         child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, page_id)
-        key_right = child.delete_one(key)
+        deleted = child.delete_one(key)
+        if deleted:
+            self.page_ids[index] = child.page_id
+            # 分隔 key 只用来划分区间，被删的 key 留在内部节点里不影响查找
+            self.counts[index] -= 1
+            self.rebalance(index, child)
+            self.persist()
+        return deleted
 
-        if self.need_replace(key, key_right):
-            key_index = self.get_key_index(key)
-            if key_index is not None and key_right != NULL_PAGE_ID:
-                self.keys[key_index] = key_right
-                self.persist()
+    def _delete_one(self, key: bytes) -> bool:
+        i = bisect.bisect_left(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return False
+        self.keys.pop(i)
+        free_vals([self.vals.pop(i)])
+        return True
 
+    def is_enough(self) -> bool:
+        return self.size() >= BYTES_NODE_MIN
+
+    def rebalance(self, index: int, child: 'BPlusTreeNode') -> None:
+        """
+        第 index 个子节点删除后低于 BYTES_NODE_MIN 时，先向左右兄弟借一条，借不了再与兄弟合并。
+        分隔 key 长短不一，借或合并后放不进一页时放弃，子节点保持欠满，不影响正确性。
+        只写回子节点，本节点由调用方写回。
+        """
         if child.is_enough():
-            return key_right
+            return
 
         # self not leaf
         # child is not enough
         child_left = None
-        if child.left_page_id != NULL_PAGE_ID:
-            child_left = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, child.left_page_id)
-        if self.can_borrow_child_left(page_id_index, child_left):
-            self.borrow_child_left(page_id_index, child, child_left)
-            return key_right
+        if index > 0:
+            child_left = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, self.page_ids[index - 1])
+            if self.can_borrow_child_left(index, child, child_left):
+                self.borrow_child_left(index, child, child_left)
+                return
 
         child_right = None
-        if child.right_page_id != NULL_PAGE_ID:
-            child_right = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, child.right_page_id)
-        if self.can_borrow_child_right(page_id_index, child_right):
-            self.borrow_child_right(page_id_index, child, child_right)
-            return key_right
-
-        if page_id_index < len(self.page_ids) - 1:
-            self.merge_right_child(child, child_right, page_id_index)
-            return key_right
+        if index < len(self.page_ids) - 1:
+            child_right = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, self.page_ids[index + 1])
+            if self.can_borrow_child_right(index, child, child_right):
+                self.borrow_child_right(index, child, child_right)
+                return
+
+        if child_right is not None and self.can_merge(index, child, child_right):
+            self.merge_right_child(child, child_right, index)
+        elif child_left is not None and self.can_merge(index - 1, child_left, child):
+            self.merge_right_child(child_left, child, index - 1)
+
+    def can_borrow_child_left(self, index: int, child: 'BPlusTreeNode', child_left: 'BPlusTreeNode') -> bool:
+        if len(child_left.keys) < 2:
+            return False
+        # 叶节点借走最后一条，分隔 key 取在左兄弟剩下的最后一条和它之间；
+        # 内部节点的分隔 key 下移，左兄弟最后一个 key 上移
+        if child.is_leaf:
+            key_up = separator(child_left.keys[-2], child_left.keys[-1])
+            size_left = node_size(True, child_left.keys[:-1], child_left.vals[:-1])
+            size_child = node_size(True, child_left.keys[-1:] + child.keys, child_left.vals[-1:] + child.vals)
         else:
-            self.merge_right_child(child_left, child, page_id_index - 1)
-            return key_right
-
-    def _delete_one(self, key: bytes) -> bytes | None:
-        key_right = None
-        try:
-            i = self.keys.index(key)
-        except ValueError:
-            return key_right
-        self.keys.pop(i)
-        self.vals.pop(i)
-        try:
-            key_right = self.keys[i]
-        except IndexError:
-            if self.right_page_id != NULL_PAGE_ID:
-                right = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, self.right_page_id)
-                key_right = right.keys[0]
-        return key_right
-
-    def need_replace(self, removed_key: bytes, replace_key: bytes) -> bool:
-        return removed_key in self.keys and replace_key is not None
-
-    def is_enough(self) -> bool:
-        return len(self.keys) >= DEGREE - 1
-
-    def get_key_index(self, key: bytes) -> int | None:
-        try:
-            return self.keys.index(key)
-        except ValueError:
-            return None
-
-    def can_borrow(self) -> bool:
-        return len(self.keys) >= DEGREE
-
-    def can_borrow_child_left(self, index: int, child_left: 'BPlusTreeNode') -> bool:
-        return index > 0 and child_left is not None and child_left.can_borrow()
+            key_up = child_left.keys[-1]
+            size_left = node_size(False, child_left.keys[:-1], [])
+            size_child = node_size(False, [self.keys[index - 1]] + child.keys, [])
+        keys = self.keys[:index - 1] + [key_up] + self.keys[index:]
+        return (size_left >= BYTES_NODE_MIN
+                and size_child <= BYTES_NODE
+                and node_size(False, keys, []) <= BYTES_NODE)
 
     def borrow_child_left(self, index: int, child: 'BPlusTreeNode', child_left: 'BPlusTreeNode') -> None:
         if child.is_leaf:
@@ -489,20 +700,39 @@ class BPlusTreeNode:
         else:
             _key = self.keys[index - 1]
             _page_id = child_left.page_ids.pop(-1)
+            _count = child_left.counts.pop(-1)
             child.keys.insert(0, _key)
             child.page_ids.insert(0, _page_id)
+            child.counts.insert(0, _count)
         if child.is_leaf:
-            _key = child.keys[0]
+            _key = separator(child_left.keys[-1], child.keys[0])
             self.keys[index - 1] = _key
         else:
             _key = child_left.keys.pop(-1)
             self.keys[index - 1] = _key
-        self.persist()
+        self.counts[index - 1] = child_left.count()
+        self.counts[index] = child.count()
         child.persist()
         child_left.persist()
+        self.page_ids[index - 1] = child_left.page_id
+        self.page_ids[index] = child.page_id
 
-    def can_borrow_child_right(self, index: int, child_right: 'BPlusTreeNode') -> bool:
-        return index < len(self.page_ids) - 1 and child_right is not None and child_right.can_borrow()
+    def can_borrow_child_right(self, index: int, child: 'BPlusTreeNode', child_right: 'BPlusTreeNode') -> bool:
+        if len(child_right.keys) < 2:
+            return False
+        # 叶节点借走第一条，分隔 key 取在它和右兄弟剩下的第一条之间
+        if child.is_leaf:
+            key_up = separator(child_right.keys[0], child_right.keys[1])
+            size_right = node_size(True, child_right.keys[1:], child_right.vals[1:])
+            size_child = node_size(True, child.keys + child_right.keys[:1], child.vals + child_right.vals[:1])
+        else:
+            key_up = child_right.keys[0]
+            size_right = node_size(False, child_right.keys[1:], [])
+            size_child = node_size(False, child.keys + [self.keys[index]], [])
+        keys = self.keys[:index] + [key_up] + self.keys[index + 1:]
+        return (size_right >= BYTES_NODE_MIN
+                and size_child <= BYTES_NODE
+                and node_size(False, keys, []) <= BYTES_NODE)
 
     def borrow_child_right(self, index: int, child: 'BPlusTreeNode', child_right: 'BPlusTreeNode') -> None:
         if child.is_leaf:
@@ -513,17 +743,31 @@ class BPlusTreeNode:
         else:
             _key = self.keys[index]
             _page_id = child_right.page_ids.pop(0)
+            _count = child_right.counts.pop(0)
             child.keys.append(_key)
             child.page_ids.append(_page_id)
+            child.counts.append(_count)
         if child.is_leaf:
-            _key = child_right.keys[0]
+            _key = separator(child.keys[-1], child_right.keys[0])
             self.keys[index] = _key
         else:
             _key = child_right.keys.pop(0)
             self.keys[index] = _key
-        self.persist()
+        self.counts[index] = child.count()
+        self.counts[index + 1] = child_right.count()
         child.persist()
         child_right.persist()
+        self.page_ids[index] = child.page_id
+        self.page_ids[index + 1] = child_right.page_id
+
+    def can_merge(self, index: int, left_child: 'BPlusTreeNode', right_child: 'BPlusTreeNode') -> bool:
+        # 合并后公共前缀可能变短，按合并后的 keys 重新计算
+        if left_child.is_leaf:
+            size = node_size(True, left_child.keys + right_child.keys, left_child.vals + right_child.vals)
+        else:
+            # 分隔 key 下移，与 right_child 的 page_ids[0] 组成一条记录
+            size = node_size(False, left_child.keys + [self.keys[index]] + right_child.keys, [])
+        return size <= BYTES_NODE
 
     def merge_right_child(self, left_child: 'BPlusTreeNode', right_child: 'BPlusTreeNode', index: int) -> None:
         if left_child.is_leaf:
@@ -535,517 +779,1198 @@ class BPlusTreeNode:
             left_child.keys.append(_key)
             left_child.keys.extend(right_child.keys)
             left_child.page_ids.extend(right_child.page_ids)
+            left_child.counts.extend(right_child.counts)
 
-        left_child.right_page_id = right_child.right_page_id
-        if left_child.right_page_id != NULL_PAGE_ID:
-            rr_child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, left_child.right_page_id)
-            rr_child.left_page_id = left_child.page_id
-            rr_child.persist()
+        if not self.pager.cow:
+            left_child.right_page_id = right_child.right_page_id
+            if left_child.right_page_id != NULL_PAGE_ID:
+                rr_child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, left_child.right_page_id)
+                rr_child.left_page_id = left_child.page_id
+                rr_child.persist()
 
         self.page_ids.pop(index + 1)
-        self.persist()
+        self.counts.pop(index + 1)
+        self.counts[index] = left_child.count()
         left_child.persist()
+        self.page_ids[index] = left_child.page_id
         self.free_list.add_page_id(right_child.page_id)
 
     def is_empty(self) -> bool:
-        return len(self.keys) == 0
-
-    def delete_lt(self, key: bytes) -> bool:
-        """
-        删除所有 key < k 的记录，返回 True 表示本节点可能下溢需要父节点处理。
-
-        策略：
-        - 叶节点：直接截断 < key 的部分，同时修复左侧叶链表指针
-        - 内部节点：
-            1. 找到包含 key 的子节点路径 (index)
-            2. 释放所有 index 左侧的子树（整体丢弃）
-            3. 递归处理 index 子节点
-            4. 丢弃已删的 keys[0..index-1] 和 page_ids[0..index-1]
-            5. 更新最左侧分隔键
-            6. 若 index 子节点下溢，向右借位或与右兄弟合并
-        """
-        if self.is_leaf:
-            # 找到第一个 >= key 的位置
-            i = 0
-            while i < len(self.keys) and self.keys[i] < key:
-                i += 1
-            # 截断左侧 [0..i-1]
-            self.keys = self.keys[i:]
-            self.vals = self.vals[i:]
-            # 修复左侧叶链表：把之前左邻的叶节点全部断开
-            if self.left_page_id != NULL_PAGE_ID:
-                # 逐个向左遍历并释放，同时断开链表
-                node = self
-                while node.left_page_id != NULL_PAGE_ID:
-                    left = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, node.left_page_id)
-                    self.free_list.add_page_id(left.page_id)
-                    node = left
-                self.left_page_id = NULL_PAGE_ID
-                self.persist()
-            else:
-                self.persist()
-            return False  # 叶节点即使空也由上层决定是否需要处理
+        return self.key_count() == 0
 
-        # 内部节点
-        index = self.get_page_id_index(key)
+    def delete_lt(self, key: bytes) -> None:
+        """删除所有 key < k 的记录"""
+        self._delete_left(key, False)
 
-        # 1. 释放 index 左侧所有子树
-        for i in range(index):
-            child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, self.page_ids[i])
-            child._free_subtree()
+    def delete_le(self, key: bytes) -> None:
+        """删除所有 key <= k 的记录"""
+        self._delete_left(key, True)
 
-        # 2. 递归处理 index 子节点
-        child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, self.page_ids[index])
-        child.delete_lt(key)
-
-        # 3. 更新本节点：去掉 index 左侧的 keys 和 page_ids
-        #    内部节点有 n 个 keys 和 n+1 个 page_ids
-        #    page_ids[0..index-1] 已被释放，keys[0..index-1] 对应的分隔键也要删除
-        self.page_ids = self.page_ids[index:]  # 现在 page_ids[0] 是原来的 page_ids[index]
-        self.keys = self.keys[index:]  # 去掉左侧的 index 个分隔键
-
-        # 4. 更新最左侧子树对应的分隔键
-        #    最左侧子节点（page_ids[0]）现在最小 key 可能已变化
-        #    如果它是叶节点，keys[0]（若存在）就是新的分隔键
-        #    如果 keys 非空，keys[0] 是 page_ids[0] 和 page_ids[1] 之间的分隔
-        #    需要用 page_ids[0] 最小 key 来更新 keys[0]（若 page_ids[0] 非空）
-        child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, self.page_ids[0])
-        if len(self.keys) > 0:
-            new_sep = self._get_leftmost_key(child)
-            if new_sep is not None:
-                # keys[0] 是 page_ids[0] 和 page_ids[1] 之间的分隔，
-                # 对于叶节点，分隔键 = page_ids[1] 的第一个 key（B+树惯例）
-                # 不需要修改 keys[0]，它已经指向右侧子树的最小值，保持不变
-                pass
-
-        # 5. 检查 child（page_ids[0]）是否下溢，只能向右借/合并
-        if not child.is_enough() and not child.is_leaf:
-            if len(self.page_ids) > 1:
-                child_right = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, self.page_ids[1])
-                if child_right.can_borrow():
-                    self.borrow_child_right(0, child, child_right)
-                else:
-                    self.merge_right_child(child, child_right, 0)
-        elif child.is_leaf and len(child.keys) == 0 and len(self.page_ids) > 1:
-            # 叶节点被清空，合并（直接丢弃空叶，把右侧提上来）
-            child_right = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, self.page_ids[1])
-            # 修复链表：child_right 的左侧指向 child 的左侧（NULL）
-            child_right.left_page_id = child.left_page_id
-            child_right.persist()
-            self.free_list.add_page_id(child.page_id)
-            self.page_ids.pop(0)
-            self.keys.pop(0)
+    def delete_gt(self, key: bytes) -> None:
+        """删除所有 key > k 的记录"""
+        self._delete_right(key, False)
 
-        self.persist()
-        return len(self.keys) == 0
+    def delete_ge(self, key: bytes) -> None:
+        """删除所有 key >= k 的记录"""
+        self._delete_right(key, True)
 
-    def delete_le(self, key: bytes) -> bool:
+    def _delete_left(self, key: bytes, inclusive: bool) -> None:
         """
-        删除所有 key <= k 的记录。
-        与 delete_lt 唯一的区别：叶节点截断条件是 <= key 而非 < key。
-        内部节点路径查找、左侧子树释放、下溢修复逻辑完全相同。
+        沿包含 key 的路径向下：
+        - 路径左侧的子树整体释放，同一层的左邻都在其中，left_page_id 置空
+        - 叶节点截断左侧的记录
+        - 回到每一层时，最左子节点只有右兄弟，下溢由 rebalance 借位或合并
+        路径左侧的叶节点只在所属子树里释放一次，不沿叶链表再走
         """
         if self.is_leaf:
-            # 找到第一个 > key 的位置
             i = 0
-            while i < len(self.keys) and self.keys[i] <= key:
+            while i < len(self.keys) and (self.keys[i] < key or (inclusive and self.keys[i] == key)):
                 i += 1
+            free_vals(self.vals[:i])
             self.keys = self.keys[i:]
             self.vals = self.vals[i:]
-            if self.left_page_id != NULL_PAGE_ID:
-                node = self
-                while node.left_page_id != NULL_PAGE_ID:
-                    left = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, node.left_page_id)
-                    self.free_list.add_page_id(left.page_id)
-                    node = left
-                self.left_page_id = NULL_PAGE_ID
-                self.persist()
-            else:
-                self.persist()
-            return False
+            self.left_page_id = NULL_PAGE_ID
+            self.persist()
+            return
 
-        # 内部节点
         index = self.get_page_id_index(key)
-
-        # 1. 释放 index 左侧所有子树
         for i in range(index):
             child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, self.page_ids[i])
             child._free_subtree()
-
-        # 2. 递归处理 index 子节点
-        child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, self.page_ids[index])
-        child.delete_le(key)
-
-        # 3. 去掉左侧已丢弃的 keys 和 page_ids
         self.page_ids = self.page_ids[index:]
+        self.counts = self.counts[index:]
         self.keys = self.keys[index:]
+        self.left_page_id = NULL_PAGE_ID
 
-        # 4. 重新加载 child（page_ids 已更新，page_ids[0] 是当前最左子节点）
         child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, self.page_ids[0])
-
-        # 5. 检查下溢，只能向右借/合并（左侧已全删）
-        if not child.is_enough() and not child.is_leaf:
-            if len(self.page_ids) > 1:
-                child_right = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, self.page_ids[1])
-                if child_right.can_borrow():
-                    self.borrow_child_right(0, child, child_right)
-                else:
-                    self.merge_right_child(child, child_right, 0)
-        elif child.is_leaf and len(child.keys) == 0 and len(self.page_ids) > 1:
-            child_right = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, self.page_ids[1])
-            child_right.left_page_id = child.left_page_id
-            child_right.persist()
-            self.free_list.add_page_id(child.page_id)
-            self.page_ids.pop(0)
-            self.keys.pop(0)
-
+        child._delete_left(key, inclusive)
+        self.page_ids[0] = child.page_id
+        self.counts[0] = child.count()
+        self.rebalance(0, child)
         self.persist()
-        return len(self.keys) == 0
 
-    def delete_gt(self, key: bytes) -> bool:
-        """
-        删除所有 key > k 的记录。与 delete_lt 镜像：
-        - 叶节点：截断 > key 的右侧部分，修复右侧叶链表指针
-        - 内部节点：
-            1. 找到包含 key 的子树位置 (index)
-            2. 释放 index 右侧所有子树
-            3. 递归处理 index 子节点
-            4. 去掉 keys[index..] 和 page_ids[index+1..]
-            5. 若 index 子节点下溢，向左借/合并（右侧已全删，无右兄弟）
-        """
+    def _delete_right(self, key: bytes, inclusive: bool) -> None:
+        """与 _delete_left 镜像，释放路径右侧的子树，right_page_id 置空"""
         if self.is_leaf:
-            # 找到第一个 > key 的位置
             i = 0
-            while i < len(self.keys) and self.keys[i] <= key:
+            while i < len(self.keys) and (self.keys[i] < key or (not inclusive and self.keys[i] == key)):
                 i += 1
-            # 截断右侧 [i..]
+            free_vals(self.vals[i:])
             self.keys = self.keys[:i]
             self.vals = self.vals[:i]
-            # 修复右侧叶链表：向右遍历并释放
-            if self.right_page_id != NULL_PAGE_ID:
-                node = self
-                while node.right_page_id != NULL_PAGE_ID:
-                    right = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, node.right_page_id)
-                    self.free_list.add_page_id(right.page_id)
-                    node = right
-                self.right_page_id = NULL_PAGE_ID
-                self.persist()
-            else:
-                self.persist()
-            return False
+            self.right_page_id = NULL_PAGE_ID
+            self.persist()
+            return
 
-        # 内部节点
         index = self.get_page_id_index(key)
-
-        # 1. 释放 index 右侧所有子树（page_ids[index+1..] 对应的子树）
         for i in range(index + 1, len(self.page_ids)):
             child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, self.page_ids[i])
             child._free_subtree()
-
-        # 2. 递归处理 index 子节点
-        child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, self.page_ids[index])
-        child.delete_gt(key)
-
-        # 3. 去掉右侧已丢弃的 keys 和 page_ids
-        #    内部节点：keys[index..] 是 page_ids[index] 和右侧的分隔键，全部丢弃
         self.page_ids = self.page_ids[:index + 1]
+        self.counts = self.counts[:index + 1]
         self.keys = self.keys[:index]
+        self.right_page_id = NULL_PAGE_ID
 
-        # 4. 重新加载 child（page_ids[-1] 是当前最右子节点）
-        child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, self.page_ids[-1])
-
-        # 5. 检查下溢，只能向左借/合并（右侧已全删）
-        child_index = len(self.page_ids) - 1
-        if not child.is_enough() and not child.is_leaf:
-            if child_index > 0:
-                child_left = new_b_plus_tree_node_from_page_id(self.pager, self.free_list,
-                                                               self.page_ids[child_index - 1])
-                if child_left.can_borrow():
-                    self.borrow_child_left(child_index, child, child_left)
-                else:
-                    self.merge_right_child(child_left, child, child_index - 1)
-        elif child.is_leaf and len(child.keys) == 0 and child_index > 0:
-            # 空叶节点，丢弃，修复右侧链表指针
-            child_left = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, self.page_ids[child_index - 1])
-            child_left.right_page_id = child.right_page_id  # 应为 NULL_PAGE_ID（右侧已释放）
-            child_left.persist()
-            self.free_list.add_page_id(child.page_id)
-            self.page_ids.pop(-1)
-            if len(self.keys) > 0:
-                self.keys.pop(-1)
-
+        child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, self.page_ids[index])
+        child._delete_right(key, inclusive)
+        self.page_ids[index] = child.page_id
+        self.counts[index] = child.count()
+        self.rebalance(index, child)
         self.persist()
-        return len(self.keys) == 0
 
-    def delete_ge(self, key: bytes) -> bool:
-        """
-        删除所有 key >= k 的记录。与 delete_gt 唯一区别：
-        叶节点截断条件是 >= key 而非 > key。
-        """
+    def _free_subtree(self, with_vals: bool = True) -> None:
+        """递归释放整棵子树的所有页面（整体丢弃，无需平衡），with_vals 时包括叶节点 val 的溢出页"""
         if self.is_leaf:
-            # 找到第一个 >= key 的位置
-            i = 0
-            while i < len(self.keys) and self.keys[i] < key:
-                i += 1
-            # 截断右侧 [i..]
-            self.keys = self.keys[:i]
-            self.vals = self.vals[:i]
-            # 修复右侧叶链表
-            if self.right_page_id != NULL_PAGE_ID:
-                node = self
-                while node.right_page_id != NULL_PAGE_ID:
-                    right = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, node.right_page_id)
-                    self.free_list.add_page_id(right.page_id)
-                    node = right
-                self.right_page_id = NULL_PAGE_ID
-                self.persist()
-            else:
-                self.persist()
-            return False
+            if with_vals:
+                free_vals(self.vals)
+        else:
+            for page_id in self.page_ids:
+                child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, page_id)
+                child._free_subtree(with_vals)
+        self.free_list.add_page_id(self.page_id)
 
-        # 内部节点
-        index = self.get_page_id_index(key)
 
-        # 1. 释放 index 右侧所有子树
-        for i in range(index + 1, len(self.page_ids)):
-            child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, self.page_ids[i])
-            child._free_subtree()
+def leaf_entry_size(key: bytes, val: bytes | Overflow) -> int:
+    if isinstance(val, Overflow):
+        return SLOT.size + LEAF_ENTRY.size + len(key) + OVERFLOW_REF.size
+    return SLOT.size + LEAF_ENTRY.size + len(key) + len(val)
 
-        # 2. 递归处理 index 子节点
-        child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, self.page_ids[index])
-        child.delete_ge(key)
 
-        # 3. 去掉右侧已丢弃的 keys 和 page_ids
-        self.page_ids = self.page_ids[:index + 1]
-        self.keys = self.keys[:index]
+def internal_entry_size(key: bytes) -> int:
+    return SLOT.size + INTERNAL_ENTRY.size + len(key)
 
-        # 4. 重新加载最右子节点
-        child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, self.page_ids[-1])
-
-        # 5. 检查下溢，只能向左借/合并
-        child_index = len(self.page_ids) - 1
-        if not child.is_enough() and not child.is_leaf:
-            if child_index > 0:
-                child_left = new_b_plus_tree_node_from_page_id(self.pager, self.free_list,
-                                                               self.page_ids[child_index - 1])
-                if child_left.can_borrow():
-                    self.borrow_child_left(child_index, child, child_left)
-                else:
-                    self.merge_right_child(child_left, child, child_index - 1)
-        elif child.is_leaf and len(child.keys) == 0 and child_index > 0:
-            child_left = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, self.page_ids[child_index - 1])
-            child_left.right_page_id = child.right_page_id
-            child_left.persist()
-            self.free_list.add_page_id(child.page_id)
-            self.page_ids.pop(-1)
-            if len(self.keys) > 0:
-                self.keys.pop(-1)
 
-        self.persist()
-        return len(self.keys) == 0
+def common_prefix(keys: list[bytes]) -> bytes:
+    """有序 keys 的公共前缀，只需比较首尾两个"""
+    if len(keys) == 0:
+        return b''
+    first = keys[0]
+    last = keys[-1]
+    i = 0
+    while i < len(first) and i < len(last) and first[i] == last[i]:
+        i += 1
+    return first[:i]
 
-    def _free_subtree(self) -> None:
-        """递归释放整棵子树的所有页面（整体丢弃，无需平衡）"""
-        if not self.is_leaf:
-            for page_id in self.page_ids:
-                child = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, page_id)
-                child._free_subtree()
-        self.free_list.add_page_id(self.page_id)
 
-    def _get_leftmost_key(self, node: 'BPlusTreeNode') -> bytes | None:
-        """获取子树中最左侧的 key"""
-        cur = node
-        while not cur.is_leaf:
-            if len(cur.page_ids) == 0:
-                return None
-            cur = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, cur.page_ids[0])
-        if len(cur.keys) == 0:
-            return None
-        return cur.keys[0]
+def node_size(is_leaf: bool, keys: list[bytes], vals: list[bytes]) -> int:
+    """keys/vals 编码成一页后的字节数，每条记录省去公共前缀；内部节点忽略 vals"""
+    prefix = len(common_prefix(keys))
+    if is_leaf:
+        size = sum(leaf_entry_size(k, v) for k, v in zip(keys, vals))
+    else:
+        size = sum(internal_entry_size(k) for k in keys)
+    return BYTES_NODE_HEADER + prefix + size - prefix * len(keys)
+
+
+def separator(left: bytes, right: bytes) -> bytes:
+    """
+    left < right，返回满足 left < s <= right 的最短 s：right 截到与 left 第一个不同的字节为止。
+    分隔 key 只用来划分区间，不必是真实存在的 key。
+    """
+    i = 0
+    while i < len(left) and left[i] == right[i]:
+        i += 1
+    return right[:i + 1]
+
+
+def split_starts(sizes: list[int]) -> list[int]:
+    """切成最少的段数使每段不超过 BYTES_NODE，再按字节数均分，返回每段的起始下标"""
+    total = sum(sizes)
+    count = -(-total // (BYTES_NODE - BYTES_NODE_HEADER))
+    target = -(-total // count)
+    starts = [0]
+    acc = 0
+    for i, size in enumerate(sizes):
+        if acc > 0 and acc + size > target:
+            starts.append(i)
+            acc = 0
+        acc += size
+    return starts
+
 
+def check_key(key: bytes) -> None:
+    if len(key) > BYTES_KEY_MAX:
+        raise ValueError("key 过大")
 
-def new_b_plus_tree_node(pager: Pager, free_list: FreeList, is_leaf: bool) -> BPlusTreeNode:
+
+def val_overflows(key: bytes, val: bytes) -> bool:
+    """超过 BYTES_VAL_INLINE_MAX 或整条放不进 BYTES_ENTRY_MAX 的 val 存到溢出页"""
+    return len(val) > BYTES_VAL_INLINE_MAX or leaf_entry_size(key, val) > BYTES_ENTRY_MAX
+
+
+def stored_entry_size(key: bytes, val: bytes) -> int:
+    """val 经 store_val 存放后这条叶节点记录的字节数"""
+    if val_overflows(key, val):
+        return SLOT.size + LEAF_ENTRY.size + len(key) + OVERFLOW_REF.size
+    return leaf_entry_size(key, val)
+
+
+def store_val(pager: Pager, free_list: FreeList, key: bytes, val: bytes | Overflow) -> bytes | Overflow:
+    """溢出的 val 写到溢出页，叶节点只存引用；已在溢出页上的 val（重建时）原样保留"""
+    if isinstance(val, Overflow):
+        return val
+    if val_overflows(key, val):
+        return new_overflow(pager, free_list, val)
+    return val
+
+
+def free_vals(vals: list[bytes | Overflow]) -> None:
+    """释放被删除或覆盖的 val 占用的溢出页"""
+    for val in vals:
+        if isinstance(val, Overflow):
+            val.free()
+
+
+def new_b_plus_tree_node(pager: Pager, free_list: FreeList, is_leaf: bool, sequential: bool = False) -> BPlusTreeNode:
+    """sequential 为 True 时从文件末尾取页，依次新建的节点在文件里连续"""
     node = BPlusTreeNode()
     node.pager = pager
     node.free_list = free_list
     node.is_leaf = is_leaf
-    node.page_id = free_list.get_page_id()
+    node.page_id = free_list.get_new_page_id() if sequential else free_list.get_page_id()
+    if pager.is_writer():
+        pager.latch_exclusive(node.page_id)
     node.left_page_id = NULL_PAGE_ID
     node.right_page_id = NULL_PAGE_ID
     node.keys = []
     node.vals = []
     node.page_ids = []
+    node.counts = []
     return node
 
 
 def new_b_plus_tree_node_from_page_id(pager: Pager, free_list: FreeList, page_id: int) -> BPlusTreeNode:
+    """
+    优先取节点缓存里已解码的对象，取到的对象被修改后必须 persist。
+    写者第一次取某页时先加独占闩，到操作结束（或确定不再改它）才放开；读者由调用方先加共享闩。
+    写时复制时写者取已提交的页拿到单独的对象，缓存里的对象留给不加闩的快照读者。
+    """
+    writer = pager.is_writer()
+    if writer:
+        pager.latch_exclusive(page_id)
+    private = writer and pager.cow and page_id not in pager.fresh
+    node = None if private else pager.node_cache.get(page_id)
+    if node is not None:
+        return node
     node = BPlusTreeNode()
     node.pager = pager
     node.free_list = free_list
-    buf = pager.page_get(page_id)
-    node.is_leaf = from_buf(buf, bool)
-    _page_id = from_buf(buf, int)
+    view = pager.page_view(page_id)
+    is_leaf, _page_id, left_page_id, right_page_id, num_keys, _, _, length_prefix = NODE_HEADER.unpack_from(view)
     if _page_id != page_id:
         raise ValueError("page_id 错误")
+    node.is_leaf = is_leaf
     node.page_id = page_id
-    node.left_page_id = from_buf(buf, int)
-    node.right_page_id = from_buf(buf, int)
-    num_keys = from_buf(buf, int)
-    node.keys = [from_buf(buf, bytes) for _ in range(num_keys)]
-    if node.is_leaf:
-        num_vals = from_buf(buf, int)
-        node.vals = [from_buf(buf, bytes) for _ in range(num_vals)]
-    else:
-        num_page_ids = from_buf(buf, int)
-        node.page_ids = [from_buf(buf, int) for _ in range(num_page_ids)]
+    node.left_page_id = left_page_id
+    node.right_page_id = right_page_id
+    node.view = view
+    node.num_keys = num_keys
+    node.prefix = view[BYTES_NODE_HEADER:BYTES_NODE_HEADER + length_prefix].tobytes()
+    node._keys = None
+    node._vals = None
+    node._page_ids = None
+    node._counts = None
+    if not private:
+        # 未解码的节点引用着整页
+        pager.node_cache.put(page_id, node, BYTES_PAGE)
     return node
 
 
-class BPlusTree:
+def left_page_id_from_page(page_bs: bytes) -> int:
+    return NODE_HEADER.unpack_from(page_bs)[2]
+
+
+def right_page_id_from_page(page_bs: bytes) -> int:
+    return NODE_HEADER.unpack_from(page_bs)[3]
+
+
+class BPlusTreeCursor:
+    """
+    叶节点上的游标。两次调用之间不持有闩，只记下当前叶节点的版本、key 和 val 在节点里存的形式：
+    移动时叶节点已被写者改过，就按记下的 key 从根重新定位，打开的游标不会挡住写者。
+    写时复制的树没有叶链，还要记下叶节点的区间 [lo, hi)，移到邻居时按区间边界从根下降。
+    """
 
     def __init__(self):
+        self.tree: 'BPlusTree | None' = None
         self.pager: Pager | None = None
         self.free_list: FreeList | None = None
+        self.node: BPlusTreeNode | None = None
+        self.index: int = 0
+        self.version: int = 0
+        self.key_cur: bytes = b''
+        self.val_cur: bytes | Overflow = b''
+        self.lo: bytes | None = None
+        self.hi: bytes | None = None
+        # 记着 version 的叶节点，对它的闩留一个引用，闩表不会删掉它，version 一直可比
+        self.held: int | None = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> tuple[bytes, bytes | None]:
+        if not self.valid():
+            self.close()
+            raise StopIteration
+        r = (self.key(), self.val())
+        self.next()
+        return r
+
+    def valid(self) -> bool:
+        return self.node is not None
+
+    def key(self) -> bytes:
+        return self.key_cur
+
+    def val(self) -> bytes | None:
+        """溢出的 val 要在叶节点未变时读，变了就按 key 重新查，记录已被删除时返回 None"""
+        if not isinstance(self.val_cur, Overflow):
+            return self.val_cur
+        if self._latch():
+            try:
+                return self.val_cur.read()
+            finally:
+                self._unlatch()
+        return self.tree.get_one(self.key_cur)
+
+    def seek_first(self) -> None:
+        node, _, lo, hi = self.tree._leaf_shared(lambda _node, _before: 0)
+        self._settle(node, 0, True, self.seek_first, lo, hi)
+
+    def seek_last(self) -> None:
+        node, _, lo, hi = self.tree._leaf_shared(lambda _node, _before: _node.key_count())
+        self._settle(node, node.key_count() - 1, False, self.seek_last, lo, hi)
+
+    def seek(self, key: bytes) -> None:
+        """定位到第一个 >= key 的记录"""
+        node, _, lo, hi = self.tree._leaf_shared(lambda _node, _before: _node.get_page_id_index(key))
+        self._settle(node, node.bisect_left(key), True, lambda: self.seek(key), lo, hi)
+
+    def seek_gt(self, key: bytes) -> None:
+        """定位到第一个 > key 的记录"""
+        node, _, lo, hi = self.tree._leaf_shared(lambda _node, _before: _node.get_page_id_index(key))
+        self._settle(node, node.bisect_right(key), True, lambda: self.seek_gt(key), lo, hi)
+
+    def seek_le(self, key: bytes) -> None:
+        """定位到最后一个 <= key 的记录"""
+        node, _, lo, hi = self.tree._leaf_shared(lambda _node, _before: _node.get_page_id_index(key))
+        self._settle(node, node.bisect_right(key) - 1, False, lambda: self.seek_le(key), lo, hi)
+
+    def seek_lt(self, key: bytes) -> None:
+        """定位到最后一个 < key 的记录"""
+        node, _, lo, hi = self.tree._leaf_shared(lambda _node, _before: _node.get_page_id_index(key))
+        self._settle(node, node.bisect_left(key) - 1, False, lambda: self.seek_lt(key), lo, hi)
+
+    def seek_nth(self, n: int) -> None:
+        """定位到按 key 排序的第 n 条记录（从 0 开始），按内部节点的子树记录数下降，不走叶链"""
+        if n < 0:
+            self.node = None
+            self._hold(None)
+            return
+
+        def step(node: BPlusTreeNode, before: int) -> int:
+            index = 0
+            rest = n - before
+            while index < node.key_count() and rest >= node.count_at(index):
+                rest -= node.count_at(index)
+                index += 1
+            return index
+
+        node, before, lo, hi = self.tree._leaf_shared(step, True)
+        self._settle(node, n - before, True, lambda: self.seek_nth(n), lo, hi)
+
+    def next(self) -> None:
+        if self._latch():
+            self._settle(self.node, self.index + 1, True, lambda: self.seek_gt(self.key_cur), self.lo, self.hi)
+        else:
+            self.seek_gt(self.key_cur)
+
+    def prev(self) -> None:
+        if self._latch():
+            self._settle(self.node, self.index - 1, False, lambda: self.seek_lt(self.key_cur), self.lo, self.hi)
+        else:
+            self.seek_lt(self.key_cur)
+
+    def close(self) -> None:
+        self.node = None
+        self._hold(None)
+        self.pager.read_ahead_scan_end()
+
+    def _hold(self, page_id: int | None) -> None:
+        """改为记着 page_id 的 version，None 为不再记"""
+        latches = self.pager.latches
+        if page_id is not None:
+            latches.ref(page_id)
+        if self.held is not None:
+            latches.unref(self.held)
+        self.held = page_id
+
+    def _latch(self) -> bool:
+        """对当前叶节点加共享闩，期间被改过时放开并返回 False；快照里的页不会变，不用加闩"""
+        if self.tree.snapshot is not None:
+            return True
+        latches = self.pager.latches
+        latches.acquire_shared(self.node.page_id)
+        if latches.version(self.node.page_id) == self.version:
+            return True
+        latches.release_shared(self.node.page_id)
+        return False
+
+    def _unlatch(self) -> None:
+        self.tree._unlatch(self.node)
+
+    def _settle(self, node: BPlusTreeNode, index: int, forward: bool, retry: Callable[[], None],
+                lo: bytes | None, hi: bytes | None) -> None:
+        """
+        node 已加共享闩，index 越过节点两端时移到邻居，记下位置后放开闩。
+        有叶链时沿链走，邻居正被写者独占时不在持闩状态下等待：放开闩，等写者结束后调用 retry 重新定位。
+        写时复制的树放开闩后从根下降：向右找包含 hi 的叶节点，向左找区间止于 lo 的叶节点。
+        """
+        while (index >= node.key_count()) if forward else (index < 0):
+            if self.pager.cow:
+                bound = hi if forward else lo
+                self.tree._unlatch(node)
+                if bound is None:
+                    self.node = None
+                    self._hold(None)
+                    return
+                if forward:
+                    node, _, lo, hi = self.tree._leaf_shared(lambda _node, _before: _node.get_page_id_index(bound))
+                    index = node.bisect_left(bound)
+                else:
+                    node, _, lo, hi = self.tree._leaf_shared(lambda _node, _before: _node.bisect_left(bound))
+                    index = node.bisect_left(bound) - 1
+                continue
+            page_id = node.right_page_id if forward else node.left_page_id
+            if page_id == NULL_PAGE_ID:
+                self.tree._unlatch(node)
+                self.node = None
+                self._hold(None)
+                return
+            if not self.tree._crab(node, page_id):
+                retry()
+                return
+            self.pager.read_ahead_scan(page_id, right_page_id_from_page if forward else left_page_id_from_page)
+            node = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, page_id)
+            index = 0 if forward else node.key_count() - 1
+            lo = hi = None
+        self.node = node
+        self.index = index
+        if self.tree.snapshot is None:
+            self._hold(node.page_id)
+            self.version = self.pager.latches.version(node.page_id)
+        self.key_cur = node.key_at(index)
+        self.val_cur = node.stored_val_at(index)
+        self.lo = lo
+        self.hi = hi
+        self.tree._unlatch(node)
+
+
+def new_b_plus_tree_cursor(tree: 'BPlusTree') -> BPlusTreeCursor:
+    cursor = BPlusTreeCursor()
+    cursor.tree = tree
+    cursor.pager = tree.pager
+    cursor.free_list = tree.free_list
+    cursor.node = None
+    cursor.index = 0
+    cursor.held = None
+    return cursor
+
+
+class LevelStats:
+    """树的一层：节点数，以及读过的节点（抽样时为样本）页内已用字节数的合计、最小和最大值"""
+
+    def __init__(self):
+        self.nodes: int = 0
+        self.sampled: int = 0
+        self.bytes_total: int = 0
+        self.bytes_min: int = 0
+        self.bytes_max: int = 0
+
+    def add(self, size: int) -> None:
+        self.bytes_min = size if self.sampled == 0 else min(self.bytes_min, size)
+        self.bytes_max = max(self.bytes_max, size)
+        self.bytes_total += size
+        self.sampled += 1
+
+    def bytes_avg(self) -> float:
+        return self.bytes_total / self.sampled if self.sampled > 0 else 0.0
+
+    def fill(self) -> float:
+        """平均填充率，相对 BYTES_PAGE"""
+        return self.bytes_avg() / BYTES_PAGE
+
+
+def new_level_stats(nodes: int) -> LevelStats:
+    stats = LevelStats()
+    stats.nodes = nodes
+    return stats
+
+
+def size_bucket(size: int) -> int:
+    """直方图的桶：不小于 size 的最小的 2 的幂，0 单独一桶"""
+    return 0 if size == 0 else 1 << (size - 1).bit_length()
+
+
+class BPlusTreeStats:
+    """
+    BPlusTree.stats 的结果。levels 自根向下；key_sizes / val_sizes 为字节数直方图（桶见 size_bucket），
+    溢出的 val 按总长度计。抽样时叶节点层的填充、直方图和 overflow_pages 只统计读过的叶节点，
+    其余各项都是准确值。leaf_breaks 为按 key 顺序相邻、但后一个不是前一个下一页的叶节点对数。
+    """
+
+    def __init__(self):
+        self.height: int = 0
+        self.count: int = 0
+        self.levels: list[LevelStats] = []
+        self.key_sizes: dict[int, int] = {}
+        self.val_sizes: dict[int, int] = {}
+        self.overflow_pages: int = 0
+        self.leaf_breaks: int = 0
+        self.bloom_pages: int = 0
+        self.free_pages: int = 0
+        self.free_list_pages: int = 0
+
+    def fragmentation(self) -> float:
+        """叶链上不连续的比例，0 为叶节点按顺序连续存放"""
+        leaves = self.levels[-1].nodes
+        return self.leaf_breaks / (leaves - 1) if leaves > 1 else 0.0
+
+    def pages(self) -> int:
+        """树占用的页数，抽样时溢出页只含样本里的"""
+        return sum(level.nodes for level in self.levels) + self.overflow_pages + self.bloom_pages
+
+
+def new_b_plus_tree_stats() -> BPlusTreeStats:
+    return BPlusTreeStats()
+
+
+class BPlusTree:
+    """
+    多个读者线程可与一个写者并发（写者之间由 pager 的 write_lock 串行）。
+    读者自根向下加共享闩，取到子节点的闩后放开父节点；写者对取到的页加独占闩，
+    单条写入和删除确定某层以上结构不变后，只改这些祖先的子树记录数并立即放开它们。
+    写时复制模式下可以用 at 取某个快照里的只读视图，读它不加闩，看到的是快照打开前最后一次提交的树。
+    可选的 Bloom 过滤器存在自己的页里，头页号记在 meta，get_one 下降前先查，不存在的 key 多数不读树的页；
+    写入先置过滤器的位再改树，删除不清位。
+    新页从本树的区段分配（见 extent.Extents），同一棵树的页在文件里聚在一起。
+    """
+
+    def __init__(self):
+        self.pager: Pager | None = None
+        self.free_list: ExtentFreeList | None = None
         self.seq: int = 0
-        self.root: BPlusTreeNode | None = None
+        self.snapshot: Snapshot | None = None
+
+    @property
+    def root(self) -> BPlusTreeNode:
+        """
+        每次按 meta 里的 root_page_id 取（走节点缓存），同一棵树的多个 BPlusTree 对象都能看到换根。
+        写者同时对根指针加独占闩；读者应走 _root_shared。
+        """
+        if self.snapshot is not None:
+            if self.pager.is_writer():
+                raise ValueError("快照只读")
+            return new_b_plus_tree_node_from_page_id(self.pager, self.free_list,
+                                                     self.snapshot.root_page_id_get(self.seq))
+        if self.pager.is_writer():
+            self.pager.latch_exclusive(self.root_latch_key())
+        root_page_id = self.pager.root_page_id_get(self.seq)
+        return new_b_plus_tree_node_from_page_id(self.pager, self.free_list, root_page_id)
+
+    @root.setter
+    def root(self, root: BPlusTreeNode) -> None:
+        self.pager.root_page_id_set(self.seq, root.page_id)
+
+    def root_latch_key(self) -> tuple[str, int]:
+        """根指针（meta 里的 root_page_id）的闩，与页的闩分开"""
+        return 'root', self.seq
+
+    def _root_sync(self, root: BPlusTreeNode) -> None:
+        """改完后根换了页（新建一层或写时复制）时，把新的 page_id 写进 meta"""
+        if root.page_id != self.pager.root_page_id_get(self.seq):
+            self.root = root
+
+    def at(self, snapshot: Snapshot) -> 'BPlusTree':
+        """本树在快照里的只读视图，快照关闭后不能再用"""
+        tree = new_b_plus_tree(self.pager, self.free_list, self.seq, False)
+        tree.snapshot = snapshot
+        return tree
+
+    def bloom_latch_key(self) -> tuple[str, int]:
+        return 'bloom', self.seq
+
+    def bloom(self) -> BloomFilter | None:
+        """本树的 Bloom 过滤器，快照视图不用"""
+        if self.snapshot is not None:
+            return None
+        page_id = self.pager.bloom_page_id_get(self.seq)
+        if page_id == NULL_PAGE_ID:
+            return None
+        return new_bloom_filter_from_page_id(self.pager, self.free_list, page_id)
+
+    def _bloom_add(self, keys: list[bytes]) -> None:
+        """写者在改树之前置位，只在置位期间独占过滤器的闩"""
+        if len(keys) == 0 or self.bloom() is None:
+            return
+        with self.pager.latch_exclusive_brief(self.bloom_latch_key()):
+            self.bloom().add(keys)
+
+    def _bloom_tap(self, key_vals: Iterable[tuple[bytes, bytes]]) -> Iterable[tuple[bytes, bytes]]:
+        """bulk_load 流式读取时按批把 key 加进过滤器"""
+        keys = []
+        for key_val in key_vals:
+            keys.append(key_val[0])
+            if len(keys) >= 1024:
+                self._bloom_add(keys)
+                keys = []
+            yield key_val
+        self._bloom_add(keys)
+
+    def _may_contain(self, key: bytes) -> bool:
+        """持闩取过滤器，重建时换下来的旧过滤器的页可能已被重用"""
+        if self.snapshot is not None or self.pager.bloom_page_id_get(self.seq) == NULL_PAGE_ID:
+            return True
+        with self.pager.latch_shared_gated(self.bloom_latch_key()):
+            bloom = self.bloom()
+            return bloom is None or bloom.may_contain(key)
+
+    def bloom_rebuild(self, bits_per_key: int | None = None) -> None:
+        """
+        按现有记录数重建过滤器，清掉删除留下的位；bits_per_key 为 None 时沿用原来的，为 0 时去掉过滤器。
+        重建期间独占过滤器的闩到操作结束，旧过滤器的页回收后可能马上被重用。
+        """
+        with self.pager.operation():
+            self.pager.latch_exclusive_gated(self.bloom_latch_key())
+            old = self.bloom()
+            if bits_per_key is None:
+                if old is None:
+                    raise ValueError("没有 Bloom 过滤器")
+                bits_per_key = old.bits_per_key
+            page_id = NULL_PAGE_ID
+            if bits_per_key > 0:
+                root = self.root
+                bloom = new_bloom_filter(self.pager, self.free_list, bits_per_key, root.count())
+                keys = []
+                for key in self._keys(root):
+                    keys.append(key)
+                    if len(keys) >= 1024:
+                        bloom.add(keys)
+                        keys = []
+                bloom.add(keys)
+                page_id = bloom.page_id
+            self.pager.bloom_page_id_set(self.seq, page_id)
+            if old is not None:
+                old.free()
+
+    def _keys(self, node: BPlusTreeNode) -> Iterable[bytes]:
+        """写者按顺序取子树里的全部 key，不走叶链，写时复制的树也能用"""
+        for key, _ in self._entries(node):
+            yield key
+
+    def _root_shared(self) -> BPlusTreeNode:
+        """对根节点加共享闩后返回，根正被写者独占时放开根指针等它结束再取；快照里不加闩"""
+        if self.snapshot is not None:
+            return new_b_plus_tree_node_from_page_id(self.pager, self.free_list,
+                                                     self.snapshot.root_page_id_get(self.seq))
+        latches = self.pager.latches
+        while True:
+            latches.acquire_shared(self.root_latch_key())
+            page_id = self.pager.root_page_id_get(self.seq)
+            latched = latches.acquire_shared(page_id, False)
+            latches.release_shared(self.root_latch_key())
+            if latched:
+                return new_b_plus_tree_node_from_page_id(self.pager, self.free_list, page_id)
+            latches.wait(page_id)
+
+    def _leaf_shared(self, step: Callable[[BPlusTreeNode, int], int], count: bool = False) \
+            -> tuple[BPlusTreeNode, int, bytes | None, bytes | None]:
+        """
+        读者自根向下加共享闩（crabbing），返回加着共享闩的叶节点，调用方用完后 _unlatch。
+        step(node, before) 给出下一层的子节点下标，count 为 True 时 before 是路径左侧子树的记录数之和。
+        同时返回叶节点的区间 [lo, hi)，取自路径上离它最近的分隔 key，None 表示不限。
+        子节点正被写者独占时不在持闩状态下等待：放开父节点，等写者结束后从根重来，不会死锁。
+        """
+        while True:
+            node = self._root_shared()
+            before = 0
+            lo = hi = None
+            while not node.is_leaf:
+                index = step(node, before)
+                if count:
+                    before += sum(node.count_at(i) for i in range(index))
+                if index > 0:
+                    lo = node.key_at(index - 1)
+                if index < node.key_count():
+                    hi = node.key_at(index)
+                page_id = node.page_id_at(index)
+                if not self._crab(node, page_id):
+                    break
+                node = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, page_id)
+            else:
+                return node, before, lo, hi
+
+    def _crab(self, node: BPlusTreeNode, page_id: int) -> bool:
+        """持着 node 的共享闩去取 page_id 的，取到后放开 node；取不到时放开 node 等写者结束，返回 False"""
+        if self.snapshot is not None:
+            return True
+        if not self.pager.latches.acquire_shared(page_id, False):
+            self._unlatch(node)
+            self.pager.latches.wait(page_id)
+            return False
+        self._unlatch(node)
+        return True
+
+    def _unlatch(self, node: BPlusTreeNode) -> None:
+        if self.snapshot is None:
+            self.pager.latches.release_shared(node.page_id)
+
+    def cursor(self) -> BPlusTreeCursor:
+        return new_b_plus_tree_cursor(self)
 
     def get_all(self) -> list[bytes]:
-        vals = self.root.get_ge(b'')
-        return vals
+        return self.range()
 
     def get_lt(self, key: bytes) -> list[bytes]:
-        vals = self.root.get_lt(key)
-        return vals
+        return self.range(hi=key, hi_inclusive=False)
 
     def get_le(self, key: bytes) -> list[bytes]:
-        vals = self.root.get_le(key)
-        return vals
+        return self.range(hi=key, hi_inclusive=True)
 
     def get_gt(self, key: bytes) -> list[bytes]:
-        vals = self.root.get_gt(key)
-        return vals
+        return self.range(lo=key, lo_inclusive=False)
 
     def get_ge(self, key: bytes) -> list[bytes]:
-        vals = self.root.get_ge(key)
+        return self.range(lo=key, lo_inclusive=True)
+
+    def range(self, lo: bytes | None = None, hi: bytes | None = None, lo_inclusive: bool = True,
+              hi_inclusive: bool = False, limit: int | None = None, offset: int = 0,
+              reverse: bool = False) -> list[bytes]:
+        """
+        返回 lo ~ hi 之间的 val，lo/hi 为 None 表示不限。
+        reverse 时从 hi 沿 left_page_id 倒序读；offset 按子树记录数直接定位，limit 读够即停。
+        """
+        cursor = self.cursor()
+        if not reverse:
+            if lo is None:
+                cursor.seek_first()
+            elif lo_inclusive:
+                cursor.seek(lo)
+            else:
+                cursor.seek_gt(lo)
+        else:
+            if hi is None:
+                cursor.seek_last()
+            elif hi_inclusive:
+                cursor.seek_le(hi)
+            else:
+                cursor.seek_lt(hi)
+
+        if offset > 0 and cursor.valid():
+            # 跳过的记录不经过叶节点
+            position = self.rank(cursor.key())
+            cursor.seek_nth(position - offset if reverse else position + offset)
+
+        vals = []
+        while cursor.valid() and (limit is None or len(vals) < limit):
+            key = cursor.key()
+            if not reverse and hi is not None and (key > hi or (key == hi and not hi_inclusive)):
+                break
+            if reverse and lo is not None and (key < lo or (key == lo and not lo_inclusive)):
+                break
+            val = cursor.val()
+            # 游标停下之后被并发删除的记录跳过
+            if val is not None:
+                vals.append(val)
+            if reverse:
+                cursor.prev()
+            else:
+                cursor.next()
+        cursor.close()
         return vals
 
+    def count(self) -> int:
+        """记录总数，只读根节点"""
+        root = self._root_shared()
+        try:
+            return root.count()
+        finally:
+            self._unlatch(root)
+
+    def count_range(self, lo: bytes | None = None, hi: bytes | None = None, lo_inclusive: bool = True,
+                    hi_inclusive: bool = False) -> int:
+        """lo ~ hi 之间的记录数，参数含义同 range"""
+        start = 0 if lo is None else self._rank(lo, not lo_inclusive)
+        end = self.count() if hi is None else self._rank(hi, hi_inclusive)
+        return max(end - start, 0)
+
+    def rank(self, key: bytes) -> int:
+        """< key 的记录数，即 key 按顺序的下标"""
+        return self._rank(key, False)
+
+    def _rank(self, key: bytes, inclusive: bool) -> int:
+        """< key（inclusive 时 <= key）的记录数：路径左侧子树的记录数之和加上叶节点内的下标"""
+        leaf, before, _, _ = self._leaf_shared(lambda node, _before: node.get_page_id_index(key), True)
+        try:
+            return before + (leaf.bisect_right(key) if inclusive else leaf.bisect_left(key))
+        finally:
+            self._unlatch(leaf)
+
     def get_one(self, key: bytes) -> bytes | None:
-        val = self.root.get_one(key)
-        return val
+        if not self._may_contain(key):
+            return None
+        leaf, _, _, _ = self._leaf_shared(lambda node, _before: node.get_page_id_index(key))
+        try:
+            return leaf._get_one(key)
+        finally:
+            self._unlatch(leaf)
+
+    def stats(self, sample: int = 0) -> BPlusTreeStats:
+        """
+        逐层读出内部节点，统计各层节点数和填充；叶节点的顺序取自父节点，算碎片不用读叶节点。
+        sample 大于 0 且叶节点更多时只随机读 sample 个叶节点。
+        统计期间持有 write_lock，写者等它结束，读者不受影响。
+        """
+        with self.pager.write_lock:
+            stats = new_b_plus_tree_stats()
+            if self.snapshot is not None:
+                root_page_id = self.snapshot.root_page_id_get(self.seq)
+            else:
+                root_page_id = self.pager.root_page_id_get(self.seq)
+            stats.count = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, root_page_id).count()
+            page_ids = [root_page_id]
+            while True:
+                level = new_level_stats(len(page_ids))
+                stats.levels.append(level)
+                if new_b_plus_tree_node_from_page_id(self.pager, self.free_list, page_ids[0]).is_leaf:
+                    break
+                children = []
+                for page_id in page_ids:
+                    node = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, page_id)
+                    level.add(node.size())
+                    children.extend(node.page_id_at(i) for i in range(node.key_count() + 1))
+                page_ids = children
+            stats.height = len(stats.levels)
+            stats.leaf_breaks = sum(b != a + 1 for a, b in zip(page_ids, page_ids[1:]))
+            if 0 < sample < len(page_ids):
+                page_ids = random.sample(page_ids, sample)
+            for page_id in page_ids:
+                node = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, page_id)
+                level.add(node.size())
+                for i in range(node.key_count()):
+                    key_size = size_bucket(len(node.key_at(i)))
+                    stats.key_sizes[key_size] = stats.key_sizes.get(key_size, 0) + 1
+                    val = node.stored_val_at(i)
+                    if isinstance(val, Overflow):
+                        length = val.length
+                        stats.overflow_pages += -(-length // BYTES_OVERFLOW_DATA)
+                    else:
+                        length = len(val)
+                    val_size = size_bucket(length)
+                    stats.val_sizes[val_size] = stats.val_sizes.get(val_size, 0) + 1
+            bloom = self.bloom()
+            if bloom is not None:
+                stats.bloom_pages = 1 + sum(len(s.page_ids) for s in bloom.slices)
+            stats.free_pages, stats.free_list_pages = self.free_list.length()
+            return stats
 
     def add(self, key_vals: list[tuple[bytes, bytes]]) -> None:
-        for key, val in key_vals:
-            if self.root.is_full():
-                child = self.root
-                new_root = new_b_plus_tree_node(self.pager, self.free_list, False)
-                _key = child.keys[DEGREE - 1]
-                if child.is_leaf:
-                    _key = child.keys[DEGREE]
-                new_root.keys = [_key]
-                new_root.page_ids = [child.page_id]
-                child_new = child.split()
-                new_root.page_ids.append(child_new.page_id)
-                new_root.persist()
-                self.pager.root_page_id_set(self.seq, new_root.page_id)
-                self.root = new_root
-            self.root.add(key, val)
+        """已存在的 key 保持不变，批内重复的 key 保留第一条"""
+        self.write(key_vals, False)
 
     def upsert(self, key_vals: list[tuple[bytes, bytes]]) -> None:
+        """批内重复的 key 保留最后一条"""
+        self.write(key_vals, True)
+
+    def write(self, key_vals: list[tuple[bytes, bytes]], replace: bool) -> None:
+        """
+        整批按 key 排序后自顶向下分组写入，每个被改动的页只写一次。
+        单条写入先找出结构会变的最高节点，从它开始写，之上的祖先已提前放开；整批写入持闩到操作结束。
+        写时复制时每次写入都换页到根，不提前放开祖先。
+        """
+        batch = {}
         for key, val in key_vals:
-            if self.root.is_full():
-                child = self.root
+            check_key(key)
+            if replace or key not in batch:
+                batch[key] = val
+        if len(batch) == 0:
+            return
+        key_vals = sorted(batch.items())
+        with self.pager.operation():
+            self._bloom_add([key for key, _ in key_vals])
+            root = self.root
+            if len(key_vals) == 1 and not self.pager.cow:
+                root, is_root = self._write_start(key_vals[0][0], key_vals[0][1], replace)
+                if root is None:
+                    return
+                if not is_root:
+                    root.write(key_vals, replace)
+                    return
+            splits = root.write(key_vals, replace)
+            while len(splits) > 0:
+                # 根被切开，新建一层
                 new_root = new_b_plus_tree_node(self.pager, self.free_list, False)
-                _key = child.keys[DEGREE - 1]
-                if child.is_leaf:
-                    _key = child.keys[DEGREE]
-                new_root.keys = [_key]
-                new_root.page_ids = [child.page_id]
-                child_new = child.split()
-                new_root.page_ids.append(child_new.page_id)
-                new_root.persist()
-                self.pager.root_page_id_set(self.seq, new_root.page_id)
-                self.root = new_root
-            self.root.upsert(key, val)
+                new_root.keys = [key for key, _ in splits]
+                new_root.page_ids = [root.page_id] + [node.page_id for _, node in splits]
+                new_root.counts = [root.count()] + [node.count() for _, node in splits]
+                splits = []
+                if new_root.size() <= BYTES_NODE:
+                    new_root.persist()
+                else:
+                    splits = new_root.split()
+                root = new_root
+            self._root_sync(root)
+
+    def bulk_load(self, key_vals: Iterable[tuple[bytes, bytes]], is_sorted: bool = False) -> None:
+        """
+        空树自底向上批量建树：按 key 顺序把叶节点装到 BYTES_NODE 写出，再逐层建内部节点，
+        每页只写一次，最后一次性切换根。key 重复时保留第一条，与 add 一致。
+        is_sorted 为 True 时按流式读取，不整体排序，遇到逆序的 key 报错。
+        """
+        if not is_sorted:
+            key_vals = sorted(key_vals, key=lambda key_val: key_val[0])
+        with self.pager.operation():
+            if not (self.root.is_leaf and self.root.is_empty()):
+                raise ValueError("bulk_load 只能用于空树")
+            level = self._bulk_load_level(self._bloom_tap(key_vals), True)
+            if len(level) == 0:
+                return
+            while len(level) > 1:
+                level = self._bulk_load_level(level, False)
+            old_root = self.root
+            self.root = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, level[0][1])
+            self.free_list.add_page_id(old_root.page_id)
+
+    def _bulk_load_level(self, entries: Iterable[tuple], is_leaf: bool, sequential: bool = False) \
+            -> list[tuple[bytes, int, int]]:
+        """
+        把一层的记录依次装进节点，返回每个节点的分隔 key、page_id 和子树记录数，作为上一层的记录。
+        叶节点的记录是 (key, val)，内部节点的记录是 (分隔 key, 子节点 page_id, 子树记录数)，
+        每个内部节点的第一个子节点放在页头，不带 key。
+        节点在确定右邻之后才写出，保证每页只写一次。sequential 见 new_b_plus_tree_node。
+        """
+        level = []
+        counts = []
+        node = None
+        size = 0
+        key_last = None
+        for entry in entries:
+            key, val = entry[0], entry[1]
+            if key_last is not None:
+                if key < key_last:
+                    raise ValueError("key 未排序")
+                if key == key_last:
+                    continue
+            if is_leaf:
+                check_key(key)
+                val = store_val(self.pager, self.free_list, key, val)
+                size_entry = leaf_entry_size(key, val)
+            else:
+                size_entry = internal_entry_size(key)
+            full = node is None
+            if node is not None:
+                # 按加入这一条之后的公共前缀估算压缩后的大小
+                num_keys = len(node.keys) + 1
+                prefix = len(common_prefix(node.keys[:1] + [key]))
+                full = BYTES_NODE_HEADER + prefix + size + size_entry - prefix * num_keys > BYTES_NODE
+            if full:
+                node_new = new_b_plus_tree_node(self.pager, self.free_list, is_leaf, sequential)
+                key_up = key
+                if node is not None:
+                    if not self.pager.cow:
+                        node_new.left_page_id = node.page_id
+                        node.right_page_id = node_new.page_id
+                    node.persist()
+                    if is_leaf:
+                        key_up = separator(key_last, key)
+                node = node_new
+                size = 0
+                level.append((key_up, node.page_id))
+                counts.append(0)
+                if not is_leaf:
+                    key_last = key
+                    node.page_ids.append(val)
+                    node.counts.append(entry[2])
+                    counts[-1] += entry[2]
+                    continue
+            key_last = key
+            node.keys.append(key)
+            if is_leaf:
+                node.vals.append(val)
+                counts[-1] += 1
+            else:
+                node.page_ids.append(val)
+                node.counts.append(entry[2])
+                counts[-1] += entry[2]
+            size += size_entry
+        if node is not None:
+            node.persist()
+        return [(key, page_id, count) for (key, page_id), count in zip(level, counts)]
+
+    def rebuild(self) -> None:
+        """
+        在线重建：按 key 顺序把现有记录装进从文件末尾新取的连续页，叶节点在文件里依次相邻且装满，
+        溢出页原样沿用；最后在一次操作里切换根、回收旧树的页。
+        建新树期间持有 write_lock，写者等它结束；旧树没有写者，读者照常读它，不用加闩。
+        """
+        if self.snapshot is not None:
+            raise ValueError("快照只读")
+        with self.pager.write_lock:
+            old_root = new_b_plus_tree_node_from_page_id(self.pager, self.free_list,
+                                                         self.pager.root_page_id_get(self.seq))
+            level = self._bulk_load_level(self._entries(old_root), True, True)
+            if len(level) == 0:
+                root = new_b_plus_tree_node(self.pager, self.free_list, True, True)
+                root.persist()
+            else:
+                while len(level) > 1:
+                    level = self._bulk_load_level(level, False, True)
+                root = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, level[0][1])
+            with self.pager.operation():
+                old_root = self.root
+                self.root = root
+                old_root._free_subtree(False)
+
+    def _entries(self, node: BPlusTreeNode) -> Iterable[tuple[bytes, bytes | Overflow]]:
+        """按顺序取子树里的全部记录，溢出的 val 只取引用"""
+        if node.is_leaf:
+            yield from zip(node.keys, node.vals)
+            return
+        for index in range(node.key_count() + 1):
+            yield from self._entries(new_b_plus_tree_node_from_page_id(self.pager, self.free_list,
+                                                                        node.page_id_at(index)))
 
     def update_lt(self, key_search: bytes, index_vals: list[tuple[int, bytes]]) -> None:
-        for index, val in index_vals:
-            self.root.update_lt(key_search, index, val)
+        """
+        每个 (index, val) 把范围内的 val 从 index 起改写为 val。不变长的改写原地进行；
+        改写后放不下原叶节点的记录不动它，随后按 upsert 走写入路径，叶节点照常分裂
+        """
+        with self.pager.operation():
+            for index, val in index_vals:
+                root = self.root
+                grown = root.update_lt(key_search, index, val)
+                self._root_sync(root)
+                if len(grown) > 0:
+                    self.upsert(grown)
 
     def update_le(self, key_search: bytes, index_vals: list[tuple[int, bytes]]) -> None:
-        for index, val in index_vals:
-            self.root.update_le(key_search, index, val)
+        with self.pager.operation():
+            for index, val in index_vals:
+                root = self.root
+                grown = root.update_le(key_search, index, val)
+                self._root_sync(root)
+                if len(grown) > 0:
+                    self.upsert(grown)
 
     def update_gt(self, key_search: bytes, index_vals: list[tuple[int, bytes]]) -> None:
-        for index, val in index_vals:
-            self.root.update_gt(key_search, index, val)
+        with self.pager.operation():
+            for index, val in index_vals:
+                root = self.root
+                grown = root.update_gt(key_search, index, val)
+                self._root_sync(root)
+                if len(grown) > 0:
+                    self.upsert(grown)
 
     def update_ge(self, key_search: bytes, index_vals: list[tuple[int, bytes]]) -> None:
-        for index, val in index_vals:
-            self.root.update_ge(key_search, index, val)
+        with self.pager.operation():
+            for index, val in index_vals:
+                root = self.root
+                grown = root.update_ge(key_search, index, val)
+                self._root_sync(root)
+                if len(grown) > 0:
+                    self.upsert(grown)
 
     def delete_one(self, key: bytes) -> None:
-        self.root.delete_one(key)
-        if self.root.is_empty() and not self.root.is_leaf:
-            page_id = self.root.page_ids[0]
-            new_root = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, page_id)
-            self.pager.root_page_id_set(self.seq, new_root.page_id)
-            self.root = new_root
+        with self.pager.operation():
+            if self.pager.cow:
+                root = self.root
+                root.delete_one(key)
+                self._root_sync(root)
+                self._shrink_root()
+                return
+            start, is_root = self._delete_start(key)
+            if start is None:
+                return
+            start.delete_one(key)
+            if is_root:
+                self._shrink_root()
+
+    def _path(self, key: bytes) -> tuple[list[tuple[BPlusTreeNode, int]], BPlusTreeNode]:
+        """写者持独占闩从根走到 key 所在的叶节点，返回沿途的 (内部节点, 子节点下标) 和叶节点"""
+        path = []
+        node = self.root
+        while not node.is_leaf:
+            index = node.get_page_id_index(key)
+            path.append((node, index))
+            node = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, node.page_id_at(index))
+        return path, node
+
+    def _release_ancestors(self, path: list[tuple[BPlusTreeNode, int]], depth: int, delta: int) -> None:
+        """
+        path[:depth] 的结构不会再变，只把子树记录数加上 delta，写回后放开它们和根指针，
+        读者不用等下面的节点改完
+        """
+        if depth == 0:
+            return
+        for node, index in path[:depth]:
+            if delta != 0:
+                node.counts[index] += delta
+                node.persist()
+        self.pager.latch_release([self.root_latch_key()] + [node.page_id for node, _ in path[:depth]])
+
+    def _write_start(self, key: bytes, val: bytes, replace: bool) -> tuple[BPlusTreeNode | None, bool]:
+        """
+        单条写入的 crabbing。前缀压缩下插入一条可能把叶节点切成多段，分裂会传到哪一层只有到了叶节点才知道，
+        所以先持闩走到叶节点，再自下而上估算每层最多分裂出几个节点，第一个放得下的节点以上的祖先提前放开。
+        返回要从它开始写入的节点及它是否为根，key 已存在且不覆盖时返回 None。
+        """
+        path, leaf = self._path(key)
+        i = leaf.bisect_left(key)
+        exists = i < leaf.key_count() and leaf.key_at(i) == key
+        if exists and not replace:
+            return None, False
+        depth = len(path)
+        pushed = leaf.split_count(stored_entry_size(key, val))
+        while depth > 0 and pushed > 0:
+            depth -= 1
+            pushed = path[depth][0].split_count(pushed * internal_entry_size(b'\x00' * BYTES_KEY_MAX))
+        start = path[depth][0] if depth < len(path) else leaf
+        self._release_ancestors(path, depth, 0 if exists else 1)
+        return start, depth == 0
+
+    def _delete_start(self, key: bytes) -> tuple[BPlusTreeNode | None, bool]:
+        """
+        单条删除的 crabbing：叶节点删除后仍不低于 BYTES_NODE_MIN 时父节点不用借位或合并，
+        内部节点按 may_underflow 估算，第一个不会下溢的节点以上的祖先提前放开。key 不存在时返回 None。
+        """
+        path, leaf = self._path(key)
+        i = leaf.bisect_left(key)
+        if i == leaf.key_count() or leaf.key_at(i) != key:
+            return None, False
+        depth = len(path)
+        keys = leaf.keys
+        vals = leaf.vals
+        shrink = node_size(True, keys[:i] + keys[i + 1:], vals[:i] + vals[i + 1:]) < BYTES_NODE_MIN
+        while depth > 0 and shrink:
+            depth -= 1
+            shrink = path[depth][0].may_underflow()
+        start = path[depth][0] if depth < len(path) else leaf
+        self._release_ancestors(path, depth, -1)
+        return start, depth == 0
 
     def delete_lt(self, key: bytes) -> None:
-        self.root.delete_lt(key)
-        # 收缩根：如果根（内部节点）只剩 0 个 keys，说明只有一个子节点，下降一层
-        while self.root.is_empty() and not self.root.is_leaf:
-            old_root = self.root
-            page_id = old_root.page_ids[0]
-            new_root = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, page_id)
-            self.free_list.add_page_id(old_root.page_id)
-            self.pager.root_page_id_set(self.seq, new_root.page_id)
-            self.root = new_root
+        with self.pager.operation():
+            root = self.root
+            root.delete_lt(key)
+            self._root_sync(root)
+            self._shrink_root()
 
     def delete_le(self, key: bytes) -> None:
-        self.root.delete_le(key)
-        # 收缩根：如果根（内部节点）只剩 0 个 keys，下降一层
-        while self.root.is_empty() and not self.root.is_leaf:
-            old_root = self.root
-            page_id = old_root.page_ids[0]
-            new_root = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, page_id)
-            self.free_list.add_page_id(old_root.page_id)
-            self.pager.root_page_id_set(self.seq, new_root.page_id)
-            self.root = new_root
+        with self.pager.operation():
+            root = self.root
+            root.delete_le(key)
+            self._root_sync(root)
+            self._shrink_root()
 
     def delete_gt(self, key: bytes) -> None:
-        self.root.delete_gt(key)
-        # 收缩根：根只剩一个子节点时下降一层
-        while self.root.is_empty() and not self.root.is_leaf:
-            old_root = self.root
-            page_id = old_root.page_ids[0]
-            new_root = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, page_id)
-            self.free_list.add_page_id(old_root.page_id)
-            self.pager.root_page_id_set(self.seq, new_root.page_id)
-            self.root = new_root
+        with self.pager.operation():
+            root = self.root
+            root.delete_gt(key)
+            self._root_sync(root)
+            self._shrink_root()
 
     def delete_ge(self, key: bytes) -> None:
-        self.root.delete_ge(key)
-        # 收缩根：根只剩一个子节点时下降一层
-        while self.root.is_empty() and not self.root.is_leaf:
-            old_root = self.root
-            page_id = old_root.page_ids[0]
-            new_root = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, page_id)
+        with self.pager.operation():
+            root = self.root
+            root.delete_ge(key)
+            self._root_sync(root)
+            self._shrink_root()
+
+    def _shrink_root(self) -> None:
+        # 收缩根：根（内部节点）只剩 0 个 keys，说明只有一个子节点，下降一层
+        root = self.root
+        while root.is_empty() and not root.is_leaf:
+            old_root = root
+            root = new_b_plus_tree_node_from_page_id(self.pager, self.free_list, old_root.page_id_at(0))
             self.free_list.add_page_id(old_root.page_id)
-            self.pager.root_page_id_set(self.seq, new_root.page_id)
-            self.root = new_root
+            self.root = root
 
 
-def new_b_plus_tree(pager: Pager, free_list: FreeList, seq: int, is_seq_new: bool) -> BPlusTree:
+def new_b_plus_tree(pager: Pager, free_list: FreeList, seq: int, is_seq_new: bool,
+                    bloom_bits_per_key: int = 0) -> BPlusTree:
+    """
+    bloom_bits_per_key 大于 0 时给树配 Bloom 过滤器，已有的树还没有过滤器时扫一遍建出来；
+    为 0 时沿用 meta 里已有的过滤器（若有）
+    """
     tree = BPlusTree()
     tree.pager = pager
-    tree.free_list = free_list
+    tree.free_list = new_extent_free_list(pager, free_list, seq)
     tree.seq = seq
     if is_seq_new:
-        tree.root = new_b_plus_tree_node(pager, free_list, True)
-        tree.root.persist()
-        pager.root_page_id_set(seq, tree.root.page_id)
-    else:
-        root_page_id = pager.root_page_id_get(seq)
-        tree.root = new_b_plus_tree_node_from_page_id(pager, free_list, root_page_id)
+        with pager.operation():
+            root = new_b_plus_tree_node(pager, tree.free_list, True)
+            root.persist()
+            tree.root = root
+    if bloom_bits_per_key > 0 and pager.bloom_page_id_get(seq) == NULL_PAGE_ID:
+        tree.bloom_rebuild(bloom_bits_per_key)
     return tree
@@ -1,17 +1,22 @@
 import inspect
 import os
+import random
+import threading
+import time
 import pytest
 
-from b_plus_tree import BPlusTreeNode, BPlusTree, new_b_plus_tree_node_from_page_id, new_b_plus_tree
-from free_list import new_free_list
-from const import META_PAGE_ID
+from b_plus_tree import BPlusTreeNode, BPlusTree, new_b_plus_tree_node_from_page_id, new_b_plus_tree, \
+    leaf_entry_size, separator, node_size
+from free_list import new_free_list, new_free_list_from_page_id, new_free_list_node_from_page_id
+from overflow import Overflow
+from const import META_PAGE_ID, BYTES_PAGE, BYTES_KEY_MAX, BYTES_ENTRY_MAX, BYTES_NODE_HEADER, NULL_PAGE_ID
 from file import file_open
 from pager import new_pager
 
 
-def init(name: str) -> tuple[int, BPlusTree]:
+def init(name: str, cow: bool = False) -> tuple[int, BPlusTree]:
     fd = file_open(f'{name}.db')
-    pager = new_pager(fd)
+    pager = new_pager(fd, cow=cow)
     free_list = new_free_list(pager, META_PAGE_ID)
     b_plus_tree = new_b_plus_tree(pager, free_list, 0, True)
     return fd, b_plus_tree
@@ -89,6 +94,23 @@ def test_add_6():
     close(fd, name)
 
 
+def test_upsert_split_separator():
+    """子节点分裂后，等于新分隔 key 的 key 要进右边的新节点，不能在左边再插一份"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'%04d' % i for i in range(1000)]
+    for i in range(1000):
+        o = keys[i * 7 % 1000]
+        b_plus_tree.add([(o, o)])
+    for i in range(1000):
+        o = keys[i * 13 % 1000]
+        b_plus_tree.upsert([(o, o + b'-' * 100)])
+    for o in keys:
+        assert b_plus_tree.get_one(o) == o + b'-' * 100
+    assert b_plus_tree.get_all() == [o + b'-' * 100 for o in keys]
+    close(fd, name)
+
+
 def test_get_one_1():
     name = inspect.currentframe().f_code.co_name
     fd, b_plus_tree = init(name)
@@ -698,5 +720,1204 @@ def test_delete_ge_7_delete_within_leaf():
     close(fd, name)
 
 
+def test_update_multi_level():
+    """多层树上 update_lt/le/gt/ge 改的是给定偏移处的字节，不是下降时子节点的下标"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'%04d' % i for i in range(1000)]
+    for o in keys:
+        b_plus_tree.add([(o, b'.' * 100)])
+    b_plus_tree.update_lt(b'0300.', [(5, b'a')])
+    b_plus_tree.update_le(b'0300.', [(6, b'b')])
+    b_plus_tree.update_gt(b'0700.', [(7, b'c')])
+    b_plus_tree.update_ge(b'0700.', [(8, b'd')])
+    for i, o in enumerate(keys):
+        val = bytearray(b'.' * 100)
+        if i <= 300:
+            val[5:7] = b'ab'
+        if i > 700:
+            val[7:9] = b'cd'
+        assert b_plus_tree.get_one(o) == bytes(val), o
+    close(fd, name)
+
+
+@pytest.mark.parametrize('cow', [False, True])
+def test_update_grow(cow):
+    """改写后变长、原叶节点放不下时叶节点照常分裂，溢出的部分存到溢出页，节点都放得进一页"""
+    name = f'{inspect.currentframe().f_code.co_name}_{cow}'
+    fd, b_plus_tree = init(name, cow)
+    keys = [b'%04d' % i for i in range(1000)]
+    b_plus_tree.add([(o, b'.' * 20) for o in keys])
+    b_plus_tree.update_ge(b'0200.', [(20, b'a' * 150)])
+    b_plus_tree.update_lt(b'0100.', [(20, b'b' * 3000), (3020, b'c')])
+    b_plus_tree.update_gt(b'0200.', [(0, b'd')])
+    for i, o in enumerate(keys):
+        val = b'.' * 20
+        if i > 200:
+            val = b'd' + val[1:] + b'a' * 150
+        elif i <= 100:
+            val += b'b' * 3000 + b'c'
+        assert b_plus_tree.get_one(o) == val, o
+    assert check_nodes(b_plus_tree.root, set()) == len(keys)
+    close(fd, name)
+
+
+# ──────────────────────────────────────────────
+# cursor 测试
+# ──────────────────────────────────────────────
+
+def test_cursor_1_next():
+    """seek 之后逐条向后读，跨越多个叶节点"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'a', b'b', b'c', b'd', b'e', b'f', b'g', b'h', b'i', b'j']
+    for o in keys:
+        b_plus_tree.add([(o, o)])
+    cursor = b_plus_tree.cursor()
+    cursor.seek(b'c')
+    assert [k for k, _ in cursor] == keys[2:]
+    cursor.seek(b'cc')
+    assert cursor.key() == b'd'
+    cursor.seek(b'z')
+    assert not cursor.valid()
+    close(fd, name)
+
+
+def test_cursor_2_prev():
+    """倒序遍历"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'a', b'b', b'c', b'd', b'e', b'f', b'g', b'h', b'i', b'j']
+    for o in keys:
+        b_plus_tree.add([(o, o)])
+    cursor = b_plus_tree.cursor()
+    cursor.seek_last()
+    result = []
+    while cursor.valid():
+        result.append(cursor.val())
+        cursor.prev()
+    assert result == keys[::-1]
+    cursor.seek_le(b'ee')
+    assert cursor.key() == b'e'
+    cursor.seek_lt(b'e')
+    assert cursor.key() == b'd'
+    cursor.seek_lt(b'a')
+    assert not cursor.valid()
+    close(fd, name)
+
+
+def test_cursor_3_stop_early():
+    """只读前几条就停止，不会读完整条叶链"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'%02d' % i for i in range(40)]
+    for o in keys:
+        b_plus_tree.add([(o, o)])
+    cursor = b_plus_tree.cursor()
+    cursor.seek_first()
+    misses = b_plus_tree.pager.misses
+    result = []
+    for k, _ in cursor:
+        result.append(k)
+        if len(result) == 3:
+            break
+    cursor.close()
+    assert result == keys[:3]
+    assert b_plus_tree.pager.misses == misses
+    close(fd, name)
+
+
+def test_cursor_4_empty():
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    cursor = b_plus_tree.cursor()
+    cursor.seek_first()
+    assert not cursor.valid()
+    cursor.seek_last()
+    assert not cursor.valid()
+    assert b_plus_tree.get_all() == []
+    close(fd, name)
+
+
+# ──────────────────────────────────────────────
+# range 测试
+# ──────────────────────────────────────────────
+
+def test_range_1_bounds():
+    """上下界及是否包含"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'a', b'b', b'c', b'd', b'e', b'f', b'g', b'h', b'i', b'j']
+    for o in keys:
+        b_plus_tree.add([(o, o)])
+    assert b_plus_tree.range(b'c', b'f') == [b'c', b'd', b'e']
+    assert b_plus_tree.range(b'c', b'f', False, True) == [b'd', b'e', b'f']
+    assert b_plus_tree.range(b'cc', b'ff') == [b'd', b'e', b'f']
+    assert b_plus_tree.range(None, b'c') == [b'a', b'b']
+    assert b_plus_tree.range(b'h', None) == [b'h', b'i', b'j']
+    assert b_plus_tree.range(b'f', b'c') == []
+    close(fd, name)
+
+
+def test_range_2_reverse():
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'a', b'b', b'c', b'd', b'e', b'f', b'g', b'h', b'i', b'j']
+    for o in keys:
+        b_plus_tree.add([(o, o)])
+    assert b_plus_tree.range(b'c', b'f', reverse=True) == [b'e', b'd', b'c']
+    assert b_plus_tree.range(b'c', b'f', False, True, reverse=True) == [b'f', b'e', b'd']
+    assert b_plus_tree.range(reverse=True) == keys[::-1]
+    close(fd, name)
+
+
+def test_range_3_limit_offset():
+    """分页：limit 读够即停，offset 跳过前几条"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'%02d' % i for i in range(40)]
+    for o in keys:
+        b_plus_tree.add([(o, o)])
+    assert b_plus_tree.range(limit=5) == keys[:5]
+    assert b_plus_tree.range(limit=5, offset=10) == keys[10:15]
+    assert b_plus_tree.range(b'20', limit=3, reverse=True) == keys[-3:][::-1]
+    assert b_plus_tree.range(b'20', b'30', limit=3, offset=2, reverse=True) == [b'27', b'26', b'25']
+    assert b_plus_tree.range(limit=0) == []
+    close(fd, name)
+
+
+def height(node: BPlusTreeNode) -> int:
+    h = 1
+    while not node.is_leaf:
+        node = new_b_plus_tree_node_from_page_id(node.pager, node.free_list, node.page_ids[0])
+        h += 1
+    return h
+
+
+def check_nodes(node: BPlusTreeNode, page_ids: set[int]) -> int:
+    """每个节点都放得进一页，没有页被两个节点共用，内部节点记录的子树记录数准确，返回子树记录数"""
+    assert node.page_id not in page_ids
+    page_ids.add(node.page_id)
+    assert node.size() <= BYTES_PAGE
+    if node.is_leaf:
+        return len(node.keys)
+    for page_id, count in zip(node.page_ids, node.counts):
+        child = new_b_plus_tree_node_from_page_id(node.pager, node.free_list, page_id)
+        assert check_nodes(child, page_ids) == count
+    return sum(node.counts)
+
+
+def test_capacity_1_fanout():
+    """节点按字节数装满一页才分裂，1000 条小记录两层就够"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'%04d' % i for i in range(1000)]
+    for o in keys:
+        b_plus_tree.add([(o, o)])
+    assert height(b_plus_tree.root) == 2
+    check_nodes(b_plus_tree.root, set())
+    assert b_plus_tree.get_all() == keys
+    close(fd, name)
+
+
+def test_capacity_2_large_vals():
+    """大记录下多层树的分裂、借位、合并"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'%04d' % i for i in range(300)]
+    for o in keys:
+        b_plus_tree.add([(o, o * 200)])
+    assert height(b_plus_tree.root) >= 2
+    check_nodes(b_plus_tree.root, set())
+    for o in keys[::2]:
+        b_plus_tree.delete_one(o)
+    check_nodes(b_plus_tree.root, set())
+    assert b_plus_tree.get_all() == [o * 200 for o in keys[1::2]]
+    close(fd, name)
+
+
+def test_capacity_3_range_delete_reuse():
+    """范围删除释放的页只进空闲链表一次，重新插入后不会被两个节点共用"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'%04d' % i for i in range(300)]
+    for o in keys:
+        b_plus_tree.add([(o, o * 200)])
+    b_plus_tree.delete_lt(b'0100')
+    b_plus_tree.delete_ge(b'0200')
+    check_nodes(b_plus_tree.root, set())
+    for o in keys:
+        b_plus_tree.upsert([(o, o * 100)])
+    check_nodes(b_plus_tree.root, set())
+    assert b_plus_tree.get_all() == [o * 100 for o in keys]
+    close(fd, name)
+
+
+def test_capacity_4_entry_too_large():
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    with pytest.raises(ValueError):
+        b_plus_tree.add([(b'k' * (BYTES_KEY_MAX + 1), b'')])
+    # val 不再受单页限制，放不下的存到溢出页
+    b_plus_tree.add([(b'k' * BYTES_KEY_MAX, b'v' * BYTES_ENTRY_MAX)])
+    assert b_plus_tree.get_one(b'k' * BYTES_KEY_MAX) == b'v' * BYTES_ENTRY_MAX
+    close(fd, name)
+
+
+def test_slotted_1_lookup_without_decode():
+    """查找在页视图上二分，不解码整个节点"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'%04d' % i for i in range(1000)]
+    for o in keys:
+        b_plus_tree.add([(o, o * 2)])
+    page_id = b_plus_tree.root.page_ids[-1]
+    b_plus_tree.pager.node_cache.clear()
+    node = new_b_plus_tree_node_from_page_id(b_plus_tree.pager, b_plus_tree.free_list, page_id)
+    key = node.key_at(node.key_count() // 2)
+    assert node.get_one(key) == key * 2
+    assert node.get_one(key + b'0') is None
+    assert node.bisect_right(key) == node.key_count() // 2 + 1
+    assert node._keys is None
+    assert node.keys[node.key_count() // 2] == key
+    close(fd, name)
+
+
+def test_slotted_2_roundtrip():
+    """解码后重新编码，页内容不变"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    for o in [b'%04d' % i for i in range(500)]:
+        b_plus_tree.add([(o, o * 3)])
+    for page_id in [b_plus_tree.root.page_id] + b_plus_tree.root.page_ids:
+        b_plus_tree.pager.node_cache.clear()
+        node = new_b_plus_tree_node_from_page_id(b_plus_tree.pager, b_plus_tree.free_list, page_id)
+        page_bs = bytes(node.view)
+        node.decode()
+        assert bytes(node) == page_bs
+    close(fd, name)
+
+
+def test_bulk_load_1():
+    """批量建树与逐条插入结果一致，叶节点装满"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'%05d' % i for i in range(5000)]
+    b_plus_tree.bulk_load([(o, o * 3) for o in reversed(keys)])
+    # 公共前缀压缩后每页能放下的记录只会更多
+    per_leaf = (BYTES_PAGE - BYTES_NODE_HEADER) // leaf_entry_size(keys[0], keys[0] * 3)
+    assert height(b_plus_tree.root) == 2
+    assert len(b_plus_tree.root.page_ids) <= -(-len(keys) // per_leaf)
+    check_nodes(b_plus_tree.root, set())
+    assert b_plus_tree.get_all() == [o * 3 for o in keys]
+    assert b_plus_tree.range(b'01000', b'01003', reverse=True) == [b'01002' * 3, b'01001' * 3, b'01000' * 3]
+    for o in keys[::97]:
+        assert b_plus_tree.get_one(o) == o * 3
+    assert new_b_plus_tree(b_plus_tree.pager, b_plus_tree.free_list, 0, False).get_all() == [o * 3 for o in keys]
+    close(fd, name)
+
+
+def test_bulk_load_2_then_modify():
+    """建好的树可以继续插入和删除"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'%05d' % i for i in range(0, 2000, 2)]
+    b_plus_tree.bulk_load(((o, o) for o in keys), is_sorted=True)
+    b_plus_tree.add([(b'%05d' % i, b'%05d' % i) for i in range(1, 2000, 2)])
+    b_plus_tree.delete_lt(b'00500')
+    check_nodes(b_plus_tree.root, set())
+    assert b_plus_tree.get_all() == [b'%05d' % i for i in range(500, 2000)]
+    close(fd, name)
+
+
+def test_bulk_load_3_errors():
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    b_plus_tree.bulk_load([])
+    assert b_plus_tree.get_all() == []
+    with pytest.raises(ValueError):
+        b_plus_tree.bulk_load([(b'b', b'b'), (b'a', b'a')], is_sorted=True)
+    b_plus_tree.add([(b'a', b'a')])
+    with pytest.raises(ValueError):
+        b_plus_tree.bulk_load([(b'b', b'b')])
+    close(fd, name)
+
+
+def test_write_batch_1_page_once(monkeypatch):
+    """一批落在同一批叶节点上的写入，每页只写一次"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'%05d' % i for i in range(2000)]
+    b_plus_tree.bulk_load([(o, o) for o in keys])
+    writes = []
+    page_set = b_plus_tree.pager.page_set
+    monkeypatch.setattr(b_plus_tree.pager, 'page_set', lambda page_id, bs: (writes.append(page_id), page_set(page_id, bs)))
+    b_plus_tree.upsert([(o, o[::-1]) for o in keys[500:1000]])
+    assert len(writes) == len(set(writes))
+    assert b_plus_tree.get_all() == [o[::-1] if 500 <= i < 1000 else o for i, o in enumerate(keys)]
+    close(fd, name)
+
+
+def test_write_batch_2_split():
+    """一批写入让叶节点和根一次切成多段"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'%05d' % i for i in range(3000)]
+    b_plus_tree.add([(o, o * 100) for o in keys[::2]])
+    b_plus_tree.upsert([(o, o * 90) for o in keys[1::2]])
+    assert height(b_plus_tree.root) == 3
+    check_nodes(b_plus_tree.root, set())
+    assert b_plus_tree.get_all() == [o * 100 if i % 2 == 0 else o * 90 for i, o in enumerate(keys)]
+    assert b_plus_tree.range(reverse=True, limit=2) == [keys[-1] * 90, keys[-2] * 100]
+    close(fd, name)
+
+
+def test_write_batch_3_duplicates():
+    """add 保留已有的和批内第一条，upsert 保留批内最后一条"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    b_plus_tree.add([(b'a', b'1'), (b'b', b'1'), (b'a', b'2')])
+    assert b_plus_tree.get_all() == [b'1', b'1']
+    b_plus_tree.add([(b'a', b'3'), (b'c', b'3')])
+    assert b_plus_tree.get_all() == [b'1', b'1', b'3']
+    b_plus_tree.upsert([(b'b', b'4'), (b'b', b'5'), (b'c', b'5')])
+    assert b_plus_tree.get_all() == [b'1', b'5', b'5']
+    close(fd, name)
+
+
+def test_node_cache_1_reuse():
+    """同一页的节点只解码一次，persist 后缓存的是最新的对象"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'%04d' % i for i in range(1000)]
+    b_plus_tree.add([(o, o) for o in keys])
+    pager = b_plus_tree.pager
+    root = b_plus_tree.root
+    assert b_plus_tree.root is root
+    hits = pager.node_cache.hits
+    for o in keys[::10]:
+        assert b_plus_tree.get_one(o) == o
+    assert pager.node_cache.hits > hits
+    b_plus_tree.upsert([(keys[0], b'x')])
+    assert b_plus_tree.get_one(keys[0]) == b'x'
+    close(fd, name)
+
+
+def test_node_cache_2_invalidate():
+    """页被释放或被别的对象改写后不再命中旧对象"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'%04d' % i for i in range(1000)]
+    b_plus_tree.add([(o, o) for o in keys])
+    pager = b_plus_tree.pager
+    page_ids = b_plus_tree.root.page_ids
+    b_plus_tree.delete_ge(b'0500')
+    for page_id in page_ids:
+        if page_id not in b_plus_tree.root.page_ids:
+            assert page_id not in pager.node_cache.nodes
+    other = new_b_plus_tree(pager, b_plus_tree.free_list, 0, False)
+    other.upsert([(keys[1], b'y')])
+    assert b_plus_tree.get_one(keys[1]) == b'y'
+    assert b_plus_tree.get_all()[:2] == [keys[0], b'y']
+    close(fd, name)
+
+
+def test_prefix_1_separator():
+    """共享长前缀的 key，分隔 key 截到刚好能区分左右两侧"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'user/%06d/profile/settings' % i for i in range(3000)]
+    b_plus_tree.upsert([(o, b'v' * 20) for o in keys])
+    root = b_plus_tree.root
+    assert len(root.keys) > 1
+    for key in root.keys:
+        assert len(key) < len(keys[0])
+    check_nodes(root, set())
+    assert b_plus_tree.get_all() == [b'v' * 20] * len(keys)
+    for key in keys[::97]:
+        assert b_plus_tree.get_one(key) == b'v' * 20
+    assert separator(b'abc1', b'abd') == b'abd'
+    assert separator(b'ab', b'abc') == b'abc'
+    assert separator(b'abcde', b'abzzz') == b'abz'
+    close(fd, name)
+
+
+def test_prefix_2_compress():
+    """叶节点的公共前缀只存一次，同样的记录占的页更少"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'x' * 100 + b'%05d' % i for i in range(2000)]
+    b_plus_tree.bulk_load([(o, b'v') for o in keys])
+    per_leaf = (BYTES_PAGE - BYTES_NODE_HEADER) // leaf_entry_size(keys[0], b'v')
+    root = b_plus_tree.root
+    assert len(root.page_ids) < len(keys) // per_leaf // 2
+    leaf = new_b_plus_tree_node_from_page_id(b_plus_tree.pager, b_plus_tree.free_list, root.page_ids[0])
+    assert leaf.size() == node_size(True, leaf.keys, leaf.vals)
+    check_nodes(root, set())
+    b_plus_tree.delete_lt(keys[1000])
+    b_plus_tree.delete_ge(keys[1500])
+    check_nodes(b_plus_tree.root, set())
+    assert b_plus_tree.get_all() == [b'v'] * 500
+    close(fd, name)
+
+
+def test_prefix_3_lookup_outside_prefix():
+    """在页上直接查找，key 落在公共前缀之外时定位到两端"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'm%03d' % i for i in range(10)]
+    b_plus_tree.upsert([(o, o) for o in keys])
+    b_plus_tree.pager.node_cache.clear()
+    root = b_plus_tree.root
+    assert root.prefix == b'm00'
+    assert root._keys is None
+    assert root.bisect_left(b'a') == 0
+    assert root.bisect_right(b'm') == 0
+    assert root.bisect_left(b'm005') == 5
+    assert root.bisect_right(b'm005') == 6
+    assert root.bisect_left(b'm01') == 10
+    assert root.bisect_right(b'z') == 10
+    assert b_plus_tree.get_one(b'a') is None
+    assert b_plus_tree.get_one(b'm007') == b'm007'
+    assert root._keys is None
+    close(fd, name)
+
+
+def test_overflow_1_lazy(monkeypatch):
+    """大 val 存在溢出页上，叶节点保持紧凑，只取 key 的扫描不读溢出页"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'%04d' % i for i in range(200)]
+    b_plus_tree.upsert([(o, o * 1000) for o in keys])
+    assert height(b_plus_tree.root) == 2
+    check_nodes(b_plus_tree.root, set())
+    pager = b_plus_tree.pager
+    root = b_plus_tree.root
+    leaf = new_b_plus_tree_node_from_page_id(pager, b_plus_tree.free_list, root.page_ids[0])
+    overflow = leaf.stored_val_at(0)
+    assert isinstance(overflow, Overflow)
+    overflow_page_ids = set(overflow.page_ids())
+    pager.node_cache.clear()
+    viewed = []
+    page_view = pager.page_view
+    monkeypatch.setattr(pager, 'page_view', lambda page_id: (viewed.append(page_id), page_view(page_id))[1])
+    cursor = b_plus_tree.cursor()
+    cursor.seek_first()
+    scanned = []
+    while cursor.valid():
+        scanned.append(cursor.key())
+        cursor.next()
+    assert scanned == keys
+    assert overflow_page_ids.isdisjoint(viewed)
+    assert b_plus_tree.get_one(keys[0]) == keys[0] * 1000
+    assert not overflow_page_ids.isdisjoint(viewed)
+    close(fd, name)
+
+
+def test_overflow_2_free(monkeypatch):
+    """覆盖、删除的大 val 释放其溢出页"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'%04d' % i for i in range(50)]
+    b_plus_tree.upsert([(o, o * 2000) for o in keys])
+    free_list = b_plus_tree.free_list
+    freed = []
+    add_page_id = free_list.add_page_id
+    monkeypatch.setattr(free_list, 'add_page_id', lambda page_id: (freed.append(page_id), add_page_id(page_id)))
+
+    def overflow_page_ids(keys_in: list[bytes]) -> set[int]:
+        result = set()
+        cursor = b_plus_tree.cursor()
+        cursor.seek_first()
+        while cursor.valid():
+            if cursor.key() in keys_in:
+                result.update(cursor.node.stored_val_at(cursor.index).page_ids())
+            cursor.next()
+        return result
+
+    page_ids = overflow_page_ids(keys[:5])
+    b_plus_tree.upsert([(o, o * 1999) for o in keys[:5]])
+    assert page_ids <= set(freed)
+    page_ids = overflow_page_ids(keys[:10] + keys[40:])
+    b_plus_tree.delete_one(keys[0])
+    b_plus_tree.delete_lt(keys[10])
+    b_plus_tree.delete_ge(keys[40])
+    assert page_ids <= set(freed)
+    # add 不覆盖已有的 key，不释放任何页
+    num_freed = len(freed)
+    b_plus_tree.add([(o, o * 2000) for o in keys])
+    assert len(freed) == num_freed
+    assert b_plus_tree.get_all() == [o * 2000 for o in keys]
+    close(fd, name)
+
+
+def test_overflow_3_update():
+    """按下标改写大 val，原地写溢出页"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'%04d' % i for i in range(20)]
+    b_plus_tree.upsert([(o, b'a' * 5000) for o in keys])
+    b_plus_tree.update_ge(keys[10], [(4094, b'bbbb')])
+    b_plus_tree.update_lt(b'0009x', [(4998, b'ccc')])
+    updated = b'a' * 4094 + b'bbbb' + b'a' * 902
+    grown = b'a' * 4998 + b'ccc'
+    assert b_plus_tree.get_all() == [grown] * 10 + [updated] * 10
+    close(fd, name)
+
+
+def test_count_1():
+    """增删、分裂、合并、借位和范围删除后子树记录数保持准确"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'%04d' % i for i in range(3000)]
+    b_plus_tree.add([(o, o * 100) for o in keys[::2]])
+    b_plus_tree.add([(o, o * 100) for o in keys[1::2]])
+    b_plus_tree.upsert([(o, o * 120) for o in keys[::3]])
+    assert height(b_plus_tree.root) == 3
+    assert check_nodes(b_plus_tree.root, set()) == len(keys)
+    for o in keys[::5]:
+        b_plus_tree.delete_one(o)
+    b_plus_tree.delete_lt(keys[100])
+    b_plus_tree.delete_ge(keys[2900])
+    rest = [o for i, o in enumerate(keys) if i % 5 != 0 and 100 <= i < 2900]
+    assert check_nodes(b_plus_tree.root, set()) == len(rest)
+    assert b_plus_tree.count() == len(rest)
+    assert b_plus_tree.rank(keys[1500]) == len([o for o in rest if o < keys[1500]])
+    assert b_plus_tree.rank(b'9999') == len(rest)
+    assert b_plus_tree.count_range(keys[500], keys[1500]) == len([o for o in rest if keys[500] <= o < keys[1500]])
+    assert b_plus_tree.count_range(keys[500], keys[1500], False, True) == \
+           len([o for o in rest if keys[500] < o <= keys[1500]])
+    assert b_plus_tree.count_range(lo=keys[2000]) == len([o for o in rest if o >= keys[2000]])
+    assert b_plus_tree.count_range(keys[1500], keys[500]) == 0
+    close(fd, name)
+
+
+def test_count_2_seek_nth():
+    """按序号定位，深 offset 不逐条经过叶节点"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'%05d' % i for i in range(20000)]
+    b_plus_tree.bulk_load([(o, o) for o in keys])
+    assert check_nodes(b_plus_tree.root, set()) == len(keys)
+    cursor = b_plus_tree.cursor()
+    for n in (0, 1, 777, 10000, 19999):
+        cursor.seek_nth(n)
+        assert cursor.key() == keys[n]
+    cursor.seek_nth(20000)
+    assert not cursor.valid()
+    cursor.seek_nth(-1)
+    assert not cursor.valid()
+    pager = b_plus_tree.pager
+    pager.node_cache.clear()
+    misses = pager.node_cache.misses
+    assert b_plus_tree.range(limit=3, offset=15000) == keys[15000:15003]
+    assert pager.node_cache.misses - misses <= height(b_plus_tree.root) * 3
+    assert b_plus_tree.range(keys[100], keys[200], limit=5, offset=98) == keys[198:200]
+    assert b_plus_tree.range(hi=keys[19000], limit=2, offset=10, reverse=True) == keys[18988:18990][::-1]
+    assert b_plus_tree.range(hi=keys[5], offset=10, reverse=True) == []
+    close(fd, name)
+
+
+def test_latch_1_crabbing(monkeypatch):
+    """单条写入和删除在改叶节点时已放开根，其他读者可以同时读别的叶节点"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'%05d' % i for i in range(0, 6000, 2)]
+    random.Random(0).shuffle(keys)
+    for i in range(0, len(keys), 100):
+        b_plus_tree.add([(o, o * 4) for o in keys[i:i + 100]])
+    assert height(b_plus_tree.root) >= 2
+    latches = b_plus_tree.pager.latches
+    root_page_id = b_plus_tree.root.page_id
+    seen = []
+
+    def check():
+        seen.append(latches.writer(root_page_id) is None and latches.writer(b_plus_tree.root_latch_key()) is None)
+        result = []
+        t = threading.Thread(target=lambda: result.append(b_plus_tree.get_one(b'00000')))
+        t.start()
+        t.join(5)
+        seen.append(result == [b'00000' * 4])
+
+    _write = BPlusTreeNode._write
+    _delete_one = BPlusTreeNode._delete_one
+
+    def write(self, key_vals, replace):
+        check()
+        return _write(self, key_vals, replace)
+
+    def delete_one(self, key):
+        check()
+        return _delete_one(self, key)
+
+    monkeypatch.setattr(BPlusTreeNode, '_write', write)
+    monkeypatch.setattr(BPlusTreeNode, '_delete_one', delete_one)
+    b_plus_tree.upsert([(b'05001', b'x')])
+    b_plus_tree.delete_one(b'05000')
+    assert seen == [True] * 4
+    assert b_plus_tree.get_one(b'05001') == b'x'
+    assert b_plus_tree.get_one(b'05000') is None
+    assert check_nodes(b_plus_tree.root, set()) == len(keys)
+    close(fd, name)
+
+
+def test_latch_2_concurrent():
+    """多个读者与一个写者并发，读者看到的不变的 key 始终完整有序，结束后树结构正确"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    stable = [b'%05d' % i for i in range(0, 3000, 3)]
+    b_plus_tree.add([(o, o * 2) for o in stable])
+    stop = threading.Event()
+    errors = []
+
+    def reader(seed):
+        rnd = random.Random(seed)
+        try:
+            while not stop.is_set():
+                key = rnd.choice(stable)
+                assert b_plus_tree.get_one(key) == key * 2
+                lo = b'%05d' % rnd.randrange(3000)
+                hi = b'%05d' % (int(lo) + 60)
+                cursor = b_plus_tree.cursor()
+                cursor.seek(lo)
+                got = []
+                while cursor.valid() and cursor.key() < hi:
+                    got.append(cursor.key())
+                    cursor.next()
+                assert got == sorted(set(got))
+                assert {o for o in stable if lo <= o < hi} <= set(got)
+                assert {o * 2 for o in stable if lo <= o < hi} <= set(b_plus_tree.range(lo, hi))
+                assert len(stable) <= b_plus_tree.count() <= 3000
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=reader, args=(i,)) for i in range(4)]
+    for t in readers:
+        t.start()
+    rnd = random.Random(0)
+    ref = set(stable)
+    deadline = time.time() + 1
+    while time.time() < deadline and len(errors) == 0:
+        # 只改不在 stable 里的 key
+        key = b'%05d' % (rnd.randrange(1000) * 3 + rnd.choice((1, 2)))
+        if rnd.random() < 0.5:
+            b_plus_tree.upsert([(key, key * rnd.randrange(1, 40))])
+            ref.add(key)
+        elif rnd.random() < 0.9:
+            b_plus_tree.delete_one(key)
+            ref.discard(key)
+        else:
+            key_vals = [(b'%05d' % i, b'z' * 30) for i in rnd.sample(range(1, 3000, 3), 30)]
+            b_plus_tree.upsert(key_vals)
+            ref.update(key for key, _ in key_vals)
+    stop.set()
+    for t in readers:
+        t.join(10)
+        assert not t.is_alive()
+    assert errors == []
+    assert check_nodes(b_plus_tree.root, set()) == len(ref)
+    cursor = b_plus_tree.cursor()
+    cursor.seek_first()
+    assert [key for key, _ in cursor] == sorted(ref)
+    close(fd, name)
+
+
+def test_latch_3_evict():
+    """扫描和写入结束后闩表里不留闩，打开的游标只留当前叶节点的一个"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    key_vals = [(b'%06d' % i, b'%06d' % i) for i in range(20000)]
+    b_plus_tree.add(key_vals)
+    latches = b_plus_tree.pager.latches
+    assert len(latches) == 0
+    assert b_plus_tree.get_all() == [v for _, v in key_vals]
+    assert len(latches) == 0
+    cursor = b_plus_tree.cursor()
+    cursor.seek(b'010000')
+    for _ in range(3000):
+        next(cursor)
+    assert len(latches) == 1
+    b_plus_tree.upsert([(b'013001', b'x')])
+    assert next(cursor) == (b'013000', b'013000')
+    assert next(cursor) == (b'013001', b'x')
+    cursor.close()
+    assert len(latches) == 0
+    close(fd, name)
+
+
+def test_cow_1_snapshot():
+    """快照里看到的是打开前最后一次提交的树，之后的写入和删除不影响它"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name, True)
+    keys = [b'%04d' % i for i in range(1000)]
+    b_plus_tree.add([(o, o) for o in keys])
+    with b_plus_tree.pager.snapshot() as snapshot:
+        view = b_plus_tree.at(snapshot)
+        b_plus_tree.upsert([(o, b'x') for o in keys[:500]])
+        b_plus_tree.delete_ge(b'0800')
+        b_plus_tree.add([(b'a', b'a')])
+        assert view.get_all() == keys
+        assert view.count() == 1000
+        assert view.get_one(b'0100') == b'0100'
+        assert view.range(b'0790', b'0810') == keys[790:810]
+        with pytest.raises(ValueError):
+            view.add([(b'b', b'b')])
+    assert b_plus_tree.get_all() == [b'x'] * 500 + keys[500:800] + [b'a']
+    assert check_nodes(b_plus_tree.root, set()) == 801
+    close(fd, name)
+
+
+def test_cow_2_pages(monkeypatch):
+    """已提交的树页不原地改写；快照打开期间被替换下来的页不回收，关闭后的下一次提交交回空闲链"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name, True)
+    b_plus_tree.add([(b'%04d' % i, b'v' * 100) for i in range(1000)])
+    pager = b_plus_tree.pager
+    committed = set()
+    check_nodes(b_plus_tree.root, committed)
+    written = []
+    page_set = pager.page_set
+
+    def record(page_id, page_bs):
+        written.append(page_id)
+        page_set(page_id, page_bs)
+
+    monkeypatch.setattr(pager, 'page_set', record)
+    with pager.snapshot():
+        b_plus_tree.upsert([(b'0500', b'w')])
+        b_plus_tree.delete_one(b'0000')
+        b_plus_tree.update_ge(b'0900', [(0, b'u')])
+        assert len(pager.pending) > 0
+        b_plus_tree.add([(b'%04d' % i, b'v' * 100) for i in range(1000, 1200)])
+        assert committed & set(written) == set()
+    b_plus_tree.add([(b'x', b'x')])
+    assert pager.pending == []
+    assert b_plus_tree.count() == 1200
+    close(fd, name)
+
+
+def test_cow_3_cursor():
+    """写时复制的树没有叶链，游标按叶节点的区间从根下降找邻居"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name, True)
+    keys = [b'%04d' % i for i in range(0, 6000, 2)]
+    b_plus_tree.add([(o, o * 80) for o in keys])
+    b_plus_tree.delete_lt(b'0100')
+    keys = [o for o in keys if o >= b'0100']
+    assert height(b_plus_tree.root) > 2
+
+    def leaves(node):
+        if node.is_leaf:
+            return [node]
+        return [leaf for page_id in node.page_ids
+                for leaf in leaves(new_b_plus_tree_node_from_page_id(node.pager, node.free_list, page_id))]
+
+    assert all(leaf.left_page_id == leaf.right_page_id == NULL_PAGE_ID for leaf in leaves(b_plus_tree.root))
+    with b_plus_tree.pager.snapshot() as snapshot:
+        view = b_plus_tree.at(snapshot)
+        b_plus_tree.delete_ge(b'3000')
+        for tree, want in ((b_plus_tree, [o for o in keys if o < b'3000']), (view, keys)):
+            cursor = tree.cursor()
+            cursor.seek_first()
+            assert [key for key, _ in cursor] == want
+            cursor.seek_last()
+            back = []
+            while cursor.valid():
+                back.append(cursor.key())
+                cursor.prev()
+            assert back == want[::-1]
+            cursor.seek_lt(b'1001')
+            assert cursor.key() == b'1000'
+            cursor.seek_gt(b'1001')
+            assert cursor.key() == b'1002'
+            assert tree.range(b'0990', b'1010', reverse=True) == [o * 80 for o in want[445:455]][::-1]
+    close(fd, name)
+
+
+def test_cow_4_concurrent():
+    """快照读者不加闩，写者持续提交期间同一快照读两遍结果一致"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name, True)
+    pager = b_plus_tree.pager
+    b_plus_tree.add([(b'%05d' % i, b'v' * 30) for i in range(3000)])
+    stop = threading.Event()
+    errors = []
+
+    def reader():
+        try:
+            while not stop.is_set():
+                with pager.snapshot() as snapshot:
+                    view = b_plus_tree.at(snapshot)
+                    vals = view.get_all()
+                    assert len(vals) == view.count()
+                    assert view.get_all() == vals
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=reader) for _ in range(2)]
+    for t in readers:
+        t.start()
+    rnd = random.Random(0)
+    deadline = time.time() + 1
+    while time.time() < deadline and len(errors) == 0:
+        key = b'%05d' % rnd.randrange(3000)
+        if rnd.random() < 0.5:
+            b_plus_tree.upsert([(key, b'w' * rnd.randrange(1, 60))])
+        else:
+            b_plus_tree.delete_one(key)
+    stop.set()
+    for t in readers:
+        t.join(10)
+        assert not t.is_alive()
+    assert errors == []
+    close(fd, name)
+
+
+def test_cow_5_reopen():
+    """写时复制模式记在 meta 里，不指定 cow 重新打开时沿用，指定普通模式时报错"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name, True)
+    keys = [b'%04d' % i for i in range(2000)]
+    b_plus_tree.add([(o, o) for o in keys])
+    b_plus_tree.upsert([(o, o + b'-') for o in keys[::3]])
+    want = b_plus_tree.get_all()
+    pager = new_pager(fd)
+    assert pager.cow
+    free_list = new_free_list_from_page_id(pager, pager.meta.used_page_id, pager.meta.head_page_id,
+                                           pager.meta.tail_page_id)
+    b_plus_tree = new_b_plus_tree(pager, free_list, 0, False)
+    assert b_plus_tree.get_all() == want
+    assert b_plus_tree.get_ge(b'1000') == want[1000:]
+    with pytest.raises(ValueError):
+        new_pager(fd, cow=False)
+    close(fd, name)
+
+
+def test_cow_6_pending_reopen():
+    """快照开着时进程退出，被替换下来还在 pending 里的页重新打开后回到空闲链，文件里的页一页不漏"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name, True)
+    b_plus_tree.add([(b'%04d' % i, b'v' * 100) for i in range(1000)])
+    pager = b_plus_tree.pager
+    with pager.snapshot():
+        b_plus_tree.upsert([(b'%04d' % i, b'w' * 100) for i in range(0, 1000, 7)])
+        b_plus_tree.delete_ge(b'0900')
+        assert len(pager.pending) > 0
+        pager = new_pager(fd)
+        free_list = new_free_list_from_page_id(pager, pager.meta.used_page_id, pager.meta.head_page_id,
+                                               pager.meta.tail_page_id)
+    b_plus_tree = new_b_plus_tree(pager, free_list, 0, False)
+    assert b_plus_tree.count() == 900
+    page_ids = {META_PAGE_ID, pager.extents.page_id}
+    check_nodes(b_plus_tree.root, page_ids)
+    for page_id, end, _ in pager.extents.extents.values():
+        page_ids.update(range(page_id, end))
+    node = free_list.head
+    while True:
+        page_ids.add(node.page_id)
+        page_ids.update(node.page_ids[node.unused:])
+        if node.next_page_id == NULL_PAGE_ID:
+            break
+        node = new_free_list_node_from_page_id(pager, node.next_page_id)
+    assert page_ids == set(range(pager.meta.used_page_id + 1))
+    close(fd, name)
+
+
+def bloom_page_ids(b_plus_tree: BPlusTree) -> set[int]:
+    bloom = b_plus_tree.bloom()
+    return {bloom.page_id} | {page_id for s in bloom.slices for page_id in s.page_ids}
+
+
+def test_bloom_1_miss():
+    """不存在的 key 多数不读树的页，只读过滤器的位图页"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    pager = b_plus_tree.pager
+    b_plus_tree = new_b_plus_tree(pager, b_plus_tree.free_list, 1, True, 10)
+    keys = [b'k%05d' % i for i in range(20000)]
+    for i in range(0, len(keys), 1000):
+        b_plus_tree.add([(o, o) for o in keys[i:i + 1000]])
+    b_plus_tree.add([(b'a', b'a')])
+    assert b_plus_tree.get_one(b'a') == b'a'
+    assert all(b_plus_tree.get_one(o) == o for o in keys[::97])
+    views = []
+    page_view = pager.page_view
+    pager.page_view = lambda page_id: views.append(page_id) or page_view(page_id)
+    misses = [b'x%05d' % i for i in range(2000)]
+    assert all(b_plus_tree.get_one(o) is None for o in misses)
+    pager.page_view = page_view
+    tree_reads = [page_id for page_id in views if page_id not in bloom_page_ids(b_plus_tree)]
+    assert len(tree_reads) < len(misses) * 0.05 * 3
+    close(fd, name)
+
+
+def test_bloom_2_open():
+    """已有的树带上 bits_per_key 打开时扫一遍建过滤器，之后不传也沿用 meta 里的"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'%05d' % i for i in range(5000)]
+    b_plus_tree.bulk_load([(o, o) for o in keys])
+    assert b_plus_tree.bloom() is None
+    pager, free_list = b_plus_tree.pager, b_plus_tree.free_list
+    b_plus_tree = new_b_plus_tree(pager, free_list, 0, False, 10)
+    bloom = b_plus_tree.bloom()
+    assert bloom is not None and len(bloom.slices) == 1
+    pager.node_cache.clear()
+    b_plus_tree = new_b_plus_tree(pager, free_list, 0, False)
+    assert b_plus_tree.bloom().page_id == bloom.page_id
+    assert all(b_plus_tree.get_one(o) == o for o in keys)
+    # 空树 bulk_load 时按流把 key 加进过滤器
+    b_plus_tree_2 = new_b_plus_tree(pager, free_list, 1, True, 10)
+    b_plus_tree_2.bulk_load(((o, o) for o in keys), True)
+    assert all(b_plus_tree_2.bloom().may_contain(o) for o in keys)
+    close(fd, name)
+
+
+def test_bloom_3_rebuild():
+    """删除不清位，重建后按剩下的记录数分配；bits_per_key 为 0 时去掉过滤器，页都交回空闲链"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    pager, free_list = b_plus_tree.pager, b_plus_tree.free_list.free_list
+    b_plus_tree = new_b_plus_tree(pager, free_list, 1, True, 10)
+    keys = [b'%05d' % i for i in range(20000)]
+    for i in range(0, len(keys), 2000):
+        b_plus_tree.upsert([(o, o) for o in keys[i:i + 2000]])
+    assert len(b_plus_tree.bloom().slices) > 1
+    b_plus_tree.delete_ge(b'01000')
+    assert b_plus_tree.bloom().may_contain(keys[-1])
+    b_plus_tree.bloom_rebuild()
+    bloom = b_plus_tree.bloom()
+    assert len(bloom.slices) == 1 and bloom.slices[0].count == 1000
+    assert all(b_plus_tree.get_one(o) == o for o in keys[:1000])
+    assert sum(bloom.may_contain(o) for o in keys[1000:]) < 19000 * 0.03
+    page_ids = bloom_page_ids(b_plus_tree)
+    b_plus_tree.bloom_rebuild(0)
+    assert b_plus_tree.bloom() is None
+    assert pager.bloom_page_id_get(1) == NULL_PAGE_ID
+    assert all(b_plus_tree.get_one(o) == o for o in keys[:1000])
+    free = set()
+    node = free_list.head
+    while True:
+        free.update(node.page_ids[node.unused:])
+        if node.next_page_id == NULL_PAGE_ID:
+            break
+        node = new_free_list_node_from_page_id(pager, node.next_page_id)
+    assert page_ids <= free
+    with pytest.raises(ValueError):
+        b_plus_tree.bloom_rebuild()
+    close(fd, name)
+
+
+def test_bloom_4_concurrent():
+    """读者的 get_one 与写者并发，写入先置位再改树，读者不会漏掉已写完的 key"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    b_plus_tree = new_b_plus_tree(b_plus_tree.pager, b_plus_tree.free_list, 1, True, 10)
+    stable = [b'%05d' % i for i in range(0, 30000, 3)]
+    b_plus_tree.upsert([(o, o) for o in stable])
+    stop = threading.Event()
+    errors = []
+
+    def reader() -> None:
+        try:
+            rnd = random.Random()
+            while not stop.is_set():
+                key = rnd.choice(stable)
+                assert b_plus_tree.get_one(key) == key
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=reader) for _ in range(3)]
+    for t in readers:
+        t.start()
+    rnd = random.Random(0)
+    for i in range(200):
+        b_plus_tree.upsert([(b'%05d' % (rnd.randrange(10000) * 3 + 1), b'x') for _ in range(20)])
+        if i % 50 == 0:
+            b_plus_tree.bloom_rebuild()
+    stop.set()
+    for t in readers:
+        t.join(10)
+        assert not t.is_alive()
+    assert errors == []
+    close(fd, name)
+
+
+def test_stats_1():
+    """各层节点数、记录数、直方图与遍历一致；bulk_load 的叶节点连续，随机写入后出现碎片"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'%05d' % i for i in range(5000)]
+    b_plus_tree.bulk_load([(o, o * 10) for o in keys])
+    stats = b_plus_tree.stats()
+    assert stats.count == 5000
+    assert stats.height == len(stats.levels) >= 2
+    assert stats.levels[0].nodes == 1
+    assert stats.leaf_breaks == 0 and stats.fragmentation() == 0.0
+    assert stats.key_sizes == {8: 5000}
+    assert stats.val_sizes == {64: 5000}
+    leaves = stats.levels[-1]
+    assert leaves.sampled == leaves.nodes
+    assert 0.5 < leaves.fill() <= 1.0
+    assert leaves.bytes_min <= leaves.bytes_avg() <= leaves.bytes_max <= BYTES_PAGE
+    assert stats.overflow_pages == 0 and stats.bloom_pages == 0
+
+    b_plus_tree_2 = new_b_plus_tree(b_plus_tree.pager, b_plus_tree.free_list, 1, True)
+    rnd = random.Random(0)
+    rnd.shuffle(keys)
+    for o in keys:
+        b_plus_tree_2.add([(o, o * 10)])
+    b_plus_tree_2.add([(b'big', b'x' * 10000)])
+    stats = b_plus_tree_2.stats()
+    assert stats.count == 5001
+    assert stats.fragmentation() > 0.1
+    assert stats.overflow_pages == 3
+    assert stats.val_sizes[16384] == 1
+    close(fd, name)
+
+
+def test_stats_2_sample():
+    """抽样只读 sample 个叶节点；删除后空闲页变多"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'%05d' % i for i in range(20000)]
+    b_plus_tree.bulk_load([(o, o * 10) for o in keys])
+    full = b_plus_tree.stats()
+    views = []
+    pager = b_plus_tree.pager
+    page_view = pager.page_view
+    pager.page_view = lambda page_id: views.append(page_id) or page_view(page_id)
+    pager.node_cache.clear()
+    stats = b_plus_tree.stats(10)
+    pager.page_view = page_view
+    assert stats.levels[-1].nodes == full.levels[-1].nodes > 10
+    assert stats.levels[-1].sampled == 10
+    assert sum(stats.key_sizes.values()) < full.count
+    assert len(views) < sum(level.nodes for level in full.levels[:-1]) + 10 + full.free_list_pages + 5
+    b_plus_tree.delete_ge(b'05000')
+    stats = b_plus_tree.stats()
+    assert stats.count == 5000
+    assert stats.free_pages >= full.levels[-1].nodes * 3 // 4 - full.free_pages
+    close(fd, name)
+
+
+def test_rebuild_1():
+    """随机写入、大量删除后重建：记录不变，叶节点连续且装满，溢出页沿用，旧树的页交回空闲链"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'%05d' % i for i in range(6000)]
+    random.Random(0).shuffle(keys)
+    for o in keys:
+        b_plus_tree.add([(o, o * 10)])
+    b_plus_tree.upsert([(b'big', b'x' * 10000)])
+    b_plus_tree.delete_lt(b'03000')
+    for o in keys[:1000]:
+        b_plus_tree.delete_one(o)
+    expected = b_plus_tree.get_all()
+    before = b_plus_tree.stats()
+    assert before.fragmentation() > 0.1
+    b_plus_tree.rebuild()
+    after = b_plus_tree.stats()
+    assert b_plus_tree.get_all() == expected
+    assert after.count == before.count
+    assert after.leaf_breaks == 0
+    assert after.levels[-1].nodes < before.levels[-1].nodes
+    assert after.levels[-1].fill() > before.levels[-1].fill()
+    assert after.overflow_pages == before.overflow_pages == 3
+    assert after.free_pages >= before.free_pages + sum(level.nodes for level in before.levels) - 2
+    assert check_nodes(b_plus_tree.root, set()) == after.count
+    # 叶链正确，正反向游标都能走完
+    assert b_plus_tree.range(reverse=True) == expected[::-1]
+    b_plus_tree.add([(b'00000', b'a')])
+    assert b_plus_tree.get_one(b'00000') == b'a'
+    # 空树也能重建
+    b_plus_tree.delete_ge(b'')
+    b_plus_tree.rebuild()
+    assert b_plus_tree.get_all() == []
+    close(fd, name)
+
+
+def test_rebuild_2_concurrent():
+    """重建期间读者照常读旧树，切换根之后读新树"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    keys = [b'%05d' % i for i in range(20000)]
+    random.Random(0).shuffle(keys)
+    for i in range(0, len(keys), 100):
+        b_plus_tree.add([(o, o) for o in keys[i:i + 100]])
+    stop = threading.Event()
+    errors = []
+    reads = []
+
+    def reader() -> None:
+        try:
+            rnd = random.Random()
+            while not stop.is_set():
+                key = rnd.choice(keys)
+                assert b_plus_tree.get_one(key) == key
+                assert len(b_plus_tree.range(key, limit=50)) > 0
+                reads.append(1)
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=reader) for _ in range(3)]
+    for t in readers:
+        t.start()
+    for _ in range(3):
+        b_plus_tree.rebuild()
+    stop.set()
+    for t in readers:
+        t.join(10)
+        assert not t.is_alive()
+    assert errors == []
+    assert len(reads) > 0
+    assert b_plus_tree.count() == 20000
+    close(fd, name)
+
+
+def test_rebuild_3_cow():
+    """写时复制时快照里仍是旧树，旧树的页等快照关闭后才回收"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name, True)
+    keys = [b'%04d' % i for i in range(3000)]
+    random.Random(0).shuffle(keys)
+    for i in range(0, len(keys), 100):
+        b_plus_tree.add([(o, o) for o in keys[i:i + 100]])
+    with b_plus_tree.pager.snapshot() as snapshot:
+        view = b_plus_tree.at(snapshot)
+        b_plus_tree.rebuild()
+        assert len(b_plus_tree.pager.pending) > 0
+        assert view.get_all() == sorted(keys)
+        with pytest.raises(ValueError):
+            view.rebuild()
+    assert b_plus_tree.get_all() == sorted(keys)
+    assert b_plus_tree.stats().leaf_breaks == 0
+    close(fd, name)
+
+
+def test_rollback_1():
+    """操作中途出错时树、空闲链和 meta 回到操作开始前，之后照常写入"""
+    name = inspect.currentframe().f_code.co_name
+    fd, b_plus_tree = init(name)
+    pager = b_plus_tree.pager
+    key_vals = [(str(i).zfill(5).encode(), str(i).encode() * 20) for i in range(4000)]
+    b_plus_tree.add(key_vals[:2000])
+    b_plus_tree.delete_lt(key_vals[500][0])
+    used_page_id = pager.meta.used_page_id
+    free_pages = b_plus_tree.free_list.length()
+    with pytest.raises(ValueError):
+        with pager.batch():
+            b_plus_tree.add(key_vals[2000:])
+            b_plus_tree.delete_ge(key_vals[1000][0])
+            raise ValueError("出错")
+    assert b_plus_tree.get_all() == [v for _, v in key_vals[500:2000]]
+    assert pager.meta.used_page_id == used_page_id
+    assert b_plus_tree.free_list.length() == free_pages
+    assert pager.latched == set()
+    b_plus_tree.add(key_vals[2000:])
+    assert b_plus_tree.get_all() == [v for _, v in key_vals[500:]]
+    close(fd, name)
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
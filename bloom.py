@@ -0,0 +1,173 @@
+import hashlib
+import math
+import struct
+
+from const import BYTES_PAGE
+from free_list import FreeList
+from pager import Pager
+
+# 头页：page_id | 每个 key 的位数 | 段数，之后每段为 容量 | 已加入的 key 数 | 页数，再接该段各页的 page_id
+BLOOM_HEADER = struct.Struct('>qHH')
+BLOOM_SLICE = struct.Struct('>qqH')
+BLOOM_PAGE_REF = struct.Struct('>q')
+# 位图页：page_id | 位图
+BLOOM_PAGE_HEADER = struct.Struct('>q')
+BITS_BLOOM_PAGE = (BYTES_PAGE - BLOOM_PAGE_HEADER.size) * 8
+
+
+def bloom_hash(key: bytes) -> tuple[int, int, int]:
+    """key 落在哪一页由 block 决定，页内的各位由 a + i * b 给出"""
+    h = hashlib.blake2b(key, digest_size=16).digest()
+    block = int.from_bytes(h[:8], 'big')
+    a = int.from_bytes(h[8:12], 'big')
+    b = int.from_bytes(h[12:16], 'big') | 1
+    return block, a, b
+
+
+class BloomSlice:
+    """一段位图，按页分块：一个 key 的全部位落在同一页里，查一次只读一页"""
+
+    def __init__(self):
+        self.capacity: int = 0
+        self.count: int = 0
+        self.page_ids: list[int] = []
+
+    def positions(self, key: bytes, num_hashes: int) -> tuple[int, list[int]]:
+        block, a, b = bloom_hash(key)
+        return self.page_ids[block % len(self.page_ids)], [(a + i * b) % BITS_BLOOM_PAGE for i in range(num_hashes)]
+
+
+class BloomFilter:
+    """
+    B+ 树的 Bloom 过滤器，存在自己的页里，get_one 下降之前先查，多数不存在的 key 不读树的页。
+    只增不删：删除的 key 留在位图里，只让误判变多，可用 BPlusTree.bloom_rebuild 重建。
+    可扩展：最后一段装满 capacity 个 key 后新开一段，页数翻倍，查找时各段都查。
+    段的页号都记在头页里，头页放不下新段时继续往最后一段里加，误判率随之上升。
+    """
+
+    def __init__(self):
+        self.pager: Pager | None = None
+        self.free_list: FreeList | None = None
+        self.page_id: int = 0
+        self.bits_per_key: int = 0
+        self.slices: list[BloomSlice] = []
+
+    def __bytes__(self) -> bytes:
+        r = [BLOOM_HEADER.pack(self.page_id, self.bits_per_key, len(self.slices))]
+        for s in self.slices:
+            r.append(BLOOM_SLICE.pack(s.capacity, s.count, len(s.page_ids)))
+            r.extend(BLOOM_PAGE_REF.pack(page_id) for page_id in s.page_ids)
+        return b''.join(r)
+
+    def size(self) -> int:
+        return BLOOM_HEADER.size + sum(BLOOM_SLICE.size + BLOOM_PAGE_REF.size * len(s.page_ids) for s in self.slices)
+
+    def persist(self) -> None:
+        self.pager.page_set(self.page_id, bytes(self))
+        self.pager.node_cache.put(self.page_id, self, self.size())
+
+    @property
+    def num_hashes(self) -> int:
+        return max(1, round(self.bits_per_key * math.log(2)))
+
+    def may_contain(self, key: bytes) -> bool:
+        """返回 False 时 key 一定不在树里"""
+        for s in self.slices:
+            page_id, positions = s.positions(key, self.num_hashes)
+            view = self.pager.page_view(page_id)
+            if all(view[BLOOM_PAGE_HEADER.size + pos // 8] & (1 << (pos % 8)) for pos in positions):
+                return True
+        return False
+
+    def add(self, keys: list[bytes]) -> None:
+        """加入一批 key，已可能存在的跳过，同一页的位一起写"""
+        pages = {}
+        for key in keys:
+            if self.may_contain(key) or self._pending(pages, key):
+                continue
+            s = self.slices[-1]
+            if s.count >= s.capacity:
+                s = self._slice_add(len(s.page_ids) * 2) or s
+            s.count += 1
+            page_id, positions = s.positions(key, self.num_hashes)
+            if page_id not in pages:
+                pages[page_id] = bytearray(self.pager.page_view(page_id))
+            for pos in positions:
+                pages[page_id][BLOOM_PAGE_HEADER.size + pos // 8] |= 1 << (pos % 8)
+        if len(pages) == 0:
+            return
+        for page_id, page_bs in pages.items():
+            self.pager.page_set(page_id, bytes(page_bs))
+        self.persist()
+
+    def _pending(self, pages: dict[int, bytearray], key: bytes) -> bool:
+        """本批里前面已置上、还没写回的位"""
+        for s in self.slices:
+            page_id, positions = s.positions(key, self.num_hashes)
+            page_bs = pages.get(page_id)
+            if page_bs is not None and all(page_bs[BLOOM_PAGE_HEADER.size + pos // 8] & (1 << (pos % 8))
+                                           for pos in positions):
+                return True
+        return False
+
+    def _slice_add(self, num_pages: int) -> BloomSlice | None:
+        """新开一段，头页放不下时返回 None"""
+        if self.size() + BLOOM_SLICE.size + BLOOM_PAGE_REF.size * num_pages > BYTES_PAGE:
+            return None
+        s = BloomSlice()
+        s.capacity = num_pages * BITS_BLOOM_PAGE // self.bits_per_key
+        s.count = 0
+        s.page_ids = [self.free_list.get_page_id() for _ in range(num_pages)]
+        for page_id in s.page_ids:
+            self.pager.page_set(page_id, BLOOM_PAGE_HEADER.pack(page_id) + bytes(BITS_BLOOM_PAGE // 8))
+        self.slices.append(s)
+        return s
+
+    def free(self) -> None:
+        for s in self.slices:
+            for page_id in s.page_ids:
+                self.free_list.add_page_id(page_id)
+        self.free_list.add_page_id(self.page_id)
+
+
+def new_bloom_filter(pager: Pager, free_list: FreeList, bits_per_key: int, capacity: int) -> BloomFilter:
+    """第一段按 capacity 个 key 分配页，至少一页"""
+    if bits_per_key <= 0:
+        raise ValueError("bits_per_key 错误")
+    bloom = BloomFilter()
+    bloom.pager = pager
+    bloom.free_list = free_list
+    bloom.page_id = free_list.get_page_id()
+    bloom.bits_per_key = bits_per_key
+    bloom.slices = []
+    max_pages = (BYTES_PAGE - BLOOM_HEADER.size - BLOOM_SLICE.size) // BLOOM_PAGE_REF.size
+    bloom._slice_add(min(max(1, -(-capacity * bits_per_key // BITS_BLOOM_PAGE)), max_pages))
+    bloom.persist()
+    return bloom
+
+
+def new_bloom_filter_from_page_id(pager: Pager, free_list: FreeList, page_id: int) -> BloomFilter:
+    bloom = pager.node_cache.get(page_id)
+    if bloom is not None:
+        return bloom
+    bloom = BloomFilter()
+    bloom.pager = pager
+    bloom.free_list = free_list
+    view = pager.page_view(page_id)
+    _page_id, bits_per_key, num_slices = BLOOM_HEADER.unpack_from(view)
+    if _page_id != page_id:
+        raise ValueError("page_id 错误")
+    bloom.page_id = page_id
+    bloom.bits_per_key = bits_per_key
+    bloom.slices = []
+    offset = BLOOM_HEADER.size
+    for _ in range(num_slices):
+        s = BloomSlice()
+        s.capacity, s.count, num_pages = BLOOM_SLICE.unpack_from(view, offset)
+        offset += BLOOM_SLICE.size
+        s.page_ids = [BLOOM_PAGE_REF.unpack_from(view, offset + i * BLOOM_PAGE_REF.size)[0]
+                      for i in range(num_pages)]
+        offset += BLOOM_PAGE_REF.size * num_pages
+        bloom.slices.append(s)
+    pager.node_cache.put(page_id, bloom, bloom.size())
+    return bloom
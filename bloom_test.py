@@ -0,0 +1,83 @@
+import inspect
+import os
+import pytest
+
+from bloom import BloomFilter, new_bloom_filter, new_bloom_filter_from_page_id, BITS_BLOOM_PAGE
+from const import META_PAGE_ID, BYTES_PAGE
+from file import file_open
+from free_list import new_free_list
+from pager import new_pager
+
+
+def init(name: str, bits_per_key: int = 10, capacity: int = 0) -> tuple[int, BloomFilter]:
+    fd = file_open(f'{name}.db')
+    pager = new_pager(fd)
+    free_list = new_free_list(pager, META_PAGE_ID)
+    with pager.operation():
+        bloom = new_bloom_filter(pager, free_list, bits_per_key, capacity)
+    return fd, bloom
+
+
+def close(fd: int, name: str) -> None:
+    os.close(fd)
+    os.remove(f'{name}.db')
+
+
+def add(bloom: BloomFilter, keys: list[bytes]) -> None:
+    with bloom.pager.operation():
+        bloom.add(keys)
+
+
+def test_add():
+    """加入的 key 都能查到，10 位每 key 时误判约 1%"""
+    name = inspect.currentframe().f_code.co_name
+    fd, bloom = init(name)
+    keys = [b'k%06d' % i for i in range(2000)]
+    add(bloom, keys)
+    assert all(bloom.may_contain(key) for key in keys)
+    false_positives = sum(bloom.may_contain(b'x%06d' % i) for i in range(20000))
+    assert false_positives < 20000 * 0.03
+    assert sum(s.count for s in bloom.slices) <= len(keys)
+    close(fd, name)
+
+
+def test_scale():
+    """装满后新开一段，页数翻倍，误判率不随 key 数上升"""
+    name = inspect.currentframe().f_code.co_name
+    fd, bloom = init(name)
+    capacity = BITS_BLOOM_PAGE // 10
+    keys = [b'k%06d' % i for i in range(capacity * 5)]
+    for i in range(0, len(keys), 1000):
+        add(bloom, keys[i:i + 1000])
+    assert [len(s.page_ids) for s in bloom.slices] == [1, 2, 4]
+    assert all(bloom.may_contain(key) for key in keys)
+    false_positives = sum(bloom.may_contain(b'x%06d' % i) for i in range(20000))
+    assert false_positives < 20000 * 0.05
+    assert len(bytes(bloom)) <= BYTES_PAGE
+    close(fd, name)
+
+
+def test_capacity():
+    """按预计的 key 数分配第一段"""
+    name = inspect.currentframe().f_code.co_name
+    fd, bloom = init(name, 8, 100000)
+    assert len(bloom.slices) == 1
+    assert bloom.slices[0].capacity >= 100000
+    close(fd, name)
+
+
+def test_reopen():
+    name = inspect.currentframe().f_code.co_name
+    fd, bloom = init(name)
+    keys = [b'k%06d' % i for i in range(5000)]
+    add(bloom, keys)
+    bloom.pager.node_cache.clear()
+    got = new_bloom_filter_from_page_id(bloom.pager, bloom.free_list, bloom.page_id)
+    assert got is not bloom
+    assert bytes(got) == bytes(bloom)
+    assert all(got.may_contain(key) for key in keys)
+    close(fd, name)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -8,14 +8,92 @@ BYTES_HEAD_PAGE_ID = 8
 BYTES_TAIL_PAGE_ID = 8
 BYTES_B_PLUS_TREE_SEQ = 8
 BYTES_DATABASE_SEQ = 8
+BYTES_EXTENT_PAGE_ID = 8
+BYTES_COW = 1
+BYTES_PENDING_PAGE_ID = 8
 BYTES_ROOT_PAGE_ID = 8
+BYTES_BLOOM_PAGE_ID = 8
+BYTES_META_HEADER = (
+        BYTES_MAGIC_NUMBER +
+        BYTES_USED_PAGE_ID +
+        BYTES_HEAD_PAGE_ID +
+        BYTES_TAIL_PAGE_ID +
+        BYTES_B_PLUS_TREE_SEQ +
+        BYTES_DATABASE_SEQ +
+        BYTES_EXTENT_PAGE_ID +
+        BYTES_COW +
+        BYTES_PENDING_PAGE_ID
+)
+# 每个 seq 在 meta 页里占一个根页号和一个 Bloom 过滤器头页号
+NUM_ROOT_PAGE_IDS = (BYTES_PAGE - BYTES_META_HEADER) // (BYTES_ROOT_PAGE_ID + BYTES_BLOOM_PAGE_ID)
 
-DEGREE = 2
+# B+ 树节点按编码后的字节数分裂：超过 BYTES_NODE 就分裂（FILL_FACTOR 取 0.5 ~ 1），
+# 删除后低于 BYTES_NODE_MIN 时向兄弟借一条或与兄弟合并
+FILL_FACTOR = 1.0
+BYTES_NODE = int(BYTES_PAGE * FILL_FACTOR)
+BYTES_NODE_MIN = BYTES_NODE // 4
+# 节点页头：is_leaf | page_id | left_page_id | right_page_id | num_keys(2) | page_ids[0] | counts[0] | 公共前缀长度(2)
+BYTES_NODE_HEADER = 1 + 8 + 8 + 8 + 2 + 8 + 8 + 2
+# 单条记录（含 slot）的上限，保证一页至少放得下 4 条，分裂出的每段都不为空
+BYTES_ENTRY_MAX = (BYTES_PAGE - BYTES_NODE_HEADER) // 4
+# 叶节点一条最长为 slot、key 长度、val 长度、溢出引用加 key，内部节点的记录（slot、key 长度、page_id、记录数加 key）更短
+BYTES_KEY_MAX = BYTES_ENTRY_MAX - 2 - 2 - 2 - 16
+# 超过这个长度的 val 存到溢出页，叶节点只留引用，扫描时一页能放更多条
+BYTES_VAL_INLINE_MAX = BYTES_PAGE // 8
 
-MAGIC_NUMBER_BS = b'\x95\x27'
+# Bε 树内部节点的分隔 key 最多占半页、子节点最多 BE_FANOUT 个，页里其余空间做消息缓冲区
+BE_FANOUT = 16
+BYTES_BE_PIVOTS = BYTES_PAGE // 2
+
+# LSM 树的 memtable 超过这个字节数就写成 run，run 多于 LSM_RUNS_MAX 个时后台合并
+LSM_MEMTABLE_BYTES = 64 * 1024
+LSM_RUNS_MAX = 4
+
+# 可扩展哈希的最大深度，目录最多 2 ** HASH_DEPTH_MAX 项，头页放得下全部目录页的 page_id
+HASH_DEPTH_MAX = 16
+
+# B+ 树从文件末尾连续取一段页作为自己的区段，新节点先从区段里分配；
+# 第一个区段 EXTENT_PAGES_MIN 页，之后每次翻倍，最多 EXTENT_PAGES 页
+EXTENT_PAGES_MIN = 4
+EXTENT_PAGES = 64
+
+# Bloom 过滤器每个 key 的位数，10 位约 1% 误判；Database 的 tables 默认启用
+BLOOM_BITS_PER_KEY = 10
+
+# 第二个字节是文件格式版本，meta 页头、节点页、表的行编码或区段表的布局变了就加一；
+# 打开 magic number 不为空又不等于它的文件时报错，不按当前格式去读旧文件
+MAGIC_NUMBER_BS = b'\x95\x28'
 
 NUM_PAGE_IDS = 2
 
 NUM_TABLE = 2
 
-INIT_B_PLUS_TREE_SEQ = 0
\ No newline at end of file
+INIT_B_PLUS_TREE_SEQ = 0
+
+# 表数据所用的树：B+ 树 / 写优化的 Bε 树
+TREE_B_PLUS = 0
+TREE_B_EPSILON = 1
+TREE_LSM = 2
+# 只做等值查找的索引可用可扩展哈希
+TREE_HASH = 3
+
+CACHE_SIZE = 256
+
+# 解码后节点对象缓存的容量，按节点的字节数计
+NODE_CACHE_BYTES = 4 * 1024 * 1024
+
+# 持久化级别：不 fsync / 每个 batch 结束 fsync / 每个操作结束 fsync
+DURABILITY_OFF = 0
+DURABILITY_BATCH = 1
+DURABILITY_OPERATION = 2
+
+BYTES_WAL_LSN = 8
+BYTES_WAL_RECORD_HEADER = 24
+INIT_WAL_LSN = 1
+WAL_CHECKPOINT_BYTES = 4 * 1024 * 1024
+
+MMAP_GROW_PAGES = 256
+
+READ_AHEAD_MIN = 4
+READ_AHEAD_MAX = 64
+READ_AHEAD_WORKERS = 2
@@ -0,0 +1,27 @@
+from b_epsilon_tree import BEpsilonTree, new_b_epsilon_tree
+from b_plus_tree import BPlusTree, new_b_plus_tree
+from const import TREE_B_PLUS, TREE_B_EPSILON, TREE_LSM, TREE_HASH
+from free_list import FreeList
+from hash_index import HashIndex, new_hash_index
+from lsm_tree import LSMTree, new_lsm_tree
+from pager import Pager
+
+
+
+def new_data_tree(pager: Pager, free_list: FreeList, kind: int, seq: int, is_seq_new: bool,
+                  bloom_bits_per_key: int = 0) -> BPlusTree | BEpsilonTree | LSMTree | HashIndex:
+    """
+    按 kind 建表数据、索引或 KV 所用的树，几种树的读写接口相同，哈希索引只支持等值查找。
+    bloom_bits_per_key 大于 0 时配 Bloom 过滤器，只有 B+ 树支持
+    """
+    if kind != TREE_B_PLUS and bloom_bits_per_key > 0:
+        raise ValueError("只有 B+ 树支持 Bloom 过滤器")
+    if kind == TREE_B_PLUS:
+        return new_b_plus_tree(pager, free_list, seq, is_seq_new, bloom_bits_per_key)
+    if kind == TREE_B_EPSILON:
+        return new_b_epsilon_tree(pager, free_list, seq, is_seq_new)
+    if kind == TREE_LSM:
+        return new_lsm_tree(pager, free_list, seq, is_seq_new)
+    if kind == TREE_HASH:
+        return new_hash_index(pager, free_list, seq, is_seq_new)
+    raise ValueError("kind 错误")
@@ -1,11 +1,12 @@
 import io
 
-from b_plus_tree import new_b_plus_tree
-from const import META_PAGE_ID, INIT_B_PLUS_TREE_SEQ
+from const import META_PAGE_ID, INIT_B_PLUS_TREE_SEQ, TREE_B_PLUS, BLOOM_BITS_PER_KEY
 from free_list import FreeList, new_free_list_from_page_id, new_free_list
 from kv import KV, new_kv
 from pager import Pager
 from table import Table, new_table, new_table_from_bytes
+from b_plus_tree import BPlusTreeStats
+from data_tree import new_data_tree
 from b_plus_tree_seq import BPlusTreeSeqGenerator, new_b_plus_tree_seq_generator
 from utils import from_buf, from_bytes
 
@@ -18,32 +19,42 @@ class Database:
         self.b_plus_tree_seq_gen: BPlusTreeSeqGenerator | None = None
         self.tables: KV | None = None
 
-    def create_table(self, table_name: str, col_names: list[str], col_types: list[int]) -> Table:
-        table = self.tables[table_name]
-        if table is not None:
-            raise ValueError("table name already exists")
+    def create_table(self, table_name: str, col_names: list[str], col_types: list[int],
+                     kind: int = TREE_B_PLUS, bloom_bits_per_key: int = 0) -> Table:
+        """
+        kind 选表数据所用的树，写多读少的表可用 TREE_B_EPSILON；
+        常查不存在的主键（如去重）的 B+ 树表可设 bloom_bits_per_key 配 Bloom 过滤器
+        """
+        with self.pager.operation():
+            # tables 带 Bloom 过滤器，新表名通常不读树的页
+            table = self.tables[table_name]
+            if table is not None:
+                raise ValueError("table name already exists")
 
-        seq = self.b_plus_tree_seq_gen.get_next_seq()
-        table = new_table(table_name, col_names, col_types, self.pager, self.free_list, seq)
-        self.persist_table(table_name, table)
-        return table
+            seq = self.b_plus_tree_seq_gen.get_next_seq()
+            table = new_table(table_name, col_names, col_types, self.pager, self.free_list, seq, kind,
+                              bloom_bits_per_key)
+            self.persist_table(table_name, table)
+            return table
 
-    def create_index(self, table_name: str, col_names: list[str]):
-        table = self.get_table(table_name)
+    def create_index(self, table_name: str, col_names: list[str], kind: int = TREE_B_PLUS):
+        """只按等值查找的列（如会话 id、邮箱）可用 TREE_HASH"""
+        with self.pager.operation():
+            table = self.get_table(table_name)
 
-        col_indexes = []
-        for col_name in col_names:
-            col_index = table.col_names.index(col_name)
-            col_indexes.append(col_index)
-        col_indexes.sort()
-        col_indexes = tuple(col_indexes)
-        if col_indexes in table.indexes:
-            raise ValueError("index already exists")
+            col_indexes = []
+            for col_name in col_names:
+                col_index = table.col_names.index(col_name)
+                col_indexes.append(col_index)
+            col_indexes.sort()
+            col_indexes = tuple(col_indexes)
+            if col_indexes in table.indexes:
+                raise ValueError("index already exists")
 
-        seq = self.b_plus_tree_seq_gen.get_next_seq()
-        index = new_b_plus_tree(self.pager, self.free_list, seq, True)
-        table.indexes[col_indexes] = index
-        self.persist_table(table_name, table)
+            seq = self.b_plus_tree_seq_gen.get_next_seq()
+            table.indexes[col_indexes] = new_data_tree(self.pager, self.free_list, kind, seq, True)
+            table.index_kinds[col_indexes] = kind
+            self.persist_table(table_name, table)
 
     def get_table(self, table_name: str) -> Table:
         table_bytes = self.tables[table_name]
@@ -53,6 +64,38 @@ class Database:
         table = new_table_from_bytes(table_row, self.pager, self.free_list)
         return table
 
+    def vacuum_table(self, table_name: str) -> None:
+        """在线重建表数据和各索引的 B+ 树（见 BPlusTree.rebuild），其他种类的树跳过"""
+        table = self.get_table(table_name)
+        if table.kind == TREE_B_PLUS:
+            table.data.rebuild()
+        for col_indexes, tree in table.indexes.items():
+            if table.index_kinds[col_indexes] == TREE_B_PLUS:
+                tree.rebuild()
+
+    def stats(self, sample: int = 0) -> dict[str, BPlusTreeStats]:
+        """
+        各棵 B+ 树的统计，键为 'tables'（表目录）、表名和 '表名(列名,...)'（索引），
+        其他种类的树不统计；sample 见 BPlusTree.stats
+        """
+        result = {'tables': self.tables.data.stats(sample)}
+        cursor = self.tables.data.cursor()
+        cursor.seek_first()
+        table_names = [from_bytes(key, str) for key, _ in cursor]
+        for table_name in table_names:
+            table = self.get_table(table_name)
+            if table.kind == TREE_B_PLUS:
+                result[table_name] = table.data.stats(sample)
+            for col_indexes, tree in table.indexes.items():
+                if table.index_kinds[col_indexes] == TREE_B_PLUS:
+                    col_names = ','.join(table.col_names[i] for i in col_indexes)
+                    result[f'{table_name}({col_names})'] = tree.stats(sample)
+        return result
+
+    def close(self) -> None:
+        """关闭文件前调用，见 Pager.close"""
+        self.pager.close()
+
     def persist_table(self, table_name: str, table: Table):
         table_row = bytes(table)
         self.tables[table_name] = table_row
@@ -61,10 +104,11 @@ class Database:
 def new_database(pager: Pager) -> Database:
     db = Database()
     db.pager = pager
-    db.free_list = new_free_list(pager, META_PAGE_ID)
-    db.b_plus_tree_seq_gen = new_b_plus_tree_seq_generator(pager, INIT_B_PLUS_TREE_SEQ)
-    seq = db.b_plus_tree_seq_gen.get_next_seq()
-    db.tables = new_kv(db.pager, db.free_list, seq, True)
+    with pager.operation():
+        db.free_list = new_free_list(pager, META_PAGE_ID)
+        db.b_plus_tree_seq_gen = new_b_plus_tree_seq_generator(pager, INIT_B_PLUS_TREE_SEQ)
+        seq = db.b_plus_tree_seq_gen.get_next_seq()
+        db.tables = new_kv(db.pager, db.free_list, seq, True, bloom_bits_per_key=BLOOM_BITS_PER_KEY)
     return db
 
 
@@ -78,5 +122,6 @@ def new_database_from_meta(pager: Pager, meta: io.BytesIO) -> Database:
     init_seq = from_buf(meta, int)
     db.b_plus_tree_seq_gen = new_b_plus_tree_seq_generator(pager, init_seq)
     database_seq = from_buf(meta, int)
-    db.tables = new_kv(db.pager, db.free_list, database_seq, False)
+    # tables 新建时就配了过滤器，这里按同样的位数载入
+    db.tables = new_kv(db.pager, db.free_list, database_seq, False, bloom_bits_per_key=BLOOM_BITS_PER_KEY)
     return db
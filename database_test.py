@@ -1,6 +1,11 @@
-from const import META_PAGE_ID, BYTES_MAGIC_NUMBER, MAGIC_NUMBER_BS
+import inspect
+import os
+
+from b_epsilon_tree import BEpsilonTree
+from const import META_PAGE_ID, BYTES_MAGIC_NUMBER, MAGIC_NUMBER_BS, TREE_B_EPSILON, TREE_HASH, TREE_LSM
 from database import Database, new_database_from_meta, new_database
 from file import file_open
+from hash_index import HashIndex
 from pager import new_pager
 from row import new_row, new_row_from_bytes
 from value.const import VALUE_TYPE_STRING, VALUE_TYPE_INT
@@ -97,3 +102,143 @@ def test_get_one_by_index():
         assert _val_get == _val
         val_get = new_row_from_bytes(_val_get)
         assert val_get == val
+
+
+def test_create_table_b_epsilon():
+    """写多读少的表用 Bε 树存数据，重新打开后按表里记下的 kind 取回"""
+    name = inspect.currentframe().f_code.co_name
+    fd, db = init(name)
+    db.create_table(TB_NAME, ["name", "score"], [VALUE_TYPE_STRING, VALUE_TYPE_INT], TREE_B_EPSILON)
+    table = db.get_table(TB_NAME)
+    assert isinstance(table.data, BEpsilonTree)
+    key_vals = [(bytes(new_value_int(i)), bytes(new_row([new_value_string(NAME), new_value_int(i)])))
+                for i in range(1000)]
+    table.data.add(key_vals)
+    table.data.delete_one(key_vals[0][0])
+    os.close(fd)
+
+    fd, db = init(name)
+    table = db.get_table(TB_NAME)
+    assert table.kind == TREE_B_EPSILON
+    assert table.data.get_one(key_vals[1][0]) == key_vals[1][1]
+    assert table.data.get_one(key_vals[0][0]) is None
+    os.close(fd)
+    os.remove(f'{name}.db')
+
+
+def test_create_index_hash():
+    """只做等值查找的列用哈希索引，重新打开后按表里记下的 kind 取回"""
+    name = inspect.currentframe().f_code.co_name
+    fd, db = init(name)
+    db.create_table(TB_NAME, ["email", "score"], [VALUE_TYPE_STRING, VALUE_TYPE_INT])
+    db.create_index(TB_NAME, ["email"], TREE_HASH)
+    table = db.get_table(TB_NAME)
+    index = table.indexes[(0,)]
+    assert isinstance(index, HashIndex)
+    key_vals = [(bytes(new_row([new_value_string(f'user{i}@example.com')])), bytes(new_row([new_value_int(i)])))
+                for i in range(1000)]
+    index.add(key_vals)
+    os.close(fd)
+
+    fd, db = init(name)
+    table = db.get_table(TB_NAME)
+    assert table.index_kinds[(0,)] == TREE_HASH
+    assert table.indexes[(0,)].get_one(key_vals[10][0]) == key_vals[10][1]
+    os.close(fd)
+    os.remove(f'{name}.db')
+
+
+def test_bloom():
+    """tables 默认带 Bloom 过滤器，查不存在的表名不读树的页；建表时可给数据树配过滤器，重新打开后沿用"""
+    name = inspect.currentframe().f_code.co_name
+    fd, db = init(name)
+    db.create_table(TB_NAME, ["name", "score"], [VALUE_TYPE_STRING, VALUE_TYPE_INT], bloom_bits_per_key=10)
+    for i in range(200):
+        db.create_table(f'{TB_NAME}_{i}', ["name"], [VALUE_TYPE_STRING])
+    os.close(fd)
+
+    fd, db = init(name)
+    bloom = db.tables.data.bloom()
+    assert bloom is not None
+    bloom_page_ids = {bloom.page_id} | {page_id for s in bloom.slices for page_id in s.page_ids}
+    pager = db.pager
+    views = []
+    page_view = pager.page_view
+    pager.page_view = lambda page_id: views.append(page_id) or page_view(page_id)
+    assert all(db.tables[f'missing_{i}'] is None for i in range(100))
+    pager.page_view = page_view
+    assert len([page_id for page_id in views if page_id not in bloom_page_ids]) < 10
+    table = db.get_table(TB_NAME)
+    assert table.data.bloom() is not None
+    os.close(fd)
+    os.remove(f'{name}.db')
+
+
+def test_stats():
+    """表目录、B+ 树表及其索引都有统计，其他种类的树不统计"""
+    name = inspect.currentframe().f_code.co_name
+    fd, db = init(name)
+    db.create_table(TB_NAME, ["name", "score"], [VALUE_TYPE_STRING, VALUE_TYPE_INT])
+    db.create_index(TB_NAME, ["score"])
+    db.create_index(TB_NAME, ["name"], TREE_HASH)
+    db.create_table('events', ["name"], [VALUE_TYPE_STRING], TREE_B_EPSILON)
+    table = db.get_table(TB_NAME)
+    table.data.add([(bytes(new_value_int(i)), bytes(new_row([new_value_string(NAME), new_value_int(i)])))
+                    for i in range(1000)])
+    stats = db.stats()
+    assert set(stats) == {'tables', TB_NAME, f'{TB_NAME}(score)'}
+    assert stats['tables'].count == 2
+    assert stats[TB_NAME].count == 1000
+    assert stats['tables'].bloom_pages > 0
+    os.close(fd)
+    os.remove(f'{name}.db')
+
+
+def test_vacuum_table():
+    """重建表数据和 B+ 树索引，重新打开后数据不变"""
+    name = inspect.currentframe().f_code.co_name
+    fd, db = init(name)
+    db.create_table(TB_NAME, ["name", "score"], [VALUE_TYPE_STRING, VALUE_TYPE_INT])
+    db.create_index(TB_NAME, ["score"])
+    table = db.get_table(TB_NAME)
+    key_vals = [(bytes(new_value_int(i)), bytes(new_row([new_value_string(NAME), new_value_int(i)])))
+                for i in range(3000)]
+    for i in range(0, len(key_vals), 7):
+        table.data.add(key_vals[i:i + 7][::-1])
+    table.indexes[(1,)].add([(bytes(new_value_int(i)), bytes(new_value_int(i))) for i in range(3000)])
+    table.data.delete_lt(key_vals[2000][0])
+    db.vacuum_table(TB_NAME)
+    stats = db.stats()
+    assert stats[TB_NAME].count == 1000
+    assert stats[TB_NAME].leaf_breaks == 0
+    assert stats[f'{TB_NAME}(score)'].leaf_breaks == 0
+    os.close(fd)
+
+    fd, db = init(name)
+    table = db.get_table(TB_NAME)
+    assert table.data.get_all() == [val for _, val in key_vals[2000:]]
+    assert table.indexes[(1,)].count() == 3000
+    os.close(fd)
+    os.remove(f'{name}.db')
+
+
+def test_close():
+    """关闭前等 LSM 表的后台合并结束并关掉线程，重新打开后数据不变"""
+    name = inspect.currentframe().f_code.co_name
+    fd, db = init(name)
+    db.create_table(TB_NAME, ["name", "score"], [VALUE_TYPE_STRING, VALUE_TYPE_INT], TREE_LSM)
+    table = db.get_table(TB_NAME)
+    key_vals = [(bytes(new_value_int(i)), bytes(new_row([new_value_string(NAME * 10), new_value_int(i)])))
+                for i in range(20000)]
+    for i in range(0, len(key_vals), 1000):
+        table.data.upsert(key_vals[i:i + 1000])
+    db.close()
+    assert table.data.executor is None
+    os.close(fd)
+
+    fd, db = init(name)
+    table = db.get_table(TB_NAME)
+    assert table.data.get_all() == [val for _, val in key_vals]
+    db.close()
+    os.close(fd)
+    os.remove(f'{name}.db')
@@ -0,0 +1,127 @@
+import struct
+
+from const import NULL_PAGE_ID, BYTES_PAGE, EXTENT_PAGES, EXTENT_PAGES_MIN
+from free_list import FreeList
+from pager import Pager
+
+# 区段表页：page_id | 项数，每项为 树的 seq | 下一个未分配的页 | 区段末尾（不含）| 区段的页数
+EXTENT_HEADER = struct.Struct('>qH')
+EXTENT_ENTRY = struct.Struct('>qqqq')
+NUM_EXTENTS = (BYTES_PAGE - EXTENT_HEADER.size) // EXTENT_ENTRY.size
+
+
+class Extents:
+    """
+    各棵 B+ 树当前的区段：从文件末尾预留一段连续的页，只分给这棵树，
+    同一棵树的节点（含叶链）在文件里聚在一起，不和其他树交错。
+    区段从 EXTENT_PAGES_MIN 页开始，同一棵树每预留一次翻倍，直到 EXTENT_PAGES，小表不会白占一大段。
+    整张表存在一页里，页号记在 meta，随分配它的操作一起提交，重新打开后接着分配，预留的页不会丢。
+    区段用完后项留着，记下下一次预留的大小；表满时没有项的树直接用空闲链。
+    """
+
+    def __init__(self):
+        self.pager: Pager | None = None
+        self.free_list: FreeList | None = None
+        self.page_id: int = NULL_PAGE_ID
+        self.extents: dict[int, tuple[int, int, int]] = {}
+
+    def __bytes__(self) -> bytes:
+        r = [EXTENT_HEADER.pack(self.page_id, len(self.extents))]
+        r.extend(EXTENT_ENTRY.pack(seq, page_id, end, size) for seq, (page_id, end, size) in self.extents.items())
+        return b''.join(r)
+
+    def persist(self) -> None:
+        self.pager.page_set(self.page_id, bytes(self))
+
+    def rollback(self) -> None:
+        """pager 回滚后按 meta 里的页号重新载入"""
+        with self.free_list.lock:
+            extents_load(self, self.pager.extent_page_id_get())
+
+    def get_page_id(self, seq: int) -> int:
+        """
+        先用本树当前区段里剩下的页，用完了就为它预留下一个（更大的）区段；
+        只有区段表满、这棵树分不到区段时才用空闲链
+        """
+        with self.free_list.lock:
+            extent = self.extents.get(seq)
+            if extent is not None and extent[0] < extent[1]:
+                page_id, end, size = extent
+            else:
+                if extent is None and len(self.extents) >= NUM_EXTENTS:
+                    return self.free_list.get_page_id()
+                if self.page_id == NULL_PAGE_ID:
+                    # 表页先于区段分配，不夹在同一棵树前后两个区段之间
+                    self.page_id = self.free_list.get_page_id()
+                    self.pager.extent_page_id_set(self.page_id)
+                size = EXTENT_PAGES_MIN if extent is None else min(extent[2] * 2, EXTENT_PAGES)
+                page_id = self.free_list.reserve(size)
+                end = page_id + size
+            self.extents[seq] = page_id + 1, end, size
+            self.persist()
+            if self.pager.cow:
+                self.pager.fresh.add(page_id)
+            return page_id
+
+
+def new_extents_from_page_id(pager: Pager, free_list: FreeList, page_id: int) -> Extents:
+    extents = Extents()
+    extents.pager = pager
+    extents.free_list = free_list
+    extents_load(extents, page_id)
+    return extents
+
+
+def extents_load(extents: Extents, page_id: int) -> None:
+    extents.page_id = page_id
+    extents.extents = {}
+    if page_id == NULL_PAGE_ID:
+        return
+    view = extents.pager.page_view(page_id)
+    _page_id, num_extents = EXTENT_HEADER.unpack_from(view)
+    if _page_id != page_id:
+        raise ValueError("page_id 错误")
+    for i in range(num_extents):
+        seq, next_page_id, end, size = EXTENT_ENTRY.unpack_from(view, EXTENT_HEADER.size + i * EXTENT_ENTRY.size)
+        extents.extents[seq] = next_page_id, end, size
+
+
+class ExtentFreeList:
+    """某棵 B+ 树看到的空闲链：新页从本树的区段分配，回收和其余操作交给全局的空闲链"""
+
+    def __init__(self):
+        self.free_list: FreeList | None = None
+        self.extents: Extents | None = None
+        self.seq: int = 0
+
+    def get_page_id(self) -> int:
+        return self.extents.get_page_id(self.seq)
+
+    def get_new_page_id(self) -> int:
+        return self.free_list.get_new_page_id()
+
+    def add_page_id(self, page_id: int) -> None:
+        self.free_list.add_page_id(page_id)
+
+    def length(self) -> tuple[int, int]:
+        return self.free_list.length()
+
+
+def new_extent_free_list(pager: Pager, free_list: FreeList | ExtentFreeList, seq: int) -> ExtentFreeList:
+    """区段表每个 pager 只载入一次，登记在 pager.extents"""
+    if isinstance(free_list, ExtentFreeList):
+        free_list = free_list.free_list
+    with pager.lock:
+        extents = pager.extents
+    if extents is None:
+        extents = new_extents_from_page_id(pager, free_list, pager.extent_page_id_get())
+        with pager.lock:
+            if pager.extents is None:
+                pager.extents = extents
+                pager.rollback_hooks.append(extents.rollback)
+            extents = pager.extents
+    r = ExtentFreeList()
+    r.free_list = free_list
+    r.extents = extents
+    r.seq = seq
+    return r
@@ -0,0 +1,125 @@
+import inspect
+import os
+import pytest
+
+from b_plus_tree import new_b_plus_tree
+from const import META_PAGE_ID, EXTENT_PAGES, EXTENT_PAGES_MIN, NULL_PAGE_ID
+from extent import NUM_EXTENTS, new_extent_free_list
+from file import file_open
+from free_list import FreeList, new_free_list
+from pager import Pager, new_pager
+
+
+def init(name: str) -> tuple[int, Pager, FreeList]:
+    fd = file_open(f'{name}.db')
+    pager = new_pager(fd)
+    free_list = new_free_list(pager, META_PAGE_ID)
+    return fd, pager, free_list
+
+
+def close(fd: int, name: str) -> None:
+    os.close(fd)
+    os.remove(f'{name}.db')
+
+
+def test_get_page_id():
+    """同一棵树连续分配得到区段里连续的页，区段用完后预留下一个"""
+    name = inspect.currentframe().f_code.co_name
+    fd, pager, free_list = init(name)
+    a = new_extent_free_list(pager, free_list, 0)
+    b = new_extent_free_list(pager, free_list, 1)
+    with pager.operation():
+        page_ids_a = [a.get_page_id() for _ in range(EXTENT_PAGES_MIN + 1)]
+        page_ids_b = [b.get_page_id() for _ in range(3)]
+        page_ids_a.append(a.get_page_id())
+    assert page_ids_a == list(range(page_ids_a[0], page_ids_a[0] + EXTENT_PAGES_MIN + 2))
+    assert page_ids_b == list(range(page_ids_b[0], page_ids_b[0] + 3))
+    assert page_ids_b[0] == page_ids_a[0] + 3 * EXTENT_PAGES_MIN
+    assert a.extents is b.extents
+    close(fd, name)
+
+
+def test_grow():
+    """第一个区段 EXTENT_PAGES_MIN 页，同一棵树每预留一次翻倍，最多 EXTENT_PAGES 页"""
+    name = inspect.currentframe().f_code.co_name
+    fd, pager, free_list = init(name)
+    a = new_extent_free_list(pager, free_list, 0)
+    sizes = []
+    with pager.operation():
+        for _ in range(4 * EXTENT_PAGES):
+            page_id = a.get_page_id()
+            _, end, size = a.extents.extents[0]
+            if end == page_id + size:
+                sizes.append(size)
+    expected = []
+    size = EXTENT_PAGES_MIN
+    while sum(expected) < 4 * EXTENT_PAGES:
+        expected.append(size)
+        size = min(size * 2, EXTENT_PAGES)
+    assert sizes == expected
+    close(fd, name)
+
+
+def test_extent_first():
+    """空闲链里有页时也先用本树的区段，区段表满时才用空闲链"""
+    name = inspect.currentframe().f_code.co_name
+    fd, pager, free_list = init(name)
+    a = new_extent_free_list(pager, free_list, 0)
+    with pager.operation():
+        page_ids = [free_list.get_page_id() for _ in range(2)]
+        for page_id in page_ids:
+            free_list.add_page_id(page_id)
+        page_id = a.get_page_id()
+        assert page_id not in page_ids
+        assert a.extents.extents[0] == (page_id + 1, page_id + EXTENT_PAGES_MIN, EXTENT_PAGES_MIN)
+        for _ in range(EXTENT_PAGES_MIN):
+            assert a.get_page_id() not in page_ids
+    close(fd, name)
+
+
+def test_reopen():
+    """区段表随操作提交，重新载入后接着上次的位置分配"""
+    name = inspect.currentframe().f_code.co_name
+    fd, pager, free_list = init(name)
+    a = new_extent_free_list(pager, free_list, 0)
+    with pager.operation():
+        page_ids = [a.get_page_id() for _ in range(5)]
+    assert pager.extent_page_id_get() != NULL_PAGE_ID
+    pager.extents = None
+    a = new_extent_free_list(pager, free_list, 0)
+    assert a.extents is pager.extents
+    with pager.operation():
+        assert a.get_page_id() == page_ids[-1] + 1
+    close(fd, name)
+
+
+def test_table_full():
+    """区段表满时其余的树直接用空闲链"""
+    name = inspect.currentframe().f_code.co_name
+    fd, pager, free_list = init(name)
+    with pager.operation():
+        for seq in range(NUM_EXTENTS):
+            new_extent_free_list(pager, free_list, seq).get_page_id()
+        used = free_list.page_id_generator.used_page_id
+        assert new_extent_free_list(pager, free_list, NUM_EXTENTS).get_page_id() == used + 1
+    assert len(pager.extents.extents) == NUM_EXTENTS
+    close(fd, name)
+
+
+def test_locality():
+    """两棵树交替写入，各自的叶节点仍聚在自己的区段里"""
+    name = inspect.currentframe().f_code.co_name
+    fd, pager, free_list = init(name)
+    trees = [new_b_plus_tree(pager, free_list, seq, True) for seq in range(2)]
+    for i in range(3000):
+        for tree in trees:
+            tree.add([(b'%05d' % i, b'v' * 100)])
+    for tree in trees:
+        stats = tree.stats()
+        assert stats.levels[-1].nodes > 50
+        assert stats.fragmentation() < 0.2
+    close(fd, name)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
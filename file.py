@@ -1,6 +1,28 @@
 import os
+import threading
+
+# 没有 pread/pwrite 的平台（如 Windows）退回 lseek + read/write，它们共享文件偏移，由这把锁串行化
+seek_lock: threading.Lock = threading.Lock()
 
 
 def file_open(path: str) -> int:
     fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_BINARY)
     return fd
+
+
+def file_pread(fd: int, length: int, offset: int) -> bytes:
+    """读 offset 处的 length 字节，不改变（或不依赖）文件偏移，多线程可同时调用"""
+    if hasattr(os, 'pread'):
+        return os.pread(fd, length, offset)
+    with seek_lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.read(fd, length)
+
+
+def file_pwrite(fd: int, data: bytes | bytearray, offset: int) -> None:
+    if hasattr(os, 'pwrite'):
+        os.pwrite(fd, data, offset)
+        return
+    with seek_lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        os.write(fd, data)
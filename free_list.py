@@ -1,3 +1,5 @@
+import threading
+
 from const import NULL_PAGE_ID, NUM_PAGE_IDS
 from pager import Pager
 from utils import to_bytes, from_buf
@@ -13,6 +15,13 @@ class PageIdGenerator:
         self.pager.used_page_id_set(self.used_page_id)
         return self.used_page_id
 
+    def get_next_page_ids(self, n: int) -> int:
+        """一次取 n 个连续的新页，返回第一页"""
+        first = self.used_page_id + 1
+        self.used_page_id += n
+        self.pager.used_page_id_set(self.used_page_id)
+        return first
+
 
 def new_page_id_generator(pager: Pager, init_page_id: int) -> PageIdGenerator:
     id_gen = PageIdGenerator()
@@ -88,23 +97,150 @@ def new_free_list_node_from_page_id(pager: Pager, page_id: int) -> FreeListNode:
 
 
 class FreeList:
+    """空闲页链表，分配和回收由 lock 串行化"""
 
     def __init__(self):
+        self.lock: threading.RLock = threading.RLock()
         self.pager: Pager | None = None
         self.page_id_generator: PageIdGenerator | None = None
         self.head: FreeListNode | None = None
         self.tail: FreeListNode | None = None
+        # 写时复制时等待快照关闭的页，按 pager.pending 的顺序记在另一条链上，链的页不经过 pending
+        self.pending_head: FreeListNode | None = None
+        self.pending_tail: FreeListNode | None = None
 
     # 对外暴露使用
     def get_page_id(self) -> int:
-        page_id = self.get_unused_page_id()
-        if page_id == NULL_PAGE_ID:
+        with self.lock:
+            page_id = self.get_unused_page_id()
+            if page_id == NULL_PAGE_ID:
+                page_id = self.page_id_generator.get_next_page_id()
+            if self.pager.cow:
+                self.pager.fresh.add(page_id)
+            return page_id
+
+    # 对外暴露使用
+    def get_new_page_id(self) -> int:
+        """不用空闲链里的页，从文件末尾取新页，连续调用得到连续的页号"""
+        with self.lock:
             page_id = self.page_id_generator.get_next_page_id()
-        return page_id
+            if self.pager.cow:
+                self.pager.fresh.add(page_id)
+            return page_id
+
+    # 对外暴露使用
+    def get_free_page_id(self) -> int:
+        """只取空闲链里的页，没有时返回 NULL_PAGE_ID"""
+        with self.lock:
+            page_id = self.get_unused_page_id()
+            if page_id != NULL_PAGE_ID and self.pager.cow:
+                self.pager.fresh.add(page_id)
+            return page_id
+
+    # 对外暴露使用
+    def reserve(self, n: int) -> int:
+        """从文件末尾连续预留 n 页，返回第一页，由调用方自己分配"""
+        with self.lock:
+            return self.page_id_generator.get_next_page_ids(n)
 
     # 对外暴露使用
     def add_page_id(self, page_id: int) -> None:
-        self.add_unused_page_id(page_id)
+        with self.lock:
+            if self.pager.cow and self.pager.page_defer(page_id):
+                self.pending_add(page_id)
+                return
+            self.release(page_id)
+
+    def length(self) -> tuple[int, int]:
+        """空闲页数与空闲链自身占的页数"""
+        with self.lock:
+            free_pages = 0
+            list_pages = 0
+            node = self.head
+            while True:
+                free_pages += len(node.page_ids) - node.unused
+                list_pages += 1
+                if node.next_page_id == NULL_PAGE_ID:
+                    return free_pages, list_pages
+                node = new_free_list_node_from_page_id(self.pager, node.next_page_id)
+
+    def release(self, page_id: int) -> None:
+        with self.lock:
+            # 释放的页不再对应原来的节点
+            self.pager.node_cache.invalidate(page_id)
+            self.add_unused_page_id(page_id)
+
+    def pending_add(self, page_id: int) -> None:
+        """进了 pager.pending 的页同时追加到 pending 链尾，和替换它的事务一起提交"""
+        tail = self.pending_tail
+        if tail is not None and not tail.is_full():
+            tail.add_unused_page_id(page_id)
+            tail.persist()
+            return
+        node = new_free_list_node(self.pager, self.page_id_generator.get_next_page_id(), NULL_PAGE_ID)
+        node.add_unused_page_id(page_id)
+        node.persist()
+        if tail is None:
+            self.pending_head = node
+            self.pager.pending_page_id_set(node.page_id)
+        else:
+            tail.next_page_id = node.page_id
+            tail.persist()
+        self.pending_tail = node
+
+    def pending_release(self, page_id: int) -> None:
+        """pager 按进 pending 的顺序交回页，从 pending 链头取下后放进空闲链"""
+        with self.lock:
+            head = self.pending_head
+            if head is None or head.get_unused_page_id() != page_id:
+                raise ValueError("pending 链错误")
+            if not head.have_unused():
+                if head is self.pending_tail:
+                    self.pending_head = None
+                    self.pending_tail = None
+                    self.pager.pending_page_id_set(NULL_PAGE_ID)
+                else:
+                    if head.next_page_id == self.pending_tail.page_id:
+                        self.pending_head = self.pending_tail
+                    else:
+                        self.pending_head = new_free_list_node_from_page_id(self.pager, head.next_page_id)
+                    self.pager.pending_page_id_set(self.pending_head.page_id)
+                self.release(head.page_id)
+            self.release(page_id)
+
+    def pending_drain(self) -> None:
+        """打开文件时还没有快照，上次退出时 pending 链上的页全部交回空闲链"""
+        page_id = self.pager.pending_page_id_get()
+        if page_id == NULL_PAGE_ID:
+            return
+        with self.pager.operation():
+            while page_id != NULL_PAGE_ID:
+                node = new_free_list_node_from_page_id(self.pager, page_id)
+                for pending_page_id in node.page_ids[node.unused:]:
+                    self.release(pending_page_id)
+                self.release(node.page_id)
+                page_id = node.next_page_id
+            self.pager.pending_page_id_set(NULL_PAGE_ID)
+
+    def rollback(self) -> None:
+        """pager 回滚后按 meta 重新载入头尾节点和 pending 链"""
+        with self.lock:
+            meta = self.pager.meta
+            self.page_id_generator.used_page_id = meta.used_page_id
+            self.head = new_free_list_node_from_page_id(self.pager, meta.head_page_id)
+            if meta.tail_page_id == meta.head_page_id:
+                self.tail = self.head
+            else:
+                self.tail = new_free_list_node_from_page_id(self.pager, meta.tail_page_id)
+            self.pending_head = None
+            self.pending_tail = None
+            page_id = meta.pending_page_id
+            while page_id != NULL_PAGE_ID:
+                node = new_free_list_node_from_page_id(self.pager, page_id)
+                if self.pending_head is None:
+                    self.pending_head = node
+                self.pending_tail = node
+                page_id = node.next_page_id
 
     def add_unused_page_id(self, page_id: int) -> None:
         if not self.tail.is_full():
@@ -166,6 +302,10 @@ def new_free_list(pager: Pager, init_page_id: int) -> FreeList:
     pager.tail_page_id_set(head.page_id)
     free_list.head = head
     free_list.tail = head
+    free_list.pending_head = None
+    free_list.pending_tail = None
+    pager.page_release = free_list.pending_release
+    pager.rollback_hooks.append(free_list.rollback)
     return free_list
 
 
@@ -174,5 +314,14 @@ def new_free_list_from_page_id(pager: Pager, init_page_id: int, head_page_id: in
     free_list.pager = pager
     free_list.page_id_generator = new_page_id_generator(pager, init_page_id)
     free_list.head = new_free_list_node_from_page_id(pager, head_page_id)
-    free_list.tail = new_free_list_node_from_page_id(pager, tail_page_id)
+    # 只有一页时头尾是同一个节点，分开载入的话追加到尾部后头节点的 next_page_id 就旧了
+    if tail_page_id == head_page_id:
+        free_list.tail = free_list.head
+    else:
+        free_list.tail = new_free_list_node_from_page_id(pager, tail_page_id)
+    free_list.pending_head = None
+    free_list.pending_tail = None
+    free_list.pending_drain()
+    pager.page_release = free_list.pending_release
+    pager.rollback_hooks.append(free_list.rollback)
     return free_list
@@ -3,7 +3,7 @@ import inspect
 import pytest
 from const import META_PAGE_ID, BYTES_MAGIC_NUMBER, MAGIC_NUMBER_BS, NULL_PAGE_ID
 from file import file_open
-from free_list import FreeList, new_free_list, new_free_list_from_page_id
+from free_list import FreeList, new_free_list, new_free_list_from_page_id, new_free_list_node_from_page_id
 from pager import new_pager
 from utils import from_buf
 
@@ -103,5 +103,62 @@ def test_get_unused_page_id_4():
     close(fd, name)
 
 
+def test_reopen_head_is_tail():
+    """重新打开时空闲链只有一页，之后追加到尾部的页从头部取得到"""
+    name = inspect.currentframe().f_code.co_name
+    fd, free_list = init(name)
+    free_list.pager.flush()
+    fd, free_list = init(name)
+    assert free_list.head is free_list.tail
+    for i in [10, 20, 30]:
+        free_list.add_unused_page_id(i)
+    assert [free_list.get_unused_page_id() for _ in range(3)] == [10, 20, 30]
+    close(fd, name)
+
+
+def chain_page_ids(free_list: FreeList, node) -> list[int]:
+    page_ids = []
+    while node is not None:
+        page_ids.extend(node.page_ids[node.unused:])
+        if node.next_page_id == NULL_PAGE_ID:
+            break
+        node = new_free_list_node_from_page_id(free_list.pager, node.next_page_id)
+    return page_ids
+
+
+def test_pending():
+    """写时复制时进了 pending 的页也记在 pending 链上，快照关闭后按序取下交回空闲链；
+    快照还开着时进程退出，重新打开文件时链上的页全部交回"""
+    name = inspect.currentframe().f_code.co_name
+    fd = file_open(f'{name}.db')
+    pager = new_pager(fd, cow=True)
+    pager.magic_number_set()
+    free_list = new_free_list(pager, META_PAGE_ID)
+    with pager.operation():
+        page_ids = [free_list.get_page_id() for _ in range(7)]
+    with pager.snapshot():
+        with pager.operation():
+            for page_id in page_ids[:3]:
+                free_list.add_page_id(page_id)
+        assert chain_page_ids(free_list, free_list.pending_head) == page_ids[:3]
+    with pager.operation():
+        pass
+    assert free_list.pending_head is None
+    assert pager.pending_page_id_get() == NULL_PAGE_ID
+    assert set(page_ids[:3]) <= set(chain_page_ids(free_list, free_list.head))
+    with pager.snapshot():
+        with pager.operation():
+            for page_id in page_ids[3:]:
+                free_list.add_page_id(page_id)
+        pager = new_pager(fd)
+        assert pager.pending_page_id_get() != NULL_PAGE_ID
+        free_list = new_free_list_from_page_id(pager, pager.meta.used_page_id, pager.meta.head_page_id,
+                                               pager.meta.tail_page_id)
+    assert pager.pending_page_id_get() == NULL_PAGE_ID
+    assert set(page_ids[3:]) <= set(chain_page_ids(free_list, free_list.head))
+    assert new_pager(fd).pending_page_id_get() == NULL_PAGE_ID
+    close(fd, name)
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
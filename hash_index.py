@@ -0,0 +1,312 @@
+import hashlib
+import struct
+from contextlib import contextmanager
+
+from b_epsilon_tree import encode_val, decode_val, read_val, val_size
+from b_plus_tree import LEAF_ENTRY, check_key, free_vals, store_val
+from const import NULL_PAGE_ID, BYTES_PAGE, HASH_DEPTH_MAX
+from free_list import FreeList
+from overflow import Overflow
+from pager import Pager
+
+# 头页：page_id | 全局深度 | 记录数 | 目录页个数，之后是各目录页的 page_id
+HASH_HEADER = struct.Struct('>qBqH')
+# 目录页：page_id，之后是桶首页的 page_id，下标为 key 的哈希值取低 depth 位
+DIR_HEADER = struct.Struct('>q')
+DIR_ENTRY = struct.Struct('>q')
+DIR_ENTRIES = (BYTES_PAGE - DIR_HEADER.size) // DIR_ENTRY.size
+# 桶页：page_id | 局部深度 | 记录条数 | 下一页（局部深度到 HASH_DEPTH_MAX 后放不下才接页）
+BUCKET_HEADER = struct.Struct('>qBHq')
+
+
+def hash_key(key: bytes) -> int:
+    """跨进程稳定的 64 位哈希"""
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'big')
+
+
+class HashBucket:
+    """一个桶的全部记录，解码后放进节点缓存，取到的对象被修改后必须 persist"""
+
+    def __init__(self):
+        self.pager: Pager | None = None
+        self.free_list: FreeList | None = None
+        self.page_ids: list[int] = []
+        self.depth: int = 0
+        self.keys: list[bytes] = []
+        self.vals: list[bytes | Overflow] = []
+
+    @property
+    def page_id(self) -> int:
+        return self.page_ids[0]
+
+    def entries(self) -> list[bytes]:
+        r = []
+        for key, val in zip(self.keys, self.vals):
+            length, val_bs = encode_val(val)
+            r.append(LEAF_ENTRY.pack(len(key), length) + key + val_bs)
+        return r
+
+    def pages(self) -> list[list[bytes]]:
+        """记录按页切开，至少一页"""
+        pages = [[]]
+        size = BUCKET_HEADER.size
+        for entry in self.entries():
+            if size + len(entry) > BYTES_PAGE:
+                pages.append([])
+                size = BUCKET_HEADER.size
+            pages[-1].append(entry)
+            size += len(entry)
+        return pages
+
+    def overflows(self) -> bool:
+        size = sum(LEAF_ENTRY.size + len(key) + val_size(val) for key, val in zip(self.keys, self.vals))
+        return BUCKET_HEADER.size + size > BYTES_PAGE
+
+    def persist(self) -> None:
+        """按需增减页链，首页不变"""
+        pages = self.pages()
+        while len(self.page_ids) < len(pages):
+            self.page_ids.append(self.free_list.get_page_id())
+        while len(self.page_ids) > len(pages):
+            self.free_list.add_page_id(self.page_ids.pop())
+        for i, entries in enumerate(pages):
+            next_page_id = self.page_ids[i + 1] if i + 1 < len(pages) else NULL_PAGE_ID
+            page_id = self.page_ids[i]
+            self.pager.page_set(page_id, BUCKET_HEADER.pack(page_id, self.depth, len(entries), next_page_id)
+                                + b''.join(entries))
+        size = sum(len(entry) for entries in pages for entry in entries)
+        self.pager.node_cache.put(self.page_id, self, size)
+
+    def find(self, key: bytes) -> int:
+        for i, k in enumerate(self.keys):
+            if k == key:
+                return i
+        return -1
+
+
+def new_hash_bucket(pager: Pager, free_list: FreeList, depth: int) -> HashBucket:
+    bucket = HashBucket()
+    bucket.pager = pager
+    bucket.free_list = free_list
+    bucket.page_ids = [free_list.get_page_id()]
+    bucket.depth = depth
+    bucket.keys = []
+    bucket.vals = []
+    return bucket
+
+
+def new_hash_bucket_from_page_id(pager: Pager, free_list: FreeList, page_id: int) -> HashBucket:
+    bucket = pager.node_cache.get(page_id)
+    if bucket is not None:
+        return bucket
+    bucket = HashBucket()
+    bucket.pager = pager
+    bucket.free_list = free_list
+    bucket.page_ids = []
+    bucket.keys = []
+    bucket.vals = []
+    size = 0
+    while page_id != NULL_PAGE_ID:
+        view = pager.page_view(page_id)
+        _page_id, depth, num_entries, next_page_id = BUCKET_HEADER.unpack_from(view)
+        if _page_id != page_id:
+            raise ValueError("page_id 错误")
+        bucket.page_ids.append(page_id)
+        bucket.depth = depth
+        offset = BUCKET_HEADER.size
+        for _ in range(num_entries):
+            length_key, length_val = LEAF_ENTRY.unpack_from(view, offset)
+            offset += LEAF_ENTRY.size
+            bucket.keys.append(view[offset:offset + length_key].tobytes())
+            val, offset = decode_val(pager, free_list, view, offset + length_key, length_val)
+            bucket.vals.append(val)
+        size += offset
+        page_id = next_page_id
+    pager.node_cache.put(bucket.page_id, bucket, size)
+    return bucket
+
+
+class HashIndex:
+    """
+    可扩展哈希索引，只支持等值查找：get_one/add/upsert/delete_one，以及 count。
+    key 的哈希值取低 depth 位查目录得到桶，查找读头页、一个目录页和一个桶页，前两者常驻缓冲池。
+    桶放不下一页时按下一位哈希分裂，局部深度追上全局深度时目录先翻倍；删除不合并桶。
+    写者持根指针的独占闩到操作结束，读者查找期间持共享闩。
+    """
+
+    def __init__(self):
+        self.pager: Pager | None = None
+        self.free_list: FreeList | None = None
+        self.seq: int = 0
+
+    def root_latch_key(self) -> tuple[str, int]:
+        return 'root', self.seq
+
+    @contextmanager
+    def reading(self):
+        with self.pager.latch_shared_gated(self.root_latch_key()):
+            yield
+
+    def header(self) -> tuple[int, int, int, list[int]]:
+        """头页的 page_id、全局深度、记录数和目录页"""
+        page_id = self.pager.root_page_id_get(self.seq)
+        view = self.pager.page_view(page_id)
+        _page_id, depth, count, num_dir_pages = HASH_HEADER.unpack_from(view)
+        if _page_id != page_id:
+            raise ValueError("page_id 错误")
+        dir_page_ids = [DIR_ENTRY.unpack_from(view, HASH_HEADER.size + i * DIR_ENTRY.size)[0]
+                        for i in range(num_dir_pages)]
+        return page_id, depth, count, dir_page_ids
+
+    def header_set(self, page_id: int, depth: int, count: int, dir_page_ids: list[int]) -> None:
+        self.pager.page_set(page_id, HASH_HEADER.pack(page_id, depth, count, len(dir_page_ids))
+                            + b''.join(DIR_ENTRY.pack(dir_page_id) for dir_page_id in dir_page_ids))
+
+    def slot_get(self, dir_page_ids: list[int], slot: int) -> int:
+        view = self.pager.page_view(dir_page_ids[slot // DIR_ENTRIES])
+        return DIR_ENTRY.unpack_from(view, DIR_HEADER.size + slot % DIR_ENTRIES * DIR_ENTRY.size)[0]
+
+    def slots_set(self, dir_page_ids: list[int], slots: list[int], bucket_page_id: int) -> None:
+        pages = {}
+        for slot in slots:
+            dir_page_id = dir_page_ids[slot // DIR_ENTRIES]
+            if dir_page_id not in pages:
+                pages[dir_page_id] = bytearray(self.pager.page_view(dir_page_id))
+            DIR_ENTRY.pack_into(pages[dir_page_id], DIR_HEADER.size + slot % DIR_ENTRIES * DIR_ENTRY.size,
+                                bucket_page_id)
+        for dir_page_id, page_bs in pages.items():
+            self.pager.page_set(dir_page_id, bytes(page_bs))
+
+    def dir_write(self, slots: list[int], dir_page_ids: list[int]) -> list[int]:
+        """整个目录按页写出，页不够时新分配，返回目录页"""
+        dir_page_ids = list(dir_page_ids)
+        for i in range(0, len(slots), DIR_ENTRIES):
+            if i // DIR_ENTRIES == len(dir_page_ids):
+                dir_page_ids.append(self.free_list.get_page_id())
+            page_id = dir_page_ids[i // DIR_ENTRIES]
+            self.pager.page_set(page_id, DIR_HEADER.pack(page_id)
+                                + b''.join(DIR_ENTRY.pack(s) for s in slots[i:i + DIR_ENTRIES]))
+        return dir_page_ids
+
+    def bucket(self, dir_page_ids: list[int], depth: int, key: bytes,
+               dirty: dict[int, HashBucket] | None = None) -> tuple[int, HashBucket]:
+        """key 所在的目录项和桶，dirty 为本次写入改过、还没写回的桶"""
+        slot = hash_key(key) & ((1 << depth) - 1)
+        page_id = self.slot_get(dir_page_ids, slot)
+        if dirty is not None and page_id in dirty:
+            return slot, dirty[page_id]
+        return slot, new_hash_bucket_from_page_id(self.pager, self.free_list, page_id)
+
+    def get_one(self, key: bytes) -> bytes | None:
+        with self.reading():
+            _, depth, _, dir_page_ids = self.header()
+            _, bucket = self.bucket(dir_page_ids, depth, key)
+            i = bucket.find(key)
+            return read_val(bucket.vals[i]) if i >= 0 else None
+
+    def count(self) -> int:
+        with self.reading():
+            return self.header()[2]
+
+    def add(self, key_vals: list[tuple[bytes, bytes]]) -> None:
+        """已存在的 key 保持不变，批内重复的 key 保留第一条"""
+        self.write(key_vals, False)
+
+    def upsert(self, key_vals: list[tuple[bytes, bytes]]) -> None:
+        """批内重复的 key 保留最后一条"""
+        self.write(key_vals, True)
+
+    def write(self, key_vals: list[tuple[bytes, bytes]], replace: bool) -> None:
+        batch = {}
+        for key, val in key_vals:
+            check_key(key)
+            if replace or key not in batch:
+                batch[key] = val
+        if len(batch) == 0:
+            return
+        with self.pager.operation():
+            self.pager.latch_exclusive_gated(self.root_latch_key())
+            page_id, depth, count, dir_page_ids = self.header()
+            # 同一个桶在一批里只写回一次
+            dirty = {}
+            for key, val in batch.items():
+                slot, bucket = self.bucket(dir_page_ids, depth, key, dirty)
+                i = bucket.find(key)
+                if i >= 0:
+                    if not replace:
+                        continue
+                    free_vals([bucket.vals[i]])
+                    bucket.vals[i] = store_val(self.pager, self.free_list, key, val)
+                else:
+                    bucket.keys.append(key)
+                    bucket.vals.append(store_val(self.pager, self.free_list, key, val))
+                    count += 1
+                dirty[bucket.page_id] = bucket
+                if bucket.overflows():
+                    depth, dir_page_ids = self.split(bucket, slot, depth, dir_page_ids, dirty)
+            for bucket in dirty.values():
+                bucket.persist()
+            self.header_set(page_id, depth, count, dir_page_ids)
+
+    def split(self, bucket: HashBucket, slot: int, depth: int, dir_page_ids: list[int],
+              dirty: dict[int, HashBucket]) -> tuple[int, list[int]]:
+        """
+        放不下一页的桶按下一位哈希一分为二，分完仍放不下的继续分；局部深度等于全局深度时目录先翻倍。
+        局部深度到 HASH_DEPTH_MAX 后不再分裂，桶接成页链。新桶记进 dirty，返回新的全局深度和目录页。
+        """
+        work = [(bucket, slot & ((1 << bucket.depth) - 1))]
+        while len(work) > 0:
+            bucket, pattern = work.pop()
+            if not bucket.overflows() or bucket.depth >= HASH_DEPTH_MAX:
+                continue
+            if bucket.depth == depth:
+                slots = [self.slot_get(dir_page_ids, s) for s in range(1 << depth)]
+                dir_page_ids = self.dir_write(slots + slots, dir_page_ids)
+                depth += 1
+            bit = 1 << bucket.depth
+            right = new_hash_bucket(self.pager, self.free_list, bucket.depth + 1)
+            dirty[right.page_id] = right
+            keys, vals = bucket.keys, bucket.vals
+            bucket.keys, bucket.vals = [], []
+            for key, val in zip(keys, vals):
+                side = right if hash_key(key) & bit else bucket
+                side.keys.append(key)
+                side.vals.append(val)
+            bucket.depth += 1
+            # 原来指向这个桶、且这一位为 1 的目录项改指向新桶
+            step = 1 << bucket.depth
+            self.slots_set(dir_page_ids, list(range(pattern | bit, 1 << depth, step)), right.page_id)
+            work.append((bucket, pattern))
+            work.append((right, pattern | bit))
+        return depth, dir_page_ids
+
+    def delete_one(self, key: bytes) -> None:
+        with self.pager.operation():
+            self.pager.latch_exclusive_gated(self.root_latch_key())
+            page_id, depth, count, dir_page_ids = self.header()
+            _, bucket = self.bucket(dir_page_ids, depth, key)
+            i = bucket.find(key)
+            if i < 0:
+                return
+            free_vals([bucket.vals.pop(i)])
+            bucket.keys.pop(i)
+            bucket.persist()
+            self.header_set(page_id, depth, count - 1, dir_page_ids)
+
+
+def new_hash_index(pager: Pager, free_list: FreeList, seq: int, is_seq_new: bool) -> HashIndex:
+    if pager.cow:
+        raise ValueError("写时复制模式不支持哈希索引")
+    index = HashIndex()
+    index.pager = pager
+    index.free_list = free_list
+    index.seq = seq
+    if is_seq_new:
+        with pager.operation():
+            page_id = free_list.get_page_id()
+            bucket = new_hash_bucket(pager, free_list, 0)
+            bucket.persist()
+            dir_page_ids = index.dir_write([bucket.page_id], [])
+            index.header_set(page_id, 0, 0, dir_page_ids)
+            pager.root_page_id_set(seq, page_id)
+    return index
@@ -0,0 +1,173 @@
+import inspect
+import os
+import random
+import threading
+import pytest
+
+from const import META_PAGE_ID, HASH_DEPTH_MAX
+from file import file_open
+from free_list import new_free_list
+from hash_index import HashIndex, new_hash_index, new_hash_bucket_from_page_id, hash_key
+from pager import new_pager
+
+
+def init(name: str) -> tuple[int, HashIndex]:
+    fd = file_open(f'{name}.db')
+    pager = new_pager(fd)
+    free_list = new_free_list(pager, META_PAGE_ID)
+    index = new_hash_index(pager, free_list, 0, True)
+    return fd, index
+
+
+def close(fd: int, name: str) -> None:
+    os.close(fd)
+    os.remove(f'{name}.db')
+
+
+def check_dir(index: HashIndex) -> None:
+    """每个目录项指向的桶里，key 的哈希值低 depth 位都与目录项相同"""
+    _, depth, count, dir_page_ids = index.header()
+    total = 0
+    seen = set()
+    for slot in range(1 << depth):
+        page_id = index.slot_get(dir_page_ids, slot)
+        bucket = new_hash_bucket_from_page_id(index.pager, index.free_list, page_id)
+        mask = (1 << bucket.depth) - 1
+        for key in bucket.keys:
+            assert hash_key(key) & mask == slot & mask
+        if page_id not in seen:
+            seen.add(page_id)
+            total += len(bucket.keys)
+    assert total == count
+
+
+def test_add_get():
+    name = inspect.currentframe().f_code.co_name
+    fd, index = init(name)
+    keys = [b'session-%06d' % i for i in range(20000)]
+    for i in range(0, len(keys), 100):
+        index.add([(key, key[8:]) for key in keys[i:i + 100]])
+    index.add([(keys[0], b'x')])
+    assert index.get_one(keys[0]) == keys[0][8:]
+    assert index.get_one(b'x') is None
+    assert index.count() == len(keys)
+    _, depth, _, dir_page_ids = index.header()
+    assert depth >= 8 and len(dir_page_ids) == -(-(1 << depth) // 511)
+    check_dir(index)
+    for key in random.Random(0).sample(keys, 1000):
+        assert index.get_one(key) == key[8:]
+    close(fd, name)
+
+
+def test_page_reads():
+    """查找只读头页、一个目录页和一个桶页"""
+    name = inspect.currentframe().f_code.co_name
+    fd, index = init(name)
+    keys = [b'user%d@example.com' % i for i in range(20000)]
+    index.upsert([(key, b'%d' % i) for i, key in enumerate(keys)])
+    pager = index.pager
+    pager.node_cache.clear()
+    views = []
+    page_view = pager.page_view
+    pager.page_view = lambda page_id: views.append(page_id) or page_view(page_id)
+    assert index.get_one(keys[12345]) == b'12345'
+    assert len(views) == 3
+    close(fd, name)
+
+
+def test_random():
+    """随机的 add / upsert / delete 与 dict 比对，val 有长有短（含溢出页）"""
+    name = inspect.currentframe().f_code.co_name
+    fd, index = init(name)
+    rnd = random.Random(0)
+    ref = {}
+    for step in range(4000):
+        r = rnd.random()
+        key = b'%04d' % rnd.randrange(3000)
+        if r < 0.4:
+            key_vals = [(b'%04d' % rnd.randrange(3000), b'v%d' % step * rnd.choice((1, 5, 200)))
+                        for _ in range(rnd.randrange(1, 20))]
+            index.upsert(key_vals)
+            ref.update(key_vals)
+        elif r < 0.7:
+            val = b'a%d' % step * rnd.choice((1, 300))
+            index.add([(key, val)])
+            ref.setdefault(key, val)
+        else:
+            index.delete_one(key)
+            ref.pop(key, None)
+        if step % 500 == 0:
+            check_dir(index)
+            index.pager.node_cache.clear()
+    check_dir(index)
+    assert index.count() == len(ref)
+    for i in range(3000):
+        assert index.get_one(b'%04d' % i) == ref.get(b'%04d' % i)
+    close(fd, name)
+
+
+def test_depth_max():
+    """局部深度到 HASH_DEPTH_MAX 后不再分裂，桶接成页链"""
+    name = inspect.currentframe().f_code.co_name
+    fd, index = init(name)
+    # 哈希值低 HASH_DEPTH_MAX 位相同的 key
+    keys = []
+    i = 0
+    while len(keys) < 12:
+        key = b'%08d' % i
+        if hash_key(key) & ((1 << HASH_DEPTH_MAX) - 1) == 0:
+            keys.append(key)
+        i += 1
+    index.upsert([(key, b'v' * 500) for key in keys])
+    _, depth, _, dir_page_ids = index.header()
+    assert depth == HASH_DEPTH_MAX
+    bucket = new_hash_bucket_from_page_id(index.pager, index.free_list, index.slot_get(dir_page_ids, 0))
+    assert len(bucket.page_ids) > 1
+    check_dir(index)
+    for key in keys:
+        assert index.get_one(key) == b'v' * 500
+    for key in keys:
+        index.delete_one(key)
+    bucket = new_hash_bucket_from_page_id(index.pager, index.free_list, index.slot_get(dir_page_ids, 0))
+    assert len(bucket.page_ids) == 1
+    assert index.count() == 0
+    close(fd, name)
+
+
+def test_concurrent():
+    name = inspect.currentframe().f_code.co_name
+    fd, index = init(name)
+    stable = [b'%05d' % i for i in range(0, 30000, 3)]
+    index.upsert([(key, key) for key in stable])
+    stop = threading.Event()
+    errors = []
+
+    def reader(seed: int) -> None:
+        rnd = random.Random(seed)
+        try:
+            while not stop.is_set():
+                key = rnd.choice(stable)
+                assert index.get_one(key) == key
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=reader, args=(i,)) for i in range(3)]
+    for t in readers:
+        t.start()
+    rnd = random.Random(0)
+    for _ in range(200):
+        keys = [b'%05d' % (rnd.randrange(10000) * 3 + 1) for _ in range(50)]
+        if rnd.random() < 0.7:
+            index.upsert([(key, key * 10) for key in keys])
+        else:
+            index.delete_one(keys[0])
+    stop.set()
+    for t in readers:
+        t.join(10)
+        assert not t.is_alive()
+    assert errors == []
+    close(fd, name)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
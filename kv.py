@@ -1,5 +1,9 @@
-from b_plus_tree import BPlusTree, new_b_plus_tree
+from b_epsilon_tree import BEpsilonTree
+from b_plus_tree import BPlusTree
+from const import TREE_B_PLUS
+from data_tree import new_data_tree
 from free_list import FreeList
+from lsm_tree import LSMTree
 from pager import Pager
 from utils import to_bytes
 
@@ -7,7 +11,7 @@ from utils import to_bytes
 class KV:
 
     def __init__(self):
-        self.data: BPlusTree | None = None
+        self.data: BPlusTree | BEpsilonTree | LSMTree | None = None
 
     def __getitem__(self, item):
         _item = to_bytes(item)
@@ -24,7 +28,9 @@ class KV:
         self.data.delete_one(_key)
 
 
-def new_kv(pager: Pager, free_list: FreeList, seq: int, is_seq_new: bool) -> KV:
+def new_kv(pager: Pager, free_list: FreeList, seq: int, is_seq_new: bool, kind: int = TREE_B_PLUS,
+           bloom_bits_per_key: int = 0) -> KV:
+    """kind 选所用的树，重新打开时要传建立时的 kind；bloom_bits_per_key 见 new_b_plus_tree"""
     kv = KV()
-    kv.data = new_b_plus_tree(pager, free_list, seq, is_seq_new)
+    kv.data = new_data_tree(pager, free_list, kind, seq, is_seq_new, bloom_bits_per_key)
     return kv
@@ -1,9 +1,12 @@
+import inspect
+import os
 import pytest
 
-from const import META_PAGE_ID, BYTES_MAGIC_NUMBER, MAGIC_NUMBER_BS
+from const import META_PAGE_ID, BYTES_MAGIC_NUMBER, MAGIC_NUMBER_BS, TREE_LSM
 from file import file_open
 from free_list import new_free_list_from_page_id, new_free_list
 from kv import new_kv, KV
+from lsm_tree import LSMTree
 from pager import new_pager
 from utils import from_bytes, from_buf
 
@@ -51,5 +54,33 @@ def test_get():
     assert from_bytes(kv["b"], int) == 2
 
 
+def test_lsm():
+    """KV 可以建在 LSM 树上，重新打开时传同样的 kind"""
+    name = inspect.currentframe().f_code.co_name
+    fd = file_open(f'{name}.db')
+    pager = new_pager(fd)
+    pager.magic_number_set()
+    free_list = new_free_list(pager, META_PAGE_ID)
+    kv = new_kv(pager, free_list, 0, True, TREE_LSM)
+    assert isinstance(kv.data, LSMTree)
+    for i in range(5000):
+        kv[i] = i * 2
+    del kv[0]
+    pager.close()
+    os.close(fd)
+
+    fd = file_open(f'{name}.db')
+    pager = new_pager(fd)
+    meta = pager.meta
+    free_list = new_free_list_from_page_id(pager, meta.used_page_id, meta.head_page_id, meta.tail_page_id)
+    kv = new_kv(pager, free_list, 0, False, TREE_LSM)
+    assert kv[0] is None
+    assert from_bytes(kv[4999], int) == 9998
+    kv.data.compact_wait()
+    pager.close()
+    os.close(fd)
+    os.remove(f'{name}.db')
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
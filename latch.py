@@ -0,0 +1,161 @@
+import threading
+from typing import Hashable
+
+
+class Latch:
+    """
+    页的读写闩：多个线程可以同时持有共享闩，独占闩同一时刻只有一个线程持有。
+    按线程记录持有者，同一线程可以重入；只有自己持有共享闩时也可以再取独占闩。
+    version 在每次独占闩完全释放时加一，读者据此判断页在两次访问之间是否被改过。
+    """
+
+    def __init__(self):
+        self.cond: threading.Condition = threading.Condition(threading.Lock())
+        self.readers: dict[int, int] = {}
+        self.writer: int | None = None
+        self.writer_count: int = 0
+        self.version: int = 0
+
+    def acquire_shared(self, blocking: bool = True) -> bool:
+        me = threading.get_ident()
+        with self.cond:
+            while self.writer is not None and self.writer != me:
+                if not blocking:
+                    return False
+                self.cond.wait()
+            self.readers[me] = self.readers.get(me, 0) + 1
+            return True
+
+    def release_shared(self) -> None:
+        me = threading.get_ident()
+        with self.cond:
+            count = self.readers.get(me, 0)
+            if count == 0:
+                raise ValueError("未持有共享闩")
+            if count == 1:
+                del self.readers[me]
+                self.cond.notify_all()
+            else:
+                self.readers[me] = count - 1
+
+    def acquire_exclusive(self) -> None:
+        me = threading.get_ident()
+        with self.cond:
+            while (self.writer is not None and self.writer != me) or any(t != me for t in self.readers):
+                self.cond.wait()
+            self.writer = me
+            self.writer_count += 1
+
+    def release_exclusive(self) -> None:
+        with self.cond:
+            if self.writer != threading.get_ident():
+                raise ValueError("未持有独占闩")
+            self.writer_count -= 1
+            if self.writer_count == 0:
+                self.writer = None
+                self.version += 1
+                self.cond.notify_all()
+
+    def wait(self) -> None:
+        """等当前的独占者放开，调用方不能持有其他闩"""
+        self.acquire_shared()
+        self.release_shared()
+
+
+def new_latch(version: int = 0) -> Latch:
+    latch = Latch()
+    latch.version = version
+    return latch
+
+
+class LatchTable:
+    """
+    按页（或树的根指针）取闩。闩按需创建并计引用：取闩、等待和 ref 各算一个引用，
+    引用归零（没人持有、没人在等、也没有游标记着它的 version）时删掉，表的大小随同时访问的页数而不随文件增长。
+    删掉后再建的闩，version 从所有删掉过的闩的最大 version 之后开始，之前记下的 version 一定对不上，按改过处理。
+    """
+
+    def __init__(self):
+        self.lock: threading.Lock = threading.Lock()
+        self.latches: dict[Hashable, Latch] = {}
+        self.refs: dict[Hashable, int] = {}
+        self.horizon: int = 0
+
+    def ref(self, key: Hashable) -> Latch:
+        """取闩的对象并加一个引用，用完调用 unref"""
+        with self.lock:
+            latch = self.latches.get(key)
+            if latch is None:
+                latch = new_latch(self.horizon + 1)
+                self.latches[key] = latch
+                self.refs[key] = 0
+            self.refs[key] += 1
+            return latch
+
+    def unref(self, key: Hashable) -> None:
+        with self.lock:
+            count = self.refs[key] - 1
+            if count > 0:
+                self.refs[key] = count
+                return
+            latch = self.latches.pop(key)
+            del self.refs[key]
+            self.horizon = max(self.horizon, latch.version)
+
+    def acquire_shared(self, key: Hashable, blocking: bool = True) -> bool:
+        latch = self.ref(key)
+        if latch.acquire_shared(blocking):
+            return True
+        self.unref(key)
+        return False
+
+    def release_shared(self, key: Hashable) -> None:
+        with self.lock:
+            latch = self.latches.get(key)
+        if latch is None:
+            raise ValueError("未持有共享闩")
+        latch.release_shared()
+        self.unref(key)
+
+    def acquire_exclusive(self, key: Hashable) -> None:
+        latch = self.ref(key)
+        try:
+            latch.acquire_exclusive()
+        except BaseException:
+            self.unref(key)
+            raise
+
+    def release_exclusive(self, key: Hashable) -> None:
+        with self.lock:
+            latch = self.latches.get(key)
+        if latch is None:
+            raise ValueError("未持有独占闩")
+        latch.release_exclusive()
+        self.unref(key)
+
+    def wait(self, key: Hashable) -> None:
+        """等 key 当前的独占者放开，调用方不能持有其他闩"""
+        latch = self.ref(key)
+        try:
+            latch.wait()
+        finally:
+            self.unref(key)
+
+    def version(self, key: Hashable) -> int:
+        """调用方持有 key 的闩或引用"""
+        with self.lock:
+            return self.latches[key].version
+
+    def writer(self, key: Hashable) -> int | None:
+        """key 的独占者，没有时为 None"""
+        with self.lock:
+            latch = self.latches.get(key)
+        return None if latch is None else latch.writer
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.latches)
+
+
+def new_latch_table() -> LatchTable:
+    return LatchTable()
@@ -0,0 +1,150 @@
+import threading
+
+import pytest
+
+from latch import new_latch, new_latch_table
+
+
+def run(target) -> None:
+    """在另一个线程里执行，等它结束"""
+    t = threading.Thread(target=target)
+    t.start()
+    t.join()
+
+
+def test_shared():
+    latch = new_latch()
+    latch.acquire_shared()
+    result = []
+    run(lambda: result.append(latch.acquire_shared(False)))
+    assert result == [True]
+    assert len(latch.readers) == 2
+    latch.release_shared()
+    with pytest.raises(ValueError):
+        latch.release_shared()
+
+
+def test_exclusive():
+    """独占时其他线程取不到共享闩，持有者自己可以；完全放开后 version 加一"""
+    latch = new_latch()
+    latch.acquire_exclusive()
+    latch.acquire_exclusive()
+    result = []
+    run(lambda: result.append(latch.acquire_shared(False)))
+    assert result == [False]
+    assert latch.acquire_shared(False)
+    latch.release_shared()
+    latch.release_exclusive()
+    assert latch.version == 0
+    latch.release_exclusive()
+    assert latch.version == 1
+    run(lambda: result.append(latch.acquire_shared(False)))
+    assert result == [False, True]
+    with pytest.raises(ValueError):
+        latch.release_exclusive()
+
+
+def test_exclusive_wait_readers():
+    """独占闩等其他线程的共享闩全部放开，自己持有的共享闩不挡"""
+    latch = new_latch()
+    latch.acquire_shared()
+    held = threading.Event()
+    release = threading.Event()
+
+    def reader():
+        latch.acquire_shared()
+        held.set()
+        release.wait()
+        latch.release_shared()
+
+    t = threading.Thread(target=reader)
+    t.start()
+    held.wait()
+    acquired = threading.Event()
+
+    def writer():
+        latch.acquire_exclusive()
+        acquired.set()
+        latch.release_exclusive()
+
+    w = threading.Thread(target=writer)
+    w.start()
+    assert not acquired.wait(0.05)
+    latch.release_shared()
+    assert not acquired.wait(0.05)
+    release.set()
+    assert acquired.wait(5)
+    t.join()
+    w.join()
+
+
+def test_wait():
+    latch = new_latch()
+    latch.acquire_exclusive()
+    done = threading.Event()
+
+    def reader():
+        latch.wait()
+        done.set()
+
+    t = threading.Thread(target=reader)
+    t.start()
+    assert not done.wait(0.05)
+    latch.release_exclusive()
+    assert done.wait(5)
+    t.join()
+    assert latch.readers == {}
+
+
+def test_latch_table():
+    """同一个 key 在有引用期间是同一个闩，引用归零时删掉"""
+    table = new_latch_table()
+    assert table.ref(1) is table.ref(1)
+    assert table.ref(1) is not table.ref(('root', 1))
+    table.unref(('root', 1))
+    assert len(table) == 1
+    for _ in range(3):
+        table.unref(1)
+    assert len(table) == 0
+
+
+def test_latch_table_evict():
+    """取闩和等待结束后闩不留在表里；删掉后再建的闩 version 比之前记下的都大"""
+    table = new_latch_table()
+    table.acquire_shared(1)
+    version = table.version(1)
+    table.release_shared(1)
+    for _ in range(3):
+        table.acquire_exclusive(1)
+        table.acquire_exclusive(1)
+        table.release_exclusive(1)
+        table.release_exclusive(1)
+    table.wait(1)
+    assert table.acquire_shared(2, False)
+    table.release_shared(2)
+    assert len(table) == 0
+    table.acquire_shared(1)
+    assert table.version(1) > version + 3
+    table.release_shared(1)
+    assert len(table) == 0
+
+
+def test_latch_table_ref_keeps_version():
+    """留着引用时闩不删，没有写者时 version 不变"""
+    table = new_latch_table()
+    table.ref(1)
+    table.acquire_shared(1)
+    version = table.version(1)
+    table.release_shared(1)
+    table.acquire_shared(1)
+    assert table.version(1) == version
+    table.release_shared(1)
+    table.acquire_exclusive(1)
+    table.release_exclusive(1)
+    assert table.version(1) == version + 1
+    table.unref(1)
+    assert len(table) == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,589 @@
+import bisect
+import heapq
+import struct
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator
+
+from b_epsilon_tree import MESSAGE_ENTRY, PIVOT_ENTRY, MSG_UPSERT, MSG_DELETE, Message, encode_val, decode_val, \
+    message_size, read_val
+from b_plus_tree import check_key, free_vals, store_val
+from const import NULL_PAGE_ID, BYTES_PAGE, LSM_MEMTABLE_BYTES, LSM_RUNS_MAX
+from free_list import FreeList
+from pager import Pager
+
+# 树的头页：page_id | 日志首页 | run 个数，之后是各 run 索引首页的 page_id（新的在前）
+LSM_HEADER = struct.Struct('>qqH')
+RUN_REF = struct.Struct('>q')
+# memtable 的日志页：page_id | 下一页 | 记录条数，记录同 Bε 树的消息
+LOG_HEADER = struct.Struct('>qqH')
+# run 的数据页：page_id | 记录条数，记录按 key 排序，格式同 Bε 树的消息，删除为墓碑
+RUN_PAGE_HEADER = struct.Struct('>qH')
+# run 的稀疏索引页：page_id | 下一页 | 条数，每条为一个数据页的首 key 和 page_id
+RUN_INDEX_HEADER = struct.Struct('>qqH')
+
+
+class RunPage:
+    """run 的一个数据页，写好后不再修改，解码后放进节点缓存"""
+
+    def __init__(self):
+        self.page_id: int = 0
+        self.keys: list[bytes] = []
+        self.messages: list[Message] = []
+
+    def size(self) -> int:
+        return RUN_PAGE_HEADER.size + sum(message_size(key, val) for key, (_, val) in zip(self.keys, self.messages))
+
+
+def new_run_page_from_page_id(pager: Pager, free_list: FreeList, page_id: int) -> RunPage:
+    page = pager.node_cache.get(page_id)
+    if page is not None:
+        return page
+    page = RunPage()
+    view = pager.page_view(page_id)
+    _page_id, num_records = RUN_PAGE_HEADER.unpack_from(view)
+    if _page_id != page_id:
+        raise ValueError("page_id 错误")
+    page.page_id = page_id
+    page.keys = []
+    page.messages = []
+    offset = RUN_PAGE_HEADER.size
+    for _ in range(num_records):
+        key, message, offset = decode_message(pager, free_list, view, offset)
+        page.keys.append(key)
+        page.messages.append(message)
+    pager.node_cache.put(page_id, page, page.size())
+    return page
+
+
+class Run:
+    """
+    不可变的有序 run：一串数据页，外加稀疏索引（每个数据页的首 key），索引常驻内存。
+    查找只读一个数据页，范围扫描从 lo 所在的数据页起顺序读。
+    """
+
+    def __init__(self):
+        self.pager: Pager | None = None
+        self.free_list: FreeList | None = None
+        # 索引首页的 page_id，即树的头页里记的 run
+        self.page_id: int = 0
+        self.index_page_ids: list[int] = []
+        self.keys: list[bytes] = []
+        self.page_ids: list[int] = []
+
+    def page(self, index: int) -> RunPage:
+        return new_run_page_from_page_id(self.pager, self.free_list, self.page_ids[index])
+
+    def find(self, key: bytes) -> Message | None:
+        index = bisect.bisect_right(self.keys, key) - 1
+        if index < 0:
+            return None
+        page = self.page(index)
+        i = bisect.bisect_left(page.keys, key)
+        if i < len(page.keys) and page.keys[i] == key:
+            return page.messages[i]
+        return None
+
+    def records(self, lo: bytes | None, hi: bytes | None, reverse: bool) -> Iterator[tuple[bytes, Message]]:
+        """按序产出 [lo, hi] 之间的记录（含墓碑），边界是否包含由调用方再判断"""
+        if reverse:
+            start = len(self.page_ids) - 1 if hi is None else bisect.bisect_right(self.keys, hi) - 1
+            for index in range(start, -1, -1):
+                page = self.page(index)
+                for key, message in zip(reversed(page.keys), reversed(page.messages)):
+                    if hi is not None and key > hi:
+                        continue
+                    if lo is not None and key < lo:
+                        return
+                    yield key, message
+            return
+        start = 0 if lo is None else max(bisect.bisect_right(self.keys, lo) - 1, 0)
+        for index in range(start, len(self.page_ids)):
+            page = self.page(index)
+            for key, message in zip(page.keys, page.messages):
+                if lo is not None and key < lo:
+                    continue
+                if hi is not None and key > hi:
+                    return
+                yield key, message
+
+    def free(self) -> None:
+        """释放 run 的数据页和索引页，记录里的溢出页由调用方决定"""
+        for page_id in self.page_ids + self.index_page_ids:
+            self.free_list.add_page_id(page_id)
+
+
+def new_run(pager: Pager, free_list: FreeList, records: Iterator[tuple[bytes, Message]]) -> Run | None:
+    """把有序的记录顺序写成数据页，再写稀疏索引页，没有记录时返回 None"""
+    keys, pages = run_encode(records)
+    return new_run_from_pages(pager, free_list, keys, pages)
+
+
+def run_encode(records: Iterator[tuple[bytes, Message]]) -> tuple[list[bytes], list[list[bytes]]]:
+    """有序的记录按数据页分组编码，返回每页的首 key 和各页的记录，不读写页"""
+    keys = []
+    pages = []
+    entries = []
+    size = RUN_PAGE_HEADER.size
+    for key, message in records:
+        entry = encode_message(key, message)
+        if size + len(entry) > BYTES_PAGE:
+            pages.append(entries)
+            entries = []
+            size = RUN_PAGE_HEADER.size
+        if len(entries) == 0:
+            keys.append(key)
+        entries.append(entry)
+        size += len(entry)
+    if len(entries) > 0:
+        pages.append(entries)
+    return keys, pages
+
+
+def new_run_from_pages(pager: Pager, free_list: FreeList, keys: list[bytes], pages: list[list[bytes]]) -> Run | None:
+    """run_encode 编码好的数据页分配页号写出，再写稀疏索引页，没有数据页时返回 None"""
+    if len(pages) == 0:
+        return None
+    run = Run()
+    run.pager = pager
+    run.free_list = free_list
+    run.keys = keys
+    run.page_ids = []
+    for entries in pages:
+        run_page_write(run, entries)
+
+    index_pages = [[]]
+    size = RUN_INDEX_HEADER.size
+    for key, page_id in zip(run.keys, run.page_ids):
+        entry = PIVOT_ENTRY.pack(len(key), page_id) + key
+        if size + len(entry) > BYTES_PAGE:
+            index_pages.append([])
+            size = RUN_INDEX_HEADER.size
+        index_pages[-1].append(entry)
+        size += len(entry)
+    run.index_page_ids = [free_list.get_page_id() for _ in index_pages]
+    for i, entries in enumerate(index_pages):
+        next_page_id = run.index_page_ids[i + 1] if i + 1 < len(index_pages) else NULL_PAGE_ID
+        page_id = run.index_page_ids[i]
+        pager.page_set(page_id, RUN_INDEX_HEADER.pack(page_id, next_page_id, len(entries)) + b''.join(entries))
+    run.page_id = run.index_page_ids[0]
+    return run
+
+
+def run_page_write(run: Run, entries: list[bytes]) -> None:
+    page_id = run.free_list.get_page_id()
+    run.pager.page_set(page_id, RUN_PAGE_HEADER.pack(page_id, len(entries)) + b''.join(entries))
+    run.page_ids.append(page_id)
+
+
+def new_run_from_page_id(pager: Pager, free_list: FreeList, page_id: int) -> Run:
+    run = Run()
+    run.pager = pager
+    run.free_list = free_list
+    run.page_id = page_id
+    run.index_page_ids = []
+    run.keys = []
+    run.page_ids = []
+    while page_id != NULL_PAGE_ID:
+        view = pager.page_view(page_id)
+        _page_id, next_page_id, num_entries = RUN_INDEX_HEADER.unpack_from(view)
+        if _page_id != page_id:
+            raise ValueError("page_id 错误")
+        run.index_page_ids.append(page_id)
+        offset = RUN_INDEX_HEADER.size
+        for _ in range(num_entries):
+            length_key, data_page_id = PIVOT_ENTRY.unpack_from(view, offset)
+            offset += PIVOT_ENTRY.size
+            run.keys.append(view[offset:offset + length_key].tobytes())
+            run.page_ids.append(data_page_id)
+            offset += length_key
+        page_id = next_page_id
+    return run
+
+
+def encode_message(key: bytes, message: Message) -> bytes:
+    op, val = message
+    length, val_bs = encode_val(val)
+    return MESSAGE_ENTRY.pack(op, len(key), length) + key + val_bs
+
+
+def decode_message(pager: Pager, free_list: FreeList, view: memoryview, offset: int) -> tuple[bytes, Message, int]:
+    """返回 key、消息及其后的偏移"""
+    op, length_key, length_val = MESSAGE_ENTRY.unpack_from(view, offset)
+    offset += MESSAGE_ENTRY.size
+    key = view[offset:offset + length_key].tobytes()
+    val, offset = decode_val(pager, free_list, view, offset + length_key, length_val)
+    return key, (op, val), offset
+
+
+def tagged(records: Iterator[tuple[bytes, Message]], age: int) -> Iterator[tuple[bytes, int, Message]]:
+    """给记录标上来源的新旧，0 为 memtable，越大越旧"""
+    for key, message in records:
+        yield key, age, message
+
+
+class LSMTree:
+    """
+    LSM 树，对外接口与 BPlusTree 的 get_*/range/add/upsert/delete_* 相同。
+    写入先进内存里的 memtable，同时追加到页链上的日志（重新打开时重放），memtable 满了顺序写成一个不可变的 run；
+    run 多于 LSM_RUNS_MAX 个时由后台线程把全部 run 合并成一个，丢掉被覆盖的旧版本和墓碑。
+    读取按 memtable、新 run 到旧 run 的顺序查找，扫描时多路归并。
+    同一 seq 的树只有一个对象（登记在 pager.tree_states），memtable 不会分叉。
+    写者持根指针的独占闩到操作结束，读者整个读取期间持共享闩。
+    """
+
+    def __init__(self):
+        self.pager: Pager | None = None
+        self.free_list: FreeList | None = None
+        self.seq: int = 0
+        # 头页，meta 里记的 root_page_id 指向它
+        self.page_id: int = 0
+        self.memtable: dict[bytes, Message] = {}
+        self.memtable_bytes: int = 0
+        # 日志页链，最后一页还在追加，log_entries 为它已有的记录
+        self.log_page_ids: list[int] = []
+        self.log_entries: list[bytes] = []
+        # 新的在前
+        self.runs: list[Run] = []
+        self.executor: ThreadPoolExecutor | None = None
+        self.future: Future | None = None
+
+    def __bytes__(self) -> bytes:
+        r = [LSM_HEADER.pack(self.page_id, self.log_page_ids[0], len(self.runs))]
+        for run in self.runs:
+            r.append(RUN_REF.pack(run.page_id))
+        return b''.join(r)
+
+    def persist(self) -> None:
+        self.pager.page_set(self.page_id, bytes(self))
+
+    def root_latch_key(self) -> tuple[str, int]:
+        return 'root', self.seq
+
+    def writing(self) -> None:
+        """写者对根指针加独占闩，到操作结束才放开"""
+        self.pager.latch_exclusive_gated(self.root_latch_key())
+
+    @contextmanager
+    def reading(self):
+        """读者持根指针的共享闩，期间 memtable 和 run 列表都不会变"""
+        with self.pager.latch_shared_gated(self.root_latch_key()):
+            yield
+
+    def find(self, key: bytes) -> Message | None:
+        """key 最新的一条记录，可能是墓碑"""
+        message = self.memtable.get(key)
+        if message is not None:
+            return message
+        for run in self.runs:
+            message = run.find(key)
+            if message is not None:
+                return message
+        return None
+
+    def get_one(self, key: bytes) -> bytes | None:
+        with self.reading():
+            message = self.find(key)
+            if message is None or message[0] == MSG_DELETE:
+                return None
+            return read_val(message[1])
+
+    def get_all(self) -> list[bytes]:
+        return self.range()
+
+    def get_lt(self, key: bytes) -> list[bytes]:
+        return self.range(hi=key, hi_inclusive=False)
+
+    def get_le(self, key: bytes) -> list[bytes]:
+        return self.range(hi=key, hi_inclusive=True)
+
+    def get_gt(self, key: bytes) -> list[bytes]:
+        return self.range(lo=key, lo_inclusive=False)
+
+    def get_ge(self, key: bytes) -> list[bytes]:
+        return self.range(lo=key, lo_inclusive=True)
+
+    def range(self, lo: bytes | None = None, hi: bytes | None = None, lo_inclusive: bool = True,
+              hi_inclusive: bool = False, limit: int | None = None, offset: int = 0,
+              reverse: bool = False) -> list[bytes]:
+        """参数含义同 BPlusTree.range，offset 逐条跳过"""
+        vals = []
+        with self.reading():
+            for _, val in self.scan(lo, hi, lo_inclusive, hi_inclusive, reverse):
+                if offset > 0:
+                    offset -= 1
+                    continue
+                if limit is not None and len(vals) >= limit:
+                    break
+                vals.append(read_val(val))
+        return vals
+
+    def count(self) -> int:
+        """记录总数，要去掉旧版本和墓碑，需归并扫描全部 run"""
+        with self.reading():
+            return sum(1 for _ in self.scan(None, None, True, False, False))
+
+    def scan(self, lo: bytes | None, hi: bytes | None, lo_inclusive: bool, hi_inclusive: bool,
+             reverse: bool) -> Iterator[tuple[bytes, bytes]]:
+        """多路归并 memtable 和各 run，同一 key 只取最新的一条，跳过墓碑；调用方持有闩"""
+        def inside(key: bytes) -> bool:
+            return ((lo is None or key > lo or (lo_inclusive and key == lo))
+                    and (hi is None or key < hi or (hi_inclusive and key == hi)))
+
+        memtable = sorted(((key, message) for key, message in self.memtable.items()
+                           if (lo is None or key >= lo) and (hi is None or key <= hi)), reverse=reverse)
+        sources = [tagged(iter(memtable), 0)]
+        sources += [tagged(run.records(lo, hi, reverse), age + 1) for age, run in enumerate(self.runs)]
+        if reverse:
+            merged = heapq.merge(*sources, key=lambda r: (r[0], -r[1]), reverse=True)
+        else:
+            merged = heapq.merge(*sources, key=lambda r: (r[0], r[1]))
+        last = None
+        for key, _, (op, val) in merged:
+            if key == last:
+                continue
+            last = key
+            if op != MSG_DELETE and inside(key):
+                yield key, val
+
+    def add(self, key_vals: list[tuple[bytes, bytes]]) -> None:
+        """已存在的 key 保持不变，批内重复的 key 保留第一条"""
+        self.write(key_vals, False)
+
+    def upsert(self, key_vals: list[tuple[bytes, bytes]]) -> None:
+        """批内重复的 key 保留最后一条"""
+        self.write(key_vals, True)
+
+    def write(self, key_vals: list[tuple[bytes, bytes]], replace: bool) -> None:
+        batch = {}
+        for key, val in key_vals:
+            check_key(key)
+            if replace or key not in batch:
+                batch[key] = val
+        if len(batch) == 0:
+            return
+        with self.pager.operation():
+            self.writing()
+            records = []
+            for key, val in batch.items():
+                if not replace:
+                    message = self.find(key)
+                    if message is not None and message[0] != MSG_DELETE:
+                        continue
+                records.append((key, (MSG_UPSERT, store_val(self.pager, self.free_list, key, val))))
+            self.put(records)
+
+    def delete_one(self, key: bytes) -> None:
+        with self.pager.operation():
+            self.writing()
+            self.put([(key, (MSG_DELETE, b''))])
+
+    def delete_lt(self, key: bytes) -> None:
+        """删除所有 key < k 的记录"""
+        self.delete_range(None, key, True, False)
+
+    def delete_le(self, key: bytes) -> None:
+        """删除所有 key <= k 的记录"""
+        self.delete_range(None, key, True, True)
+
+    def delete_gt(self, key: bytes) -> None:
+        """删除所有 key > k 的记录"""
+        self.delete_range(key, None, False, False)
+
+    def delete_ge(self, key: bytes) -> None:
+        """删除所有 key >= k 的记录"""
+        self.delete_range(key, None, True, False)
+
+    def delete_range(self, lo: bytes | None, hi: bytes | None, lo_inclusive: bool, hi_inclusive: bool) -> None:
+        """范围内现存的每个 key 写一条墓碑"""
+        with self.pager.operation():
+            self.writing()
+            keys = [key for key, _ in self.scan(lo, hi, lo_inclusive, hi_inclusive, False)]
+            self.put([(key, (MSG_DELETE, b'')) for key in keys])
+
+    def put(self, records: list[tuple[bytes, Message]]) -> None:
+        """记录写进 memtable 并追加到日志，被覆盖的 val 释放溢出页；memtable 满了写成 run"""
+        if len(records) == 0:
+            return
+        for key, message in records:
+            old = self.memtable.get(key)
+            if old is not None:
+                free_vals([old[1]])
+                self.memtable_bytes -= message_size(key, old[1])
+            self.memtable[key] = message
+            self.memtable_bytes += message_size(key, message[1])
+            self.log_append(encode_message(key, message))
+        self.log_write(NULL_PAGE_ID)
+        if self.memtable_bytes >= LSM_MEMTABLE_BYTES:
+            self.memtable_flush()
+
+    def log_append(self, entry: bytes) -> None:
+        size = LOG_HEADER.size + sum(len(e) for e in self.log_entries)
+        if size + len(entry) > BYTES_PAGE:
+            page_id = self.free_list.get_page_id()
+            self.log_write(page_id)
+            self.log_page_ids.append(page_id)
+            self.log_entries = []
+        self.log_entries.append(entry)
+
+    def log_write(self, next_page_id: int) -> None:
+        page_id = self.log_page_ids[-1]
+        self.pager.page_set(page_id, LOG_HEADER.pack(page_id, next_page_id, len(self.log_entries))
+                            + b''.join(self.log_entries))
+
+    def memtable_flush(self) -> None:
+        """memtable 顺序写成最新的 run，日志随之作废；没有更旧的 run 时墓碑不必写出"""
+        records = sorted(self.memtable.items())
+        if len(self.runs) == 0:
+            records = [(key, message) for key, message in records if message[0] != MSG_DELETE]
+        run = new_run(self.pager, self.free_list, iter(records))
+        if run is not None:
+            self.runs.insert(0, run)
+        for page_id in self.log_page_ids:
+            self.free_list.add_page_id(page_id)
+        self.log_page_ids = [self.free_list.get_page_id()]
+        self.log_entries = []
+        self.log_write(NULL_PAGE_ID)
+        self.memtable = {}
+        self.memtable_bytes = 0
+        self.persist()
+        if len(self.runs) > LSM_RUNS_MAX:
+            self.compact_submit()
+
+    def compact_submit(self) -> None:
+        """交给后台线程合并，已有合并在排队或进行时不再提交"""
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        if self.future is None or self.future.done():
+            self.future = self.executor.submit(self.compact)
+
+    def compact_wait(self) -> None:
+        """等后台合并结束，合并出错时在这里抛出；不能在 operation/batch 内调用"""
+        if self.future is not None:
+            self.future.result()
+
+    def close(self) -> None:
+        """等后台合并结束并关掉合并线程，合并出错时在这里抛出；之后再触发合并时重新起线程"""
+        try:
+            self.compact_wait()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+            self.future = None
+
+    def rollback(self) -> None:
+        """pager 回滚后按页重新载入 run 列表，重放日志重建 memtable；回滚掉的操作里新建的树直接注销"""
+        if self.pager.root_page_id_get(self.seq) != self.page_id:
+            with self.pager.lock:
+                if self.pager.tree_states.get(self.seq) is self:
+                    del self.pager.tree_states[self.seq]
+            return
+        self.memtable = {}
+        self.memtable_bytes = 0
+        lsm_tree_load(self)
+
+    def compact(self) -> None:
+        """
+        全部 run 归并成一个：同一 key 只留最新的一条，墓碑之下已没有更旧的数据，一并丢掉，
+        被丢掉的旧 val 释放溢出页。
+        归并和编码不占 write_lock：读的是开始时的 run，它们不可变，期间写者照常写 memtable，
+        新写成的 run 只会插到前面。最后一次写操作里才分配页写出新 run、换上 run 列表、释放旧 run。
+        合并结果在写出前整个放在内存里。
+        """
+        with self.reading():
+            runs = list(self.runs)
+        if len(runs) <= 1:
+            return
+        dropped = []
+
+        def records() -> Iterator[tuple[bytes, Message]]:
+            sources = [tagged(run.records(None, None, False), age) for age, run in enumerate(runs)]
+            last = None
+            for key, _, message in heapq.merge(*sources, key=lambda r: (r[0], r[1])):
+                if key == last:
+                    dropped.append(message[1])
+                    continue
+                last = key
+                if message[0] != MSG_DELETE:
+                    yield key, message
+
+        keys, pages = run_encode(records())
+        with self.pager.operation():
+            self.writing()
+            # 另一次合并已先换掉了这些 run，这次的结果作废，还没分配过页
+            if self.runs[len(self.runs) - len(runs):] != runs:
+                return
+            run = new_run_from_pages(self.pager, self.free_list, keys, pages)
+            # 合并期间写成的 run 比合并的结果新，留在前面
+            newer = self.runs[:len(self.runs) - len(runs)]
+            self.runs = newer + ([run] if run is not None else [])
+            self.persist()
+            for old in runs:
+                old.free()
+            free_vals(dropped)
+
+
+def new_lsm_tree(pager: Pager, free_list: FreeList, seq: int, is_seq_new: bool) -> LSMTree:
+    """同一 seq 返回同一个对象，已打开过的直接取"""
+    if pager.cow:
+        raise ValueError("写时复制模式不支持 LSM 树")
+    if not is_seq_new:
+        with pager.lock:
+            tree = pager.tree_states.get(seq)
+        if tree is not None:
+            return tree
+    tree = LSMTree()
+    tree.pager = pager
+    tree.free_list = free_list
+    tree.seq = seq
+    tree.memtable = {}
+    tree.memtable_bytes = 0
+    tree.runs = []
+    if is_seq_new:
+        with pager.operation():
+            tree.page_id = free_list.get_page_id()
+            tree.log_page_ids = [free_list.get_page_id()]
+            tree.log_entries = []
+            tree.log_write(NULL_PAGE_ID)
+            tree.persist()
+            pager.root_page_id_set(seq, tree.page_id)
+        with pager.lock:
+            pager.tree_states[seq] = tree
+        return tree
+    lsm_tree_load(tree)
+    with pager.lock:
+        # 并发打开同一棵树时只留先登记的那个
+        return pager.tree_states.setdefault(seq, tree)
+
+
+def lsm_tree_load(tree: LSMTree) -> None:
+    """读头页和各 run 的索引，重放日志重建 memtable"""
+    pager = tree.pager
+    page_id = pager.root_page_id_get(tree.seq)
+    view = pager.page_view(page_id)
+    _page_id, log_page_id, num_runs = LSM_HEADER.unpack_from(view)
+    if _page_id != page_id:
+        raise ValueError("page_id 错误")
+    tree.page_id = page_id
+    run_page_ids = [RUN_REF.unpack_from(view, LSM_HEADER.size + i * RUN_REF.size)[0] for i in range(num_runs)]
+    tree.runs = [new_run_from_page_id(pager, tree.free_list, run_page_id) for run_page_id in run_page_ids]
+    tree.log_page_ids = []
+    while log_page_id != NULL_PAGE_ID:
+        view = pager.page_view(log_page_id)
+        _page_id, next_page_id, num_records = LOG_HEADER.unpack_from(view)
+        if _page_id != log_page_id:
+            raise ValueError("page_id 错误")
+        tree.log_page_ids.append(log_page_id)
+        tree.log_entries = []
+        offset = LOG_HEADER.size
+        for _ in range(num_records):
+            start = offset
+            key, message, offset = decode_message(pager, tree.free_list, view, offset)
+            tree.log_entries.append(view[start:offset].tobytes())
+            old = tree.memtable.get(key)
+            if old is not None:
+                tree.memtable_bytes -= message_size(key, old[1])
+            tree.memtable[key] = message
+            tree.memtable_bytes += message_size(key, message[1])
+        log_page_id = next_page_id
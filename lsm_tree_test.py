@@ -0,0 +1,288 @@
+import inspect
+import os
+import random
+import threading
+import pytest
+
+from const import META_PAGE_ID, LSM_RUNS_MAX, NULL_PAGE_ID
+from file import file_open
+from free_list import FreeList, new_free_list, new_free_list_node_from_page_id
+import lsm_tree
+from lsm_tree import LSMTree, new_lsm_tree
+from overflow import Overflow
+from pager import new_pager
+
+
+def init(name: str) -> tuple[int, LSMTree]:
+    fd = file_open(f'{name}.db')
+    pager = new_pager(fd)
+    free_list = new_free_list(pager, META_PAGE_ID)
+    tree = new_lsm_tree(pager, free_list, 0, True)
+    return fd, tree
+
+
+def close(fd: int, name: str, tree: LSMTree) -> None:
+    tree.pager.close()
+    os.close(fd)
+    os.remove(f'{name}.db')
+
+
+def reopen(tree: LSMTree) -> LSMTree:
+    """丢掉内存里的状态，从页上重新读出头页、run 索引并重放日志"""
+    tree.compact_wait()
+    tree.pager.tree_states.clear()
+    tree.pager.node_cache.clear()
+    return new_lsm_tree(tree.pager, tree.free_list, tree.seq, False)
+
+
+def test_add_get():
+    name = inspect.currentframe().f_code.co_name
+    fd, tree = init(name)
+    keys = [b'%05d' % i for i in range(20000)]
+    random.Random(0).shuffle(keys)
+    for i in range(0, len(keys), 100):
+        tree.add([(key, key * 8) for key in keys[i:i + 100]])
+    tree.add([(keys[0], b'x')])
+    assert tree.get_one(keys[0]) == keys[0] * 8
+    assert tree.get_one(b'x') is None
+    assert len(tree.runs) > 0
+    assert len(tree.memtable) > 0
+    keys.sort()
+    assert tree.get_all() == [key * 8 for key in keys]
+    assert tree.count() == len(keys)
+    tree.compact_wait()
+    assert len(tree.runs) <= LSM_RUNS_MAX
+    close(fd, name, tree)
+
+
+def test_same_object():
+    """同一 seq 只有一个对象，另一个 KV/Table 写入的 memtable 也能读到"""
+    name = inspect.currentframe().f_code.co_name
+    fd, tree = init(name)
+    tree.upsert([(b'a', b'1')])
+    tree_2 = new_lsm_tree(tree.pager, tree.free_list, 0, False)
+    assert tree_2 is tree
+    assert tree_2.get_one(b'a') == b'1'
+    close(fd, name, tree)
+
+
+def test_range():
+    name = inspect.currentframe().f_code.co_name
+    fd, tree = init(name)
+    keys = [b'%05d' % i for i in range(0, 30000, 2)]
+    tree.upsert([(key, key * 5) for key in keys[::2]])
+    tree.upsert([(key, key) for key in keys])
+    # 较新的 run 和 memtable 里的墓碑盖住旧的记录
+    tree.delete_one(keys[52])
+    del keys[52]
+    assert tree.range(b'00100', b'00110') == keys[50:54]
+    assert tree.range(b'00100', b'00110', lo_inclusive=False, hi_inclusive=True) == keys[51:55]
+    assert tree.range(b'00100', b'00110', reverse=True) == keys[53:49:-1]
+    assert tree.range(b'00100', limit=3, offset=2) == keys[52:55]
+    assert tree.get_lt(b'00004') == keys[:2]
+    assert tree.get_le(b'00004') == keys[:3]
+    assert tree.get_gt(b'29994') == keys[-2:]
+    assert tree.get_ge(b'29994') == keys[-3:]
+    assert tree.range(reverse=True) == keys[::-1]
+    close(fd, name, tree)
+
+
+def test_delete_side():
+    name = inspect.currentframe().f_code.co_name
+    fd, tree = init(name)
+    keys = [b'%05d' % i for i in range(10000)]
+    tree.upsert([(key, key * 20) for key in keys])
+    tree.delete_lt(b'01000')
+    tree.delete_ge(b'09000')
+    tree.delete_le(b'02000')
+    tree.delete_gt(b'07999')
+    assert tree.get_all() == [key * 20 for key in keys[2001:8000]]
+    tree.delete_ge(b'')
+    assert tree.get_all() == []
+    assert tree.count() == 0
+    close(fd, name, tree)
+
+
+def test_random():
+    """随机的 add / upsert / delete 与 dict 比对，val 有长有短（含溢出页），中途重新打开"""
+    name = inspect.currentframe().f_code.co_name
+    fd, tree = init(name)
+    rnd = random.Random(0)
+    ref = {}
+    for step in range(4000):
+        r = rnd.random()
+        key = b'%04d' % rnd.randrange(2000)
+        if r < 0.4:
+            key_vals = [(b'%04d' % rnd.randrange(2000), b'v%d' % step * rnd.choice((1, 5, 200)))
+                        for _ in range(rnd.randrange(1, 20))]
+            tree.upsert(key_vals)
+            ref.update(key_vals)
+        elif r < 0.7:
+            val = b'a%d' % step * rnd.choice((1, 300))
+            tree.add([(key, val)])
+            ref.setdefault(key, val)
+        elif r < 0.95:
+            tree.delete_one(key)
+            ref.pop(key, None)
+        elif r < 0.97:
+            tree.delete_lt(key)
+            ref = {k: v for k, v in ref.items() if k >= key}
+        else:
+            tree.delete_gt(key)
+            ref = {k: v for k, v in ref.items() if k <= key}
+        if step % 500 == 0:
+            tree = reopen(tree)
+            for k in rnd.sample(range(2000), 50):
+                assert tree.get_one(b'%04d' % k) == ref.get(b'%04d' % k)
+    assert tree.get_all() == [ref[key] for key in sorted(ref)]
+    assert tree.get_ge(b'1000') == [ref[key] for key in sorted(ref) if key >= b'1000']
+    for key in ref:
+        assert tree.get_one(key) == ref[key]
+    close(fd, name, tree)
+
+
+def tree_page_ids(tree: LSMTree) -> set[int]:
+    """树用到的全部页，含溢出页"""
+    page_ids = {tree.page_id} | set(tree.log_page_ids)
+    vals = [val for _, val in tree.memtable.values()]
+    for run in tree.runs:
+        page_ids.update(run.page_ids + run.index_page_ids)
+        for index in range(len(run.page_ids)):
+            vals += [val for _, val in run.page(index).messages]
+    for val in vals:
+        if isinstance(val, Overflow):
+            page_ids.update(val.page_ids())
+    return page_ids
+
+
+def free_page_ids(free_list: FreeList) -> set[int]:
+    page_ids = set()
+    node = free_list.head
+    while True:
+        page_ids.update(node.page_ids[node.unused:])
+        if node.next_page_id == NULL_PAGE_ID:
+            return page_ids
+        node = new_free_list_node_from_page_id(free_list.pager, node.next_page_id)
+
+
+def test_pages_freed():
+    """覆盖写入、删除后经过合并，旧版本的页（含溢出页）都回到空闲链"""
+    name = inspect.currentframe().f_code.co_name
+    fd, tree = init(name)
+    for round_ in range(3):
+        tree.upsert([(b'%04d' % i, b'%d' % round_ * size) for i, size in zip(range(2000), [10, 100, 3000] * 700)])
+    tree.delete_ge(b'1000')
+    tree.compact_wait()
+    tree.compact()
+    live = tree_page_ids(tree)
+    free = free_page_ids(tree.free_list)
+    assert live & free == set()
+    used = tree.free_list.page_id_generator.used_page_id
+    free_list_page_ids = set()
+    node = tree.free_list.head
+    while node.page_id != NULL_PAGE_ID:
+        free_list_page_ids.add(node.page_id)
+        if node.next_page_id == NULL_PAGE_ID:
+            break
+        node = new_free_list_node_from_page_id(tree.pager, node.next_page_id)
+    # 除了空闲链自身的页，其余页不是在用就是空闲
+    assert set(range(1, used + 1)) - live - free - free_list_page_ids == set()
+    close(fd, name, tree)
+
+
+def test_concurrent():
+    """读者与写者、后台合并并发，读者看到的始终是完整的某次操作之后的状态"""
+    name = inspect.currentframe().f_code.co_name
+    fd, tree = init(name)
+    stable = [b'%05d' % i for i in range(0, 30000, 3)]
+    tree.upsert([(key, key) for key in stable])
+    stop = threading.Event()
+    errors = []
+
+    def reader() -> None:
+        try:
+            while not stop.is_set():
+                assert set(stable[:300]) <= set(tree.range(b'00000', b'01000'))
+                assert tree.get_one(stable[5000]) == stable[5000]
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=reader) for _ in range(3)]
+    for t in readers:
+        t.start()
+    rnd = random.Random(0)
+    for _ in range(120):
+        keys = [b'%05d' % (rnd.randrange(10000) * 3 + 1) for _ in range(50)]
+        if rnd.random() < 0.7:
+            tree.upsert([(key, key * 10) for key in keys])
+        else:
+            tree.delete_one(keys[0])
+    stop.set()
+    for t in readers:
+        t.join(10)
+        assert not t.is_alive()
+    assert errors == []
+    close(fd, name, tree)
+
+
+def test_compact_unlocked(monkeypatch):
+    """后台合并归并期间不占 write_lock，写者照常写入，期间写成的 run 排在合并结果前面"""
+    name = inspect.currentframe().f_code.co_name
+    fd, tree = init(name)
+    started = threading.Event()
+    go = threading.Event()
+    run_encode = lsm_tree.run_encode
+
+    def blocked(records):
+        r = run_encode(records)
+        if threading.current_thread() is not threading.main_thread():
+            started.set()
+            go.wait(10)
+        return r
+
+    monkeypatch.setattr(lsm_tree, 'run_encode', blocked)
+    keys = [b'%04d' % i for i in range(1000)]
+    for round_ in range(LSM_RUNS_MAX + 1):
+        tree.upsert([(key, b'%d' % round_ * 100) for key in keys])
+    assert started.wait(10)
+    tree.upsert([(key, b'x' * 100) for key in keys[:700]])
+    assert not go.is_set()
+    assert len(tree.runs) == LSM_RUNS_MAX + 2
+    go.set()
+    tree.compact_wait()
+    assert len(tree.runs) == 2
+    assert tree.get_all() == [b'x' * 100] * 700 + [b'%d' % LSM_RUNS_MAX * 100] * 300
+    assert tree_page_ids(tree) & free_page_ids(tree.free_list) == set()
+    close(fd, name, tree)
+
+
+def test_close(monkeypatch):
+    """pager.close 等后台合并结束并关掉合并线程，合并出错时从这里抛出"""
+    name = inspect.currentframe().f_code.co_name
+    fd, tree = init(name)
+    keys = [b'%04d' % i for i in range(1000)]
+    for round_ in range(LSM_RUNS_MAX + 1):
+        tree.upsert([(key, b'%d' % round_ * 100) for key in keys])
+    tree.pager.close()
+    assert tree.executor is None
+    assert len(tree.runs) == 1
+    run_encode = lsm_tree.run_encode
+
+    def failed(records):
+        if threading.current_thread() is not threading.main_thread():
+            raise ValueError("合并失败")
+        return run_encode(records)
+
+    monkeypatch.setattr(lsm_tree, 'run_encode', failed)
+    for round_ in range(LSM_RUNS_MAX):
+        tree.upsert([(key, b'x' * 100) for key in keys])
+    with pytest.raises(ValueError):
+        tree.pager.close()
+    assert tree.executor is None
+    assert len(tree.runs) == LSM_RUNS_MAX + 1
+    assert tree.get_all() == [b'x' * 100] * 1000
+    close(fd, name, tree)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -2,11 +2,13 @@ from const import META_PAGE_ID, BYTES_MAGIC_NUMBER, MAGIC_NUMBER_BS
 from database import new_database_from_meta, new_database
 from file import file_open
 from pager import new_pager
+from wal import new_wal
 
 
 def __main():
     fd = file_open(f'test.db')
-    pager = new_pager(fd)
+    wal = new_wal(file_open(f'test.db-wal'))
+    pager = new_pager(fd, wal=wal)
     meta = pager.page_get(META_PAGE_ID)
     magic_number_bs = meta.read(BYTES_MAGIC_NUMBER)
     if magic_number_bs == MAGIC_NUMBER_BS:
@@ -0,0 +1,100 @@
+import io
+
+from const import MAGIC_NUMBER_BS, BYTES_MAGIC_NUMBER, NUM_ROOT_PAGE_IDS, NULL_PAGE_ID
+from utils import to_bytes, from_buf
+
+
+class MetaPage:
+    """
+    page 0 的内存副本，各字段修改只标记 dirty，
+    由 Pager 在提交时整页写一次。
+    """
+
+    def __init__(self):
+        self.magic_number: bytes = b''
+        self.used_page_id: int = 0
+        self.head_page_id: int = 0
+        self.tail_page_id: int = 0
+        self.b_plus_tree_seq: int = 0
+        self.database_seq: int = 0
+        self.extent_page_id: int = NULL_PAGE_ID
+        # 文件是否按写时复制模式写入，这种文件里的叶节点没有叶链
+        self.cow: bool = False
+        # 写时复制时等待快照关闭的页记在一条链上，这是链头
+        self.pending_page_id: int = NULL_PAGE_ID
+        self.root_page_ids: list[int] = []
+        self.bloom_page_ids: list[int] = []
+        self.dirty: bool = False
+
+    def __bytes__(self) -> bytes:
+        r = b''
+        r += self.magic_number.ljust(BYTES_MAGIC_NUMBER, b'\x00')
+        r += to_bytes(self.used_page_id)
+        r += to_bytes(self.head_page_id)
+        r += to_bytes(self.tail_page_id)
+        r += to_bytes(self.b_plus_tree_seq)
+        r += to_bytes(self.database_seq)
+        r += to_bytes(self.extent_page_id)
+        r += to_bytes(self.cow)
+        r += to_bytes(self.pending_page_id)
+        for root_page_id in self.root_page_ids:
+            r += to_bytes(root_page_id)
+        for bloom_page_id in self.bloom_page_ids:
+            r += to_bytes(bloom_page_id)
+        return r
+
+    def magic_number_exist(self) -> bool:
+        return self.magic_number == MAGIC_NUMBER_BS
+
+    def format_check(self) -> None:
+        """新文件的 magic number 全是 0，不为空又不是当前版本的是别的格式写的"""
+        if self.magic_number.strip(b'\x00') != b'' and not self.magic_number_exist():
+            raise ValueError("文件格式版本不符")
+
+    def root_page_id_set(self, seq: int, root_page_id: int) -> None:
+        if seq >= NUM_ROOT_PAGE_IDS:
+            raise ValueError("b_plus_tree_seq 超出 meta 页容量")
+        self.root_page_ids[seq] = root_page_id
+        self.dirty = True
+
+    def bloom_page_id_set(self, seq: int, bloom_page_id: int) -> None:
+        if seq >= NUM_ROOT_PAGE_IDS:
+            raise ValueError("b_plus_tree_seq 超出 meta 页容量")
+        self.bloom_page_ids[seq] = bloom_page_id
+        self.dirty = True
+
+
+def new_meta_page_from_buf(buf: io.BytesIO) -> MetaPage:
+    meta = MetaPage()
+    meta.magic_number = buf.read(BYTES_MAGIC_NUMBER)
+    meta.used_page_id = from_buf(buf, int)
+    meta.head_page_id = from_buf(buf, int)
+    meta.tail_page_id = from_buf(buf, int)
+    meta.b_plus_tree_seq = from_buf(buf, int)
+    meta.database_seq = from_buf(buf, int)
+    # 同 bloom_page_ids，0 即还没有区段表
+    meta.extent_page_id = from_buf(buf, int) or NULL_PAGE_ID
+    meta.cow = from_buf(buf, bool)
+    meta.pending_page_id = from_buf(buf, int) or NULL_PAGE_ID
+    meta.root_page_ids = [from_buf(buf, int) for _ in range(NUM_ROOT_PAGE_IDS)]
+    # 0 是 meta 页自身，不会是过滤器的头页，新文件里读出的 0 即没有过滤器
+    meta.bloom_page_ids = [from_buf(buf, int) or NULL_PAGE_ID for _ in range(NUM_ROOT_PAGE_IDS)]
+    meta.dirty = False
+    return meta
+
+
+def meta_page_copy(meta: MetaPage) -> MetaPage:
+    r = MetaPage()
+    r.magic_number = meta.magic_number
+    r.used_page_id = meta.used_page_id
+    r.head_page_id = meta.head_page_id
+    r.tail_page_id = meta.tail_page_id
+    r.b_plus_tree_seq = meta.b_plus_tree_seq
+    r.database_seq = meta.database_seq
+    r.extent_page_id = meta.extent_page_id
+    r.cow = meta.cow
+    r.pending_page_id = meta.pending_page_id
+    r.root_page_ids = list(meta.root_page_ids)
+    r.bloom_page_ids = list(meta.bloom_page_ids)
+    r.dirty = meta.dirty
+    return r
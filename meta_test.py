@@ -0,0 +1,45 @@
+import io
+import pytest
+
+from const import MAGIC_NUMBER_BS, BYTES_PAGE, NUM_ROOT_PAGE_IDS, NULL_PAGE_ID
+from meta import new_meta_page_from_buf
+
+
+def test_bytes():
+    meta = new_meta_page_from_buf(io.BytesIO(b''))
+    assert not meta.magic_number_exist()
+    meta.magic_number = MAGIC_NUMBER_BS
+    meta.used_page_id = 3
+    meta.head_page_id = 1
+    meta.tail_page_id = 2
+    meta.b_plus_tree_seq = 5
+    meta.database_seq = 0
+    meta.extent_page_id = 6
+    meta.cow = True
+    meta.pending_page_id = 8
+    meta.root_page_id_set(4, 3)
+    meta.bloom_page_id_set(4, 7)
+    bs = bytes(meta)
+    assert len(bs) <= BYTES_PAGE
+    got = new_meta_page_from_buf(io.BytesIO(bs))
+    assert got.magic_number_exist()
+    assert (got.used_page_id, got.head_page_id, got.tail_page_id) == (3, 1, 2)
+    assert got.b_plus_tree_seq == 5
+    assert got.extent_page_id == 6
+    assert got.cow
+    assert got.pending_page_id == 8
+    assert got.root_page_ids[4] == 3
+    assert got.bloom_page_ids[4] == 7
+    assert got.bloom_page_ids[3] == NULL_PAGE_ID
+
+
+def test_root_page_id_set_overflow():
+    meta = new_meta_page_from_buf(io.BytesIO(b''))
+    with pytest.raises(ValueError):
+        meta.root_page_id_set(NUM_ROOT_PAGE_IDS, 1)
+    with pytest.raises(ValueError):
+        meta.bloom_page_id_set(NUM_ROOT_PAGE_IDS, 1)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
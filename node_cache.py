@@ -0,0 +1,60 @@
+import threading
+from collections import OrderedDict
+
+from const import NODE_CACHE_BYTES
+
+
+class NodeCache:
+    """
+    解码后的节点对象缓存，按 page_id 索引，LRU 淘汰，容量按节点占用的字节数计。
+    页被写入或释放时作废，写入后由写入者把最新的节点放回。多个读者线程共用，内部加锁。
+    """
+
+    def __init__(self):
+        self.lock: threading.Lock = threading.Lock()
+        self.capacity: int = NODE_CACHE_BYTES
+        self.nodes: OrderedDict[int, tuple[object, int]] = OrderedDict()
+        self.size: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get(self, page_id: int) -> object | None:
+        with self.lock:
+            item = self.nodes.get(page_id)
+            if item is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.nodes.move_to_end(page_id)
+            return item[0]
+
+    def put(self, page_id: int, node: object, size: int) -> None:
+        with self.lock:
+            self._invalidate(page_id)
+            if size > self.capacity:
+                return
+            self.nodes[page_id] = (node, size)
+            self.size += size
+            while self.size > self.capacity:
+                _, (_, _size) = self.nodes.popitem(last=False)
+                self.size -= _size
+
+    def invalidate(self, page_id: int) -> None:
+        with self.lock:
+            self._invalidate(page_id)
+
+    def _invalidate(self, page_id: int) -> None:
+        item = self.nodes.pop(page_id, None)
+        if item is not None:
+            self.size -= item[1]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.nodes.clear()
+            self.size = 0
+
+
+def new_node_cache(capacity: int = NODE_CACHE_BYTES) -> NodeCache:
+    cache = NodeCache()
+    cache.capacity = capacity
+    return cache
@@ -0,0 +1,43 @@
+import pytest
+
+from node_cache import new_node_cache
+
+
+def test_get_put():
+    cache = new_node_cache(100)
+    assert cache.get(1) is None
+    node = object()
+    cache.put(1, node, 10)
+    assert cache.get(1) is node
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_evict_by_size():
+    """按字节数淘汰最久未用的"""
+    cache = new_node_cache(100)
+    for page_id in range(1, 5):
+        cache.put(page_id, page_id, 30)
+    assert 1 not in cache.nodes
+    assert cache.size == 90
+    cache.get(2)
+    cache.put(5, 5, 30)
+    assert 2 in cache.nodes
+    assert 3 not in cache.nodes
+    cache.put(6, 6, 101)
+    assert 6 not in cache.nodes
+
+
+def test_invalidate():
+    cache = new_node_cache(100)
+    cache.put(1, 1, 10)
+    cache.put(1, 1, 20)
+    assert cache.size == 20
+    cache.invalidate(1)
+    cache.invalidate(2)
+    assert cache.get(1) is None
+    assert cache.size == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
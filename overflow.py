@@ -0,0 +1,84 @@
+import struct
+
+from const import NULL_PAGE_ID, BYTES_PAGE
+from free_list import FreeList
+from pager import Pager
+
+# 溢出页：下一页的 page_id | 数据
+OVERFLOW_HEADER = struct.Struct('>q')
+BYTES_OVERFLOW_DATA = BYTES_PAGE - OVERFLOW_HEADER.size
+
+
+class Overflow:
+    """
+    存在溢出页链上的 val，叶节点里只存引用：首页 page_id 和 val 总长度。
+    只有 read 时才沿链读页，扫描只取 key 时不会碰到溢出页。
+    """
+
+    def __init__(self):
+        self.pager: Pager | None = None
+        self.free_list: FreeList | None = None
+        self.page_id: int = 0
+        self.length: int = 0
+
+    def read(self) -> bytes:
+        chunks = []
+        page_id = self.page_id
+        remain = self.length
+        while remain > 0:
+            view = self.pager.page_view(page_id)
+            next_page_id, = OVERFLOW_HEADER.unpack_from(view)
+            length = min(remain, BYTES_OVERFLOW_DATA)
+            chunks.append(view[OVERFLOW_HEADER.size:OVERFLOW_HEADER.size + length].tobytes())
+            remain -= length
+            page_id = next_page_id
+        return b''.join(chunks)
+
+    def page_ids(self) -> list[int]:
+        """链上所有页，只读页头"""
+        result = []
+        page_id = self.page_id
+        while page_id != NULL_PAGE_ID:
+            result.append(page_id)
+            page_id, = OVERFLOW_HEADER.unpack_from(self.pager.page_view(page_id))
+        return result
+
+    def update(self, index: int, val: bytes) -> None:
+        """原地改写 [index, index + len(val))，长度不变，只重写涉及的页"""
+        if index < 0 or index + len(val) > self.length:
+            raise ValueError("val 越界")
+        if len(val) == 0:
+            return
+        page_ids = self.page_ids()
+        first = index // BYTES_OVERFLOW_DATA
+        last = (index + len(val) - 1) // BYTES_OVERFLOW_DATA
+        for i in range(first, last + 1):
+            start = max(index, i * BYTES_OVERFLOW_DATA)
+            end = min(index + len(val), (i + 1) * BYTES_OVERFLOW_DATA)
+            offset = OVERFLOW_HEADER.size + start - i * BYTES_OVERFLOW_DATA
+            page_bs = bytearray(self.pager.page_view(page_ids[i]))
+            page_bs[offset:offset + end - start] = val[start - index:end - index]
+            self.pager.page_set(page_ids[i], bytes(page_bs))
+
+    def free(self) -> None:
+        for page_id in self.page_ids():
+            self.free_list.add_page_id(page_id)
+
+
+def new_overflow(pager: Pager, free_list: FreeList, val: bytes) -> Overflow:
+    """把 val 切成页写进新分配的溢出页链"""
+    chunks = [val[i:i + BYTES_OVERFLOW_DATA] for i in range(0, len(val), BYTES_OVERFLOW_DATA)]
+    page_ids = [free_list.get_page_id() for _ in chunks]
+    for i, chunk in enumerate(chunks):
+        next_page_id = page_ids[i + 1] if i + 1 < len(page_ids) else NULL_PAGE_ID
+        pager.page_set(page_ids[i], OVERFLOW_HEADER.pack(next_page_id) + chunk)
+    return new_overflow_from_ref(pager, free_list, page_ids[0] if page_ids else NULL_PAGE_ID, len(val))
+
+
+def new_overflow_from_ref(pager: Pager, free_list: FreeList, page_id: int, length: int) -> Overflow:
+    overflow = Overflow()
+    overflow.pager = pager
+    overflow.free_list = free_list
+    overflow.page_id = page_id
+    overflow.length = length
+    return overflow
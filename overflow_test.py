@@ -0,0 +1,63 @@
+import inspect
+import os
+import pytest
+
+from const import META_PAGE_ID
+from file import file_open
+from free_list import FreeList, new_free_list
+from overflow import BYTES_OVERFLOW_DATA, new_overflow, new_overflow_from_ref
+from pager import Pager, new_pager
+
+
+def init(name: str) -> tuple[int, Pager, FreeList]:
+    fd = file_open(f'{name}.db')
+    pager = new_pager(fd)
+    pager.magic_number_set()
+    free_list = new_free_list(pager, META_PAGE_ID)
+    return fd, pager, free_list
+
+
+def close(fd: int, name: str) -> None:
+    os.close(fd)
+    os.remove(f'{name}.db')
+
+
+def test_read():
+    """跨多页的 val 按引用读回"""
+    name = inspect.currentframe().f_code.co_name
+    fd, pager, free_list = init(name)
+    val = bytes(range(256)) * 40
+    overflow = new_overflow(pager, free_list, val)
+    assert len(overflow.page_ids()) == -(-len(val) // BYTES_OVERFLOW_DATA)
+    other = new_overflow_from_ref(pager, free_list, overflow.page_id, overflow.length)
+    assert other.read() == val
+    close(fd, name)
+
+
+def test_update():
+    """原地改写跨页边界的一段，只重写涉及的页"""
+    name = inspect.currentframe().f_code.co_name
+    fd, pager, free_list = init(name)
+    val = b'a' * (BYTES_OVERFLOW_DATA * 3)
+    overflow = new_overflow(pager, free_list, val)
+    index = BYTES_OVERFLOW_DATA - 2
+    overflow.update(index, b'bbbb')
+    assert overflow.read() == val[:index] + b'bbbb' + val[index + 4:]
+    with pytest.raises(ValueError):
+        overflow.update(len(val) - 1, b'bb')
+    close(fd, name)
+
+
+def test_free():
+    """释放后链上的页回到空闲列表，再分配时复用"""
+    name = inspect.currentframe().f_code.co_name
+    fd, pager, free_list = init(name)
+    overflow = new_overflow(pager, free_list, b'x' * (BYTES_OVERFLOW_DATA * 2))
+    page_ids = overflow.page_ids()
+    overflow.free()
+    assert sorted(free_list.get_page_id() for _ in page_ids) == sorted(page_ids)
+    close(fd, name)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
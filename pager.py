@@ -1,127 +1,685 @@
 import os
 import io
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Hashable
 
-from const import BYTES_PAGE, META_PAGE_ID, MAGIC_NUMBER_BS, BYTES_MAGIC_NUMBER, BYTES_USED_PAGE_ID, BYTES_HEAD_PAGE_ID, \
-    BYTES_TAIL_PAGE_ID, BYTES_B_PLUS_TREE_SEQ, BYTES_DATABASE_SEQ, BYTES_ROOT_PAGE_ID
-from utils import to_bytes, from_bytes
+from const import BYTES_PAGE, META_PAGE_ID, MAGIC_NUMBER_BS, CACHE_SIZE, DURABILITY_OFF, DURABILITY_BATCH, \
+    DURABILITY_OPERATION, WAL_CHECKPOINT_BYTES
+from file import file_pread, file_pwrite
+from latch import LatchTable, new_latch_table
+from meta import MetaPage, new_meta_page_from_buf, meta_page_copy
+from node_cache import NodeCache, new_node_cache
+from read_ahead import ReadAhead, new_read_ahead
+from wal import WAL
+
+
+class Frame:
+
+    def __init__(self):
+        self.page_id: int = 0
+        self.data: bytearray = bytearray(BYTES_PAGE)
+        self.dirty: bool = False
+        self.pin_count: int = 0
+        self.ref: bool = False
+        # 已写入 WAL 但还没写回数据文件的页，lsn 为最后一次写入 WAL 的记录
+        self.logged: bool = False
+        self.lsn: int = 0
+
+
+def new_frame(page_id: int, data: bytes) -> Frame:
+    frame = Frame()
+    frame.page_id = page_id
+    frame.data = bytearray(data.ljust(BYTES_PAGE, b'\x00'))
+    frame.dirty = False
+    frame.pin_count = 0
+    frame.ref = True
+    frame.logged = False
+    frame.lsn = 0
+    return frame
+
+
+class Snapshot:
+    """打开时最后一次提交的各棵树的根，写时复制下这些根可达的页在快照关闭前不会被改写或回收"""
+
+    def __init__(self):
+        self.txn: int = 0
+        self.root_page_ids: list[int] = []
+
+    def root_page_id_get(self, seq: int) -> int:
+        return self.root_page_ids[seq]
+
+
+def new_snapshot(txn: int, root_page_ids: list[int]) -> Snapshot:
+    snapshot = Snapshot()
+    snapshot.txn = txn
+    snapshot.root_page_ids = root_page_ids
+    return snapshot
 
 
 class Pager:
+    """
+    缓冲池与提交。多线程可同时读：缓冲池的结构由 lock 保护，未命中时在锁外 pread。
+    写者互斥：operation/batch 期间持有 write_lock，写者取的页独占闩在最外层结束时释放。
+    写时复制（cow）模式下已提交的页不再原地改写，读快照看到的是某次提交时的各棵树。
+    """
 
     def __init__(self):
         self.fd: int = 0
+        self.wal: WAL | None = None
+        self.meta: MetaPage | None = None
+        self.read_ahead: ReadAhead | None = None
+        self.cache_size: int = CACHE_SIZE
+        # 上层解码后的页对象（如 B+ 树节点），页被改写时作废
+        self.node_cache: NodeCache = new_node_cache()
+        # 缓冲池，按进入顺序排列，配合 ref 位实现 CLOCK（second chance）淘汰
+        self.frames: OrderedDict[int, Frame] = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.durability: int = DURABILITY_OPERATION
+        # 嵌套的 batch/operation 深度，以及最外层结束时需要的持久化级别
+        self.scope_depth: int = 0
+        self.scope_level: int = DURABILITY_OPERATION
+        # 最外层 operation/batch 内第一次改某页前的内容（改之前不在缓冲池为 None）和第一次改 meta 前的副本，
+        # 出错时据此回滚，结束时清空
+        self.undo: dict[int, bytes | None] = {}
+        self.meta_undo: MetaPage | None = None
+        # 回滚后要按页重新载入内存状态的对象（如空闲链、区段表）
+        self.rollback_hooks: list[Callable[[], None]] = []
+        # group commit：write_seq 为已写回的次数，synced_seq 为已 fsync 覆盖到的位置
+        self.commit_cond: threading.Condition = threading.Condition()
+        self.write_seq: int = 0
+        self.synced_seq: int = 0
+        self.syncing: bool = False
+        # 保护缓冲池、计数和 meta
+        self.lock: threading.RLock = threading.RLock()
+        # 同一时刻只有一个写者线程在 operation/batch 内
+        self.write_lock: threading.RLock = threading.RLock()
+        self.writer: int | None = None
+        # 页（及树的根指针）的读写闩，latched 为当前写者持有的独占闩
+        self.latches: LatchTable = new_latch_table()
+        self.latched: set[Hashable] = set()
+        # 写时复制：txn 为已提交的事务数，fresh 为本事务新分配、还能原地改的页，
+        # roots 为最后一次提交时各棵树的根，snapshots 为打开的快照（txn -> 个数），
+        # pending 为被替换下来的页及替换它的事务，等更早的快照都关闭后由 page_release 交回空闲链；
+        # 空闲链同时按同样的顺序把这些页记在磁盘上（meta 的 pending_page_id），重新打开时交回，不会丢
+        self.cow: bool = False
+        self.txn: int = 0
+        self.fresh: set[int] = set()
+        self.roots: list[int] = []
+        self.snapshots: dict[int, int] = {}
+        self.pending: list[tuple[int, int]] = []
+        self.page_release: Callable[[int], None] | None = None
+        # 同一棵树的多个对象需要共享的内存状态（如 LSM 树的 memtable），按 seq 登记一个对象
+        self.tree_states: dict[int, object] = {}
+        # B+ 树的区段表（extent.Extents），第一次建 B+ 树对象时载入
+        self.extents: object | None = None
 
     def magic_number_set(self) -> None:
-        offset = META_PAGE_ID * BYTES_PAGE
-        bs = MAGIC_NUMBER_BS
-        self.file_update(offset, bs)
+        self.meta_touch()
+        self.meta.magic_number = MAGIC_NUMBER_BS
+        self.meta.dirty = True
 
     def magic_number_exist(self) -> bool:
-        offset = META_PAGE_ID * BYTES_PAGE
-        bs = self.file_read(offset, BYTES_MAGIC_NUMBER)
-        return bs == MAGIC_NUMBER_BS
+        return self.meta.magic_number_exist()
 
     def used_page_id_set(self, used_page_id: int) -> None:
-        offset = (
-                META_PAGE_ID * BYTES_PAGE +
-                BYTES_MAGIC_NUMBER
-        )
-        bs = to_bytes(used_page_id)
-        self.file_update(offset, bs)
+        self.meta_touch()
+        self.meta.used_page_id = used_page_id
+        self.meta.dirty = True
 
     def head_page_id_set(self, head_page_id: int) -> None:
-        offset = (
-                META_PAGE_ID * BYTES_PAGE +
-                BYTES_MAGIC_NUMBER +
-                BYTES_USED_PAGE_ID
-        )
-        bs = to_bytes(head_page_id)
-        self.file_update(offset, bs)
+        self.meta_touch()
+        self.meta.head_page_id = head_page_id
+        self.meta.dirty = True
 
     def tail_page_id_set(self, tail_page_id: int) -> None:
-        offset = (
-                META_PAGE_ID * BYTES_PAGE +
-                BYTES_MAGIC_NUMBER +
-                BYTES_USED_PAGE_ID +
-                BYTES_HEAD_PAGE_ID
-        )
-        bs = to_bytes(tail_page_id)
-        self.file_update(offset, bs)
+        self.meta_touch()
+        self.meta.tail_page_id = tail_page_id
+        self.meta.dirty = True
 
     def b_plus_tree_seq_set(self, seq: int) -> None:
-        offset = (
-                META_PAGE_ID * BYTES_PAGE +
-                BYTES_MAGIC_NUMBER +
-                BYTES_USED_PAGE_ID +
-                BYTES_HEAD_PAGE_ID +
-                BYTES_TAIL_PAGE_ID
-        )
-        bs = to_bytes(seq)
-        self.file_update(offset, bs)
+        self.meta_touch()
+        self.meta.b_plus_tree_seq = seq
+        self.meta.dirty = True
 
     def database_seq_set(self, database_page_id: int) -> None:
-        offset = (
-                META_PAGE_ID * BYTES_PAGE +
-                BYTES_MAGIC_NUMBER +
-                BYTES_USED_PAGE_ID +
-                BYTES_HEAD_PAGE_ID +
-                BYTES_TAIL_PAGE_ID +
-                BYTES_B_PLUS_TREE_SEQ
-        )
-        bs = to_bytes(database_page_id)
-        self.file_update(offset, bs)
+        self.meta_touch()
+        self.meta.database_seq = database_page_id
+        self.meta.dirty = True
+
+    def extent_page_id_set(self, extent_page_id: int) -> None:
+        self.meta_touch()
+        self.meta.extent_page_id = extent_page_id
+        self.meta.dirty = True
+
+    def extent_page_id_get(self) -> int:
+        return self.meta.extent_page_id
+
+    def pending_page_id_set(self, pending_page_id: int) -> None:
+        self.meta_touch()
+        self.meta.pending_page_id = pending_page_id
+        self.meta.dirty = True
+
+    def pending_page_id_get(self) -> int:
+        return self.meta.pending_page_id
 
     def root_page_id_set(self, seq: int, root_page_id: int) -> None:
-        offset = (
-                META_PAGE_ID * BYTES_PAGE +
-                BYTES_MAGIC_NUMBER +
-                BYTES_USED_PAGE_ID +
-                BYTES_HEAD_PAGE_ID +
-                BYTES_TAIL_PAGE_ID +
-                BYTES_B_PLUS_TREE_SEQ +
-                BYTES_DATABASE_SEQ +
-                BYTES_ROOT_PAGE_ID * seq
-        )
-        bs = to_bytes(root_page_id)
-        self.file_update(offset, bs)
+        self.meta_touch()
+        self.meta.root_page_id_set(seq, root_page_id)
 
     def root_page_id_get(self, seq: int) -> int:
-        offset = (
-                META_PAGE_ID * BYTES_PAGE +
-                BYTES_MAGIC_NUMBER +
-                BYTES_USED_PAGE_ID +
-                BYTES_HEAD_PAGE_ID +
-                BYTES_TAIL_PAGE_ID +
-                BYTES_B_PLUS_TREE_SEQ +
-                BYTES_DATABASE_SEQ +
-                BYTES_ROOT_PAGE_ID * seq
-        )
-        root_page_id_bs = self.file_read(offset, BYTES_ROOT_PAGE_ID)
-        root_page_id = from_bytes(root_page_id_bs, int)
-        return root_page_id
+        return self.meta.root_page_ids[seq]
+
+    def bloom_page_id_set(self, seq: int, bloom_page_id: int) -> None:
+        self.meta_touch()
+        self.meta.bloom_page_id_set(seq, bloom_page_id)
+
+    def bloom_page_id_get(self, seq: int) -> int:
+        return self.meta.bloom_page_ids[seq]
+
+    def meta_touch(self) -> None:
+        """操作内第一次改 meta 前留一份副本"""
+        if self.scope_depth > 0 and self.meta_undo is None:
+            self.meta_undo = meta_page_copy(self.meta)
+
+    def meta_load(self) -> None:
+        meta_bs = self.file_read(META_PAGE_ID * BYTES_PAGE, BYTES_PAGE)
+        self.meta = new_meta_page_from_buf(io.BytesIO(meta_bs))
+        self.meta.format_check()
+
+    def meta_sync(self) -> None:
+        """把内存中的 meta 序列化进 page 0，只在读 page 0 或提交时做一次"""
+        with self.lock:
+            if self.meta is not None and self.meta.dirty:
+                self.page_set(META_PAGE_ID, bytes(self.meta))
+                self.meta.dirty = False
 
     def page_get(self, page_id: int) -> io.BytesIO:
-        offset = page_id * BYTES_PAGE
-        page_bs = self.file_read(offset, BYTES_PAGE)
-        page_buf = io.BytesIO(page_bs)
+        if page_id == META_PAGE_ID:
+            self.meta_sync()
+        frame = self.frame_get(page_id)
+        page_buf = io.BytesIO(frame.data)
         return page_buf
 
+    def page_view(self, page_id: int) -> memoryview:
+        """页内容的只读视图，不复制，之后对该页的写入在视图里可见"""
+        if page_id == META_PAGE_ID:
+            self.meta_sync()
+        frame = self.frame_get(page_id)
+        return memoryview(frame.data).toreadonly()
+
     def page_set(self, page_id: int, page_bs: bytes) -> None:
-        offset = page_id * BYTES_PAGE
-        self.file_update(offset, page_bs)
+        if len(page_bs) > BYTES_PAGE:
+            raise ValueError("page 溢出")
+        self.node_cache.invalidate(page_id)
+        with self.lock:
+            self.page_touch(page_id)
+            frame = self.frames.get(page_id)
+            if frame is None:
+                # 整页覆盖，无需先读盘
+                frame = self.frame_add(new_frame(page_id, b''))
+            frame.data[:len(page_bs)] = page_bs
+            frame.ref = True
+            frame.dirty = True
 
     def file_read(self, offset: int, length: int) -> bytes:
-        os.lseek(self.fd, offset, os.SEEK_SET)
-        bs = os.read(self.fd, length)
+        page_id, page_offset = divmod(offset, BYTES_PAGE)
+        frame = self.frame_get(page_id)
+        bs = bytes(frame.data[page_offset:page_offset + length])
         return bs
 
     def file_update(self, offset: int, data: bytes) -> None:
-        os.lseek(self.fd, offset, os.SEEK_SET)
-        os.write(self.fd, data)
+        page_id, page_offset = divmod(offset, BYTES_PAGE)
+        if page_offset + len(data) > BYTES_PAGE:
+            raise ValueError("page 溢出")
+        self.node_cache.invalidate(page_id)
+        with self.lock:
+            self.page_touch(page_id)
+            frame = self.frame_get(page_id)
+            frame.data[page_offset:page_offset + len(data)] = data
+            frame.dirty = True
+
+    def page_touch(self, page_id: int) -> None:
+        """操作内第一次改某页前记下它原来的内容，调用方持有 lock"""
+        if self.scope_depth > 0 and page_id not in self.undo:
+            self.undo[page_id] = self.page_image(page_id)
+
+    def page_image(self, page_id: int) -> bytes | None:
+        frame = self.frames.get(page_id)
+        return None if frame is None else bytes(frame.data)
+
+    def page_restore(self, page_id: int, page_bs: bytes | None) -> None:
+        """回滚一页，调用方持有 lock"""
+        frame = self.frames.get(page_id)
+        if page_bs is None:
+            # 改之前不在缓冲池，文件里的就是原来的内容，丢掉缓冲池里的重新读
+            if frame is not None:
+                del self.frames[page_id]
+            return
+        if frame is None:
+            frame = self.frame_add(new_frame(page_id, page_bs))
+        else:
+            frame.data[:] = page_bs.ljust(BYTES_PAGE, b'\x00')
+        # 不开 WAL 时期间可能被淘汰写回过，一律当脏页，下次提交再写一次
+        frame.dirty = True
+
+    def frame_get(self, page_id: int) -> Frame:
+        with self.lock:
+            frame = self.frames.get(page_id)
+            if frame is not None:
+                self.hits += 1
+                frame.ref = True
+                return frame
+            self.misses += 1
+        # 读盘不持锁，多个读者的 IO 可以重叠；页的闩保证读期间没有写者改它
+        page_bs = None
+        if self.read_ahead is not None:
+            page_bs = self.read_ahead.take(page_id)
+        if page_bs is None:
+            page_bs = self.page_read(page_id)
+        with self.lock:
+            frame = self.frames.get(page_id)
+            if frame is not None:
+                # 别的线程先读进来了
+                return frame
+            return self.frame_add(new_frame(page_id, page_bs))
+
+    def frame_add(self, frame: Frame) -> Frame:
+        if len(self.frames) >= self.cache_size:
+            self.frame_evict()
+        self.frames[frame.page_id] = frame
+        return frame
+
+    def frame_evict(self) -> None:
+        # 最多转两圈：第一圈清 ref 位，第二圈一定能找到未 pin 的页
+        for _ in range(2 * len(self.frames)):
+            page_id, frame = next(iter(self.frames.items()))
+            # 开启 WAL 时未提交的脏页不能写回数据文件（no-steal），与 pin 同等对待
+            unstealable = frame.dirty and self.wal is not None
+            if frame.pin_count > 0 or frame.ref or unstealable:
+                frame.ref = False
+                self.frames.move_to_end(page_id)
+                continue
+            if frame.dirty and page_id in self.undo and self.undo[page_id] is None:
+                # 操作内改的页提交前写回了数据文件，回滚要用到文件里原来的内容
+                self.undo[page_id] = self.page_read(page_id)
+            if frame.dirty or frame.logged:
+                self.page_write(page_id, frame.data)
+            if frame.dirty:
+                self.write_seq += 1
+            del self.frames[page_id]
+            return
+        # 全部被 pin 或未提交，允许缓冲池暂时超出上限
+
+    def read_ahead_scan(self, page_id: int, next_page_id_of: Callable[[bytes], int]) -> None:
+        """叶链扫描即将读取 page_id，next_page_id_of 从页内容解析出链上的下一页"""
+        if self.read_ahead is not None:
+            self.read_ahead.scan(page_id, next_page_id_of)
+
+    def read_ahead_scan_end(self) -> None:
+        if self.read_ahead is not None:
+            self.read_ahead.scan_end()
+
+    def pin(self, page_id: int) -> None:
+        with self.lock:
+            frame = self.frame_get(page_id)
+            frame.pin_count += 1
+
+    def unpin(self, page_id: int) -> None:
+        with self.lock:
+            frame = self.frames.get(page_id)
+            if frame is None or frame.pin_count == 0:
+                raise ValueError("page 未被 pin")
+            frame.pin_count -= 1
+
+    def is_writer(self) -> bool:
+        """当前线程是否在 operation/batch 内"""
+        return self.writer == threading.get_ident()
+
+    def latch_exclusive(self, key: Hashable) -> None:
+        """写者对页（或根指针）取独占闩，最外层 operation 结束时释放"""
+        if key in self.latched:
+            return
+        self.latches.acquire_exclusive(key)
+        self.latched.add(key)
+
+    def latch_exclusive_gated(self, key: Hashable) -> None:
+        """
+        对整个读取期间都持共享闩的结构（如 Bε 树、LSM 树的根指针）取独占闩：
+        先占住入口 ('gate', key)，新来的读者等它拿到闩，读者不断时写者也不会一直等不到
+        """
+        if key in self.latched:
+            return
+        gate = 'gate', key
+        self.latches.acquire_exclusive(gate)
+        try:
+            self.latch_exclusive(key)
+        finally:
+            self.latches.release_exclusive(gate)
+
+    @contextmanager
+    def latch_exclusive_brief(self, key: Hashable):
+        """同 latch_exclusive_gated，但只在 with 块内持有，不等到操作结束"""
+        gate = 'gate', key
+        self.latches.acquire_exclusive(gate)
+        try:
+            self.latches.acquire_exclusive(key)
+        finally:
+            self.latches.release_exclusive(gate)
+        try:
+            yield
+        finally:
+            self.latches.release_exclusive(key)
+
+    @contextmanager
+    def latch_shared_gated(self, key: Hashable):
+        """与 latch_exclusive_gated 配对的读者，等在入口的写者先走"""
+        self.latches.wait(('gate', key))
+        self.latches.acquire_shared(key)
+        try:
+            yield
+        finally:
+            self.latches.release_shared(key)
+
+    def latch_release(self, keys: list[Hashable]) -> None:
+        """写者提前放开确定不会再改的页"""
+        for key in keys:
+            if key in self.latched:
+                self.latched.discard(key)
+                self.latches.release_exclusive(key)
+
+    def page_defer(self, page_id: int) -> bool:
+        """
+        写时复制时回收页：本事务新分配的页直接回收，返回 False；
+        已提交的页可能还在快照里，记进 pending，返回 True
+        """
+        if page_id in self.fresh:
+            self.fresh.discard(page_id)
+            return False
+        self.pending.append((self.txn + 1, page_id))
+        return True
+
+    def pending_release(self) -> None:
+        """事务 txn 替换下来的页只有 txn 之前打开的快照还会读，这些快照都关闭后交回空闲链"""
+        if self.page_release is None:
+            return
+        oldest = min(self.snapshots, default=self.txn + 1)
+        ready = [page_id for txn, page_id in self.pending if txn <= oldest]
+        self.pending = [(txn, page_id) for txn, page_id in self.pending if txn > oldest]
+        for page_id in ready:
+            self.page_release(page_id)
+
+    @contextmanager
+    def snapshot(self):
+        """写时复制模式下的读快照，读它不加闩，长扫描期间写者照常提交"""
+        if not self.cow:
+            raise ValueError("快照需要写时复制模式")
+        with self.lock:
+            snapshot = new_snapshot(self.txn, self.roots)
+            self.snapshots[snapshot.txn] = self.snapshots.get(snapshot.txn, 0) + 1
+        try:
+            yield snapshot
+        finally:
+            with self.lock:
+                count = self.snapshots[snapshot.txn] - 1
+                if count == 0:
+                    del self.snapshots[snapshot.txn]
+                else:
+                    self.snapshots[snapshot.txn] = count
+
+    @contextmanager
+    def batch(self):
+        """调用方显式分组的一批操作，最外层结束时只提交一次"""
+        with self.scope(DURABILITY_BATCH):
+            yield
+
+    @contextmanager
+    def operation(self):
+        """单个对外操作，如 BPlusTree.add，嵌套在 batch 中时并入 batch 提交"""
+        with self.scope(DURABILITY_OPERATION):
+            yield
+
+    @contextmanager
+    def scope(self, level: int):
+        """
+        最外层结束时提交；最外层内抛出异常时回滚其间的全部修改，不提交，放开闩后继续抛出。
+        嵌套的 operation 出错而外层接住异常继续时不回滚，由最外层一起提交
+        """
+        outermost = False
+        failed = False
+        with self.write_lock:
+            if self.scope_depth == 0:
+                self.scope_level = level
+                self.writer = threading.get_ident()
+            else:
+                self.scope_level = min(self.scope_level, level)
+            self.scope_depth += 1
+            try:
+                yield
+            except BaseException:
+                failed = True
+                raise
+            finally:
+                self.scope_depth -= 1
+                if self.scope_depth == 0:
+                    outermost = not failed
+                    try:
+                        if failed:
+                            # 持着闩回滚，读者看不到改了一半的页
+                            self.rollback()
+                            self.latch_release(list(self.latched))
+                        else:
+                            # 页已改完，先放开闩让读者继续，再把脏页交给 WAL 或数据文件
+                            self.latch_release(list(self.latched))
+                            self.commit_write()
+                    finally:
+                        self.undo.clear()
+                        self.meta_undo = None
+                        self.writer = None
+        # fsync 不持有 write_lock，下一个写者可以先改页，再并入同一次 fsync
+        if outermost:
+            self.commit_sync(self.durability >= self.scope_level)
+
+    def rollback(self) -> None:
+        """
+        撤销最外层 operation/batch 对页和 meta 的修改。出错时缓存里的节点可能已改了一半还没写进页，整个节点缓存作废；
+        再让 rollback_hooks 和 tree_states 里的对象（有 rollback 方法的）按页重新载入内存状态。
+        调用方持有 write_lock
+        """
+        with self.lock:
+            for page_id, page_bs in self.undo.items():
+                self.page_restore(page_id, page_bs)
+            self.undo.clear()
+            self.node_cache.clear()
+            if self.meta_undo is not None:
+                self.meta = self.meta_undo
+                self.meta_undo = None
+            if self.cow:
+                # 本事务分配和替换下来的页都随空闲链一起回到了事务开始时
+                self.fresh.clear()
+                self.pending = [(txn, page_id) for txn, page_id in self.pending if txn <= self.txn]
+            hooks = list(self.rollback_hooks)
+            states = list(self.tree_states.values())
+        for hook in hooks:
+            hook()
+        for state in states:
+            rollback = getattr(state, 'rollback', None)
+            if rollback is not None:
+                rollback()
+
+    def flush(self) -> None:
+        self.commit(True)
+
+    def close(self) -> None:
+        """
+        关闭文件前调用：等登记在 tree_states 的树结束后台任务（如 LSM 树的合并）并关掉其线程，再刷盘，最后停掉预读线程。
+        后台任务出错时在这里抛出；不能在 operation/batch 内调用，文件由调用方关闭
+        """
+        with self.lock:
+            states = list(self.tree_states.values())
+        error = None
+        for state in states:
+            close = getattr(state, 'close', None)
+            if close is None:
+                continue
+            try:
+                close()
+            except Exception as e:
+                error = error or e
+        self.flush()
+        if self.read_ahead is not None:
+            self.read_ahead.close()
+        if error is not None:
+            raise error
+
+    def commit(self, sync: bool) -> None:
+        with self.write_lock:
+            self.commit_write()
+        self.commit_sync(sync)
+
+    def commit_write(self) -> None:
+        """把本次修改的脏页写入 WAL 或数据文件，调用方持有 write_lock"""
+        # 持有 lock，提交期间不会有新快照打开
+        with self.lock:
+            if self.cow:
+                self.pending_release()
+            self.meta_sync()
+            if self.wal is not None:
+                self.wal_append()
+            else:
+                self.write_back()
+            if self.cow:
+                self.txn_commit()
+
+    def txn_commit(self) -> None:
+        """本事务写的页从此对新快照可见，之后再改要换页"""
+        self.txn += 1
+        self.fresh.clear()
+        self.roots = list(self.meta.root_page_ids)
+
+    def commit_sync(self, sync: bool) -> None:
+        if sync and self.durability != DURABILITY_OFF:
+            with self.commit_cond:
+                self.group_sync()
+        if self.wal is not None and not self.syncing and self.wal.size >= WAL_CHECKPOINT_BYTES:
+            self.checkpoint()
+
+    def group_sync(self) -> None:
+        ticket = self.write_seq
+        while self.synced_seq < ticket:
+            if self.syncing:
+                # 已有 leader 在 fsync，等它结束后看是否已覆盖自己的写入
+                self.commit_cond.wait()
+                continue
+            self.syncing = True
+            target = self.write_seq
+            self.commit_cond.release()
+            try:
+                if self.wal is not None:
+                    self.wal.sync()
+                else:
+                    os.fsync(self.fd)
+            finally:
+                self.commit_cond.acquire()
+                self.syncing = False
+                self.commit_cond.notify_all()
+            self.synced_seq = target
+
+    def write_back(self) -> None:
+        with self.lock:
+            dirty = [frame for frame in self.frames.values() if frame.dirty]
+            if len(dirty) == 0:
+                return
+            # 按 page_id 顺序写回，尽量顺序 IO
+            dirty.sort(key=lambda f: f.page_id)
+            for frame in dirty:
+                self.page_write(frame.page_id, frame.data)
+                frame.dirty = False
+            self.write_seq += 1
+
+    def wal_append(self) -> None:
+        """脏页整页追加到 WAL，数据文件留到淘汰或 checkpoint 时再写"""
+        with self.lock:
+            dirty = [frame for frame in self.frames.values() if frame.dirty]
+            if len(dirty) == 0:
+                return
+            dirty.sort(key=lambda f: f.page_id)
+            records = [(frame.page_id, bytes(frame.data)) for frame in dirty]
+            lsns = self.wal.append(records)
+            for frame, lsn in zip(dirty, lsns):
+                frame.lsn = lsn
+                frame.dirty = False
+                frame.logged = True
+            self.write_seq += 1
+
+    def checkpoint(self) -> None:
+        """已提交的页写回数据文件并 fsync，之后 WAL 可以清空"""
+        # 持有 write_lock，避免把写者尚未提交的改动写进数据文件
+        with self.write_lock, self.commit_cond:
+            while self.syncing:
+                self.commit_cond.wait()
+            if self.wal is None:
+                self.write_back()
+                os.fsync(self.fd)
+                return
+            with self.lock:
+                logged = [frame for frame in self.frames.values() if frame.logged]
+                logged.sort(key=lambda f: f.page_id)
+                for frame in logged:
+                    self.page_write(frame.page_id, frame.data)
+                    frame.logged = False
+            if self.durability != DURABILITY_OFF:
+                os.fsync(self.fd)
+            self.wal.truncate()
+
+    def recover(self) -> None:
+        """重放 WAL 中完整提交的页，打开数据库时调用"""
+        for page_id, page_bs in self.wal.replay():
+            self.page_write(page_id, page_bs)
         os.fsync(self.fd)
+        self.wal.truncate()
+        self.wal.sync()
+
+    def page_read(self, page_id: int) -> bytes:
+        # pread 不共享文件偏移，多线程同时读互不干扰
+        return file_pread(self.fd, BYTES_PAGE, page_id * BYTES_PAGE)
+
+    def page_write(self, page_id: int, page_bs: bytes | bytearray) -> None:
+        file_pwrite(self.fd, page_bs, page_id * BYTES_PAGE)
+        if self.read_ahead is not None:
+            # 写完再作废：已放进预读缓存的旧内容删掉，正在读的那次读完后丢弃
+            with self.read_ahead.lock:
+                self.read_ahead.invalidate(page_id)
 
 
-def new_pager(fd: int) -> Pager:
+def new_pager(fd: int, cache_size: int = CACHE_SIZE, durability: int = DURABILITY_OPERATION,
+              wal: WAL | None = None, read_ahead: bool = True, cow: bool | None = None) -> Pager:
+    """cow 为 None 时沿用文件记下的模式，新文件默认不用写时复制"""
+    if durability not in (DURABILITY_OFF, DURABILITY_BATCH, DURABILITY_OPERATION):
+        raise ValueError("durability 错误")
     pager = Pager()
     pager.fd = fd
+    pager.cache_size = cache_size
+    pager.durability = durability
+    if wal is not None:
+        pager.wal = wal
+        pager.recover()
+    if read_ahead:
+        pager.read_ahead = new_read_ahead(fd)
+    # 元数据页常驻缓冲池
+    pager.pin(META_PAGE_ID)
+    pager.meta_load()
+    # 写时复制的树没有叶链，已写过的文件不能换一种模式打开
+    if cow is None:
+        cow = pager.meta.cow
+    elif cow != pager.meta.cow:
+        if pager.magic_number_exist() or pager.meta.used_page_id != 0:
+            raise ValueError("cow 与文件不符")
+        pager.meta.cow = cow
+        pager.meta.dirty = True
+    if cow:
+        pager.cow = True
+        pager.roots = list(pager.meta.root_page_ids)
     return pager
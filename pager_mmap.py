@@ -0,0 +1,169 @@
+import os
+import io
+import mmap
+from typing import Callable
+
+from const import BYTES_PAGE, META_PAGE_ID, MMAP_GROW_PAGES, DURABILITY_OFF, DURABILITY_BATCH, DURABILITY_OPERATION
+from pager import Pager
+
+
+class PageView:
+    """页的只读视图，按需从映射里切片，不复制整页"""
+
+    def __init__(self):
+        self.view: memoryview | None = None
+        self.pos: int = 0
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            size = len(self.view) - self.pos
+        bs = bytes(self.view[self.pos:self.pos + size])
+        self.pos += len(bs)
+        return bs
+
+    def seek(self, pos: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            pos += self.pos
+        elif whence == io.SEEK_END:
+            pos += len(self.view)
+        self.pos = pos
+        return self.pos
+
+    def tell(self) -> int:
+        return self.pos
+
+
+def new_page_view(view: memoryview) -> PageView:
+    r = PageView()
+    r.view = view
+    r.pos = 0
+    return r
+
+
+class MmapPager(Pager):
+    """
+    基于 mmap 的 Pager：读直接落在映射上，写进映射、提交时 msync。
+    不使用缓冲池（由内核页缓存承担），也不支持 WAL。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.mm: mmap.mmap | None = None
+        self.mm_size: int = 0
+        # 扩展前的旧映射，还有视图引用时关不掉，等引用都释放后再关
+        self.old_maps: list[mmap.mmap] = []
+
+    def page_get(self, page_id: int) -> PageView:
+        if page_id == META_PAGE_ID:
+            self.meta_sync()
+        offset = page_id * BYTES_PAGE
+        self.ensure_size(offset + BYTES_PAGE)
+        view = memoryview(self.mm)[offset:offset + BYTES_PAGE]
+        return new_page_view(view)
+
+    def page_view(self, page_id: int) -> memoryview:
+        if page_id == META_PAGE_ID:
+            self.meta_sync()
+        offset = page_id * BYTES_PAGE
+        self.ensure_size(offset + BYTES_PAGE)
+        return memoryview(self.mm)[offset:offset + BYTES_PAGE].toreadonly()
+
+    def page_set(self, page_id: int, page_bs: bytes) -> None:
+        if len(page_bs) > BYTES_PAGE:
+            raise ValueError("page 溢出")
+        self.node_cache.invalidate(page_id)
+        offset = page_id * BYTES_PAGE
+        self.ensure_size(offset + BYTES_PAGE)
+        self.page_touch(page_id)
+        self.mm[offset:offset + len(page_bs)] = page_bs
+
+    def file_read(self, offset: int, length: int) -> bytes:
+        self.ensure_size(offset + length)
+        return self.mm[offset:offset + length]
+
+    def file_update(self, offset: int, data: bytes) -> None:
+        self.node_cache.invalidate(offset // BYTES_PAGE)
+        self.ensure_size(offset + len(data))
+        self.page_touch(offset // BYTES_PAGE)
+        self.mm[offset:offset + len(data)] = data
+
+    def page_image(self, page_id: int) -> bytes | None:
+        offset = page_id * BYTES_PAGE
+        self.ensure_size(offset + BYTES_PAGE)
+        return self.mm[offset:offset + BYTES_PAGE]
+
+    def page_restore(self, page_id: int, page_bs: bytes | None) -> None:
+        offset = page_id * BYTES_PAGE
+        self.mm[offset:offset + BYTES_PAGE] = page_bs
+
+    def ensure_size(self, size: int) -> None:
+        if size <= self.mm_size:
+            return
+        with self.lock:
+            if size <= self.mm_size:
+                return
+            chunk = MMAP_GROW_PAGES * BYTES_PAGE
+            new_size = (size + chunk - 1) // chunk * chunk
+            if os.fstat(self.fd).st_size < new_size:
+                os.ftruncate(self.fd, new_size)
+            # 旧映射可能还有 PageView 引用，不能 resize，直接重新映射，
+            # MAP_SHARED 下新旧映射看到的是同一份页缓存
+            if self.mm is not None:
+                self.old_maps.append(self.mm)
+            self.mm = mmap.mmap(self.fd, new_size)
+            self.mm_size = new_size
+            self.old_maps_close()
+
+    def old_maps_close(self) -> None:
+        """关掉已没有视图引用的旧映射"""
+        with self.lock:
+            maps = []
+            for mm in self.old_maps:
+                try:
+                    mm.close()
+                except BufferError:
+                    maps.append(mm)
+            self.old_maps = maps
+
+    def read_ahead_scan(self, page_id: int, next_page_id_of: Callable[[bytes], int]) -> None:
+        # 映射本身由内核按顺序访问预读
+        pass
+
+    def read_ahead_scan_end(self) -> None:
+        pass
+
+    def pin(self, page_id: int) -> None:
+        pass
+
+    def unpin(self, page_id: int) -> None:
+        pass
+
+    def commit_write(self) -> None:
+        self.meta_sync()
+        if len(self.old_maps) > 0:
+            self.old_maps_close()
+
+    def commit_sync(self, sync: bool) -> None:
+        if sync and self.durability != DURABILITY_OFF:
+            self.mm.flush()
+
+    def checkpoint(self) -> None:
+        self.commit(True)
+
+    def close(self) -> None:
+        super().close()
+        self.old_maps_close()
+
+
+def new_mmap_pager(fd: int, durability: int = DURABILITY_OPERATION) -> MmapPager:
+    if durability not in (DURABILITY_OFF, DURABILITY_BATCH, DURABILITY_OPERATION):
+        raise ValueError("durability 错误")
+    pager = MmapPager()
+    pager.fd = fd
+    pager.durability = durability
+    pager.mm_size = 0
+    pager.ensure_size(max(os.fstat(fd).st_size, BYTES_PAGE))
+    pager.meta_load()
+    if pager.meta.cow:
+        raise ValueError("mmap 不支持写时复制的文件")
+    return pager
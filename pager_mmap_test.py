@@ -0,0 +1,98 @@
+import inspect
+import os
+import pytest
+
+from b_plus_tree import new_b_plus_tree
+from const import META_PAGE_ID, BYTES_PAGE, MMAP_GROW_PAGES
+from file import file_open
+from free_list import new_free_list
+from pager import new_pager
+from pager_mmap import MmapPager, new_mmap_pager
+
+
+def init(name: str) -> tuple[int, MmapPager]:
+    fd = file_open(f'{name}.db')
+    pager = new_mmap_pager(fd)
+    pager.magic_number_set()
+    return fd, pager
+
+
+def close(fd: int, name: str) -> None:
+    os.close(fd)
+    os.remove(f'{name}.db')
+
+
+def test_page_get_set():
+    name = inspect.currentframe().f_code.co_name
+    fd, pager = init(name)
+    pager.page_set(1, b'12')
+    buf = pager.page_get(1)
+    assert buf.read(1) == b'1'
+    assert buf.read(1) == b'2'
+    assert pager.magic_number_exist()
+    close(fd, name)
+
+
+def test_grow():
+    """超出映射范围时按块扩展文件并重新映射，旧的 PageView 仍然可读"""
+    name = inspect.currentframe().f_code.co_name
+    fd, pager = init(name)
+    buf = pager.page_get(1)
+    page_id = MMAP_GROW_PAGES + 1
+    pager.page_set(page_id, b'x')
+    assert pager.mm_size == 2 * MMAP_GROW_PAGES * BYTES_PAGE
+    assert pager.page_get(page_id).read(1) == b'x'
+    assert buf.read(1) == b'\x00'
+    close(fd, name)
+
+
+def test_grow_close_old_map():
+    """扩展后旧映射在视图都释放后关掉，还有视图时留到提交或下次扩展再关"""
+    name = inspect.currentframe().f_code.co_name
+    fd, pager = init(name)
+    old = pager.mm
+    view = pager.page_view(1)
+    pager.page_set(MMAP_GROW_PAGES + 1, b'x')
+    assert pager.old_maps == [old]
+    assert not old.closed
+    view.release()
+    pager.flush()
+    assert pager.old_maps == []
+    assert old.closed
+    old = pager.mm
+    pager.page_set(2 * MMAP_GROW_PAGES + 1, b'y')
+    assert pager.old_maps == []
+    assert old.closed
+    pager.close()
+    close(fd, name)
+
+
+def test_b_plus_tree():
+    """mmap 模式写入的树，用普通 Pager 重新打开后内容一致"""
+    name = inspect.currentframe().f_code.co_name
+    fd, pager = init(name)
+    free_list = new_free_list(pager, META_PAGE_ID)
+    tree = new_b_plus_tree(pager, free_list, 0, True)
+    keys = [b'%02d' % i for i in range(30)]
+    for key in keys:
+        tree.add([(key, key)])
+    pager = new_pager(fd)
+    tree = new_b_plus_tree(pager, free_list, 0, False)
+    assert tree.get_all() == keys
+    close(fd, name)
+
+
+def test_cow():
+    """写时复制的文件提交时要换页、推进事务，mmap 不支持，打开时报错"""
+    name = inspect.currentframe().f_code.co_name
+    fd = file_open(f'{name}.db')
+    pager = new_pager(fd, cow=True)
+    pager.magic_number_set()
+    pager.flush()
+    with pytest.raises(ValueError):
+        new_mmap_pager(fd)
+    close(fd, name)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,297 @@
+import inspect
+import os
+import threading
+import pytest
+
+from const import BYTES_PAGE, META_PAGE_ID, DURABILITY_OPERATION, DURABILITY_BATCH, DURABILITY_OFF
+from file import file_open
+from pager import Pager, new_pager
+
+
+def init(name: str, cache_size: int, durability: int = DURABILITY_OPERATION) -> tuple[int, Pager]:
+    fd = file_open(f'{name}.db')
+    pager = new_pager(fd, cache_size, durability)
+    pager.magic_number_set()
+    return fd, pager
+
+
+def close(fd: int, name: str) -> None:
+    os.close(fd)
+    os.remove(f'{name}.db')
+
+
+def test_page_get_hit():
+    name = inspect.currentframe().f_code.co_name
+    fd, pager = init(name, 4)
+    pager.page_set(1, b'1')
+    pager.flush()
+    hits = pager.hits
+    for _ in range(3):
+        assert pager.page_get(1).read(1) == b'1'
+    assert pager.hits == hits + 3
+    close(fd, name)
+
+
+def test_page_set_write_back():
+    """写入只进缓冲池，flush 后才落盘"""
+    name = inspect.currentframe().f_code.co_name
+    fd, pager = init(name, 4)
+    pager.page_set(1, b'1')
+    assert pager.page_read(1) == b''
+    pager.flush()
+    assert pager.page_read(1)[:1] == b'1'
+    close(fd, name)
+
+
+def test_evict():
+    """超出容量时淘汰未 pin 的页，脏页淘汰前写回"""
+    name = inspect.currentframe().f_code.co_name
+    fd, pager = init(name, 4)
+    for page_id in range(1, 10):
+        pager.page_set(page_id, to_page(page_id))
+    assert len(pager.frames) == 4
+    assert META_PAGE_ID in pager.frames
+    misses = pager.misses
+    for page_id in range(1, 10):
+        assert pager.page_get(page_id).read(1) == bytes([page_id])
+    assert pager.misses > misses
+    close(fd, name)
+
+
+def test_pin():
+    name = inspect.currentframe().f_code.co_name
+    fd, pager = init(name, 2)
+    pager.pin(1)
+    for page_id in range(2, 10):
+        pager.page_get(page_id)
+    assert 1 in pager.frames
+    pager.unpin(1)
+    with pytest.raises(ValueError):
+        pager.unpin(1)
+    close(fd, name)
+
+
+def test_page_set_overflow():
+    name = inspect.currentframe().f_code.co_name
+    fd, pager = init(name, 4)
+    with pytest.raises(ValueError):
+        pager.page_set(1, b'\x00' * (BYTES_PAGE + 1))
+    close(fd, name)
+
+
+def count_fsync(monkeypatch) -> list[int]:
+    calls = []
+    monkeypatch.setattr(os, 'fsync', lambda fd: calls.append(fd))
+    return calls
+
+
+def test_durability_operation(monkeypatch):
+    """每个 operation 结束 fsync 一次，batch 内合并为一次"""
+    name = inspect.currentframe().f_code.co_name
+    fd, pager = init(name, 8, DURABILITY_OPERATION)
+    calls = count_fsync(monkeypatch)
+    for page_id in range(1, 4):
+        with pager.operation():
+            pager.page_set(page_id, to_page(page_id))
+    assert len(calls) == 3
+    with pager.batch():
+        for page_id in range(1, 4):
+            with pager.operation():
+                pager.page_set(page_id, to_page(page_id))
+    assert len(calls) == 4
+    close(fd, name)
+
+
+def test_durability_batch(monkeypatch):
+    """单独的 operation 只写回不 fsync，batch 结束才 fsync"""
+    name = inspect.currentframe().f_code.co_name
+    fd, pager = init(name, 8, DURABILITY_BATCH)
+    calls = count_fsync(monkeypatch)
+    with pager.operation():
+        pager.page_set(1, to_page(1))
+    assert len(calls) == 0
+    assert pager.page_read(1)[:1] == b'\x01'
+    with pager.batch():
+        with pager.operation():
+            pager.page_set(2, to_page(2))
+    assert len(calls) == 1
+    close(fd, name)
+
+
+def test_durability_off(monkeypatch):
+    name = inspect.currentframe().f_code.co_name
+    fd, pager = init(name, 8, DURABILITY_OFF)
+    calls = count_fsync(monkeypatch)
+    with pager.batch():
+        pager.page_set(1, to_page(1))
+    pager.flush()
+    assert len(calls) == 0
+    assert pager.page_read(1)[:1] == b'\x01'
+    close(fd, name)
+
+
+def test_meta_write_once(monkeypatch):
+    """meta 字段只改内存，提交时 page 0 整页写一次"""
+    name = inspect.currentframe().f_code.co_name
+    fd, pager = init(name, 8)
+    writes = []
+    page_write = pager.page_write
+    monkeypatch.setattr(pager, 'page_write', lambda page_id, bs: (writes.append(page_id), page_write(page_id, bs)))
+    with pager.operation():
+        for i in range(10):
+            pager.used_page_id_set(i)
+            pager.root_page_id_set(i, i)
+    assert writes == [META_PAGE_ID]
+    assert pager.root_page_id_get(9) == 9
+    assert new_pager(fd).root_page_id_get(9) == 9
+    close(fd, name)
+
+
+def to_page(page_id: int) -> bytes:
+    return bytes([page_id]) * 8
+
+
+def test_writer_lock(monkeypatch):
+    """operation 之间互斥，fsync 时已放开 write_lock，下一个写者可以先改页"""
+    name = inspect.currentframe().f_code.co_name
+    fd, pager = init(name, 4)
+    acquired = []
+
+    def try_lock():
+        ok = pager.write_lock.acquire(blocking=False)
+        if ok:
+            pager.write_lock.release()
+        acquired.append(ok)
+
+    def fsync(_fd):
+        t = threading.Thread(target=try_lock)
+        t.start()
+        t.join()
+
+    monkeypatch.setattr(os, 'fsync', fsync)
+    with pager.operation():
+        assert pager.is_writer()
+        t = threading.Thread(target=try_lock)
+        t.start()
+        t.join()
+        pager.page_set(1, b'1')
+    assert not pager.is_writer()
+    assert acquired == [False, True]
+    close(fd, name)
+
+
+@pytest.mark.parametrize('seek', [False, True])
+def test_page_read_threads(monkeypatch, seek):
+    """多个线程同时未命中读盘，pread 不共享文件偏移；没有 pread 的平台退回加锁的 lseek + read"""
+    name = f'{inspect.currentframe().f_code.co_name}_{seek}'
+    if seek:
+        monkeypatch.delattr(os, 'pread')
+        monkeypatch.delattr(os, 'pwrite')
+    fd, pager = init(name, 64)
+    for page_id in range(1, 33):
+        pager.page_set(page_id, bytes([page_id]) * BYTES_PAGE)
+    pager.flush()
+    # 新开一个空缓冲池，全部从盘上读
+    pager = new_pager(fd, 64)
+    errors = []
+
+    def read(start):
+        for page_id in list(range(start, 33)) + list(range(1, start)):
+            if pager.page_view(page_id)[BYTES_PAGE - 1] != page_id:
+                errors.append(page_id)
+
+    threads = [threading.Thread(target=read, args=(i,)) for i in range(1, 9)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert all(page_id in pager.frames for page_id in range(1, 33))
+    close(fd, name)
+
+
+def test_snapshot_pending():
+    """写时复制：被替换的页等更早打开的快照都关闭后才交回，本事务新分配的页直接回收"""
+    name = inspect.currentframe().f_code.co_name
+    fd = file_open(f'{name}.db')
+    pager = new_pager(fd, 4, cow=True)
+    pager.magic_number_set()
+    released = []
+    pager.page_release = released.append
+    pager.fresh.add(2)
+    assert not pager.page_defer(2)
+    with pager.snapshot() as snapshot:
+        assert snapshot.txn == 0
+        assert pager.page_defer(1)
+        pager.flush()
+        assert released == []
+        with pager.snapshot() as snapshot_new:
+            assert snapshot_new.txn == 1
+    pager.flush()
+    assert released == [1]
+    close(fd, name)
+
+
+def test_cow_flag():
+    """写时复制模式记在 meta 里，不指定时沿用文件的模式，与文件不符时报错"""
+    name = inspect.currentframe().f_code.co_name
+    fd, pager = init(name, 4)
+    pager.flush()
+    with pytest.raises(ValueError):
+        with pager.snapshot():
+            pass
+    with pytest.raises(ValueError):
+        new_pager(fd, 4, cow=True)
+    os.ftruncate(fd, 0)
+    pager = new_pager(fd, 4, cow=True)
+    pager.magic_number_set()
+    pager.flush()
+    assert new_pager(fd, 4).cow
+    with pytest.raises(ValueError):
+        new_pager(fd, 4, cow=False)
+    close(fd, name)
+
+
+def test_format_version():
+    """magic number 是别的格式版本时拒绝打开，全 0 的新文件和当前版本的文件照常打开"""
+    name = inspect.currentframe().f_code.co_name
+    fd, pager = init(name, 4)
+    pager.flush()
+    assert new_pager(fd, 4).magic_number_exist()
+    os.pwrite(fd, b'\x95\x27', 0)
+    with pytest.raises(ValueError):
+        new_pager(fd, 4)
+    os.pwrite(fd, b'\x00\x00', 0)
+    assert not new_pager(fd, 4).magic_number_exist()
+    close(fd, name)
+
+
+def test_rollback():
+    """最外层 operation 出错时撤销其间对页和 meta 的修改，被淘汰写回的页也恢复，不提交"""
+    name = inspect.currentframe().f_code.co_name
+    fd, pager = init(name, 4)
+    pager.page_set(1, b'1')
+    pager.flush()
+    with pytest.raises(ValueError):
+        with pager.operation():
+            pager.latch_exclusive(1)
+            pager.page_set(1, b'2')
+            for page_id in range(2, 8):
+                pager.page_set(page_id, b'x')
+            pager.used_page_id_set(7)
+            raise ValueError("出错")
+    assert pager.page_get(1).read(1) == b'1'
+    assert pager.meta.used_page_id == 0
+    assert pager.latched == set()
+    pager.flush()
+    assert pager.page_read(1)[:1] == b'1'
+    for page_id in range(2, 8):
+        assert pager.page_read(page_id)[:1] in (b'', b'\x00')
+    with pager.operation():
+        pager.page_set(1, b'3')
+    assert pager.page_read(1)[:1] == b'3'
+    close(fd, name)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,149 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from const import NULL_PAGE_ID, BYTES_PAGE, READ_AHEAD_MIN, READ_AHEAD_MAX, READ_AHEAD_WORKERS
+from file import file_pread
+
+
+class ReadAhead:
+    """
+    叶链扫描的预读：后台线程沿 right_page_id/left_page_id 用 pread 提前读入后续页，
+    扫描读到窗口中点（marker）时发起下一批并把窗口翻倍，新的扫描从最小窗口开始。
+    预读到的页只在缓冲池未命中时使用，数据文件对应页被写入时作废。
+    读盘不持锁，只在放进 pages 时加锁；读的过程中页被写入（stale）时丢掉读到的内容。
+    """
+
+    def __init__(self):
+        self.fd: int = 0
+        self.lock: threading.Lock = threading.Lock()
+        self.executor: ThreadPoolExecutor | None = None
+        self.pages: OrderedDict[int, bytes] = OrderedDict()
+        self.window: int = READ_AHEAD_MIN
+        self.running: bool = False
+        self.chain: bool = False
+        self.marker: int = NULL_PAGE_ID
+        self.frontier: int = NULL_PAGE_ID
+        self.last: int = NULL_PAGE_ID
+        self.hits: int = 0
+        # 正在读的页，以及读的过程中被写入的页
+        self.reading: set[int] = set()
+        self.stale: set[int] = set()
+        self.closed: bool = False
+
+    def scan(self, page_id: int, next_page_id_of: Callable[[bytes], int]) -> None:
+        """扫描即将沿叶链读取 page_id"""
+        if page_id == NULL_PAGE_ID:
+            return
+        with self.lock:
+            last = self.last
+            self.last = page_id
+            if page_id == self.marker:
+                # 顺着上一批继续，窗口翻倍；上一批还没读完就等它结束后接着发
+                self.marker = NULL_PAGE_ID
+                self.chain = True
+                if not self.running:
+                    self.submit_chain(next_page_id_of)
+                return
+            if self.running:
+                return
+            if page_id in self.pages:
+                return
+            if last == NULL_PAGE_ID:
+                # 第一步不预读，连续走到第二页才认为是扫描
+                return
+            self.window = READ_AHEAD_MIN
+            self.submit(page_id, next_page_id_of)
+
+    def scan_end(self) -> None:
+        with self.lock:
+            self.last = NULL_PAGE_ID
+
+    def submit_chain(self, next_page_id_of: Callable[[bytes], int]) -> None:
+        self.chain = False
+        if self.frontier == NULL_PAGE_ID:
+            return
+        self.window = min(self.window * 2, READ_AHEAD_MAX)
+        self.submit(self.frontier, next_page_id_of)
+
+    def submit(self, page_id: int, next_page_id_of: Callable[[bytes], int]) -> None:
+        if self.closed:
+            return
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=READ_AHEAD_WORKERS)
+        self.running = True
+        self.marker = NULL_PAGE_ID
+        self.frontier = NULL_PAGE_ID
+        self.executor.submit(self.job, page_id, self.window, next_page_id_of)
+
+    def job(self, page_id: int, count: int, next_page_id_of: Callable[[bytes], int]) -> None:
+        try:
+            for i in range(count):
+                if page_id == NULL_PAGE_ID:
+                    break
+                with self.lock:
+                    if self.closed:
+                        page_id = NULL_PAGE_ID
+                        break
+                    page_bs = self.pages.get(page_id)
+                    if page_bs is None:
+                        self.reading.add(page_id)
+                if page_bs is None:
+                    try:
+                        page_bs = file_pread(self.fd, BYTES_PAGE, page_id * BYTES_PAGE)
+                    finally:
+                        with self.lock:
+                            self.reading.discard(page_id)
+                            stale = page_id in self.stale
+                            self.stale.discard(page_id)
+                    if stale:
+                        # 读到的可能是写入前的内容，链上的下一页也不可信
+                        page_id = NULL_PAGE_ID
+                        break
+                with self.lock:
+                    self.pages[page_id] = page_bs
+                    while len(self.pages) > 2 * READ_AHEAD_MAX:
+                        self.pages.popitem(last=False)
+                    if i == count // 2:
+                        self.marker = page_id
+                if len(page_bs) < BYTES_PAGE:
+                    page_id = NULL_PAGE_ID
+                    break
+                page_id = next_page_id_of(page_bs)
+        except OSError:
+            page_id = NULL_PAGE_ID
+        finally:
+            with self.lock:
+                self.frontier = page_id
+                self.running = False
+                if self.chain:
+                    self.submit_chain(next_page_id_of)
+
+    def take(self, page_id: int) -> bytes | None:
+        with self.lock:
+            page_bs = self.pages.pop(page_id, None)
+            if page_bs is not None:
+                self.hits += 1
+            return page_bs
+
+    def invalidate(self, page_id: int) -> None:
+        """数据文件的页被改写，调用方需持有 self.lock"""
+        self.pages.pop(page_id, None)
+        if page_id in self.reading:
+            self.stale.add(page_id)
+
+    def close(self) -> None:
+        """不再发起预读，等正在跑的任务结束后关掉线程；任务结束时接着发的下一批也不再提交"""
+        with self.lock:
+            self.closed = True
+            executor = self.executor
+            self.executor = None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def new_read_ahead(fd: int) -> ReadAhead:
+    r = ReadAhead()
+    r.fd = fd
+    return r
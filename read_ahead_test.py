@@ -0,0 +1,140 @@
+import inspect
+import os
+import time
+import pytest
+
+import read_ahead as read_ahead_module
+from b_plus_tree import right_page_id_from_page, new_b_plus_tree
+from const import BYTES_PAGE, META_PAGE_ID, NULL_PAGE_ID, READ_AHEAD_MIN
+from file import file_open
+from free_list import new_free_list
+from pager import Pager, new_pager
+from read_ahead import ReadAhead
+from utils import to_bytes
+
+
+def init(name: str, num_pages: int) -> tuple[int, Pager]:
+    """page 1..num_pages 串成一条叶链"""
+    fd = file_open(f'{name}.db')
+    pager = new_pager(fd)
+    for page_id in range(1, num_pages + 1):
+        right_page_id = page_id + 1 if page_id < num_pages else NULL_PAGE_ID
+        page_bs = to_bytes(True) + to_bytes(page_id) + to_bytes(page_id - 1) + to_bytes(right_page_id)
+        pager.page_set(page_id, page_bs)
+    pager.flush()
+    return fd, pager
+
+
+def close(fd: int, name: str) -> None:
+    os.close(fd)
+    os.remove(f'{name}.db')
+
+
+def wait(read_ahead: ReadAhead) -> None:
+    while read_ahead.running:
+        time.sleep(0.001)
+
+
+def test_job():
+    name = inspect.currentframe().f_code.co_name
+    fd, pager = init(name, 10)
+    read_ahead = pager.read_ahead
+    read_ahead.job(3, 4, right_page_id_from_page)
+    assert list(read_ahead.pages) == [3, 4, 5, 6]
+    assert read_ahead.frontier == 7
+    read_ahead.job(9, 4, right_page_id_from_page)
+    assert read_ahead.frontier == NULL_PAGE_ID
+    close(fd, name)
+
+
+def test_scan():
+    """第二步开始预读，走到窗口中点时继续下一批并扩大窗口"""
+    name = inspect.currentframe().f_code.co_name
+    fd, pager = init(name, 40)
+    read_ahead = pager.read_ahead
+    read_ahead.scan(1, right_page_id_from_page)
+    assert len(read_ahead.pages) == 0
+    read_ahead.scan(2, right_page_id_from_page)
+    wait(read_ahead)
+    assert list(read_ahead.pages) == list(range(2, 2 + READ_AHEAD_MIN))
+    read_ahead.scan(read_ahead.marker, right_page_id_from_page)
+    wait(read_ahead)
+    assert read_ahead.window == 2 * READ_AHEAD_MIN
+    assert len(read_ahead.pages) == 3 * READ_AHEAD_MIN
+    close(fd, name)
+
+
+def test_invalidate():
+    """数据文件的页被改写后，预读的旧内容作废"""
+    name = inspect.currentframe().f_code.co_name
+    fd, pager = init(name, 4)
+    read_ahead = pager.read_ahead
+    read_ahead.job(1, 4, right_page_id_from_page)
+    pager.page_write(2, b'x')
+    assert read_ahead.take(2) is None
+    assert read_ahead.take(3) is not None
+    close(fd, name)
+
+
+def test_stale(monkeypatch):
+    """读盘期间页被写入时丢掉读到的内容，也不再沿它的链往下读"""
+    name = inspect.currentframe().f_code.co_name
+    fd, pager = init(name, 10)
+    read_ahead = pager.read_ahead
+    pread = read_ahead_module.file_pread
+
+    def file_pread(_fd, length, offset):
+        page_bs = pread(_fd, length, offset)
+        if offset == 4 * BYTES_PAGE:
+            pager.page_write(4, page_bs)
+        return page_bs
+
+    monkeypatch.setattr(read_ahead_module, 'file_pread', file_pread)
+    read_ahead.job(3, 4, right_page_id_from_page)
+    assert list(read_ahead.pages) == [3]
+    assert read_ahead.frontier == NULL_PAGE_ID
+    assert read_ahead.reading == set()
+    assert read_ahead.stale == set()
+    close(fd, name)
+
+
+def test_close():
+    """close 等预读任务结束并关掉线程，之后不再发起预读，任务结束时也不接着提交"""
+    name = inspect.currentframe().f_code.co_name
+    fd, pager = init(name, 40)
+    read_ahead = pager.read_ahead
+    read_ahead.scan(1, right_page_id_from_page)
+    read_ahead.scan(2, right_page_id_from_page)
+    read_ahead.chain = True
+    pager.close()
+    assert read_ahead.executor is None
+    assert not read_ahead.running
+    read_ahead.scan_end()
+    read_ahead.scan(20, right_page_id_from_page)
+    read_ahead.scan(21, right_page_id_from_page)
+    read_ahead.chain = True
+    read_ahead.job(30, 2, right_page_id_from_page)
+    assert read_ahead.executor is None
+    assert not read_ahead.running
+    assert 30 not in read_ahead.pages
+    close(fd, name)
+
+
+def test_b_plus_tree_get_all():
+    name = inspect.currentframe().f_code.co_name
+    fd = file_open(f'{name}.db')
+    pager = new_pager(fd, 8)
+    free_list = new_free_list(pager, META_PAGE_ID)
+    tree = new_b_plus_tree(pager, free_list, 0, True)
+    keys = [b'%03d' % i for i in range(200)]
+    for key in keys:
+        tree.add([(key, key)])
+    pager = new_pager(fd, 8)
+    tree = new_b_plus_tree(pager, free_list, 0, False)
+    assert tree.get_all() == keys
+    assert tree.get_lt(b'150') == keys[:150]
+    close(fd, name)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
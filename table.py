@@ -1,7 +1,12 @@
 import io
 from pager import Pager
 from free_list import FreeList
-from b_plus_tree import BPlusTree, new_b_plus_tree
+from b_epsilon_tree import BEpsilonTree
+from b_plus_tree import BPlusTree
+from const import TREE_B_PLUS
+from data_tree import new_data_tree
+from hash_index import HashIndex
+from lsm_tree import LSMTree
 from utils import to_bytes, from_buf
 
 
@@ -11,8 +16,10 @@ class Table:
         self.name: str = ""
         self.col_names: list[str] = []
         self.col_types: list[int] = []
-        self.data: BPlusTree | None = None
-        self.indexes: dict[tuple, BPlusTree] = {}  # key: (col_index, col_index...)
+        self.kind: int = TREE_B_PLUS
+        self.data: BPlusTree | BEpsilonTree | LSMTree | None = None
+        self.indexes: dict[tuple, BPlusTree | HashIndex] = {}  # key: (col_index, col_index...)
+        self.index_kinds: dict[tuple, int] = {}
 
     def __bytes__(self):
         r = b''
@@ -23,22 +30,27 @@ class Table:
         for col_type in self.col_types:
             r += to_bytes(col_type)
         r += to_bytes(self.data.seq)
+        r += to_bytes(self.kind)
         r += to_bytes(len(self.indexes))
         for index, tree in self.indexes.items():
             r += to_bytes(len(index))
             for col_index in index:
                 r += to_bytes(col_index)
             r += to_bytes(tree.seq)
+            r += to_bytes(self.index_kinds[index])
         return r
 
 
-def new_table(name: str, col_names: list[str], col_types: list[int], pager: Pager, free_list: FreeList, data_seq: int) -> Table:
+def new_table(name: str, col_names: list[str], col_types: list[int], pager: Pager, free_list: FreeList, data_seq: int,
+              kind: int = TREE_B_PLUS, bloom_bits_per_key: int = 0) -> Table:
     r = Table()
     r.name = name
     r.col_names = col_names
     r.col_types = col_types
-    r.data = new_b_plus_tree(pager, free_list, data_seq, True)
+    r.kind = kind
+    r.data = new_data_tree(pager, free_list, kind, data_seq, True, bloom_bits_per_key)
     r.indexes = {}
+    r.index_kinds = {}
     return r
 
 
@@ -49,15 +61,19 @@ def new_table_from_buf(buf: io.BytesIO, pager: Pager, free_list: FreeList) -> Ta
     r.col_names = [from_buf(buf, str) for _ in range(num_cols)]
     r.col_types = [from_buf(buf, int) for _ in range(num_cols)]
     data_seq = from_buf(buf, int)
-    r.data = new_b_plus_tree(pager, free_list, data_seq, False)
+    r.kind = from_buf(buf, int)
+    r.data = new_data_tree(pager, free_list, r.kind, data_seq, False)
     num_indexes = from_buf(buf, int)
     indexes = {}
+    index_kinds = {}
     for _ in range(num_indexes):
         num_index_cols = from_buf(buf, int)
         index = tuple(from_buf(buf, int) for _ in range(num_index_cols))
         index_seq = from_buf(buf, int)
-        indexes[index] = new_b_plus_tree(pager, free_list, index_seq, False)
+        index_kinds[index] = from_buf(buf, int)
+        indexes[index] = new_data_tree(pager, free_list, index_kinds[index], index_seq, False)
     r.indexes = indexes
+    r.index_kinds = index_kinds
     return r
 
 
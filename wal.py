@@ -0,0 +1,88 @@
+import os
+import zlib
+
+from const import NULL_PAGE_ID, BYTES_PAGE, BYTES_WAL_LSN, BYTES_WAL_RECORD_HEADER, INIT_WAL_LSN
+from utils import to_bytes, from_bytes
+
+
+class WAL:
+    """
+    追加写的 redo 日志，文件格式：
+        header: next_lsn
+        record: lsn | page_id | length | crc32 | page_bs
+    一次提交由若干页记录加一条 page_id == NULL_PAGE_ID 的提交记录组成，
+    replay 只重放完整提交的记录，遇到残缺或校验失败的记录即停止。
+    """
+
+    def __init__(self):
+        self.fd: int = 0
+        self.lsn: int = INIT_WAL_LSN
+        self.size: int = 0
+
+    def append(self, records: list[tuple[int, bytes]]) -> list[int]:
+        """写入一次提交，返回每条页记录的 lsn"""
+        lsns = []
+        r = b''
+        for page_id, page_bs in records:
+            lsns.append(self.lsn)
+            r += self.record_bytes(page_id, page_bs)
+        r += self.record_bytes(NULL_PAGE_ID, b'')
+        os.lseek(self.fd, self.size, os.SEEK_SET)
+        os.write(self.fd, r)
+        self.size += len(r)
+        return lsns
+
+    def record_bytes(self, page_id: int, page_bs: bytes) -> bytes:
+        header = to_bytes(self.lsn) + to_bytes(page_id) + len(page_bs).to_bytes(4, byteorder="big")
+        crc = zlib.crc32(header + page_bs)
+        self.lsn += 1
+        return header + crc.to_bytes(4, byteorder="big") + page_bs
+
+    def sync(self) -> None:
+        os.fsync(self.fd)
+
+    def replay(self) -> list[tuple[int, bytes]]:
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        bs = b''
+        while True:
+            chunk = os.read(self.fd, 64 * BYTES_PAGE)
+            if not chunk:
+                break
+            bs += chunk
+        if len(bs) < BYTES_WAL_LSN:
+            return []
+        self.lsn = from_bytes(bs[:BYTES_WAL_LSN], int)
+        result = []
+        pending = []
+        offset = BYTES_WAL_LSN
+        while offset + BYTES_WAL_RECORD_HEADER <= len(bs):
+            header = bs[offset:offset + BYTES_WAL_RECORD_HEADER]
+            lsn = from_bytes(header[:8], int)
+            page_id = from_bytes(header[8:16], int)
+            length = int.from_bytes(header[16:20], byteorder="big")
+            crc = int.from_bytes(header[20:24], byteorder="big")
+            page_bs = bs[offset + BYTES_WAL_RECORD_HEADER:offset + BYTES_WAL_RECORD_HEADER + length]
+            if len(page_bs) < length or zlib.crc32(header[:20] + page_bs) != crc:
+                break
+            offset += BYTES_WAL_RECORD_HEADER + length
+            self.lsn = lsn + 1
+            if page_id == NULL_PAGE_ID:
+                result.extend(pending)
+                pending = []
+            else:
+                pending.append((page_id, page_bs))
+        return result
+
+    def truncate(self) -> None:
+        os.ftruncate(self.fd, 0)
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        os.write(self.fd, to_bytes(self.lsn))
+        self.size = BYTES_WAL_LSN
+
+
+def new_wal(fd: int) -> WAL:
+    wal = WAL()
+    wal.fd = fd
+    wal.lsn = INIT_WAL_LSN
+    wal.size = os.fstat(fd).st_size
+    return wal
@@ -0,0 +1,101 @@
+import inspect
+import os
+import pytest
+
+from file import file_open
+from pager import Pager, new_pager
+from wal import new_wal
+
+
+def init(name: str) -> tuple[int, int, Pager]:
+    fd = file_open(f'{name}.db')
+    wal_fd = file_open(f'{name}.db-wal')
+    pager = new_pager(fd, wal=new_wal(wal_fd))
+    return fd, wal_fd, pager
+
+
+def close(fd: int, wal_fd: int, name: str) -> None:
+    os.close(fd)
+    os.close(wal_fd)
+    os.remove(f'{name}.db')
+    os.remove(f'{name}.db-wal')
+
+
+def test_append_replay():
+    name = inspect.currentframe().f_code.co_name
+    fd = file_open(f'{name}.db-wal')
+    wal = new_wal(fd)
+    wal.truncate()
+    wal.append([(1, b'a'), (2, b'b')])
+    wal.append([(1, b'c')])
+    assert new_wal(fd).replay() == [(1, b'a'), (2, b'b'), (1, b'c')]
+    os.close(fd)
+    os.remove(f'{name}.db-wal')
+
+
+def test_replay_ignore_torn():
+    """未写完提交记录或校验失败的尾部不会被重放"""
+    name = inspect.currentframe().f_code.co_name
+    fd = file_open(f'{name}.db-wal')
+    wal = new_wal(fd)
+    wal.truncate()
+    wal.append([(1, b'a')])
+    size = wal.size
+    wal.append([(2, b'b')])
+    os.ftruncate(fd, wal.size - 1)
+    assert new_wal(fd).replay() == [(1, b'a')]
+    os.lseek(fd, size, os.SEEK_SET)
+    os.write(fd, b'\xff' * 32)
+    assert new_wal(fd).replay() == [(1, b'a')]
+    os.close(fd)
+    os.remove(f'{name}.db-wal')
+
+
+def test_commit_not_in_place():
+    """提交只追加 WAL，数据文件要等 checkpoint"""
+    name = inspect.currentframe().f_code.co_name
+    fd, wal_fd, pager = init(name)
+    with pager.operation():
+        pager.page_set(1, b'1')
+    assert pager.page_read(1) == b''
+    assert pager.frames[1].logged
+    pager.checkpoint()
+    assert pager.page_read(1)[:1] == b'1'
+    assert pager.wal.size == 8
+    close(fd, wal_fd, name)
+
+
+def test_recover():
+    """进程崩溃后重新打开，已提交的页从 WAL 恢复，未提交的丢弃"""
+    name = inspect.currentframe().f_code.co_name
+    fd, wal_fd, pager = init(name)
+    with pager.operation():
+        pager.magic_number_set()
+        pager.page_set(1, b'1')
+    pager.page_set(2, b'2')
+    pager.wal.append([(3, b'3')])
+    os.ftruncate(wal_fd, pager.wal.size - 1)
+
+    pager = new_pager(fd, wal=new_wal(wal_fd))
+    assert pager.magic_number_exist()
+    assert pager.page_get(1).read(1) == b'1'
+    assert pager.page_read(2) == b''
+    assert pager.page_read(3) == b''
+    close(fd, wal_fd, name)
+
+
+def test_no_steal():
+    """未提交的脏页不会因淘汰写回数据文件"""
+    name = inspect.currentframe().f_code.co_name
+    fd, wal_fd, pager = init(name)
+    pager.cache_size = 2
+    for page_id in range(1, 5):
+        pager.page_set(page_id, b'x')
+    for page_id in range(1, 5):
+        assert pager.page_read(page_id) == b''
+    assert len(pager.frames) > pager.cache_size
+    close(fd, wal_fd, name)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])